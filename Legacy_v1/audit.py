@@ -1,34 +1,35 @@
 import boto3
-import requests
-import re
+import os
+import sys
 from datetime import datetime
 from Legacy_v1.config import TABLE_NAME, REGION, OCR_API_KEY
 
+# Shared risk engine and OCR backends live with the lambdas
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from risk_engine import RiskEngine
+from ocr import get_backend
+from extractor import extract
+
 # --- CONSTANTS ---
 FILE_NAME = "receipt.png"
-OCR_ENDPOINT = "https://api.ocr.space/parse/image"
 
 # --- HELPER: RISK ENGINE ---
-def assess_risk(merchant, amount, date_str):
-    flags = []
-    
-    # Rule 1: High Value Check
-    if amount > 5000:
-        flags.append("HIGH_VALUE")
+# v1 rules: any hit flags the receipt, the weight only has to be > 0
+LEGACY_RULES = {
+    'keywords': {word: 1 for word in ["bar", "pub", "gaming", "netflix", "casino", "club"]},
+    'keyword_flag': "NON_COMPLIANT_MERCHANT",
+    'amount_threshold': 5000,
+    'amount_weight': 1,
+    'amount_flag': "HIGH_VALUE",
+    'weekdays': [5, 6],  # 5=Saturday, 6=Sunday
+    'weekday_weight': 1,
+    'weekday_flag': "WEEKEND_EXPENSE",
+}
+LEGACY_ENGINE = RiskEngine(LEGACY_RULES)
 
-    # Rule 2: Suspicious Merchants
-    suspicious_keywords = ["bar", "pub", "gaming", "netflix", "casino", "club"]
-    if any(keyword in merchant.lower() for keyword in suspicious_keywords):
-        flags.append("NON_COMPLIANT_MERCHANT")
-    
-    # Rule 3: Weekend Check
-    try:
-        #normalized the date to YYYY-MM-DD in extract_financials
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        if dt.weekday() >= 5: # 5=Saturday, 6=Sunday
-            flags.append("WEEKEND_EXPENSE")
-    except Exception as e:
-        print(f"Risk Engine Date Error: {e}") 
+def assess_risk(merchant, amount, date_str):
+    #normalized the date to YYYY-MM-DD in extract_financials
+    _, flags = LEGACY_ENGINE.assess(merchant, amount, date_str)
 
     if flags:
         return "FLAGGED", flags
@@ -39,15 +40,12 @@ def assess_risk(merchant, amount, date_str):
 def get_ocr_text(filename):
     print(f"Scanning '{filename}'...")
     try:
+        # v1 asked OCR.space for table mode on its default engine
+        backend = get_backend(api_key=OCR_API_KEY, isTable='true', OCREngine='1', scale='false')
         with open(filename, 'rb') as f:
-            response = requests.post(
-                OCR_ENDPOINT,
-                data={'apikey': OCR_API_KEY, 'language': 'eng', 'isTable': True},
-                files={'file': f}
-            )
-        result = response.json()
-        if result.get('ParsedResults'):
-            return result['ParsedResults'][0]['ParsedText']
+            pages = backend.parse(f, os.path.getsize(filename), filename)
+        if pages:
+            return pages[0]
         print("Warning: No text found in image.")
         return ""
     except Exception as e:
@@ -56,79 +54,15 @@ def get_ocr_text(filename):
 
 def extract_financials(text):
     """
-    UPGRADED: 
-    1. Fixes 'Subtotal vs Total' bugs using scoring.
-    2. Fixes 'Phone Number Bug' (ignores huge numbers).
-    3. Normalizes Dates for the Risk Engine.
+    Date, Merchant and Total via the processor's single-pass extractor
+    (lambda/extractor.py), with the v1 defaults for anything missing.
     """
-    data = {}
-    lines = text.split('\n')
-
-    # 1. EXTRACT DATE & NORMALIZE (Fixing the Weekend Bug)
-    # Regex looks for DD-MM-YYYY or YYYY-MM-DD
-    date_match = re.search(r'(\d{2})[/-](\d{2})[/-](\d{4})|(\d{4})[/-](\d{2})[/-](\d{2})', text)
-    if date_match:
-        groups = date_match.groups()
-        if groups[0]: # Found DD-MM-YYYY
-            day, month, year = groups[0], groups[1], groups[2]
-            data['Date'] = f"{year}-{month}-{day}"
-        else: # Found YYYY-MM-DD
-            year, month, day = groups[3], groups[4], groups[5]
-            data['Date'] = f"{year}-{month}-{day}"
-    else:
-        data['Date'] = datetime.now().strftime("%Y-%m-%d")
-
-    # 2. EXTRACT MERCHANT (First non-empty line)
-    clean_lines = [line.strip() for line in lines if line.strip()]
-    data['Merchant'] = clean_lines[0] if clean_lines else "Unknown"
-
-    # 3. EXTRACT TOTAL (logic fix)
-    candidates = []
-    # Regex for currency: $10.00, 1,200.50, etc.
-    money_pattern = r'[\$£€]?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)'
-
-    for line in lines:
-        line_lower = line.lower()
-        
-        # Filter Noise (Subtotals, Tax)
-        if any(bad in line_lower for bad in ["subtotal", "tax", "vat", "change", "tender"]):
-            continue
-
-        match = re.search(money_pattern, line)
-        if match:
-            try:
-                # Clean num
-                amount_str = match.group(1).replace(',', '')
-                amount = float(amount_str)
-                
-                # SANITY FILTERS 
-                
-                # Filter 1: Phone Numbers (The "Billion Dollar Bug" Fix)
-                if amount > 200000: 
-                    continue 
-
-                # Filter 2: Years (e.g., 2024)
-                if 2018 <= amount <= 2030 and "." not in match.group(1):
-                    continue
-
-                # SCORING LOGIC
-                score = 0
-                if "total" in line_lower: score += 10
-                if "amount" in line_lower: score += 5
-                if "due" in line_lower: score += 5
-                
-                candidates.append((amount, score))
-            except ValueError:
-                continue
-
-    # Pick the winner: Highest Score -> Then Highest Amount
-    if candidates:
-        candidates.sort(key=lambda x: (x[1], x[0]), reverse=True)
-        data['Total'] = candidates[0][0]
-    else:
-        data['Total'] = 0.0
-
-    return data
+    fields = extract(text)
+    return {
+        'Date': fields['Date'] or datetime.now().strftime("%Y-%m-%d"),
+        'Merchant': fields['Merchant'] or "Unknown",
+        'Total': float(fields['Total']) if fields['Total'] is not None else 0.0,
+    }
 
 def store_audit_record(data, risk_status, risk_flags):
     """
@@ -1,6 +1,7 @@
 import streamlit as st
 import boto3
 import pandas as pd
+from boto3.dynamodb.conditions import Attr
 from datetime import datetime
 from Legacy_v1.config import TABLE_NAME, REGION
 
@@ -21,9 +22,31 @@ st.title("Automated Expense Audit & ETL Pipeline")
 st.markdown("Live view of incoming financial documents and automated risk assessment.")
 
 # 1. FETCH DATA
+# The sidebar filters go into the Scan itself, so DynamoDB only sends back the
+# matching receipts; every page is read (one scan() call stops at 1 MB).
+def scan_ledger(status, dates):
+    filters = []
+    if status != "All":
+        filters.append(Attr('RiskStatus').eq(status))
+    if len(dates) > 0:
+        filters.append(Attr('Date').between(dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d")))
+    kwargs = {}
+    if filters:
+        condition = filters[0]
+        for extra in filters[1:]:
+            condition = condition & extra
+        kwargs['FilterExpression'] = condition
+
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
 try:
-    response = table.scan()
-    items = response['Items']
+    items = scan_ledger(status_filter, date_filter)
     df = pd.DataFrame(items)
     
     if not df.empty:
@@ -31,16 +54,26 @@ try:
         df['Total'] = pd.to_numeric(df['Total'])
         
         # 2. KPI METRICS (Top Row)
+        # Computed from the scanned rows, so with a filter set they describe
+        # the filtered view, not the whole ledger; the labels say which.
+        filtered = status_filter != "All" or len(date_filter) > 0
+        scope = []
+        if status_filter != "All":
+            scope.append(status_filter)
+        if len(date_filter) > 0:
+            scope.append(f"{date_filter[0]:%Y-%m-%d} to {date_filter[-1]:%Y-%m-%d}")
+        st.caption(f"Filtered view: {', '.join(scope)}" if filtered else "Whole ledger")
+
         col1, col2, col3, col4 = st.columns(4)
         
         total_spend = df['Total'].sum()
         flagged_count = len(df[df['RiskStatus'] == 'FLAGGED'])
         avg_ticket = df['Total'].mean()
         
-        col1.metric("Total Spend", f"₹{total_spend:,.2f}")
-        col2.metric("Receipts Processed", len(df))
-        col3.metric("Risk Flags", flagged_count, delta_color="inverse")
-        col4.metric("Avg. Ticket Size", f"₹{avg_ticket:,.2f}")
+        col1.metric("Filtered Spend" if filtered else "Total Spend", f"₹{total_spend:,.2f}")
+        col2.metric("Receipts Shown" if filtered else "Receipts Processed", len(df))
+        col3.metric("Risk Flags Shown" if filtered else "Risk Flags", flagged_count, delta_color="inverse")
+        col4.metric("Avg. Ticket Size" + (" (filtered)" if filtered else ""), f"₹{avg_ticket:,.2f}")
         
         st.divider()
 
@@ -58,11 +91,7 @@ try:
 
         # 4. DATA TABLE
         st.subheader("Live Audit Log")
-        
-        # Apply Filters
-        if status_filter != "All":
-            df = df[df['RiskStatus'] == status_filter]
-            
+
         # Style the dataframe (Highlight FLAGGED rows in red)
         def highlight_risk(row):
             return ['background-color: #ffe6e6' if row['RiskStatus'] == 'FLAGGED' else '' for _ in row]
@@ -73,7 +102,7 @@ try:
         )
         
     else:
-        st.info("No data found in DynamoDB. Upload a receipt to start.")
+        st.info("No receipts match these filters. Upload a receipt or widen the date range.")
 
 except Exception as e:
     st.error(f"Error connecting to Database: {e}")
\ No newline at end of file
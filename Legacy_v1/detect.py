@@ -1,5 +1,8 @@
-import requests
-import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from ocr import OcrError, get_backend
 
 # --- CONFIGURATION ---
 API_KEY = "your-api-key"  # Free OCR API Key
@@ -11,40 +14,24 @@ def extract_text_free(filename):
     
     try:
         # 1. Open the image file
+        # 2. Send it to OCR (OCR.space by default, see OCR_BACKEND)
+        backend = get_backend(api_key=API_KEY, OCREngine='1', scale='false')
         with open(filename, 'rb') as f:
-            # 2. Send it to OCR.space
-            payload = {
-                'apikey': API_KEY,
-                'language': 'eng',
-            }
-            files = {
-                'file': f
-            }
-            
-            response = requests.post(
-                'https://api.ocr.space/parse/image',
-                data=payload,
-                files=files
-            )
+            parsed_results = backend.parse(f, os.path.getsize(filename), filename)
 
         # 3. Process the Result
-        result = response.json()
-        
-        if result['IsErroredOnProcessing']:
-            print("API Error:", result['ErrorMessage'])
-            return
-
         print("\n--- EXTRACTED DATA ---")
-        parsed_results = result.get('ParsedResults', [])
         
         if parsed_results:
-            text = parsed_results[0].get('ParsedText')
+            text = parsed_results[0]
             print(text)
             print("-------------------------")
             print(" AI Read Complete (Zero Cost).")
         else:
             print(" No text found.")
 
+    except OcrError as e:
+        print("API Error:", e)
     except Exception as e:
         print(f" Connection Error: {e}")
 
@@ -3,40 +3,51 @@ import random
 from datetime import datetime, timedelta
 from Legacy_v1.config import TABLE_NAME, REGION
 
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-table = dynamodb.Table(TABLE_NAME)
-
+# The v1 ExpenseLedger keeps its own item schema (Merchant, Date, Total as a
+# string, RiskStatus, AuditedAt) and has no /stats rollups, so it is seeded here
+# and not through tools/bulk_ingest.py, which writes processor-format rows.
 merchants = ["Uber", "Starbucks", "Apple Store", "The Leela Palace", "Netflix", "Local Taxi", "Amazon AWS", "Go Air"]
-risk_status = ["APPROVED", "FLAGGED"]
 
-print("Injecting 20 Mock Records...")
 
-for i in range(20):
-    merchant = random.choice(merchants)
-    amount = round(random.uniform(100, 15000), 2)
-    
+def mock_record(i):
+    # Deterministic per index, so a re-run overwrites the same 20 rows
+    rng = random.Random(i)
+    merchant = rng.choice(merchants)
+    amount = round(rng.uniform(100, 15000), 2)
+
     # Simulate Risk Logic
     status = "APPROVED"
     flags = ["NONE"]
-    
+
     if amount > 5000:
         status = "FLAGGED"
         flags = ["HIGH_VALUE"]
     if merchant == "Netflix":
         status = "FLAGGED"
         flags = ["NON_COMPLIANT"]
-        
-    item = {
+
+    return {
         'ReceiptID': f"mock-{i}",
         'Merchant': merchant,
-        'Date': (datetime.now() - timedelta(days=random.randint(0, 30))).strftime("%Y-%m-%d"),
+        'Date': (datetime.now() - timedelta(days=rng.randint(0, 30))).strftime("%Y-%m-%d"),
         'Total': str(amount),
         'Status': 'Audited',
         'RiskStatus': status,
         'RiskFlags': flags,
         'AuditedAt': datetime.now().isoformat()
     }
-    table.put_item(Item=item)
-    print(f"Added: {merchant} - ₹{amount}")
 
-print("Data Injection Complete. Refresh your Dashboard!")
\ No newline at end of file
+
+if __name__ == "__main__":
+    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    table = dynamodb.Table(TABLE_NAME)
+    print("Injecting 20 Mock Records...")
+
+    # One BatchWriteItem call instead of 20 serial put_item calls
+    with table.batch_writer() as batch:
+        for i in range(20):
+            item = mock_record(i)
+            batch.put_item(Item=item)
+            print(f"Added: {item['Merchant']} - ₹{item['Total']}")
+
+    print("Data Injection Complete. Refresh your Dashboard!")
@@ -1,24 +1,24 @@
 import boto3
 import os
-from Legacy_v1.config import BUCKET_NAME, REGION
+import sys
+from Legacy_v1.config import BUCKET_NAME, TABLE_NAME, REGION
+
+# Kept for the old entry point: uploads go through tools/bulk_ingest.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tools'))
+import bulk_ingest
+
 
 def upload_file(file_name):
-    s3 = boto3.client('s3', region_name=REGION)
-    
     # 1. Check if file exists locally
     if not os.path.exists(file_name):
         print(f" Error: '{file_name}' not found. Did you download a receipt image?")
         return
 
-    print(f" Uploading {file_name} to {BUCKET_NAME}...")
+    # 2. Upload to S3 (skipped if the receipt is already in the ledger)
+    s3 = boto3.client('s3', region_name=REGION)
+    dynamodb = boto3.resource('dynamodb', region_name=REGION)
+    return bulk_ingest.upload(s3, dynamodb, [(file_name, file_name)], BUCKET_NAME, TABLE_NAME, workers=1)
 
-    # 2. Upload to S3
-    try:
-        s3.upload_file(file_name, BUCKET_NAME, file_name)
-        print(" Upload Successful!")
-        print(f"   File is now safe in the cloud: s3://{BUCKET_NAME}/{file_name}")
-    except Exception as e:
-        print(f" Upload Failed: {e}")
 
 if __name__ == "__main__":
-    upload_file("receipt.png")
\ No newline at end of file
+    upload_file("receipt.png")
@@ -1,11 +1,11 @@
 import streamlit as st
 import requests
-import pandas as pd
 import boto3
 import os
 import datetime
 from dotenv import load_dotenv
-from streamlit_autorefresh import st_autorefresh
+import ledger_view
+import live_feed
 
 # --- CONFIGURATION ---
 load_dotenv()
@@ -14,6 +14,8 @@ if "API_URL" in st.secrets:
     API_URL = st.secrets["API_URL"]
     BUCKET_NAME = st.secrets["BUCKET_NAME"]
     SNS_TOPIC_ARN = st.secrets.get("SNS_TOPIC_ARN")
+    PAGE_FORMAT = st.secrets.get("PAGE_FORMAT", "columns")
+    LIVE_SOCKET_URL = st.secrets.get("LIVE_SOCKET_URL")
     if "AWS_ACCESS_KEY_ID" in st.secrets:
         os.environ["AWS_ACCESS_KEY_ID"] = st.secrets["AWS_ACCESS_KEY_ID"]
         os.environ["AWS_SECRET_ACCESS_KEY"] = st.secrets["AWS_SECRET_ACCESS_KEY"]
@@ -22,6 +24,8 @@ else:
     API_URL = os.getenv("API_URL")
     BUCKET_NAME = os.getenv("BUCKET_NAME")
     SNS_TOPIC_ARN = os.getenv("SNS_TOPIC_ARN")
+    PAGE_FORMAT = os.getenv("PAGE_FORMAT", "columns")  # or "arrow" if the reader has pyarrow
+    LIVE_SOCKET_URL = os.getenv("LIVE_SOCKET_URL")  # terraform output live_endpoint
 
 st.set_page_config(page_title="Bill-E Audit Dashboard", layout="wide")
 
@@ -64,14 +68,13 @@ if "doorbell_rung" not in st.session_state:
 st.sidebar.title("⚙️ Settings")
 st.sidebar.success("🔓 Access Granted")
 
-# ---  SLEEP MODE LOGIC ---
-# Default to ON, but with a LIMIT.
-# interval=10000 means 10 seconds.
-# limit=20 means it runs 20 times (200 seconds = ~3.5 minutes) then STOPS.
-use_auto_refresh = st.sidebar.checkbox(" Enable Live Updates", value=True)
-
-if use_auto_refresh:
-    count = st_autorefresh(interval=10000, limit=20, key="data_refresh")
+# ---  LIVE UPDATES ---
+# Pushed, not polled: a LiveFeed (live_feed.py) listens on the LIVE_SOCKET_URL
+# WebSocket in the background and reads GET /expenses/changes only when an event
+# arrives; the Live Feed panel below redraws from memory every second. Idle, that
+# is no API requests at all. Without the socket (or websocket-client) the feed
+# long-polls instead: one request every 20 s.
+use_live_updates = st.sidebar.checkbox(" Enable Live Updates", value=True)
 
 st.title("🧾 Bill-E: Live Audit Ledger")
 st.markdown("---")
@@ -83,7 +86,7 @@ if not API_URL or not BUCKET_NAME:
 
 # --- UPLOAD SECTION ---
 st.subheader("Upload New Receipt")
-uploaded_file = st.file_uploader("Choose a receipt image", type=['png', 'jpg', 'jpeg'])
+uploaded_file = st.file_uploader("Choose a receipt image or PDF", type=['png', 'jpg', 'jpeg', 'pdf'])
 
 if uploaded_file is not None:
     if st.button(" Upload to Cloud"):
@@ -96,53 +99,186 @@ if uploaded_file is not None:
                 st.error(f"Upload failed: {e}")
 
 # --- FETCH DATA ---
-try:
-    response = requests.get(API_URL)
-    if response.status_code == 200:
-        data = response.json()
-        
-        if not data:
-            st.info("The ledger is currently empty. Upload a receipt above to start!")
-        else:
-            df = pd.DataFrame(data)
-            
-            # --- PREPARE DATA ---
-            expected_cols = ['Filename', 'RiskScore', 'RiskFlags', 'ExtractedText', 'Status', 'UploadDate']
-            cols = [c for c in expected_cols if c in df.columns]
-            df = df[cols]
-
-            if 'RiskScore' in df.columns:
-                df['RiskScore'] = pd.to_numeric(df['RiskScore'], errors='coerce').fillna(0)
-
-            # --- STATS ---
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Total Receipts", len(df))
-            
-            if 'Status' in df.columns:
-                processed_count = len(df[df['Status'].isin(['Processed', 'Analyzed'])])
-            else:
-                processed_count = 0
-                
-            col2.metric("Processed Successfully", processed_count)
-            
-            # Show user if the connection is live or sleeping
-            if use_auto_refresh and count < 20:
-                 col3.metric("System Health", "Live (Auto-Sleep in 3m)")
-            else:
-                 col3.metric("System Health", "Standby (Click Refresh)")
-
-            # --- TABLE ---
-            st.subheader("Audit Trail")
-            
-            def highlight_risk(row):
-                if 'RiskScore' in row and row['RiskScore'] > 0:
-                    return ['background-color: #ffcccc'] * len(row)
-                return [''] * len(row)
-
-            st.dataframe(df.style.apply(highlight_risk, axis=1), width=1200)
-            
+# The Audit Trail is paged, sorted and filtered by the API: only the rows on
+# screen are downloaded and rendered, however big the ledger gets.
+STATS_URL = API_URL.rsplit('/', 1)[0] + '/stats'  # API_URL ends in /expenses
+CHANGES_URL = API_URL + '/changes'
+SEARCH_URL = API_URL.rsplit('/', 1)[0] + '/search'
+SEARCH_PAGE_SIZE = 25
+PAGE_SIZES = [25, 50, 100, 250]
+SORTS = {
+    "Newest first": {'order': 'desc'},
+    "Oldest first": {'order': 'asc'},
+    "Highest risk": {'sort': 'risk', 'order': 'desc'},
+}
+SHOW = {
+    "All receipts": {},
+    "Flagged only": {'min_risk': 1},
+    "Clean only": {'max_risk': 0},
+}
+REMEMBERED_PAGES = 50  # pages kept for If-None-Match revalidation
+
+def fetch_page(params):
+    # One page of the ledger, decoded straight into a DataFrame: the columnar
+    # formats send every field name once and numbers as numbers, and requests
+    # asks for brotli or gzip. Pages we already hold are sent with their ETag:
+    # while nothing changed the API answers 304 with no body and we reuse ours.
+    known = st.session_state.setdefault('page_etags', {})
+    key = tuple(sorted(params.items()))
+    headers = {'If-None-Match': known[key][0]} if key in known else {}
+    response = requests.get(API_URL, params={**params, 'format': PAGE_FORMAT}, headers=headers, timeout=10)
+    if response.status_code == 304:
+        return response, known[key][1]
+    if response.status_code != 200:
+        return response, None
+    frame, next_cursor = ledger_view.read_page(response.content, response.headers.get('Content-Type', ''))
+    page = {'frame': frame, 'next_cursor': next_cursor}
+    known.pop(key, None)
+    known[key] = (response.headers.get('ETag'), page)
+    while len(known) > REMEMBERED_PAGES:
+        known.pop(next(iter(known)))
+    return response, page
+
+def fetch_stats():
+    # KPI rollups kept up to date by the processor: two reads, whatever the
+    # ledger size. None if the API doesn't have /stats (yet).
+    try:
+        response = requests.get(STATS_URL, params={'days': 30}, timeout=10)
+    except requests.RequestException:
+        return None
+    return response.json() if response.status_code == 200 else None
+
+def fetch_search(params):
+    # Ranked full-text hits from GET /search; the index does the work, not pandas
+    response = requests.get(SEARCH_URL, params=params, timeout=10)
+    return response, (response.json() if response.status_code == 200 else None)
+
+def fetch_changes(params):
+    # Runs on the LiveFeed thread: no st.* calls in here
+    response = requests.get(CHANGES_URL, params=params, timeout=live_feed.WAIT + 10)
+    response.raise_for_status()
+    return response.json()
+
+feed = st.session_state.get('live_feed')
+if use_live_updates:
+    if feed is None:
+        feed = st.session_state['live_feed'] = live_feed.LiveFeed(
+            fetch_changes, listen=live_feed.socket_listener(LIVE_SOCKET_URL))
+    feed.start()
+elif feed is not None:
+    feed.stop()
+
+def live_panel():
+    # Redrawn every second while live; only talks to the API when the feed brought news
+    rows, received = feed.take() if feed else ([], 0)
+    if st.session_state.get('stats_received') != received:
+        st.session_state['stats'] = fetch_stats()
+        st.session_state['stats_received'] = received
+    stats = st.session_state['stats']
+
+    # --- STATS ---
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total Receipts", int(stats['Receipts']) if stats else "n/a")
+    col2.metric("Processed Successfully", int(stats['Analyzed']) if stats else "n/a")
+
+    # Show user if the connection is live
+    if use_live_updates and feed.error:
+        col3.metric("System Health", "Reconnecting...")
+    elif use_live_updates:
+        col3.metric("System Health", "Live")
     else:
+        col3.metric("System Health", "Standby (Click Refresh)")
+
+    # --- LIVE FEED ---
+    if rows:
+        st.subheader("Live Feed")
+        st.caption(f"{received} receipt(s) processed since you opened the dashboard")
+        st.dataframe(ledger_view.style(ledger_view.to_frame(rows)), width=1200, hide_index=True)
+
+try:
+    # A full run (first load, a click, Manual Refresh) always re-reads the KPIs
+    st.session_state['stats'] = fetch_stats()
+    st.session_state['stats_received'] = feed.take()[1] if feed else 0
+    st.fragment(run_every=1 if use_live_updates else None)(live_panel)()
+    stats = st.session_state['stats']
+
+    # --- TABLE ---
+    st.subheader("Audit Trail")
+    c1, c2, c3, c4 = st.columns(4)
+    sort = c1.selectbox("Sort", list(SORTS))
+    show = c2.selectbox("Show", list(SHOW))
+    uploaded = c3.date_input("Uploaded between", value=[])
+    page_size = c4.selectbox("Rows per page", PAGE_SIZES, index=2)
+
+    query = {'limit': page_size, **SORTS[sort], **SHOW[show]}
+    if len(uploaded) > 0:
+        query['from'] = uploaded[0].isoformat()
+        query['to'] = uploaded[-1].isoformat()
+
+    # Cursors of the pages opened so far; a new query starts again at page 1
+    query_key = tuple(sorted(query.items()))
+    if st.session_state.get('trail_query') != query_key:
+        st.session_state['trail_query'] = query_key
+        st.session_state['trail_cursors'] = [None]
+    cursors = st.session_state['trail_cursors']
+
+    params = dict(query)
+    if cursors[-1]:
+        params['cursor'] = cursors[-1]
+    response, page = fetch_page(params)
+
+    if page is None:
         st.error(f"Failed to fetch data. API Status: {response.status_code}")
+    elif page['frame'].empty and stats and int(stats['Receipts']) == 0:
+        st.info("The ledger is currently empty. Upload a receipt above to start!")
+    else:
+        df = page['frame']
+        if df.empty and page['next_cursor']:
+            st.info("No matches in this stretch of the ledger yet. Press Next to keep searching.")
+        elif df.empty:
+            st.info("No receipts match these filters.")
+        else:
+            # Only this page is styled and sent to the browser
+            st.dataframe(ledger_view.style(df), width=1200, hide_index=True)
+
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("◀ Previous", disabled=len(cursors) == 1):
+            cursors.pop()
+            st.rerun()
+        page_col.caption(f"Page {len(cursors)}")
+        if next_col.button("Next ▶", disabled=not page['next_cursor']):
+            cursors.append(page['next_cursor'])
+            st.rerun()
+
+    # --- SEARCH ---
+    st.subheader("Search Receipts")
+    words = st.text_input("Vendor or item (every word must appear)").strip()
+    if words:
+        if st.session_state.get('search_query') != words:
+            st.session_state['search_query'] = words
+            st.session_state['search_cursors'] = [None]
+        search_cursors = st.session_state['search_cursors']
+        search_params = {'q': words, 'limit': SEARCH_PAGE_SIZE}
+        if search_cursors[-1]:
+            search_params['cursor'] = search_cursors[-1]
+        response, result = fetch_search(search_params)
+        if result is None:
+            st.error(f"Search failed. API Status: {response.status_code}")
+        elif not result['items']:
+            st.info(f"No receipt mentions \"{words}\".")
+        else:
+            st.caption(f"{result['total']} receipt(s) match, best first")
+            # The snippet around the match stands in for the 100-character preview
+            hits = [dict(hit, ExtractedText=hit.get('Snippet', '')) for hit in result['items']]
+            st.dataframe(ledger_view.style(ledger_view.to_frame(hits)), width=1200, hide_index=True)
+            prev_col, page_col, next_col = st.columns([1, 2, 1])
+            if prev_col.button("◀ Previous hits", disabled=len(search_cursors) == 1):
+                search_cursors.pop()
+                st.rerun()
+            page_col.caption(f"Page {len(search_cursors)}")
+            if next_col.button("More hits ▶", disabled=not result['next_cursor']):
+                search_cursors.append(result['next_cursor'])
+                st.rerun()
 
 except Exception as e:
     st.error(f"Connection Error: {str(e)}")
@@ -0,0 +1,142 @@
+# Receipts/second of processor.lambda_handler for different SQS batch sizes.
+# S3, OCR, SNS and DynamoDB are stubbed with fixed latencies, so the numbers show
+# how much of the I/O wait the worker pool overlaps. Then two batches carrying
+# the same flagged receipt run at once: both get past the dedup lookup, and the
+# ledger must still end up with one row, one alert and one count in /stats.
+# Last, a run that dies between the ledger write and the alert: the redelivered
+# message must still send the alert, once, and clear AlertPending.
+#
+#   python benchmarks/bench_batch.py
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import processor
+
+S3_LATENCY = 0.02
+OCR_LATENCY = 0.5
+DB_LATENCY = 0.01
+
+
+def run(batch_size, workers):
+    s3 = fakes.FakeS3(latency=S3_LATENCY)
+    table = fakes.FakeTable(latency=DB_LATENCY)
+    sns = fakes.FakeSNS(latency=DB_LATENCY)
+    records = []
+    for i in range(batch_size):
+        key = f"receipt-{i}.png"
+        s3.put_object(Bucket='bench', Key=key, Body=f"receipt {i}".encode() * 1000)
+        records.append(fakes.s3_event_record('bench', key, f"msg-{i}"))
+
+    processor._seen_hashes.clear()  # every run should pay for OCR, not hit the dedup cache
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', sns), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table, latency=DB_LATENCY)), \
+         mock.patch.object(processor.ocr_backend, 'http', fakes.FakeHttpPool(OCR_LATENCY)), \
+         mock.patch.object(processor, 'MAX_WORKERS', workers):
+        start = time.perf_counter()
+        result = processor.lambda_handler({'Records': records}, None)
+        elapsed = time.perf_counter() - start
+
+    assert not result['batchItemFailures'], result
+    assert sum(1 for item in table.items.values() if item.get('RecordType') == 'RECEIPT') == batch_size
+    return batch_size / elapsed
+
+
+def race(copies=4):
+    # The same bytes under different keys, each in its own batch, all at once
+    s3 = fakes.FakeS3(latency=S3_LATENCY)
+    table = fakes.FakeTable(latency=DB_LATENCY)
+    sns = fakes.FakeSNS(latency=DB_LATENCY)
+    body = b"the same receipt " * 1000
+    for i in range(copies):
+        s3.put_object(Bucket='bench', Key=f"copy-{i}.png", Body=body)
+    results = []
+
+    def invoke(i):
+        event = {'Records': [fakes.s3_event_record('bench', f"copy-{i}.png", f"race-{i}")]}
+        results.append(processor.lambda_handler(event, None))
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', sns), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table, latency=DB_LATENCY)), \
+         mock.patch.object(processor.ocr_backend, 'http', fakes.FakeHttpPool(OCR_LATENCY, text="PUB 9\nBeer 4.50\nTOTAL 4.50")):
+        threads = [threading.Thread(target=invoke, args=(i,)) for i in range(copies)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    rows = sum(1 for item in table.items.values() if item.get('RecordType') == 'RECEIPT')
+    alerts = sum(1 for message in sns.messages if message.get('TopicArn') == os.environ['SNS_TOPIC_ARN'])
+    counted = table.items.get('STATS#ALL', {}).get('Receipts', 0)
+    failed = sum(len(result['batchItemFailures']) for result in results)
+    ok = (rows, alerts, counted, failed) == (1, 1, 1, 0)
+    print(f"\n{copies} batches with the same receipt at once: {rows} ledger row(s), {alerts} alert(s),"
+          f" {counted} counted in /stats, {failed} failed message(s){'' if ok else '  MISMATCH'}")
+    return ok
+
+
+def crash_then_retry():
+    # The first delivery's container dies right after the ledger write
+    s3 = fakes.FakeS3(latency=S3_LATENCY)
+    table = fakes.FakeTable(latency=DB_LATENCY)
+    sns = fakes.FakeSNS(latency=DB_LATENCY)
+    s3.put_object(Bucket='bench', Key="flagged.png", Body=b"a flagged receipt " * 1000)
+    event = {'Records': [fakes.s3_event_record('bench', "flagged.png", "crash-1")]}
+
+    def crash(*args):
+        raise RuntimeError("container killed")
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', sns), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table, latency=DB_LATENCY)), \
+         mock.patch.object(processor.ocr_backend, 'http', fakes.FakeHttpPool(OCR_LATENCY, text="PUB 9\nBeer 4.50\nTOTAL 4.50")):
+        with mock.patch.object(processor, 'publish_alerts', crash):
+            try:
+                processor.lambda_handler(event, None)
+            except RuntimeError:
+                pass
+        processor._seen_hashes.clear()  # SQS redelivers to a fresh container
+        result = processor.lambda_handler(event, None)
+        again = processor.lambda_handler(event, None)
+
+    rows = [item for item in table.items.values() if item.get('RecordType') == 'RECEIPT']
+    alerts = sum(1 for message in sns.messages if message.get('TopicArn') == os.environ['SNS_TOPIC_ARN'])
+    pending = sum(1 for item in rows if processor.ALERT_PENDING in item)
+    failed = len(result['batchItemFailures']) + len(again['batchItemFailures'])
+    ok = (len(rows), alerts, pending, failed) == (1, 1, 0, 0)
+    print(f"Crash between ledger write and alert, then redelivered twice: {len(rows)} row(s), {alerts} alert(s),"
+          f" {pending} still pending, {failed} failed message(s){'' if ok else '  MISMATCH'}")
+    return ok
+
+
+if __name__ == "__main__":
+    print(f"Latency model: S3 {S3_LATENCY}s, OCR {OCR_LATENCY}s, DynamoDB {DB_LATENCY}s")
+    print(f"{'batch':>6} {'serial r/s':>12} {'pooled r/s':>12}")
+    for batch_size in (1, 10, 100):
+        serial = run(batch_size, workers=1)
+        pooled = run(batch_size, workers=processor.MAX_WORKERS)
+        print(f"{batch_size:>6} {serial:>12.1f} {pooled:>12.1f}")
+    if not (race() & crash_then_retry()):
+        sys.exit(1)
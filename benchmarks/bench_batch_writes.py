@@ -0,0 +1,121 @@
+# Serial PutItem + SNS publish per receipt (old) against conditional PutItems
+# WRITE_WORKERS at a time + one alert digest per 25 receipts (new), for a burst
+# of flagged receipts, on moto. Then the same burst is written again from two
+# threads at once: every receipt must be inserted exactly once, and a receipt
+# whose alert fails must be taken back out of the ledger.
+#
+#   pip install -r requirements-dev.txt
+#   python benchmarks/bench_batch_writes.py
+#
+# moto answers in-process, so wall time here is mostly botocore request
+# overhead. The "at 15 ms RTT" column adds a typical in-region round trip per
+# call, or per round of WRITE_WORKERS parallel puts.
+import math
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+
+import boto3
+from moto import mock_aws
+
+BURSTS = (10, 200, 1000)
+RTT = 0.015
+
+
+def flagged_items(n, tag):
+    return [{
+        'ReceiptID': f"{tag}-{i:06d}",
+        'RecordType': 'RECEIPT',
+        'Filename': f"receipt-{i}.png",
+        'UploadDate': '2025-03-31T23:59:00',
+        'UpdatedAt': '2025-03-31T23:59:00',
+        'Status': 'Analyzed',
+        'ExtractedText': "ROYAL CASINO chips 5000.00...",
+        'RiskScore': 50,
+        'RiskFlags': ["Suspicious Item: casino"],
+    } for i in range(n)]
+
+
+def old_path(processor, topic_arn, items):
+    for item in items:
+        processor.sns.publish(TopicArn=topic_arn, Message=str(item), Subject="BILL-E ALERT")
+        processor.table.put_item(Item=item)
+    return 2 * len(items)
+
+
+def new_path(processor, topic_arn, items):
+    # -> (calls, round trips: the puts overlap WRITE_WORKERS at a time)
+    outcomes = processor.write_ledger(processor.table, items)
+    assert set(outcomes.values()) == {'inserted'}, outcomes
+    assert not processor.publish_alerts(processor.sns, topic_arn, items)
+    digests = math.ceil(len(items) / processor.ALERTS_PER_MESSAGE)
+    return len(items) + digests, math.ceil(len(items) / processor.WRITE_WORKERS) + digests
+
+
+def check_idempotent(processor, n):
+    # Two writers racing with the same burst: each receipt is inserted once
+    items = flagged_items(n, "race")
+    outcomes = []
+    threads = [threading.Thread(target=lambda: outcomes.append(processor.write_ledger(processor.table, items)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    inserted = sum(1 for result in outcomes for outcome in result.values() if outcome == 'inserted')
+    duplicates = sum(1 for result in outcomes for outcome in result.values() if outcome == 'duplicate')
+
+    # A failed alert takes its own row back, and only its own
+    lost = items[0]
+    other = dict(items[1], UpdatedAt='2025-04-01T00:00:00')
+    kept = processor.take_back(processor.table, [lost, other])
+    gone = 'Item' not in processor.table.get_item(Key={'ReceiptID': lost['ReceiptID']})
+    ok = inserted == n and duplicates == n and gone and kept == [other['ReceiptID']]
+    return ok, (f"race: {n} receipts written twice at once -> {inserted} inserted, {duplicates} duplicates;"
+                f" take-back removed its row: {gone}, left a newer one alone: {kept == [other['ReceiptID']]}"
+                f"{'' if ok else '  MISMATCH'}")
+
+
+if __name__ == "__main__":
+    with mock_aws():
+        boto3.client('dynamodb').create_table(
+            TableName=os.environ['TABLE_NAME'],
+            KeySchema=[{'AttributeName': 'ReceiptID', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'ReceiptID', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        topic_arn = boto3.client('sns').create_topic(Name='bill-e-high-risk-alerts')['TopicArn']
+        os.environ['SNS_TOPIC_ARN'] = topic_arn
+
+        import processor  # clients must be created inside the mock
+        from unittest import mock
+
+        print(f"{'burst':>6} {'old calls':>10} {'old s':>7} {'at 15ms RTT':>12} {'new calls':>10} {'new s':>7} {'at 15ms RTT':>12}")
+        with mock.patch('builtins.print'):
+            rows = []
+            for n in BURSTS:
+                start = time.perf_counter()
+                old_calls = old_path(processor, topic_arn, flagged_items(n, f"old{n}"))
+                old_s = time.perf_counter() - start
+                start = time.perf_counter()
+                new_calls, round_trips = new_path(processor, topic_arn, flagged_items(n, f"new{n}"))
+                new_s = time.perf_counter() - start
+                rows.append((n, old_calls, old_s, new_calls, new_s, round_trips))
+            ok, race = check_idempotent(processor, 200)
+        for n, old_calls, old_s, new_calls, new_s, round_trips in rows:
+            print(f"{n:>6} {old_calls:>10} {old_s:>7.2f} {old_s + old_calls * RTT:>12.2f} "
+                  f"{new_calls:>10} {new_s:>7.2f} {new_s + round_trips * RTT:>12.2f}")
+
+        count = boto3.client('dynamodb').scan(TableName=os.environ['TABLE_NAME'], Select='COUNT')['Count']
+        print(race)
+        print(f"rows written: {count} (expected {2 * sum(BURSTS) + 199})")
+        if not ok or count != 2 * sum(BURSTS) + 199:
+            sys.exit(1)
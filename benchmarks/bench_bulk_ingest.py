@@ -0,0 +1,130 @@
+# tools/bulk_ingest.py against the Legacy_v1 scripts it replaces, on moto:
+# serial upload_file per receipt vs concurrent hashed/deduped/multipart upload,
+# a resumed re-run, and serial put_item (seed_data.py) vs batched seeding.
+# Exits 1 if the seeded rows don't carry the Total /stats adds up, or if
+# seed_data.py's rows lack the fields Legacy_v1/dashboard.py reads.
+#
+#   pip install -r requirements-dev.txt
+#   python benchmarks/bench_bulk_ingest.py
+#
+# moto answers in-process, so every AWS request gets RTT seconds of sleep to
+# stand in for the network round trip.
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+
+import boto3
+from moto import mock_aws
+from unittest import mock
+
+import bulk_ingest
+import rollups
+from Legacy_v1 import seed_data
+
+BUCKET = 'bill-e-bench'
+TABLE = 'BillE_Expenses'
+SMALL_FILES = 1000
+SMALL_SIZE = 64 * 1024
+LARGE_FILES = 4
+LARGE_SIZE = 32 * 1024 * 1024
+SEED_ROWS = 20000
+SERIAL_SEED_ROWS = 1000
+RTT = 0.015
+V1_COLUMNS = {'ReceiptID', 'Date', 'Merchant', 'Total', 'RiskStatus', 'RiskFlags'}  # Legacy_v1/dashboard.py
+
+
+def with_rtt(client):
+    client.meta.events.register('before-send', lambda **kwargs: time.sleep(RTT))
+    return client
+
+
+def make_receipts(root):
+    for i in range(SMALL_FILES):
+        with open(os.path.join(root, f"receipt-{i:05d}.png"), 'wb') as f:
+            f.write(os.urandom(SMALL_SIZE))
+    for i in range(LARGE_FILES):
+        with open(os.path.join(root, f"scan-{i}.pdf"), 'wb') as f:
+            f.write(os.urandom(LARGE_SIZE))
+    # A few exact copies under another name: skipped by hash
+    for i in range(10):
+        with open(os.path.join(root, f"receipt-{i:05d}.png"), 'rb') as src, \
+                open(os.path.join(root, f"copy-{i}.png"), 'wb') as dst:
+            dst.write(src.read())
+
+
+if __name__ == "__main__":
+    with mock_aws(), tempfile.TemporaryDirectory() as root:
+        s3 = with_rtt(boto3.client('s3'))
+        s3.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={'LocationConstraint': 'ap-south-1'})
+        boto3.client('dynamodb').create_table(
+            TableName=TABLE,
+            KeySchema=[{'AttributeName': 'ReceiptID', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'ReceiptID', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        dynamodb = boto3.resource('dynamodb')
+        with_rtt(dynamodb.meta.client)
+        make_receipts(root)
+        sources = bulk_ingest.list_sources(root, 'bench/')
+        total_mb = sum(os.path.getsize(path) for path, _ in sources) / bulk_ingest.MB
+
+        # 1. Legacy: one upload_file at a time
+        start = time.perf_counter()
+        for path, key in sources:
+            s3.upload_file(path, BUCKET, 'legacy/' + key)
+        legacy = time.perf_counter() - start
+
+        # 2. Bulk: concurrent, deduped, multipart; then the same run again
+        state = os.path.join(root, 'state.jsonl')
+        with mock.patch('builtins.print'):
+            first = bulk_ingest.upload(s3, dynamodb, sources, BUCKET, TABLE, state, workers=16)
+            again = bulk_ingest.upload(s3, dynamodb, sources, BUCKET, TABLE, state, workers=16)
+
+        print(f"{len(sources)} files, {total_mb:,.0f} MB, {RTT * 1000:.0f} ms per request")
+        print(f"{'upload':<22} {'seconds':>8} {'files/s':>8} {'MB/s':>7}")
+        print(f"{'serial (upload.py)':<22} {legacy:>8.1f} {len(sources) / legacy:>8.1f} {total_mb / legacy:>7.1f}")
+        print(f"{'bulk_ingest, 16 wkrs':<22} {first['seconds']:>8.1f} {len(sources) / first['seconds']:>8.1f} "
+              f"{total_mb / first['seconds']:>7.1f}")
+        print(f"  uploaded {first['files']}, skipped {first['skipped']} duplicate(s); "
+              f"re-run: {again['resumed']} resumed, {again['files']} uploaded in {again['seconds']:.2f}s")
+
+        # 3. Seeding: serial put_item against batched writers
+        table = dynamodb.Table(TABLE)
+        engine = bulk_ingest.RiskEngine()
+        start = time.perf_counter()
+        # (rows past the seeded range, which seed() would otherwise skip as already written)
+        for i in range(SEED_ROWS, SEED_ROWS + SERIAL_SEED_ROWS):
+            table.put_item(Item=bulk_ingest.synthetic_row(i, engine))
+        serial_rate = SERIAL_SEED_ROWS / (time.perf_counter() - start)
+        with mock.patch('builtins.print'):
+            seconds = bulk_ingest.seed(dynamodb, table, SEED_ROWS, workers=8, engine=engine)
+        print(f"{'seed':<22} {'rows/s':>8}")
+        print(f"{'serial put_item':<22} {serial_rate:>8,.0f}")
+        print(f"{'batched, 8 workers':<22} {SEED_ROWS / seconds:>8,.0f}")
+        pages = boto3.client('dynamodb').get_paginator('scan').paginate(
+            TableName=TABLE, Select='COUNT', FilterExpression='attribute_exists(RecordType)')
+        count = sum(page['Count'] for page in pages)
+        print(f"rows in ledger: {count:,} (expected {SEED_ROWS + SERIAL_SEED_ROWS:,})")
+
+        # 4. Seeded rows are parsed like the processor's, so /stats has their spend
+        # (only seed() updates the rollups, not the serial put_items above)
+        stats = rollups.read_stats(dynamodb, table, days=1)
+        spend = sum(bulk_ingest.synthetic_row(i, engine)['Total'] for i in range(SEED_ROWS))
+        print(f"/stats Spend {stats['Spend']:,} (expected {spend:,}), {len(stats['TopReceipts'])} top receipts")
+        failed = stats['Spend'] != spend or not stats['TopReceipts']
+
+        # 5. The v1 seed keeps the v1 schema, with no processor rows or rollups
+        v1 = [seed_data.mock_record(i) for i in range(20)]
+        v1_ok = all(V1_COLUMNS <= set(item) and 'RecordType' not in item and float(item['Total']) > 0 for item in v1)
+        print(f"seed_data.py rows with the v1 dashboard's columns: {'yes' if v1_ok else 'NO'}")
+        if failed or not v1_ok:
+            sys.exit(1)
@@ -0,0 +1,162 @@
+# Cold-start vs warm-start cost of the processor, and where the per-call
+# overhead went before clients moved to module scope.
+#
+#   python benchmarks/bench_coldstart.py [--https https://api.ocr.space/parse/image]
+#
+# 1. Cold start: a fresh interpreter imports processor (boto3 + clients + OCR
+#    pool) and handles one receipt; the warm calls that follow reuse everything.
+# 2. Client setup that every invocation used to pay: boto3 s3/dynamodb/sns.
+# 3. OCR connection: a new connection per request (old urllib) vs the
+#    keep-alive pool, against the fake OCR server over HTTP and HTTPS
+#    (self-signed, needs the openssl CLI) and optionally a real HTTPS URL.
+import argparse
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:ap-south-1:000000000000:bench')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+
+WARM_CALLS = 20
+
+
+def ms(seconds):
+    return f"{seconds * 1000:8.1f} ms"
+
+
+def invocation_child():
+    # Runs in a fresh interpreter: import + first call + warm calls
+    start = time.perf_counter()
+    import processor
+    import fakes
+    import_time = time.perf_counter() - start
+
+    s3, table = fakes.FakeS3(), fakes.FakeTable()
+    processor.s3, processor.table, processor.sns = s3, table, fakes.FakeSNS()
+    processor.dynamodb = fakes.FakeDynamoDB(table)
+    processor.ocr_backend.http = fakes.FakeHttpPool()
+    timings = []
+    for i in range(WARM_CALLS + 1):
+        s3.put_object(Bucket='bench', Key=f"r{i}.png", Body=f"receipt {i}".encode())
+        event = {'Records': [fakes.s3_event_record('bench', f"r{i}.png", f"m{i}")]}
+        start = time.perf_counter()
+        processor.lambda_handler(event, None)
+        timings.append(time.perf_counter() - start)
+    print('RESULT', import_time, timings[0], statistics.median(timings[1:]), file=sys.stderr)
+
+
+def client_setup():
+    import boto3
+    boto3.client('s3')  # first one loads botocore's data files; not per-invocation cost
+    rows = {}
+    for name, build in (
+        ('s3 client', lambda: boto3.client('s3')),
+        ('dynamodb resource + Table', lambda: boto3.resource('dynamodb').Table('BillE_Expenses')),
+        ('sns client', lambda: boto3.client('sns')),
+    ):
+        samples = []
+        for _ in range(10):
+            start = time.perf_counter()
+            build()
+            samples.append(time.perf_counter() - start)
+        rows[name] = statistics.median(samples)
+    return rows
+
+
+def self_signed_cert(directory):
+    if not shutil.which('openssl'):
+        return None, None
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', cert],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+def connection_cost(url, post=True, verify=True):
+    import urllib3
+    body = b'--x\r\nContent-Disposition: form-data; name="file"; filename="a.png"\r\n\r\nhi\r\n--x--\r\n'
+    headers = {'Content-Type': 'multipart/form-data; boundary=x'}
+    context = None if verify else ssl._create_unverified_context()
+
+    def fresh():
+        req = urllib.request.Request(url, data=body if post else None, headers=headers)
+        with urllib.request.urlopen(req, context=context) as f:
+            f.read()
+
+    pool = urllib3.PoolManager(maxsize=1, cert_reqs='CERT_REQUIRED' if verify else 'CERT_NONE')
+    if not verify:
+        urllib3.disable_warnings()
+
+    def pooled():
+        pool.urlopen('POST' if post else 'GET', url, body=body if post else None, headers=headers).data
+
+    pooled()  # open the connection once, as the first receipt of a container would
+    results = {}
+    for name, fn in (('new connection', fresh), ('keep-alive pool', pooled)):
+        samples = []
+        for _ in range(10):
+            start = time.perf_counter()
+            try:
+                fn()
+            except Exception:
+                pass  # only the round trip matters, not the answer
+            samples.append(time.perf_counter() - start)
+        results[name] = statistics.median(samples)
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['--child']:
+        invocation_child()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--https', help="real HTTPS endpoint to time TLS handshakes against")
+    args = parser.parse_args()
+
+    out = subprocess.run([sys.executable, __file__, '--child'], capture_output=True, text=True, check=True)
+    import_time, first, warm = (float(x) for x in out.stderr.split('RESULT')[1].split())
+    print("1. Processor invocation")
+    print(f"   import (clients, OCR pool)  {ms(import_time)}")
+    print(f"   first invocation           {ms(first)}")
+    print(f"   warm invocation (median)   {ms(warm)}")
+
+    print("2. Client setup the old handler paid on every invocation")
+    setup = client_setup()
+    for name, seconds in setup.items():
+        print(f"   {name:<27}{ms(seconds)}")
+    print(f"   {'total':<27}{ms(sum(setup.values()))}")
+
+    print("3. OCR request, new connection vs keep-alive")
+    import fake_ocr_server
+    servers = []
+    server, url = fake_ocr_server.start_server()
+    servers.append(server)
+    targets = [('fake OCR, http loopback', url, True, True)]
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = self_signed_cert(tmp)
+        if cert:
+            server, url = fake_ocr_server.start_server(certfile=cert, keyfile=key)
+            servers.append(server)
+            targets.append(('fake OCR, https loopback', url, True, False))
+        if args.https:
+            targets.append((args.https, args.https, False, True))
+        for label, target, post, verify in targets:
+            costs = connection_cost(target, post, verify)
+            print(f"   {label}")
+            for name, seconds in costs.items():
+                print(f"     {name:<25}{ms(seconds)}")
+    for server in servers:
+        server.shutdown()
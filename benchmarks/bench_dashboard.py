@@ -0,0 +1,128 @@
+# Render time of the Audit Trail at 1k / 50k / 500k ledger rows: the old
+# dashboard (whole ledger in one DataFrame, styled with a per-row Styler
+# callback) against one server-side page styled with ledger_view's vectorized
+# highlight.
+#
+# Streamlit isn't needed: "render" is the work st.dataframe does before
+# anything reaches the browser. Its Styler marshalling runs Styler._compute()
+# and Styler._translate(), and the frame itself is serialized with Arrow IPC.
+#
+#   python benchmarks/bench_dashboard.py
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+
+import pandas as pd
+import pyarrow as pa
+
+import fakes
+import ledger_view
+import read_cache
+import reader
+
+SIZES = (1_000, 50_000, 500_000)
+PAGE_SIZE = 100
+
+
+def ledger_items(n):
+    rng = random.Random(n)
+    start = datetime.datetime(2025, 1, 1)
+    items = []
+    for i in range(n):
+        risk = rng.choice((0, 0, 0, 30, 50, 100))
+        stamp = (start + datetime.timedelta(seconds=i)).isoformat()
+        items.append({
+            'ReceiptID': f"{i:064x}",
+            'RecordType': 'RECEIPT',
+            'Filename': f"receipt-{i}.png",
+            'Merchant': "CITY MART",
+            'Total': str(rng.randint(100, 500000) / 100),
+            'UploadDate': stamp,
+            'UpdatedAt': stamp,
+            'Status': 'Analyzed',
+            'ExtractedText': "CITY MART Milk 2.50 TOTAL 2.50...",
+            'RiskScore': risk,
+            'RiskFlags': ["Suspicious Item: beer"] if risk else [],
+        })
+    return items
+
+
+def render(styler):
+    # What st.dataframe does with a Styler before sending it
+    styler._compute()
+    styler._translate(False, False)
+    sink = pa.BufferOutputStream()
+    table = pa.Table.from_pandas(styler.data)
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().size
+
+
+# --- BEFORE: the whole ledger, row-wise Styler ---
+def old_dashboard(items):
+    df = pd.DataFrame(items)
+    expected_cols = ['Filename', 'RiskScore', 'RiskFlags', 'ExtractedText', 'Status', 'UploadDate']
+    df = df[[c for c in expected_cols if c in df.columns]]
+    df['RiskScore'] = pd.to_numeric(df['RiskScore'], errors='coerce').fillna(0)
+
+    def highlight_risk(row):
+        if 'RiskScore' in row and row['RiskScore'] > 0:
+            return ['background-color: #ffcccc'] * len(row)
+        return [''] * len(row)
+
+    return render(df.style.apply(highlight_risk, axis=1))
+
+
+# --- AFTER: one page from the reader, vectorized highlight ---
+def new_dashboard(table, params):
+    with mock.patch.object(reader, 'table', table), mock.patch.object(read_cache, 'ENABLED', False), \
+         mock.patch('builtins.print'):
+        response = reader.lambda_handler({'queryStringParameters': params}, None)
+    page = json.loads(response['body'])
+    return render(ledger_view.style(ledger_view.to_frame(page['items'])))
+
+
+def best_ms(fn, *args, rounds=3):
+    best, result = float('inf'), None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audit Trail render time")
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'full ledger ms':>15} {'sent KB':>9} {'page ms':>9} {'risk page ms':>13} {'sent KB':>9}"
+          f" {'vectorized css ms':>18} {'row-wise css ms':>16}")
+    for n in args.sizes:
+        items = ledger_items(n)
+        table = fakes.FakeTable()
+        table.items.update((item['ReceiptID'], item) for item in items)
+
+        old_ms, old_bytes = best_ms(old_dashboard, items, rounds=1 if n > 100_000 else 3)
+        page_ms, page_bytes = best_ms(new_dashboard, table, {'limit': str(PAGE_SIZE)})
+        risk_ms, _ = best_ms(new_dashboard, table, {'limit': str(PAGE_SIZE), 'sort': 'risk', 'min_risk': '1'})
+
+        # The highlight alone, over the whole frame
+        frame = ledger_view.to_frame(items)
+        css_ms, _ = best_ms(ledger_view.highlight_styles, frame)
+        row_ms, _ = best_ms(lambda df: df.apply(
+            lambda row: ['background-color: #ffcccc' if row['RiskScore'] > 0 else ''] * len(row), axis=1), frame,
+            rounds=1)
+        print(f"{n:>9} {old_ms:>15.1f} {old_bytes / 1024:>9.0f} {page_ms:>9.1f} {risk_ms:>13.1f}"
+              f" {page_bytes / 1024:>9.0f} {css_ms:>18.1f} {row_ms:>16.1f}")
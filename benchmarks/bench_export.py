@@ -0,0 +1,190 @@
+# Parquet export (tools/export_parquet.py) at 10k / 100k / 1M ledger rows:
+# full and incremental export throughput, and two history queries answered
+# from the partitioned export against a DynamoDB Scan into pandas (what
+# Legacy_v1/dashboard.py and every ad-hoc analysis did before).
+#
+#   flagged-7d   flagged spend by merchant over the last 7 upload days
+#   monthly      spend per upload month over the whole ledger
+#
+# The ledger is a fakes.FakeTable (--latency per 1 MB page); the export goes to
+# a temporary directory and is read memory-mapped.
+# Exits non-zero if the export (after an incremental run with rescored and new
+# receipts) does not match the table. Some receipts carry a Date that doesn't
+# exist (stored before the extractor checked them); they must be exported with
+# a null Date rather than stop the export.
+#
+#   python benchmarks/bench_export.py --sizes 100000
+import argparse
+import datetime
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from boto3.dynamodb.conditions import Attr
+
+import fakes
+import export_parquet
+
+SIZES = (10_000, 100_000, 1_000_000)
+MERCHANTS = ["CITY MART", "The Leela Palace", "Starbucks Coffee", "Royal Casino", "Apollo Pharmacy"]
+DAYS = 365
+START = datetime.datetime(2025, 1, 1)
+BAD_DATE_EVERY = 1000
+
+
+def receipt(i, rng):
+    uploaded = START + datetime.timedelta(seconds=rng.randrange(DAYS * 86400))
+    risk = rng.choice((0, 0, 0, 30, 50, 100))
+    amount = Decimal(rng.randint(100, 500000)) / 100
+    return {
+        'ReceiptID': f"{i:064x}",
+        'RecordType': 'RECEIPT',
+        'Filename': f"receipt-{i}.png",
+        'UploadDate': uploaded.isoformat(),
+        'UpdatedAt': uploaded.isoformat(),
+        'Status': 'Analyzed',
+        'Merchant': rng.choice(MERCHANTS),
+        'Date': uploaded.date().isoformat(),
+        'Total': amount,
+        'Currency': 'INR',
+        'LineItems': [{'Description': "Coffee", 'Quantity': 1, 'Amount': amount}],
+        'ExtractedText': "CITY MART Milk 2.50 TOTAL 2.50...",
+        'RiskScore': risk,
+        'RiskFlags': ["Suspicious Item: beer"] if risk else [],
+    }
+
+
+def build_table(n, latency):
+    table = fakes.FakeTable(latency=latency)
+    rng = random.Random(n)
+    for i in range(n):
+        item = receipt(i, rng)
+        if i % BAD_DATE_EVERY == 0:
+            item['Date'] = '2024-02-31'
+        table.items[item['ReceiptID']] = item
+    return table
+
+
+def change_ledger(table, n, stamp):
+    # 1% rescored (score and UpdatedAt change) and 1% new receipts
+    rng = random.Random(-n)
+    for key in rng.sample(sorted(table.items), max(1, n // 100)):
+        item = dict(table.items[key])
+        item['RiskScore'] = 0 if item['RiskScore'] else 75
+        item['RiskFlags'] = [] if item['RiskScore'] == 0 else ["Rescored"]
+        item['UpdatedAt'] = stamp
+        table.put_item(Item=item)
+    for i in range(n, n + max(1, n // 100)):
+        item = receipt(i, rng)
+        item['UpdatedAt'] = stamp
+        table.put_item(Item=item)
+
+
+# --- QUERIES ---
+def scan_frame(table, condition, columns):
+    items, kwargs, units = [], {'FilterExpression': condition, 'ReturnConsumedCapacity': 'TOTAL'}, 0.0
+    while True:
+        response = table.scan(**kwargs)
+        items.extend({name: item.get(name) for name in columns} for item in response['Items'])
+        units += response['ConsumedCapacity']['CapacityUnits']
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    frame = pd.DataFrame(items, columns=columns)
+    frame['Total'] = pd.to_numeric(frame['Total'])
+    return frame, units
+
+
+def flagged_week_scan(table, since):
+    condition = Attr('RecordType').eq('RECEIPT') & Attr('RiskScore').gt(0) & Attr('UploadDate').gte(since)
+    frame, units = scan_frame(table, condition, ['Merchant', 'Total'])
+    return frame.groupby('Merchant')['Total'].sum().round(2), units
+
+
+def flagged_week_export(store, since):
+    condition = ((pc.field('risk') == 'flagged') & (pc.field('upload_month') >= since[:7])
+                 & (pc.field('UploadDate') >= pa.scalar(datetime.datetime.fromisoformat(since), pa.timestamp('us'))))
+    frame = export_parquet.read_export(store, ['Merchant', 'Total'], condition).to_pandas()
+    return frame.groupby('Merchant')['Total'].sum().round(2), 0.0
+
+
+def monthly_scan(table):
+    frame, units = scan_frame(table, Attr('RecordType').eq('RECEIPT'), ['UploadDate', 'Total'])
+    return frame.groupby(frame['UploadDate'].str[:7])['Total'].sum().round(2), units
+
+
+def monthly_export(store):
+    frame = export_parquet.read_export(store, ['upload_month', 'Total']).to_pandas()
+    return frame.groupby('upload_month')['Total'].sum().round(2), 0.0
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def same(a, b):
+    return a.index.equals(b.index) and ((a - b).abs() < 0.01).all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parquet export throughput and query latency")
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES)
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per DynamoDB page")
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'rows':>9} {'full s':>7} {'rows/s':>9} {'MB':>6} {'incr rows':>10} {'incr s':>7}"
+          f" | {'query':<11} {'scan ms':>9} {'scan RCU':>9} {'parquet ms':>11} match")
+    for n in args.sizes:
+        table = build_table(n, args.latency)
+        root = tempfile.mkdtemp(prefix='bill-e-export-')
+        store = export_parquet.LocalStore(root)
+        now = START + datetime.timedelta(days=DAYS + 1)  # every receipt is past the settle window
+        try:
+            with redirect_stdout(io.StringIO()):
+                full = export_parquet.export(table, store, segments=args.segments, now=now)
+                change_ledger(table, n, (now - datetime.timedelta(seconds=200)).isoformat())
+                incremental = export_parquet.export(table, store, now=now + datetime.timedelta(seconds=200))
+
+            # The export, newest copies only, must be the table
+            exported = export_parquet.read_export(store, ['ReceiptID', 'RiskScore', 'Total', 'Date']).to_pandas()
+            expected = {key: item for key, item in table.items.items() if item.get('RecordType') == 'RECEIPT'}
+            scores = dict(zip(exported['ReceiptID'], exported['RiskScore']))
+            bad_dates = sum(1 for item in expected.values() if item.get('Date') == '2024-02-31')
+            ok = ok and len(exported) == len(expected) and all(
+                scores.get(key) == item['RiskScore'] for key, item in expected.items())
+            ok = ok and bad_dates and exported['Date'].isna().sum() == bad_dates
+
+            since = (START + datetime.timedelta(days=DAYS - 7)).date().isoformat()
+            queries = [
+                ('flagged-7d', (flagged_week_scan, table, since), (flagged_week_export, store, since)),
+                ('monthly', (monthly_scan, table), (monthly_export, store)),
+            ]
+            for row, (name, scan, parquet) in enumerate(queries):
+                (scan_result, units), scan_ms = timed(*scan)
+                (parquet_result, _), parquet_ms = timed(*parquet)
+                match = same(scan_result, parquet_result)
+                ok = ok and match
+                prefix = (f"{n:>9} {full['seconds']:>7.1f} {n / full['seconds']:>9,.0f} {full['bytes'] / 1e6:>6.1f}"
+                          f" {incremental['rows']:>10,} {incremental['seconds']:>7.2f}") if row == 0 else ' ' * 53
+                print(f"{prefix} | {name:<11} {scan_ms:>9.1f} {units:>9,.0f} {parquet_ms:>11.1f} {match}")
+        finally:
+            shutil.rmtree(root)
+
+    if not ok:
+        sys.exit("The Parquet export does not match the ledger")
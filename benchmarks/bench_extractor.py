@@ -0,0 +1,377 @@
+# Accuracy and texts/second for lambda/extractor.py, against the multi-pass
+# Legacy_v1 extract_financials it replaces, on two corpora: synthetic receipts
+# generated here (every field labelled) and OCR_RECEIPTS, real-world OCR texts
+# with hand-read Totals and Dates.
+# Exits non-zero if the extractor's accuracy on any synthetic field drops below
+# MIN_ACCURACY, on OCR_RECEIPTS below MIN_OCR_ACCURACY, or if store / terminal /
+# card numbers on NOISE_RECEIPTS are read as money.
+#
+#   python benchmarks/bench_extractor.py
+import os
+import random
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from extractor import extract
+
+CORPUS = 3000
+MIN_ACCURACY = 0.95
+MIN_OCR_ACCURACY = {'Total': 1.0, 'Date': 0.9}
+IMPOSSIBLE_DATES = ("31/02/2024", "29-02-2023", "2024-04-31", "31-31-2024", "00/01/2024")
+# Lines with a number that is an ID, not an amount: (text, Total, item descriptions)
+NOISE_RECEIPTS = [
+    ("SHOP\nStore #1234\nMilk 2.50\nTOTAL 2.50", Decimal('2.50'), ['Milk']),
+    ("SHOP\nMilk 2.50\nVISA **** 4321", Decimal('2.50'), ['Milk']),
+    ("SHOP\nMilk 2.50\nCard No XXXXXXXXXXXX4321", Decimal('2.50'), ['Milk']),
+    ("SHOP\nBread 3.10\n**** **** **** 4321", Decimal('3.10'), ['Bread']),
+    ("WALGREENS\n#4411 Main St\nBread 3.10", Decimal('3.10'), ['Bread']),
+    ("SHOP\nTerminal ID: 88213\nPOS 7  Lane 3\nCoffee 120", Decimal('120'), ['Coffee']),
+    ("SHOP\nTable 12   Cashier 4\nAuth Code 551234\nTea 40.00\nMastercard 40.00", Decimal('40.00'), ['Tea']),
+]
+
+# Real-world receipt texts as OCR hands them back (spacing, capitals, store /
+# terminal / card lines kept), with the Total and Date read off each one by hand:
+# (text, Total, Date). Unlike the synthetic corpus these aren't generated from
+# the extractor's own templates.
+OCR_RECEIPTS = [
+    ("""WAL*MART
+Save money. Live better.
+( 972 ) 555 - 0142
+MANAGER DANA SMITH
+1200 N CENTRAL EXPY
+PLANO TX 75074
+ST# 05487 OP# 009044 TE# 44 TR# 01301
+BANANAS 000000004011 F 1.24
+MILK 2% 007874235186 F 3.48
+BREAD 007225003712 F 2.50
+SUBTOTAL 7.22
+TAX 1 8.250 % 0.00
+TOTAL 7.22
+VISA TEND 7.22
+ACCOUNT # **** **** **** 1234 S
+APPROVAL # 012345
+REF # 123456789012
+TERMINAL # SC010203
+CHANGE DUE 0.00
+# ITEMS SOLD 3
+TC# 1234 5678 9012 3456 7890
+03/14/2024 14:22:05""", Decimal('7.22'), '2024-03-14'),
+    ("""HOTEL SARAVANA BHAVAN
+No. 12, T.Nagar, Chennai - 600017
+GSTIN: 33AAACH1234F1Z5
+Ph: 044-24345678
+Bill No: 4521      Table: 7
+Date: 05/01/2025   Time: 13:42
+Cashier: Ravi      Steward: 12
+--------------------------------
+Item            Qty   Rate   Amt
+Masala Dosa      2    90.00  180.00
+Filter Coffee    2    35.00   70.00
+Mini Meals       1   150.00  150.00
+--------------------------------
+Sub Total                    400.00
+CGST @2.5%                    10.00
+SGST @2.5%                    10.00
+Round Off                      0.00
+Grand Total                  420.00
+--------------------------------
+UPI Ref No: 501234567890
+Thank You! Visit Again""", Decimal('420.00'), '2025-01-05'),
+    ("""TESCO
+Express
+Store 2871
+0345 677 9876
+MILK SEMI SKIMMED 2PT      £1.25
+HOVIS WHOLEMEAL            £1.40
+BANANAS LOOSE
+0.845 kg @ £0.79/kg        £0.67
+----------------------------
+TOTAL                      £3.32
+CONTACTLESS DEBIT          £3.32
+MASTERCARD
+**** **** **** 6612
+AUTH CODE: 834511
+MERCHANT: 2104561
+CHANGE DUE                 £0.00
+3 ITEMS   12/06/2024 18:03  2871 011 1234 5678""", Decimal('3.32'), '2024-06-12'),
+    ("""SHELL
+STATION #10442
+1820 W MAIN ST
+TERMINAL ID: 00912345
+PUMP# 06
+REGULAR UNL
+GALLONS 10.512
+PRICE/GAL $3.459
+FUEL SALE $36.36
+TOTAL $36.36
+DEBIT **** 7788
+AUTH #: 093211
+02/28/2024 07:41 AM""", Decimal('36.36'), '2024-02-28'),
+    ("""APOLLO PHARMACY
+Store Code: APL-1123
+D.No 45-6-7, MG Road
+Inv No: AP/23-24/009812   Dt: 17-11-2023
+Paracetamol 500mg 1x15    Rs. 30.00
+Cetirizine 10mg 1x10      Rs. 18.50
+Taxable Amt               Rs. 43.30
+CGST 6%                   Rs. 2.60
+SGST 6%                   Rs. 2.60
+Net Amount                Rs. 48.50
+Paid by: UPI""", Decimal('48.50'), '2023-11-17'),
+    ("""BLUE TOKAI COFFEE ROASTERS
+Store #: 14
+Terminal: T2   Order #0457
+Cappuccino            220.00
+Almond Croissant      180.00
+Total                 400.00
+VISA XXXXXXXXXXXX4417  400.00
+Date 09.08.2024""", Decimal('400.00'), '2024-08-09'),
+    ("""THE LEELA PALACE
+Room Service - Room 1204
+Guest: Mr. S Kumar
+Date: 2024-12-31
+Club Sandwich         1,250.00
+Fresh Lime Soda         350.00
+Service Charge 10%      160.00
+Subtotal              1,760.00
+CGST 9%                 158.40
+SGST 9%                 158.40
+Total Due             2,076.80
+Amount Tendered       2,100.00
+Change                   23.20""", Decimal('2076.80'), '2024-12-31'),
+    # A US date that also reads day first (1 July): the one miss MIN_OCR_ACCURACY allows
+    ("""WALGREENS #4411
+3401 W ARMITAGE AVE
+CHICAGO, IL 60647
+773-227-0322
+1 ADVIL 24CT          8.99
+1 CROWN POINT WTR      1.29
+SUBTOTAL              10.28
+SALES TAX A=10.25%     1.05
+TOTAL                 11.33
+MASTERCARD ACCT#  XXXXXXXXXXXX9921
+AUTH CODE 55123Z
+RFN#: 0441-5530-1122-7710
+01/07/2025 10:15 AM 4411 03 0722 3382""", Decimal('11.33'), '2025-01-07'),
+    ("""CORNER BAR & GRILL
+Table 12   Cashier 4   Guests 2
+Server: Mike
+Chk 3421
+2 Draft Beer          14.00
+1 Wings               11.50
+1 Nachos               9.75
+Subtotal              35.25
+Tax                    2.91
+Amount Due            38.16
+Tip                    7.00
+Total                 45.16
+Visa ************5566
+Auth Code 551234
+11/23/2024 21:47""", Decimal('45.16'), '2024-11-23'),
+    ("""DMART
+AVENUE SUPERMARTS LTD
+Store Code: 0143  POS: 07
+Bill No: 014307/2405/00811
+Date:14/05/2024 Time:19:32
+Toor Dal 1kg          142.00
+Sunflower Oil 1L      135.00
+2 x Parle-G 250g       50.00
+Items: 4   Qty: 4
+Total Amount:         327.00
+Card Paid             327.00
+Saved Rs. 41.00 on MRP""", Decimal('327.00'), '2024-05-14'),
+]
+
+MERCHANTS = ["CITY MART", "The Leela Palace", "Starbucks Coffee", "Royal Casino", "Corner Bar & Grill",
+             "Apollo Pharmacy", "Tesco Express", "Walgreens #4411"]
+ITEMS = ["Milk", "Bread", "Coffee", "Eggs", "Beer", "Red Wine", "Paneer Tikka", "Room Service",
+         "Taxi Fare", "Chips", "Shampoo", "Sandwich"]
+# (currency code, how amounts are written, tax line labels)
+LOCALES = [
+    ('INR', lambda a: f"Rs. {a:,.2f}", ["CGST 2.5%", "SGST 2.5%"]),
+    ('INR', lambda a: f"₹{a:.2f}", ["GST 5%"]),
+    ('USD', lambda a: f"${a:,.2f}", ["Sales Tax"]),
+    ('GBP', lambda a: f"£{a:.2f}", ["VAT 20%"]),
+    ('EUR', lambda a: f"€ {a:.2f}", ["VAT"]),
+]
+DATE_FORMATS = ["%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%d.%m.%Y"]
+
+
+def make_receipt(rng):
+    # -> (text, expected fields)
+    code, money, tax_labels = rng.choice(LOCALES)
+    merchant = rng.choice(MERCHANTS)
+    day = date(2024, 1, 1) + timedelta(days=rng.randrange(700))
+    lines = [merchant]
+    if rng.random() < 0.7:
+        lines.append(f"Tel: 080-{rng.randint(2000, 9999)} {rng.randint(1000, 9999)}")
+    if rng.random() < 0.5:
+        lines.append(f"GSTIN 29ABCDE{rng.randint(1000, 9999)}F1Z5")
+    stamp = day.strftime(rng.choice(DATE_FORMATS))
+    lines.append(rng.choice([f"Date: {stamp}", f"{stamp}  {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                             f"Bill No: {rng.randint(100, 99999)}   {stamp}"]))
+    lines.append("")
+
+    items, subtotal = [], Decimal('0')
+    for _ in range(rng.randint(1, 8)):
+        name = rng.choice(ITEMS)
+        qty = rng.choice([1, 1, 1, 2, 3])
+        amount = Decimal(f"{rng.uniform(20, 2500):.2f}")
+        subtotal += amount
+        label = f"{qty} x {name}" if qty > 1 else name
+        lines.append(f"{label:<20}{money(amount)}")
+        items.append({'Description': name, 'Quantity': qty, 'Amount': amount})
+
+    tax = Decimal('0')
+    lines.append(f"Subtotal{'':<12}{money(subtotal)}")
+    for label in tax_labels:
+        part = (subtotal * Decimal('0.025')).quantize(Decimal('0.01'))
+        tax += part
+        lines.append(f"{label:<20}{money(part)}")
+    total = subtotal + tax
+    lines.append(rng.choice([f"TOTAL{'':<15}{money(total)}", f"Amount Due   {money(total)}",
+                             f"Grand Total: {money(total)}"]))
+    if rng.random() < 0.5:
+        tendered = (total + rng.randint(1, 500)).quantize(Decimal('1'))
+        lines += [f"Cash{'':<16}{money(tendered)}", f"Change{'':<14}{money(tendered - total)}"]
+    lines.append("Thank you! Visit again")
+
+    return '\n'.join(lines), {
+        'Merchant': merchant, 'Date': day.isoformat(), 'Total': total, 'Tax': tax,
+        'Currency': code, 'LineItems': items,
+    }
+
+
+# The Legacy_v1/audit.py version this replaces
+def old_extract_financials(text):
+    data = {}
+    lines = text.split('\n')
+    date_match = re.search(r'(\d{2})[/-](\d{2})[/-](\d{4})|(\d{4})[/-](\d{2})[/-](\d{2})', text)
+    if date_match:
+        groups = date_match.groups()
+        if groups[0]:
+            data['Date'] = f"{groups[2]}-{groups[1]}-{groups[0]}"
+        else:
+            data['Date'] = f"{groups[3]}-{groups[4]}-{groups[5]}"
+    else:
+        data['Date'] = datetime.now().strftime("%Y-%m-%d")
+    clean_lines = [line.strip() for line in lines if line.strip()]
+    data['Merchant'] = clean_lines[0] if clean_lines else "Unknown"
+    candidates = []
+    money_pattern = r'[\$£€]?\s*(\d{1,3}(?:,\d{3})*(?:\.\d{2})?)'
+    for line in lines:
+        line_lower = line.lower()
+        if any(bad in line_lower for bad in ["subtotal", "tax", "vat", "change", "tender"]):
+            continue
+        match = re.search(money_pattern, line)
+        if match:
+            try:
+                amount = float(match.group(1).replace(',', ''))
+                if amount > 200000:
+                    continue
+                if 2018 <= amount <= 2030 and "." not in match.group(1):
+                    continue
+                score = 0
+                if "total" in line_lower: score += 10
+                if "amount" in line_lower: score += 5
+                if "due" in line_lower: score += 5
+                candidates.append((amount, score))
+            except ValueError:
+                continue
+    if candidates:
+        candidates.sort(key=lambda x: (x[1], x[0]), reverse=True)
+        data['Total'] = candidates[0][0]
+    else:
+        data['Total'] = 0.0
+    return data
+
+
+def rate(fn, texts, rounds=3):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+if __name__ == "__main__":
+    rng = random.Random(2024)
+    corpus = [make_receipt(rng) for _ in range(CORPUS)]
+    texts = [text for text, _ in corpus]
+
+    fields = ['Merchant', 'Date', 'Total', 'Tax', 'Currency', 'LineItems']
+    new_hits = dict.fromkeys(fields, 0)
+    old_hits = dict.fromkeys(['Merchant', 'Date', 'Total'], 0)
+    misses = []
+    for text, truth in corpus:
+        got = extract(text)
+        for field in fields:
+            if got[field] == truth[field]:
+                new_hits[field] += 1
+            elif len(misses) < 3:
+                misses.append((field, got[field], truth[field], text))
+        old = old_extract_financials(text)
+        old_hits['Merchant'] += old['Merchant'] == truth['Merchant']
+        old_hits['Date'] += old['Date'] == truth['Date']
+        old_hits['Total'] += abs(old['Total'] - float(truth['Total'])) < 0.005
+
+    print(f"Corpus: {CORPUS} synthetic receipts ({len(LOCALES)} locales, {len(DATE_FORMATS)} date formats)")
+    print(f"{'field':<10} {'legacy':>8} {'extractor':>10}")
+    for field in fields:
+        legacy = f"{old_hits[field] / CORPUS:.1%}" if field in old_hits else '-'
+        print(f"{field:<10} {legacy:>8} {new_hits[field] / CORPUS:>10.1%}")
+    for field, got, want, text in misses:
+        print(f"\nMiss on {field}: got {got!r}, want {want!r}\n{text}")
+
+    # Real-world OCR texts: Total and Date against what a person reads off them
+    ocr_hits = {'Total': 0, 'Date': 0}
+    ocr_old_hits = {'Total': 0, 'Date': 0}
+    for text, total, day in OCR_RECEIPTS:
+        got, old = extract(text), old_extract_financials(text)
+        for field, want in (('Total', total), ('Date', day)):
+            ocr_hits[field] += got[field] == want
+            if got[field] != want:
+                print(f"\nOCR miss on {field}: got {got[field]!r}, want {want!r} ({text.splitlines()[0]})")
+        ocr_old_hits['Total'] += abs(old['Total'] - float(total)) < 0.005
+        ocr_old_hits['Date'] += old['Date'] == day
+    print(f"\nOCR_RECEIPTS: {len(OCR_RECEIPTS)} real-world texts, read by hand")
+    print(f"{'field':<10} {'legacy':>8} {'extractor':>10}")
+    for field in ocr_hits:
+        print(f"{field:<10} {ocr_old_hits[field] / len(OCR_RECEIPTS):>8.1%} {ocr_hits[field] / len(OCR_RECEIPTS):>10.1%}")
+
+    # The extractor reads twice the fields, so it doesn't quite keep up with the legacy loop
+    old_rate = rate(old_extract_financials, texts)
+    new_rate = rate(extract, texts)
+    print(f"\nThroughput: legacy {old_rate:,.0f} texts/s (3 fields), extractor {new_rate:,.0f} texts/s (6 fields),"
+          f" {new_rate / old_rate:.2f}x the legacy rate")
+
+    # Dates that don't exist are dropped, not stored as written
+    bad_dates = [extract(f"SHOP\nDate: {stamp}\nTOTAL 10.00")['Date'] for stamp in IMPOSSIBLE_DATES]
+    print(f"Impossible dates kept: {sum(d is not None for d in bad_dates)} of {len(IMPOSSIBLE_DATES)}")
+
+    # Store, terminal and card numbers are neither line items nor the Total
+    noise_wrong = []
+    for text, total, descriptions in NOISE_RECEIPTS:
+        got = extract(text)
+        if got['Total'] != total or [item['Description'] for item in got['LineItems']] != descriptions:
+            noise_wrong.append(text)
+            print(f"  WRONG {text!r}: Total {got['Total']}, items {got['LineItems']}")
+    print(f"ID lines read as money: {len(noise_wrong)} of {len(NOISE_RECEIPTS)} receipts")
+
+    worst = min(new_hits.values()) / CORPUS
+    if worst < MIN_ACCURACY:
+        sys.exit(f"Extractor accuracy {worst:.1%} is below {MIN_ACCURACY:.0%}")
+    for field, minimum in MIN_OCR_ACCURACY.items():
+        if ocr_hits[field] / len(OCR_RECEIPTS) < minimum:
+            sys.exit(f"Extractor got {ocr_hits[field]} of {len(OCR_RECEIPTS)} OCR_RECEIPTS {field}s right")
+    if any(bad_dates):
+        sys.exit(f"Impossible dates kept: {bad_dates}")
+    if noise_wrong:
+        sys.exit(f"ID numbers read as money on {len(noise_wrong)} receipts")
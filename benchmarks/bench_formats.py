@@ -0,0 +1,187 @@
+# Payload bytes, serialize time and client decode time of the GET /expenses
+# formats (json / columns / arrow) at 10k and 100k rows, each sent as is,
+# gzip and brotli. Then a round trip through the reader checks the format and
+# Accept-Encoding negotiation end to end.
+#
+# "Serialize" is the reader's side: encode_page plus the compression the read
+# cache does once per snapshot. "Decode" is the dashboard's: decompress, parse,
+# and ledger_view.to_frame. Every format must give the same frame.
+#
+#   python benchmarks/bench_formats.py
+import argparse
+import base64
+import datetime
+import gzip
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+
+import brotli
+import pandas as pd
+
+import columnar
+import fakes
+import ledger_view
+import read_cache
+import reader
+
+SIZES = (10_000, 100_000)
+MERCHANTS = ("CITY MART", "FRESH FOODS", "QUICK FUEL", "CAFE ROMA", "OFFICE DEPOT")
+
+
+def ledger_items(n):
+    # Items as the reader gets them from DynamoDB: numbers are Decimals
+    rng = random.Random(n)
+    start = datetime.datetime(2025, 1, 1)
+    items = []
+    for i in range(n):
+        risk = rng.choice((0, 0, 0, 30, 50, 100))
+        stamp = (start + datetime.timedelta(seconds=i * 37)).isoformat()
+        merchant = rng.choice(MERCHANTS)
+        total = Decimal(rng.randint(100, 500000)) / 100
+        item = {
+            'ReceiptID': f"{rng.getrandbits(256):064x}",
+            'RecordType': 'RECEIPT',
+            'Filename': f"receipt-{i}.png",
+            'Merchant': merchant,
+            'Total': total,
+            'Date': stamp[:10],
+            'UploadDate': stamp,
+            'UpdatedAt': stamp,
+            'Status': 'Analyzed',
+            'ExtractedText': f"{merchant}\nMilk 2.50\nBread 1.20\nTOTAL {total}",
+            'RiskScore': Decimal(risk),
+            'RiskFlags': ["Suspicious Item: beer"] if risk else [],
+        }
+        if i % 50 == 0:
+            item['NearDuplicateOf'] = f"{rng.getrandbits(256):064x}"
+            item['NearDuplicateDistance'] = Decimal(rng.randint(0, 7))
+        items.append(item)
+    return items
+
+
+def best_ms(fn, rounds=3):
+    best, result = float('inf'), None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def compress(raw, coding):
+    if coding == 'gzip':
+        return gzip.compress(raw, compresslevel=6)
+    if coding == 'br':
+        return brotli.compress(raw, quality=read_cache.BROTLI_QUALITY)
+    return raw
+
+
+def decompress(payload, coding):
+    if coding == 'gzip':
+        return gzip.decompress(payload)
+    if coding == 'br':
+        return brotli.decompress(payload)
+    return payload
+
+
+def comparable(frame):
+    # RiskFlags come back as lists from JSON and numpy arrays from Arrow
+    frame = frame.reset_index(drop=True).copy()
+    frame['RiskFlags'] = frame['RiskFlags'].map(list)
+    return frame
+
+
+def run_size(n, rounds):
+    items = ledger_items(n)
+    cursor = reader.encode_cursor({'ReceiptID': items[-1]['ReceiptID']})
+    failures = 0
+    reference = None
+    print(f"\n{n:,} rows")
+    print(f"  {'format':<8} {'coding':<6} {'bytes':>11} {'vs json':>8} {'serialize ms':>13} {'decode ms':>10}")
+    for fmt in columnar.FORMATS:
+        encode_ms, (body, content_type) = best_ms(
+            lambda: columnar.encode_page(items, cursor, fmt, default=reader.decimal_encoder), rounds)
+        raw = body if isinstance(body, bytes) else body.encode('utf-8')
+        for coding in (None, 'gzip', 'br'):
+            compress_ms, payload = best_ms(lambda: compress(raw, coding), rounds)
+            decode_ms, (frame, next_cursor) = best_ms(
+                lambda: ledger_view.read_page(decompress(payload, coding), content_type), rounds)
+            if fmt == 'json' and coding is None:
+                reference = comparable(frame)
+                json_bytes = len(payload)
+            ok = next_cursor == cursor and len(frame) == n
+            try:
+                pd.testing.assert_frame_equal(comparable(frame), reference, check_dtype=False)
+            except AssertionError as e:
+                print(f"  {fmt}/{coding}: frame differs from json: {e}")
+                ok = False
+            failures += not ok
+            print(f"  {fmt:<8} {coding or '-':<6} {len(payload):>11,} {len(payload) / json_bytes:>7.0%}"
+                  f" {encode_ms + compress_ms:>13.1f} {decode_ms:>10.1f}{'' if ok else '  MISMATCH'}")
+    return failures
+
+
+# --- READER ROUND TRIP ---
+def round_trip():
+    items = ledger_items(3_000)
+    table = fakes.FakeTable()
+    table.items.update((item['ReceiptID'], item) for item in items)
+    cases = [
+        ('json', 'br, gzip', 'br'),
+        ('columns', 'gzip, deflate, br', 'br'),
+        ('columns', 'gzip', 'gzip'),
+        ('arrow', 'br;q=0.5, gzip', 'gzip'),
+        ('arrow', 'gzip;q=0', None),
+        ('json', None, None),
+    ]
+    failures, lines = 0, []
+    with mock.patch.object(reader, 'table', table), mock.patch.object(reader, 'cache', read_cache.ReadCache()), \
+         mock.patch('builtins.print'):
+        for fmt, accept, expected in cases:
+            headers = {'Accept-Encoding': accept} if accept else {}
+            event = {'queryStringParameters': {'limit': '1000', 'format': fmt}, 'headers': headers}
+            response = reader.lambda_handler(event, None)
+            sent = response['headers'].get('Content-Encoding')
+            payload = response['body']
+            if response.get('isBase64Encoded'):
+                payload = base64.b64decode(payload)
+            elif isinstance(payload, str):
+                payload = payload.encode('utf-8')
+            content_type = response['headers']['Content-Type']
+            frame, _ = ledger_view.read_page(decompress(payload, sent), content_type)
+            ok = (response['statusCode'] == 200 and sent == expected and len(frame) == 1000
+                  and content_type == (columnar.ARROW_TYPE if fmt == 'arrow' else 'application/json')
+                  and 'Accept-Encoding' in response['headers'].get('Vary', ''))
+            failures += not ok
+            lines.append(f"  {fmt:<8} {accept or '-':<18} {sent or '-':<6} {len(payload):>9,}  {content_type}"
+                         f"{'' if ok else '  MISMATCH'}")
+        bad = reader.lambda_handler({'queryStringParameters': {'format': 'xml'}}, None)
+    print("\nReader round trip, limit=1000")
+    print(f"  {'format':<8} {'Accept-Encoding':<18} {'sent':<6} {'bytes':>9}  content type")
+    print("\n".join(lines))
+    print(f"  format=xml -> {bad['statusCode']}")
+    failures += bad['statusCode'] != 400
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="GET /expenses response formats")
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    failures = sum(run_size(n, args.rounds) for n in args.sizes)
+    failures += round_trip()
+    if failures:
+        print(f"\n{failures} check(s) failed")
+        sys.exit(1)
@@ -0,0 +1,385 @@
+# Live updates: polling refresh (page 1 and /stats, revalidated by ETag through
+# the read cache) every 10 s like the old dashboard, and every 1 s for the same
+# freshness, against LiveFeed clients (live_feed.py) that either long-poll
+# GET /expenses/changes (lambda/changes.py) or listen on the WebSocket that
+# lambda/push.py sends the processor's change events down.
+#
+# --writers concurrent processor invocations each write a batch of --batch
+# receipts every --write-interval seconds for --duration seconds. Then nothing
+# is written for --idle seconds. For each mode the report has:
+#   - the delay from a batch being written to each dashboard holding its receipts
+#   - Lambda invocations (API requests, socket connects and event fan-outs) and
+#     billed Lambda seconds per dashboard-minute
+#   - DynamoDB read units, while writing and while idle
+#
+# Exits non-zero if a live dashboard misses or repeats a receipt, if the
+# processor didn't publish one change event per written batch, or if an idle
+# socket dashboard invoked a Lambda or read the ledger.
+#
+#   python benchmarks/bench_live.py --clients 20 --duration 30 --idle 40
+import argparse
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import fakes
+import live_feed
+from bench_pipeline import OcrPool, percentile, receipt_image
+from bench_read_cache import receipt
+
+import changes
+import processor
+import push
+import read_cache
+import reader
+
+BUCKET = 'bill-e-bench'
+CHANGES_TOPIC = 'arn:aws:sns:local:000000000000:bench-changes'
+
+
+# --- ACCOUNTING ---
+class Usage:
+    # Lambda invocations, Lambda seconds and DynamoDB read units, split by phase
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phase = 'connecting'
+        self.switches = [(time.monotonic(), self.phase)]
+        self.totals = {}
+
+    def switch(self, phase):
+        with self.lock:
+            self.phase = phase
+            self.switches.append((time.monotonic(), phase))
+
+    def durations(self):
+        return {phase: self.switches[i + 1][0] - began for i, (began, phase) in enumerate(self.switches[:-1])}
+
+    def bucket(self, phase):
+        return self.totals.setdefault(phase, {'requests': 0, 'seconds': 0.0, 'units': 0.0})
+
+    def add_units(self, units):
+        with self.lock:
+            self.bucket(self.phase)['units'] += units
+
+    def add_call(self, start, end):
+        # The request counts where it started; a long-poll's time is split across phases
+        with self.lock:
+            bounds = self.switches + [(float('inf'), None)]
+            for (began, phase), (ended, _) in zip(bounds, bounds[1:]):
+                if began <= start < ended:
+                    self.bucket(phase)['requests'] += 1
+                overlap = min(end, ended) - max(start, began)
+                if overlap > 0:
+                    self.bucket(phase)['seconds'] += overlap
+
+
+class ReaderTable:
+    # The reader's view of the ledger: same items, but its reads are counted
+    def __init__(self, table, usage):
+        self.table = table
+        self.usage = usage
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+    def get_item(self, **kwargs):
+        self.usage.add_units(0.5)
+        return self.table.get_item(**kwargs)
+
+    def query(self, **kwargs):
+        response = self.table.query(**kwargs)
+        read_bytes = sum(fakes.item_size(item) for item in response.get('Items', []))
+        self.usage.add_units(0.5 * max(1, math.ceil(read_bytes / 4096)))
+        return response
+
+    def scan(self, **kwargs):
+        response = self.table.scan(**kwargs)
+        read_bytes = sum(fakes.item_size(item) for item in response.get('Items', []))
+        self.usage.add_units(0.5 * max(1, math.ceil(read_bytes / 4096)))
+        return response
+
+
+class ReaderDynamoDB(fakes.FakeDynamoDB):
+    def __init__(self, table, usage, **kwargs):
+        super().__init__(table, **kwargs)
+        self.usage = usage
+
+    def batch_get_item(self, RequestItems):
+        self.usage.add_units(0.5 * sum(len(request['Keys']) for request in RequestItems.values()))
+        return super().batch_get_item(RequestItems)
+
+
+def call_reader(usage, path, params, headers=None):
+    return call_lambda(usage, reader.lambda_handler, {'rawPath': path, 'queryStringParameters': params,
+                                                      'headers': headers or {}})
+
+
+def call_lambda(usage, handler, event):
+    start = time.monotonic()
+    response = handler(event, None)
+    usage.add_call(start, time.monotonic())
+    return response
+
+
+class PushSNS(fakes.FakeSNS):
+    # Change events also invoke push.py, on their own thread as SNS does
+    def __init__(self, usage, **kwargs):
+        super().__init__(**kwargs)
+        self.usage = usage
+
+    def publish(self, **kwargs):
+        response = super().publish(**kwargs)
+        if kwargs.get('TopicArn') == CHANGES_TOPIC:
+            event = {'Records': [{'Sns': {'Message': kwargs['Message']}}]}
+            threading.Thread(target=call_lambda, args=(self.usage, push.lambda_handler, event), daemon=True).start()
+        return response
+
+
+def decode(response):
+    body = response['body']
+    if response.get('isBase64Encoded'):
+        body = gzip.decompress(base64.b64decode(body))
+    return json.loads(body)
+
+
+# --- DASHBOARDS ---
+class Refresher:
+    # The dashboard before: st_autorefresh every 10 s, first page + /stats, sent with ETags
+    def __init__(self, usage, interval):
+        self.usage = usage
+        self.interval = interval
+        self.pages = {}
+        self.arrived = {}
+
+    def get(self, path, params):
+        known = self.pages.get(path)
+        headers = {'Accept-Encoding': 'gzip'}
+        if known:
+            headers['If-None-Match'] = known[0]
+        response = call_reader(self.usage, path, params, headers)
+        if response['statusCode'] == 304:
+            return known[1]
+        page = decode(response)
+        self.pages[path] = (response['headers']['ETag'], page)
+        return page
+
+    def run(self, stop):
+        stop.wait(random.uniform(0, self.interval))
+        while not stop.is_set():
+            page = self.get('/expenses', {'limit': '100'})
+            self.get('/stats', {'days': '30'})
+            now = time.monotonic()
+            for item in page['items']:
+                self.arrived.setdefault(item['ReceiptID'], now)
+            stop.wait(self.interval)
+
+
+class TimedFeed(live_feed.LiveFeed):
+    # A LiveFeed that notes when each receipt reached it. With a gateway it
+    # listens on a socket, without one it long-polls.
+    def __init__(self, usage, wait, gateway=None):
+        super().__init__(self.fetch, wait=wait, idle_timeout=float('inf'),
+                         listen=self.listen if gateway else None)
+        self.usage = usage
+        self.gateway = gateway
+        self.arrived = {}
+        self.repeats = 0
+
+    def listen(self, stop):
+        # The socket through API Gateway: $connect and $disconnect go to push.py
+        connection_id = f"connection-{id(self)}"
+        socket = self.gateway.connect(connection_id)
+        context = {'routeKey': '$connect', 'connectionId': connection_id}
+        call_lambda(self.usage, push.lambda_handler, {'requestContext': context})
+        try:
+            yield None
+            while not stop.is_set():
+                try:
+                    message = socket.get(timeout=0.5)
+                except queue.Empty:
+                    yield None
+                    continue
+                yield json.loads(message)
+        finally:
+            self.gateway.disconnect(connection_id)
+            context = {'routeKey': '$disconnect', 'connectionId': connection_id}
+            call_lambda(self.usage, push.lambda_handler, {'requestContext': context})
+
+    def fetch(self, params):
+        response = call_reader(self.usage, '/expenses/changes', params)
+        assert response['statusCode'] == 200, response
+        return json.loads(response['body'])
+
+    def add(self, items):
+        now = time.monotonic()
+        for item in items:
+            if item['ReceiptID'] in self.arrived:
+                self.repeats += 1
+            self.arrived.setdefault(item['ReceiptID'], now)
+        super().add(items)
+
+
+# --- RUN ---
+def run(args, mode, refresh=None):
+    usage = Usage()
+    table = fakes.FakeTable(latency=args.latency)
+    for i in range(args.rows):
+        row = receipt(10_000_000 + i, datetime.datetime(2025, 1, 1) + datetime.timedelta(seconds=i))
+        table.items[row['ReceiptID']] = row
+    s3 = fakes.FakeS3()
+    sns = PushSNS(usage)
+    gateway = fakes.FakeSocketGateway(latency=args.latency)
+    sockets = ReaderTable(fakes.FakeTable(latency=args.latency, key='ConnectionId', indexes={}), usage)
+    written = {}  # ReceiptID -> when the processor invocation that wrote it returned
+    batches = []
+    stop = threading.Event()
+
+    def writer(n):
+        # Receipts n, n + writers, n + 2 * writers, ...
+        number = n
+        next_at = time.monotonic() + n * args.write_interval / args.writers
+        while True:
+            stop.wait(max(0.0, next_at - time.monotonic()))
+            if time.monotonic() >= writing_ends:
+                return
+            records, ids = [], []
+            for _ in range(args.batch):
+                image = receipt_image(number)
+                key = f"receipt-{number}.png"
+                s3.put_object(Bucket=BUCKET, Key=key, Body=image)
+                records.append(fakes.s3_event_record(BUCKET, key, f"msg-{number}"))
+                ids.append(hashlib.sha256(image).hexdigest())
+                number += args.writers
+            result = processor.lambda_handler({'Records': records}, None)
+            assert not result['batchItemFailures'], result
+            done = time.monotonic()
+            batches.append(len(ids))
+            written.update((receipt_id, done) for receipt_id in ids)
+            next_at += args.write_interval
+
+    if mode == 'refresh':
+        clients = [Refresher(usage, refresh) for _ in range(args.clients)]
+        loops = [threading.Thread(target=client.run, args=(stop,), daemon=True) for client in clients]
+    else:
+        clients = [TimedFeed(usage, args.wait, gateway if mode == 'socket' else None) for _ in range(args.clients)]
+        loops = []
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', sns), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table, latency=args.latency)), \
+         mock.patch.object(processor.ocr_backend, 'http', OcrPool(0.001)), \
+         mock.patch.object(changes, 'TOPIC_ARN', CHANGES_TOPIC), \
+         mock.patch.object(push, 'connections', sockets), \
+         mock.patch.object(push, 'api', gateway), \
+         mock.patch.object(reader, 'table', ReaderTable(table, usage)), \
+         mock.patch.object(reader, 'dynamodb', ReaderDynamoDB(table, usage, latency=args.latency)), \
+         mock.patch.object(reader, 'cache', read_cache.ReadCache()), \
+         mock.patch.object(read_cache, 'ENABLED', True):
+        for client in clients:
+            if mode != 'refresh':
+                client.start()
+        for loop in loops:
+            loop.start()
+        time.sleep(1)  # everyone connected before the first write
+
+        usage.switch('writing')
+        writing_ends = time.monotonic() + args.duration
+        writers = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        time.sleep(refresh + 1 if mode == 'refresh' else 2 * changes.SETTLE + 1)
+
+        usage.switch('idle')
+        time.sleep(args.idle)
+        usage.switch('done')
+        stop.set()
+        for client in clients:
+            if mode != 'refresh':
+                client.stop()
+                client.thread.join()
+        for loop in loops:
+            loop.join()
+
+    delays, missed, repeats = [], 0, 0
+    for client in clients:
+        for receipt_id, done in written.items():
+            if receipt_id in client.arrived:
+                delays.append(client.arrived[receipt_id] - done)
+            else:
+                missed += 1
+        repeats += getattr(client, 'repeats', 0)
+    events = [message for message in sns.messages if message.get('TopicArn') == CHANGES_TOPIC]
+    return {'usage': usage.totals, 'durations': usage.durations(), 'delays': sorted(delays), 'missed': missed, 'repeats': repeats,
+            'written': len(written), 'batches': len(batches), 'events': len(events)}
+
+
+def report(name, result, args):
+    delays = result['delays']
+    print(f"\n{name}: {args.clients} dashboards, {result['written']} receipts in {result['batches']} batches,"
+          f" {result['events']} change events")
+    if delays:
+        print(f"  delay s        p50 {percentile(delays, 50):.2f}  p95 {percentile(delays, 95):.2f}"
+              f"  max {delays[-1]:.2f}  ({len(delays):,} deliveries, {result['missed']} missed,"
+              f" {result['repeats']} repeated)")
+    for phase in ('writing', 'idle'):
+        seconds = result['durations'][phase]
+        totals = result['usage'].get(phase, {'requests': 0, 'seconds': 0.0, 'units': 0.0})
+        minutes = args.clients * seconds / 60
+        print(f"  {phase:<14} {totals['requests'] / minutes:6.1f} Lambda calls, {totals['seconds'] / minutes:6.2f}"
+              f" Lambda-s and {totals['units'] / minutes:7.1f} RCU per dashboard-minute")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Polling refresh against long-poll and socket live updates")
+    parser.add_argument('--rows', type=int, default=5000, help="receipts in the ledger at the start")
+    parser.add_argument('--clients', type=int, default=20, help="dashboards open at the same time")
+    parser.add_argument('--writers', type=int, default=2, help="concurrent processor invocations")
+    parser.add_argument('--batch', type=int, default=5, help="receipts per processor invocation")
+    parser.add_argument('--write-interval', type=float, default=3.0)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of writing")
+    parser.add_argument('--idle', type=float, default=40.0, help="seconds without writes afterwards")
+    parser.add_argument('--refresh', type=float, nargs='*', default=[10.0, 1.0],
+                        help="autorefresh intervals to compare with (10 s was the old dashboard)")
+    parser.add_argument('--wait', type=int, default=live_feed.WAIT, help="long-poll wait")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per DynamoDB call")
+    args = parser.parse_args()
+
+    for interval in args.refresh:
+        report(f"autorefresh every {interval:g}s", run(args, 'refresh', interval), args)
+    poll = run(args, 'poll')
+    report(f"long-poll (wait {args.wait}s)", poll, args)
+    socket = run(args, 'socket')
+    report("socket push", socket, args)
+
+    for name, result in (('long-poll', poll), ('socket', socket)):
+        if result['missed'] or result['repeats']:
+            sys.exit(f"Some {name} dashboards missed or repeated receipts")
+        if result['events'] != result['batches']:
+            sys.exit(f"{result['batches']} batches written but {result['events']} change events published")
+    idle = socket['usage'].get('idle', {})
+    if idle.get('requests') or idle.get('units'):
+        sys.exit(f"Idle socket dashboards made {idle['requests']} Lambda calls and read {idle['units']:g} RCU")
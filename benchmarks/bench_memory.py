@@ -0,0 +1,81 @@
+# Peak RSS of getting one receipt from S3 to the OCR request, for the old
+# bytes -> base64 -> urlencode path and the streamed multipart path.
+# Each case runs in a fresh interpreter so the peaks don't mix.
+#
+#   python benchmarks/bench_memory.py
+import os
+import resource
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+
+SIZES_MB = (1, 10, 50)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class FakeS3:
+    def __init__(self, size):
+        self.size = size
+
+    def get_object(self, Bucket, Key):
+        import fakes
+        return {'Body': fakes.StreamingBody(self.size)}
+
+
+def drain(body):
+    # Consume the request body like the socket would
+    if not isinstance(body, bytes):
+        for _ in body:
+            pass
+
+
+def before(size):
+    import base64
+    import hashlib
+    import urllib.parse
+    response = FakeS3(size).get_object(Bucket='bench', Key='receipt.png')
+    image_bytes = response['Body'].read()
+    hashlib.sha256(image_bytes).hexdigest()
+    b64_image = base64.b64encode(image_bytes).decode('utf-8')
+    data = urllib.parse.urlencode({
+        'apikey': 'bench',
+        'base64Image': f"data:image/png;base64,{b64_image}",
+    }).encode('ascii')
+    drain(data)
+
+
+def after(size):
+    import fakes
+    import processor
+    spool, _, length = processor.download_receipt(FakeS3(size), 'bench', 'receipt.png')
+    with spool:
+        processor.ocr.OcrSpaceBackend('bench', http=fakes.FakeHttpPool()).parse(spool, length, 'receipt.png')
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        mode, size = sys.argv[1], int(sys.argv[2])
+        if mode == 'after':
+            import processor  # imported before measuring, like a warm container
+        baseline = peak_rss_mb()
+        {'before': before, 'after': after}[mode](size)
+        print(f"{peak_rss_mb() - baseline:.1f}")
+        sys.exit(0)
+
+    print(f"{'input':>6} {'before MB':>10} {'after MB':>10}")
+    for mb in SIZES_MB:
+        row = []
+        for mode in ('before', 'after'):
+            out = subprocess.run([sys.executable, __file__, mode, str(mb * 1024 * 1024)],
+                                 capture_output=True, text=True, check=True)
+            row.append(float(out.stdout.split()[-1]))
+        print(f"{mb:>4}MB {row[0]:>10.1f} {row[1]:>10.1f}")
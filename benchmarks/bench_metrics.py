@@ -0,0 +1,105 @@
+# Cost of the always-on instrumentation (lambda/metrics.py): one receipt's
+# worth of stage timers plus its EMF line, and the sampling profiler running
+# through a batch. Both are measured against the same batch with METRICS=false,
+# run interleaved and compared by the median of BATCHES repeats, so a loaded
+# machine slows both sides alike. Exits non-zero when either goes over its
+# budget, so it can gate a change the same way a test would.
+#
+#   python benchmarks/bench_metrics.py
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import metrics
+import processor
+
+RECEIPTS = 20000
+BATCHES = 30
+METRICS_BUDGET = 0.02     # extra wall time on a batch with metrics on vs METRICS=false
+PROFILER_BUDGET = 0.05    # extra wall time on a batch with the sampler running
+
+
+def receipt_timer():
+    # The same calls analyze_record makes for one receipt
+    timer = metrics.Timer('receipt', dimensions=('Outcome', 'OcrEngine'), OcrEngine='ocrspace', MessageId='m')
+    timer.set(FileKey='uploads/receipt.png')
+    for stage in ('S3Get', 'Dedup', 'Ocr', 'Risk'):
+        with timer.stage(stage):
+            pass
+    timer.set(ReceiptHash='ab' * 32)
+    timer.add('Bytes', 123456, 'Bytes')
+    timer.add('OcrBytes', 123456, 'Bytes')
+    timer.add('RiskScore', 50)
+    timer.emit('analyzed')
+
+
+def per_receipt_us():
+    with redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(RECEIPTS):
+            receipt_timer()
+        return (time.perf_counter() - start) / RECEIPTS * 1e6
+
+
+def batch_seconds(sample_rate, enabled=True):
+    s3 = fakes.FakeS3(latency=0.02)
+    table = fakes.FakeTable(latency=0.005)
+    records = []
+    for i in range(10):
+        s3.put_object(Bucket='bench', Key=f"r{i}.png", Body=f"receipt {i}".encode() * 1000)
+        records.append(fakes.s3_event_record('bench', f"r{i}.png", f"msg-{i}"))
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', fakes.FakeSNS(latency=0.01)), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table, latency=0.01)), \
+         mock.patch.object(processor.ocr_backend, 'http', fakes.FakeHttpPool(0.1)), \
+         mock.patch.object(metrics, 'ENABLED', enabled), \
+         mock.patch.object(metrics, 'PROFILE_SAMPLE_RATE', sample_rate), \
+         mock.patch.object(metrics, 'PROFILE_SLOW_MS', 0):
+        start = time.perf_counter()
+        processor.lambda_handler({'Records': records}, None)
+        return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    timer_us = per_receipt_us()
+    print(f"Stage timers + EMF line: {timer_us:.1f} us per receipt")
+
+    # Interleaved, so load on the machine lands on every variant alike
+    runs = {'off': [], 'on': [], 'sampled': []}
+    for _ in range(BATCHES):
+        runs['off'].append(batch_seconds(0, enabled=False))
+        runs['on'].append(batch_seconds(0))
+        runs['sampled'].append(batch_seconds(1))
+    off, plain, sampled = (sorted(runs[name])[BATCHES // 2] for name in ('off', 'on', 'sampled'))
+    metrics_extra = plain / off - 1
+    extra = sampled / plain - 1
+    print(f"Batch of 10, median of {BATCHES}: {off * 1000:.1f} ms with METRICS=false, "
+          f"{plain * 1000:.1f} ms with metrics ({metrics_extra:+.1%}, budget {METRICS_BUDGET:.0%}), "
+          f"{sampled * 1000:.1f} ms with the sampler too ({extra:+.1%}, budget {PROFILER_BUDGET:.0%})")
+
+    # The sampler really sees the handler's worker threads
+    out = io.StringIO()
+    with mock.patch.object(metrics, 'PROFILE_SAMPLE_RATE', 1), mock.patch.object(metrics, 'PROFILE_SLOW_MS', 0), \
+            redirect_stdout(out):
+        with metrics.profile_if_slow('check'):
+            time.sleep(0.05)
+    assert '"Kind": "profile"' in out.getvalue()
+
+    if metrics_extra > METRICS_BUDGET or extra > PROFILER_BUDGET:
+        sys.exit("Instrumentation overhead over budget")
@@ -0,0 +1,355 @@
+# Near-duplicate receipts (lambda/near_dup.py), in three parts:
+#
+#   accuracy   --images synthetic receipt pictures (fonts, margins and paper
+#              tone vary), each with a copy that was photographed again (on a
+#              table, tilted, rescaled, re-lit, JPEG), re-cropped, or shrunk and
+#              re-compressed. How many copies land within NEAR_DUP_DISTANCE bits
+#              of their original, and how many pairs of different receipts do
+#              (before the Total check), plus hashing time per picture.
+#   processor  the originals, then the copies, through processor.lambda_handler
+#              with OCR stubbed by each receipt's text; the last batch holds new
+#              originals together with their copies. Every copy within the
+#              distance must be flagged NEAR_DUPLICATE of its own original, and
+#              nothing else may be.
+#   lookup     near_dup.find against --population receipts indexed with
+#              near_dup.record in a fakes.FakeTable ledger (--latency seconds per
+#              DynamoDB call), and checking every indexed hash in memory (a
+#              lower bound for any lookup that isn't indexed). Hashes cluster
+#              around the pictures' hashes and 30% of receipts share 100 round
+#              totals, so buckets are far from empty. Every lookup must return
+#              the receipt a full comparison picks.
+#   hot bucket --hot receipts with one Total whose hashes share a band, far
+#              more than one 400 KB DynamoDB item holds: every bucket update
+#              must succeed and the last receipts indexed must still be found.
+#
+# Exits non-zero if the processor flags wrongly, a lookup differs, or a bucket
+# update fails.
+#
+#   python benchmarks/bench_near_dup.py --images 300 --population 100000 1000000
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+from fake_ocr_server import receipt_text
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import extractor
+import near_dup
+import processor
+
+try:
+    from PIL import Image, ImageDraw, ImageEnhance, ImageFont
+except ImportError:
+    sys.exit("bench_near_dup.py needs Pillow")
+
+SEED = 24
+FONT_SIZES = (12, 14, 16, 18)
+POPULAR_TOTALS = [Decimal(f"{50 * n}.00") for n in range(1, 101)]
+
+
+# --- PICTURES ---
+def receipt_image(text, rng):
+    # A scan: paper as wide as the text, some font size, margin and paper tone
+    font = ImageFont.load_default(size=rng.choice(FONT_SIZES))
+    lines = text.split('\n')
+    step, margin = int(font.size * 1.5), rng.randint(12, 30)
+    width = max(int(font.getlength(line)) for line in lines) + 2 * margin
+    image = Image.new('L', (width, 2 * margin + step * len(lines)), rng.randint(235, 252))
+    draw = ImageDraw.Draw(image)
+    for n, line in enumerate(lines):
+        draw.text((margin, margin + step * n), line, fill=rng.randint(10, 50), font=font)
+    return image
+
+
+def photo(image, rng):
+    # The same paper photographed on a table: offset, tilted, rescaled, re-lit, JPEG
+    w, h = image.size
+    left, top = int(w * 0.08) + rng.randint(0, int(w * 0.25)), int(h * 0.08) + rng.randint(0, int(h * 0.2))
+    table = Image.new('L', (w + left + int(w * 0.08) + rng.randint(0, int(w * 0.2)),
+                            h + top + int(h * 0.08) + rng.randint(0, int(h * 0.2))), rng.randint(60, 120))
+    table.paste(image, (left, top))
+    out = table.rotate(rng.uniform(-2, 2), fillcolor=90, resample=Image.BICUBIC)
+    out = out.resize((int(out.width * rng.uniform(0.6, 1.4)), int(out.height * rng.uniform(0.6, 1.4))))
+    return ImageEnhance.Brightness(out).enhance(rng.uniform(0.8, 1.2)), 'JPEG', rng.randint(40, 85)
+
+
+def recrop(image, rng):
+    w, h = image.size
+    return image.crop((rng.randint(0, 10), rng.randint(0, 10), w - rng.randint(0, 10), h - rng.randint(0, 10))), 'PNG', None
+
+
+def recompress(image, rng):
+    scale = rng.uniform(0.5, 0.8)
+    return image.resize((int(image.width * scale), int(image.height * scale))), 'JPEG', rng.randint(25, 50)
+
+
+VARIANTS = {'photo': photo, 'recrop': recrop, 'recompress': recompress}
+
+
+def encode(image, kind='PNG', quality=None):
+    out = io.BytesIO()
+    image.save(out, kind, **({'quality': quality} if quality else {}))
+    return out.getvalue()
+
+
+def timed_hash(data, name):
+    began = time.perf_counter()
+    phash = near_dup.image_hash(io.BytesIO(data), name)
+    return phash, time.perf_counter() - began
+
+
+def make_receipts(count):
+    # -> [{'text', 'total', 'original': bytes, 'copy': bytes, 'variant', 'hash', 'copy_hash'}]
+    rng = random.Random(SEED)
+    receipts = []
+    timings = {'scan': []}
+    for i in range(count):
+        text = receipt_text(f"receipt-{i}".encode())
+        image = receipt_image(text, rng)
+        variant = list(VARIANTS)[i % len(VARIANTS)]
+        copy, kind, quality = VARIANTS[variant](image, rng)
+        original = encode(image)
+        copy = encode(copy, kind, quality)
+        phash, seconds = timed_hash(original, 'r.png')
+        timings['scan'].append(seconds)
+        copy_hash, seconds = timed_hash(copy, 'r.jpg' if kind == 'JPEG' else 'r.png')
+        timings.setdefault(variant, []).append(seconds)
+        receipts.append({'text': text, 'total': extractor.extract(text)['Total'], 'original': original,
+                         'copy': copy, 'kind': kind, 'variant': variant, 'hash': phash, 'copy_hash': copy_hash})
+    # A phone camera picture: 12 MP JPEG
+    big, _, _ = photo(receipt_image(receipts[0]['text'], rng), rng)
+    big = encode(big.resize((3024, 4032)), 'JPEG', 85)
+    timings['12 MP photo'] = [timed_hash(big, 'phone.jpg')[1] for _ in range(5)]
+    return receipts, timings
+
+
+# --- ACCURACY ---
+def accuracy(receipts, timings):
+    print(f"Accuracy on {len(receipts)} receipts, distance <= {near_dup.DISTANCE} of 64 bits")
+    print(f"  {'copy':<11} {'copies':>7} {'caught':>8} {'p50 bits':>9} {'p90 bits':>9} {'max bits':>9}")
+    for variant in VARIANTS:
+        bits = sorted(near_dup.distance(r['hash'], r['copy_hash']) for r in receipts
+                      if r['variant'] == variant and r['hash'] is not None and r['copy_hash'] is not None)
+        caught = sum(1 for b in bits if b <= near_dup.DISTANCE)
+        print(f"  {variant:<11} {len(bits):>7} {caught / len(bits):>8.1%} {bits[len(bits) // 2]:>9} "
+              f"{bits[len(bits) * 9 // 10]:>9} {bits[-1]:>9}")
+    hashed = [r for r in receipts if r['hash'] is not None]
+    pairs = close = same_total = 0
+    for i, one in enumerate(hashed):
+        for other in hashed[i + 1:]:
+            pairs += 1
+            if near_dup.distance(one['hash'], other['hash']) <= near_dup.DISTANCE:
+                close += 1
+                same_total += one['total'] == other['total']
+    print(f"  different receipts: {close:,} of {pairs:,} pairs ({close / pairs:.2%}) within the distance on "
+          f"the hash alone, {same_total} with the same Total too")
+    print("  hash ms: " + ", ".join(f"{name} {statistics.median(t) * 1000:.1f}" for name, t in timings.items()))
+
+
+# --- PROCESSOR ---
+class TextBackend:
+    # OCR stand-in: every picture of a receipt reads as that receipt's text
+    name = 'bench'
+
+    def __init__(self, texts):
+        self.texts = texts
+
+    def parse(self, fileobj, size, filename):
+        return [self.texts[filename]]
+
+
+def through_processor(receipts):
+    s3 = fakes.FakeS3()
+    table = fakes.FakeTable()
+    texts, expected = {}, {}
+    tail = receipts[-5:]  # originals and copies in one batch
+    for i, receipt in enumerate(receipts):
+        original, copy = f"receipts/{i}.png", f"receipts/{i}-copy.{'jpg' if receipt['kind'] == 'JPEG' else 'png'}"
+        s3.put_object(Bucket='bench', Key=original, Body=receipt['original'])
+        s3.put_object(Bucket='bench', Key=copy, Body=receipt['copy'])
+        texts[original] = texts[copy] = receipt['text']
+        if receipt['hash'] is not None and receipt['copy_hash'] is not None and \
+                near_dup.distance(receipt['hash'], receipt['copy_hash']) <= near_dup.DISTANCE:
+            expected[copy] = original
+        receipt['keys'] = (original, copy)
+    head = receipts[:-5]
+    keys = [r['keys'][0] for r in head] + [r['keys'][1] for r in head]
+    batches = [keys[start:start + 10] for start in range(0, len(keys), 10)]
+    batches.append([r['keys'][0] for r in tail] + [r['keys'][1] for r in tail])
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', fakes.FakeSNS()), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table)), \
+         mock.patch.object(processor, 'ocr_backend', TextBackend(texts)):
+        for n, batch in enumerate(batches):
+            records = [fakes.s3_event_record('bench', key, f"msg-{n}-{i}") for i, key in enumerate(batch)]
+            result = processor.lambda_handler({'Records': records}, None)
+            if result['batchItemFailures']:
+                raise RuntimeError(f"batch {n}: {result}")
+
+    ids = {item['Filename']: item['ReceiptID'] for item in table.items.values() if item.get('RecordType') == 'RECEIPT'}
+    flag = processor.RISK_ENGINE.rules['near_duplicate_flag']
+    wrong = 0
+    for item in table.items.values():
+        if item.get('RecordType') != 'RECEIPT':
+            continue
+        want = expected.get(item['Filename'])
+        if item.get('NearDuplicateOf') != (ids[want] if want else None) or (flag in item['RiskFlags']) != bool(want):
+            wrong += 1
+    flagged = sum(1 for item in table.items.values() if item.get('NearDuplicateOf'))
+    print(f"\nProcessor: {len(ids)} receipts in {len(batches)} batches, {flagged} flagged as copies "
+          f"({len(expected)} expected), {wrong} wrong")
+    return wrong == 0
+
+
+# --- LOOKUP ---
+def noise(rng, bits):
+    return sum(1 << bit for bit in rng.sample(range(64), bits))
+
+
+def populate(count, receipts, rng):
+    # -> (ledger, {total key: [(hash, ReceiptID)]}); the pictures' originals are in it
+    table = fakes.FakeTable()
+    bases = [r['hash'] for r in receipts if r['hash'] is not None]
+    by_total, block = {}, []
+    for i in range(count):
+        if i < len(receipts) and receipts[i]['hash'] is not None:
+            phash, total = receipts[i]['hash'], receipts[i]['total']
+        else:
+            phash = rng.choice(bases) ^ noise(rng, rng.randint(4, 16))
+            total = rng.choice(POPULAR_TOTALS) if rng.random() < 0.3 else Decimal(f"{rng.uniform(20, 5000):.2f}")
+        item = {'ReceiptID': f"{i:064x}", 'RecordType': 'RECEIPT', 'PHash': f"{phash:016x}", 'Total': total}
+        table.items[item['ReceiptID']] = item
+        by_total.setdefault(near_dup.total_key(total), []).append((phash, item['ReceiptID']))
+        block.append(item)
+        if len(block) == 1000:
+            near_dup.record(table, block)
+            block = []
+    near_dup.record(table, block)
+    return table, by_total
+
+
+def closest(by_total, phash, total):
+    found = [(near_dup.distance(phash, other), receipt_id) for other, receipt_id in
+             by_total.get(near_dup.total_key(total), []) if near_dup.distance(phash, other) <= near_dup.DISTANCE]
+    if not found:
+        return None
+    bits, receipt_id = min(found)
+    return receipt_id, bits
+
+
+def make_queries(receipts, by_total, count, rng):
+    # -> {kind: [(hash, total)]}
+    indexed = [(phash, Decimal(total), rid) for total, entries in by_total.items() for phash, rid in entries[:50]]
+    bases = [r['hash'] for r in receipts if r['hash'] is not None]
+    return {
+        'copies': [(r['copy_hash'], r['total']) for r in receipts if r['copy_hash'] is not None][:count],
+        'edited': [(phash ^ noise(rng, rng.randint(0, near_dup.DISTANCE)), total)
+                   for phash, total, _ in rng.sample(indexed, count)],
+        'new': [(rng.choice(bases) ^ noise(rng, rng.randint(4, 16)), rng.choice(POPULAR_TOTALS))
+                for _ in range(count)],
+    }
+
+
+def lookup(count, receipts, args):
+    rng = random.Random(SEED)
+    began = time.perf_counter()
+    table, by_total = populate(count, receipts, rng)
+    buckets = sum(1 for key in table.items if key.startswith(near_dup.PREFIX))
+    print(f"\n{count:,} receipts indexed in {time.perf_counter() - began:.0f}s ({buckets:,} buckets), "
+          f"{near_dup.BANDS} x {len(near_dup.probe_keys(0, 0)) // near_dup.BANDS} keys per lookup, "
+          f"{args.latency * 1000:.0f} ms per DynamoDB call")
+    print(f"  {'lookups':<8} {'n':>5} {'matched':>8} {'find p50 ms':>12} {'find p99 ms':>12} "
+          f"{'linear ms':>10} {'speedup':>8} {'match':>6}")
+    entries = [(phash, total_key, rid) for total_key, found in by_total.items() for phash, rid in found]
+    dynamodb = fakes.FakeDynamoDB(table, latency=args.latency)
+    ok = True
+    for kind, queries in make_queries(receipts, by_total, args.lookups, rng).items():
+        timings, same, matched = [], True, 0
+        for phash, total in queries:
+            began = time.perf_counter()
+            found = near_dup.find(dynamodb, table, phash, total)
+            timings.append(time.perf_counter() - began)
+            same = same and found == closest(by_total, phash, total)
+            matched += found is not None
+        linear = []
+        for phash, total in queries[:args.linear]:
+            key = near_dup.total_key(total)
+            began = time.perf_counter()
+            min([(near_dup.distance(phash, other), rid) for other, total_key, rid in entries
+                 if total_key == key and near_dup.distance(phash, other) <= near_dup.DISTANCE] or [None],
+                key=lambda hit: hit or (65, ''))
+            linear.append(time.perf_counter() - began)
+        timings.sort()
+        p50, p99 = timings[len(timings) // 2], timings[min(len(timings) - 1, len(timings) * 99 // 100)]
+        linear_ms = statistics.median(linear) * 1000
+        ok = ok and same
+        print(f"  {kind:<8} {len(queries):>5} {matched / len(queries):>8.0%} {p50 * 1000:>12.2f} {p99 * 1000:>12.2f} "
+              f"{linear_ms:>10.0f} {linear_ms / (p50 * 1000):>7.0f}x {str(same):>6}")
+    return ok
+
+
+def hot_bucket(count, receipts):
+    # The first band stays the same and the other bits vary, so every receipt
+    # goes into one bucket (and a few hundred others)
+    rng = random.Random(SEED)
+    base = next(r['hash'] for r in receipts if r['hash'] is not None)
+    table = fakes.FakeTable()
+    by_total, failed, items = {}, 0, []
+    total = POPULAR_TOTALS[0]
+    with mock.patch('builtins.print'):
+        for i in range(count):
+            phash = base ^ noise(rng, 3) & (1 << 48) - 1
+            items.append({'ReceiptID': f"hot{i:061x}", 'PHash': f"{phash:016x}", 'Total': total})
+            by_total.setdefault(near_dup.total_key(total), []).append((phash, items[-1]['ReceiptID']))
+            if len(items) == 10:
+                failed += near_dup.record(table, items)
+                items = []
+        failed += near_dup.record(table, items)
+    key = near_dup.bucket_key(total, 0, near_dup.bands(base)[0])
+    pages = int(table.items.get(key, {}).get('Pages', 1))
+    dynamodb = fakes.FakeDynamoDB(table)
+    last = by_total[near_dup.total_key(total)][-20:]
+    same = all(near_dup.find(dynamodb, table, phash, total) == closest(by_total, phash, total) for phash, _ in last)
+    print(f"\nHot bucket: {count:,} receipts with one Total and first band, {pages} pages, {failed} failed bucket "
+          f"updates, last 20 found like a full comparison: {same}")
+    return same and not failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perceptual-hash near-duplicate detection")
+    parser.add_argument('--images', type=int, default=300, help="synthetic receipt pictures (and copies)")
+    parser.add_argument('--population', type=int, nargs='*', default=[100000, 1000000])
+    parser.add_argument('--lookups', type=int, default=300, help="lookups per kind")
+    parser.add_argument('--linear', type=int, default=10, help="lookups per kind timed with the linear check")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per DynamoDB call")
+    parser.add_argument('--hot', type=int, default=12000, help="receipts in one bucket")
+    args = parser.parse_args()
+    if not near_dup.ENABLED:
+        sys.exit("near_dup is disabled (no Pillow)")
+
+    receipts, timings = make_receipts(args.images)
+    accuracy(receipts, timings)
+    ok = through_processor(receipts)
+    ok = hot_bucket(args.hot, receipts) and ok
+    for count in args.population:
+        ok = lookup(count, receipts, args) and ok
+    if not ok:
+        sys.exit("Near-duplicate detection gave wrong results")
@@ -0,0 +1,203 @@
+# The processor against an OCR endpoint that enforces a quota: a burst of
+# receipts goes through S3 -> SQS -> processor.lambda_handler -> fake OCR
+# server (fake_ocr_server.py over real HTTP, --quota calls per --window
+# seconds) -> DynamoDB, with the ingest queue's redrive policy (3 receives,
+# then the DLQ) played by fakes.FakeSQS.
+#
+#   unscheduled   no bucket, no concurrency limit, no retries, no deferral:
+#                 a throttled receipt fails and SQS redelivers it blindly
+#                 (what the processor did before ocr_scheduler.py)
+#   adaptive      AIMD concurrency, backoff and deferral back to SQS, but no
+#                 token bucket (OCR_RATE_PER_MINUTE unset, limits unknown)
+#   scheduled     everything, the bucket sized to the quota
+#
+# All invocations share one Scheduler here, which is what the per-container
+# buckets add up to when OCR_RATE_PER_MINUTE is the plan's rate divided by
+# the event source mapping's maximum_concurrency. Time is scaled down: the
+# function and visibility timeouts, OCR_MAX_WAIT and OCR_DEFER_SECONDS are
+# seconds, not minutes. Every invocation gets a context with --function-timeout
+# seconds left. Exits non-zero if a scheduled mode loses or dead-letters a
+# receipt, or one of its invocations runs past the function timeout.
+#
+#   python benchmarks/bench_ocr_quota.py --receipts 200 --quota 100 --window 30
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import urllib3
+
+import fakes
+import fake_ocr_server
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import ocr
+import ocr_scheduler
+import processor
+
+BUCKET = 'bill-e-bench'
+QUEUE_URL = 'https://sqs.local/000000000000/bill-e-ingest'
+MODES = ('unscheduled', 'adaptive', 'scheduled')
+
+
+class Unscheduled:
+    # Every call goes straight out, a throttle fails the receipt
+    def run(self, call):
+        return call()
+
+    def snapshot(self):
+        return {'limit': '-'}
+
+
+def scheduler_for(mode, args):
+    if mode == 'unscheduled':
+        return Unscheduled()
+    rate = args.quota / args.window * 60 if mode == 'scheduled' else 0
+    return ocr_scheduler.Scheduler(rate_per_minute=rate, burst=args.burst, max_concurrency=processor.MAX_WORKERS,
+                                   target_latency=args.target_latency, max_wait=args.max_wait)
+
+
+class LambdaContext:
+    # What the processor reads from the real one: the time left before the function timeout
+    def __init__(self, timeout):
+        self.ends = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.ends - time.monotonic()) * 1000))
+
+
+def lambda_record(message):
+    # SQS message -> the record shape the event source mapping hands to Lambda
+    attributes = {name: {'stringValue': value['StringValue'], 'dataType': value['DataType']}
+                  for name, value in message.get('MessageAttributes', {}).items()}
+    return {'messageId': message['MessageId'], 'body': message['Body'], 'messageAttributes': attributes}
+
+
+def run(mode, args):
+    server, url = fake_ocr_server.start_server(latency=args.ocr_latency, quota=args.quota, window=args.window,
+                                               throttle_style=args.throttle_style, capacity=args.capacity)
+    stats = server.RequestHandlerClass.state
+    s3 = fakes.FakeS3()
+    sqs = fakes.FakeSQS(latency=0.005, visibility_timeout=args.visibility_timeout, max_receive_count=3)
+    table = fakes.FakeTable(latency=0.005)
+    scheduler = scheduler_for(mode, args)
+    http = urllib3.PoolManager(maxsize=64, block=True, retries=False,
+                               timeout=urllib3.Timeout(connect=args.connect_timeout, read=args.read_timeout))
+    backend = ocr.OcrSpaceBackend('bench', endpoint=url, http=http, scheduler=scheduler)
+    stop = threading.Event()
+    written = 0
+    longest = [0.0]
+
+    for i in range(args.receipts):
+        key = f"uploads/receipt-{i:06d}.png"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=f"receipt {i}\n".encode('utf-8') * 64)
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps(
+            {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]}))
+
+    def poll():
+        # One event source mapping poller: batches of up to 10, delete what succeeded
+        while not stop.is_set():
+            messages = sqs.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=10,
+                                           WaitTimeSeconds=0.1).get('Messages', [])
+            if not messages:
+                continue
+            start = time.perf_counter()
+            result = processor.lambda_handler({'Records': [lambda_record(m) for m in messages]},
+                                              LambdaContext(args.function_timeout))
+            longest[0] = max(longest[0], time.perf_counter() - start)
+            failed = {f['itemIdentifier'] for f in result['batchItemFailures']}
+            for message in messages:
+                if message['MessageId'] not in failed:
+                    sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=message['ReceiptHandle'])
+
+    processor._seen_hashes.clear()
+    queue_url = QUEUE_URL if mode != 'unscheduled' else None
+    began = time.perf_counter()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sqs', sqs), \
+         mock.patch.object(processor, 'sns', fakes.FakeSNS()), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', fakes.FakeDynamoDB(table)), \
+         mock.patch.object(processor, 'ocr_backend', backend), \
+         mock.patch.object(processor, 'INGEST_QUEUE_URL', queue_url), \
+         mock.patch.object(processor, 'DEFER_SECONDS', args.defer_seconds), \
+         mock.patch.object(processor, 'FINISH_SECONDS', args.finish_seconds), \
+         mock.patch.object(ocr, 'OCR_CONNECT_TIMEOUT', args.connect_timeout), \
+         mock.patch.object(ocr, 'OCR_READ_TIMEOUT', args.read_timeout), \
+         mock.patch.object(ocr, 'SCHEDULER', scheduler):
+        threads = [threading.Thread(target=poll, daemon=True) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        deadline = time.perf_counter() + args.timeout
+        while time.perf_counter() < deadline:
+            with table.lock:
+                written = sum(1 for item in table.items.values() if item.get('RecordType') == 'RECEIPT')
+            visible, in_flight = sqs.depth()
+            if written + len(sqs.dead) >= args.receipts and not in_flight:
+                break
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - began
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=args.function_timeout + 5)
+    server.shutdown()
+
+    deferred = sqs.sent - args.receipts
+    return {
+        'mode': mode, 'written': written, 'dead': len(sqs.dead), 'calls': stats['requests'],
+        'throttled': stats['throttled'], 'deferred': deferred, 'seconds': elapsed,
+        'rate': written / elapsed if elapsed else 0.0, 'limit': scheduler.snapshot()['limit'],
+        'longest': longest[0],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processor against an OCR quota")
+    parser.add_argument('--modes', nargs='*', choices=MODES, default=MODES)
+    parser.add_argument('--receipts', type=int, default=200)
+    parser.add_argument('--quota', type=int, default=100, help="OCR calls allowed per window")
+    parser.add_argument('--window', type=float, default=30.0, help="quota window, seconds")
+    parser.add_argument('--throttle-style', choices=['429', 'errored'], default='429')
+    parser.add_argument('--capacity', type=int, default=8, help="OCR calls in flight before it slows down")
+    parser.add_argument('--ocr-latency', type=float, default=0.1)
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent processor invocations")
+    parser.add_argument('--burst', type=int, default=5, help="token bucket size")
+    parser.add_argument('--target-latency', type=float, default=1.0, help="OCR_TARGET_LATENCY, seconds")
+    parser.add_argument('--max-wait', type=float, default=5.0, help="OCR_MAX_WAIT, seconds")
+    parser.add_argument('--defer-seconds', type=float, default=2.0, help="OCR_DEFER_SECONDS")
+    parser.add_argument('--connect-timeout', type=float, default=1.0, help="OCR_CONNECT_TIMEOUT, seconds")
+    parser.add_argument('--read-timeout', type=float, default=2.0, help="OCR_READ_TIMEOUT, seconds")
+    parser.add_argument('--finish-seconds', type=float, default=1.0, help="FINISH_SECONDS")
+    parser.add_argument('--function-timeout', type=float, default=7.0,
+                        help="Lambda timeout; shorter than OCR_MAX_WAIT + the OCR timeouts")
+    parser.add_argument('--visibility-timeout', type=float, default=8.0,
+                        help="shorter than the window, longer than one invocation")
+    parser.add_argument('--timeout', type=float, default=180, help="seconds to wait for every receipt")
+    args = parser.parse_args()
+
+    quota_rate = args.quota / args.window
+    print(f"{args.receipts} receipts, quota {args.quota} calls / {args.window:g}s ({quota_rate:.1f}/s), "
+          f"{args.throttle_style} when over")
+    print(f"{'mode':<12} {'written':>8} {'DLQ':>5} {'OCR calls':>10} {'throttled':>10} {'deferred':>9} "
+          f"{'seconds':>8} {'receipts/s':>11} {'limit':>6} {'longest s':>10}")
+    ok = True
+    for mode in args.modes:
+        r = run(mode, args)
+        print(f"{r['mode']:<12} {r['written']:>8} {r['dead']:>5} {r['calls']:>10} {r['throttled']:>10} "
+              f"{r['deferred']:>9} {r['seconds']:>8.1f} {r['rate']:>11.1f} {r['limit']:>6} {r['longest']:>10.1f}")
+        if mode != 'unscheduled' and (r['written'] != args.receipts or r['dead']
+                                      or r['longest'] > args.function_timeout):
+            ok = False
+    if not ok:
+        sys.exit("A scheduled mode lost or dead-lettered receipts, or ran past the function timeout")
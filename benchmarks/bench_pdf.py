@@ -0,0 +1,140 @@
+# Multi-page PDF receipts through the processor's OCR step (pdf_pages.parse)
+# at 1 / 10 / 50 pages:
+#
+#   whole       the PDF in one OCR.space call, which reads its pages one after
+#               another (the only option without pypdf)
+#   split xN    single-page PDFs, N OCR calls at a time, texts merged in order
+#
+# The fake OCR.space reads the uploaded PDF and spends --page-latency seconds
+# per page. Every page is a receipt image whose text names its page number;
+# the last one has a flagged item, so a document is only scored right if all
+# of its pages were read. Peak memory is what Python allocated during the
+# parse (tracemalloc). Exits non-zero if a mode loses, reorders or mis-scores
+# pages.
+#
+#   python benchmarks/bench_pdf.py --pages 1 10 50 --page-latency 0.5
+import argparse
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+from fake_ocr_server import parse_multipart, receipt_text
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import ocr
+import ocr_scheduler
+import pdf_pages
+import processor
+
+try:
+    import pypdf
+    from PIL import Image, ImageDraw
+except ImportError:
+    sys.exit("bench_pdf.py needs pypdf and Pillow")
+
+
+# --- DOCUMENTS ---
+def page_text(number, pages):
+    text = f"Page {number} of {pages}\n" + receipt_text(f"page-{number}".encode())
+    return text + ("\nBeer  450.00" if number == pages else "")
+
+
+def page_image(text):
+    image = Image.new('L', (600, 800), 255)
+    draw = ImageDraw.Draw(image)
+    for n, line in enumerate(text.split('\n')):
+        draw.text((24, 24 + 18 * n), line, fill=0)
+    return image
+
+
+def build_pdf(pages):
+    # -> (PDF bytes, {sha256 of a page's image: its text})
+    texts = [page_text(n, pages) for n in range(1, pages + 1)]
+    images = [page_image(text) for text in texts]
+    out = io.BytesIO()
+    images[0].save(out, 'PDF', save_all=True, append_images=images[1:], resolution=150)
+    data = out.getvalue()
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    known = {image_key(page): text for page, text in zip(reader.pages, texts)}
+    return data, known
+
+
+def image_key(page):
+    return hashlib.sha256(page.images[0].data).hexdigest()
+
+
+class PdfOcrPool(fakes.FakeHttpPool):
+    # OCR.space stand-in: one ParsedResult per page of the uploaded PDF, --page-latency each
+    def __init__(self, latency, known):
+        super().__init__(latency)
+        self.known = known
+        self.calls = 0
+
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        fields = parse_multipart(headers['Content-Type'], b''.join(body))
+        reader = pypdf.PdfReader(io.BytesIO(fields['file']))
+        self.calls += 1
+        time.sleep(self.latency * len(reader.pages))
+        return fakes.FakeHttpResponse({
+            'ParsedResults': [{'ParsedText': self.known[image_key(page)]} for page in reader.pages],
+            'IsErroredOnProcessing': False,
+        })
+
+
+def run(data, known, mode, workers, latency):
+    pool = PdfOcrPool(latency, known)
+    backend = ocr.OcrSpaceBackend('bench', http=pool, scheduler=ocr_scheduler.Scheduler(max_concurrency=64))
+    # The processor's upload is a spooled file
+    with tempfile.SpooledTemporaryFile(max_size=processor.SPOOL_LIMIT) as spool:
+        spool.write(data)
+        spool.seek(0)
+        tracemalloc.start()
+        began = time.perf_counter()
+        if mode == 'whole':
+            pages = backend.parse(spool, len(data), 'invoice.pdf')
+        else:
+            pages = pdf_pages.parse(backend, spool, len(data), 'invoice.pdf', workers)
+        elapsed = time.perf_counter() - began
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    text = "\n\n".join(pages)
+    score, _ = processor.RISK_ENGINE.assess(text, None, None)
+    return pages, elapsed, peak, pool.calls, score
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-page PDF OCR wall-clock")
+    parser.add_argument('--pages', type=int, nargs='*', default=[1, 10, 50])
+    parser.add_argument('--workers', type=int, nargs='*', default=[1, 4, 8])
+    parser.add_argument('--page-latency', type=float, default=0.5, help="OCR seconds per page")
+    args = parser.parse_args()
+
+    ok = True
+    print(f"{'pages':>5} {'PDF KB':>7} {'mode':<9} {'seconds':>8} {'OCR calls':>10} {'peak MB':>8} "
+          f"{'in order':>9} {'risk':>5}")
+    for count in args.pages:
+        data, known = build_pdf(count)
+        expected = [page_text(n, count) for n in range(1, count + 1)]
+        modes = [('whole', None)] + [(f"split x{w}", w) for w in args.workers]
+        for name, workers in modes:
+            pages, elapsed, peak, calls, score = run(data, known, 'whole' if workers is None else 'split',
+                                                     workers, args.page_latency)
+            in_order = pages == expected
+            ok = ok and in_order and score > 0
+            print(f"{count:>5} {len(data) / 1024:>7.0f} {name:<9} {elapsed:>8.2f} {calls:>10} "
+                  f"{peak / 1e6:>8.1f} {str(in_order):>9} {score:>5}")
+
+    if not ok:
+        sys.exit("Pages were lost, reordered or not scored")
@@ -0,0 +1,329 @@
+# End-to-end benchmark of S3 -> SQS -> processor -> DynamoDB -> reader -> dashboard.
+#
+# The real processor.lambda_handler and reader.lambda_handler run in-process
+# against the stand-ins in fakes.py, each with its own injected latency:
+#
+#   upload       a synthetic receipt image is PUT to S3, and S3 notifies SQS
+#   queue_wait   message sent -> picked up by a poller (includes the batching window)
+#   handler      one processor invocation for a whole SQS batch
+#   s3_get / dedup_lookup / ocr / alert / ledger_write   calls made by the handler
+#   written      upload -> row in the ledger
+#   visible      upload -> first dashboard poll (reader ?since=) that returns the row
+#   reader       one reader invocation
+#
+# Uploads are replayed in bursts at --rate receipts/second for --duration
+# seconds. The report has p50/p95/p99 per stage, throughput and the queue
+# backlog; --json writes the same numbers (plus the git commit) to a file so
+# runs can be compared across commits.
+#
+#   python benchmarks/bench_pipeline.py --rate 40 --duration 20 --json pipeline.json
+import argparse
+import hashlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+from fake_ocr_server import parse_multipart, receipt_text
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import processor
+import reader
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+BUCKET = 'bill-e-bench'
+QUEUE_URL = 'https://sqs.local/000000000000/bill-e-ingest'
+
+
+# --- SYNTHETIC RECEIPTS ---
+def receipt_image(i):
+    # A small grayscale receipt with a unique line, so every upload hashes differently
+    seed = hashlib.sha256(f"receipt-{i}".encode()).digest()
+    text = receipt_text(seed) + f"\n\nRef {i:08d}"
+    if Image is None:
+        return text.encode('utf-8') * 50
+    image = Image.new('L', (480, 640), 255)
+    draw = ImageDraw.Draw(image)
+    for n, line in enumerate(text.split('\n')):
+        draw.text((24, 24 + 18 * n), line, fill=0)
+    out = io.BytesIO()
+    image.save(out, 'PNG')
+    return out.getvalue()
+
+
+class OcrPool(fakes.FakeHttpPool):
+    # OCR.space stand-in whose text depends on the uploaded file, like fake_ocr_server.py
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        data = b''.join(body)
+        fields = parse_multipart(headers['Content-Type'], data)
+        time.sleep(self.latency)
+        return fakes.FakeHttpResponse({
+            'ParsedResults': [{'ParsedText': receipt_text(fields['file'])}],
+            'IsErroredOnProcessing': False,
+        })
+
+
+# --- MEASUREMENT ---
+class Stages:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples[stage].append(seconds)
+
+    def timed(self, stage, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return wrapper
+
+
+def percentile(ordered, p):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p95_ms': percentile(ordered, 95) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+# --- THE PIPELINE ---
+def run(args):
+    stages = Stages()
+    s3 = fakes.FakeS3(latency=args.s3_latency)
+    sqs = fakes.FakeSQS(latency=args.sqs_latency, visibility_timeout=args.visibility_timeout)
+    table = fakes.FakeTable(latency=args.db_latency, throttle_rate=args.throttle_rate)
+    dynamodb = fakes.FakeDynamoDB(table, latency=args.db_latency)
+    sns = fakes.FakeSNS(latency=args.sns_latency)
+    ocr_pool = OcrPool(latency=args.ocr_latency)
+
+    uploaded_at = {}   # ReceiptID -> upload start
+    written_at = {}    # ReceiptID -> ledger write done
+    backlog = []       # (t, visible, in flight)
+    stop = threading.Event()
+
+    # Time every call the handler makes
+    s3.get_object = stages.timed('s3_get', s3.get_object)
+    table.get_item = stages.timed('dedup_lookup', table.get_item)
+    ocr_pool.urlopen = stages.timed('ocr', ocr_pool.urlopen)
+    sns.publish = stages.timed('alert', sns.publish)
+    put = stages.timed('ledger_write', table.put_item)
+
+    def put_item(Item, **kwargs):
+        response = put(Item=Item, **kwargs)  # raises when throttled or already there
+        now = time.perf_counter()
+        receipt_id = Item['ReceiptID']
+        if receipt_id not in written_at:
+            written_at[receipt_id] = now
+            stages.add('written', now - uploaded_at[receipt_id])
+        return response
+    table.put_item = put_item
+
+    # 1. Producer: bursts of uploads at the target rate; S3 notifies SQS
+    total = int(args.rate * args.duration)
+    bodies = [receipt_image(i) for i in range(total)]
+
+    def upload(i):
+        key = f"uploads/receipt-{i:06d}.png"
+        start = time.perf_counter()
+        uploaded_at[hashlib.sha256(bodies[i]).hexdigest()] = start
+        s3.put_object(Bucket=BUCKET, Key=key, Body=bodies[i])
+        time.sleep(args.s3_latency)
+        sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps(
+            {'Records': [{'s3': {'bucket': {'name': BUCKET}, 'object': {'key': key}}}]}))
+        stages.add('upload', time.perf_counter() - start)
+
+    def produce():
+        interval = args.burst / float(args.rate)
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            for n, first in enumerate(range(0, total, args.burst)):
+                delay = began + n * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                for i in range(first, min(first + args.burst, total)):
+                    pool.submit(upload, i)
+
+    # 2. Event source mapping: pollers fill a batch (up to --batch-size or the
+    # batching window), invoke the handler, and delete what succeeded
+    def poll():
+        while not stop.is_set():
+            messages = []
+            window_ends = None
+            while len(messages) < args.batch_size and not stop.is_set():
+                wait = 0.1 if window_ends is None else max(0.0, window_ends - time.monotonic())
+                got = sqs.receive_message(QueueUrl=QUEUE_URL, MaxNumberOfMessages=args.batch_size - len(messages),
+                                          WaitTimeSeconds=min(wait, 0.1)).get('Messages', [])
+                if got and window_ends is None:
+                    window_ends = time.monotonic() + args.window
+                messages += got
+                if window_ends is not None and time.monotonic() >= window_ends:
+                    break
+            if not messages:
+                continue
+            now_ms = time.time() * 1000
+            for message in messages:
+                stages.add('queue_wait', (now_ms - int(message['Attributes']['SentTimestamp'])) / 1000.0)
+            event = {'Records': [{'messageId': m['MessageId'], 'body': m['Body']} for m in messages]}
+            result = stages.timed('handler', processor.lambda_handler)(event, None)
+            failed = {f['itemIdentifier'] for f in result['batchItemFailures']}
+            for message in messages:
+                if message['MessageId'] not in failed:
+                    sqs.delete_message(QueueUrl=QUEUE_URL, ReceiptHandle=message['ReceiptHandle'])
+
+    # 3. Dashboard: delta sync through the reader every --poll-interval seconds
+    visible = set()
+
+    def dashboard():
+        since = '0'
+        while not stop.is_set():
+            params = {'since': since, 'limit': '1000'}
+            while True:
+                response = stages.timed('reader', reader.lambda_handler)({'queryStringParameters': params}, None)
+                body = json.loads(response['body'])
+                now = time.perf_counter()
+                for item in body['items']:
+                    since = max(since, item['UpdatedAt'])
+                    if item['ReceiptID'] not in visible:
+                        visible.add(item['ReceiptID'])
+                        stages.add('visible', now - uploaded_at[item['ReceiptID']])
+                if not body['next_cursor']:
+                    break
+                params = {'since': params['since'], 'limit': '1000', 'cursor': body['next_cursor']}
+            stop.wait(args.poll_interval)
+
+    def sample_backlog():
+        began = time.perf_counter()
+        while not stop.is_set():
+            backlog.append((round(time.perf_counter() - began, 2),) + sqs.depth())
+            stop.wait(0.1)
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', sns), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', dynamodb), \
+         mock.patch.object(processor.ocr_backend, 'http', ocr_pool), \
+         mock.patch.object(reader, 'table', table):
+        threads = [threading.Thread(target=poll, daemon=True) for _ in range(args.concurrency)]
+        threads += [threading.Thread(target=dashboard, daemon=True), threading.Thread(target=sample_backlog, daemon=True)]
+        for thread in threads:
+            thread.start()
+        began = time.perf_counter()
+        produce()
+        drain_deadline = time.perf_counter() + args.drain_timeout
+        while len(visible) < total and time.perf_counter() < drain_deadline:
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - began
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+    completed = sorted(written_at.values())
+    return {
+        'commit': git_commit(),
+        'config': vars(args),
+        'receipts': {'uploaded': total, 'written': len(written_at), 'visible': len(visible)},
+        'throughput': {
+            'offered_per_s': args.rate,
+            'written_per_s': len(completed) / (completed[-1] - began) if completed else 0.0,
+            'elapsed_s': elapsed,
+        },
+        'backlog': {
+            'max_visible': max((v for _, v, _ in backlog), default=0),
+            'max_in_flight': max((f for _, _, f in backlog), default=0),
+            'mean_visible': sum(v for _, v, _ in backlog) / max(1, len(backlog)),
+            'samples': backlog,
+        },
+        'stages': {stage: summarize(samples) for stage, samples in stages.samples.items()},
+    }
+
+
+STAGE_ORDER = ['upload', 'queue_wait', 'handler', 's3_get', 'dedup_lookup', 'ocr', 'alert',
+               'ledger_write', 'written', 'reader', 'visible']
+
+
+def print_report(report):
+    counts = report['receipts']
+    print(f"Commit {report['commit']}: {counts['uploaded']} uploaded, {counts['written']} written, "
+          f"{counts['visible']} visible on the dashboard")
+    print(f"{'stage':<14} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage in STAGE_ORDER:
+        s = report['stages'].get(stage)
+        if s:
+            print(f"{stage:<14} {s['count']:>7} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} "
+                  f"{s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    t, b = report['throughput'], report['backlog']
+    print(f"Throughput: {t['written_per_s']:.1f} receipts/s written (offered {t['offered_per_s']}/s)")
+    print(f"Backlog: max {b['max_visible']} waiting, max {b['max_in_flight']} in flight, "
+          f"mean {b['mean_visible']:.1f} waiting")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument('--rate', type=float, default=20, help="uploads per second")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of uploads")
+    parser.add_argument('--burst', type=int, default=5, help="uploads arriving together")
+    parser.add_argument('--concurrency', type=int, default=4, help="concurrent processor invocations")
+    parser.add_argument('--batch-size', type=int, default=10, help="SQS batch size (terraform: 10)")
+    parser.add_argument('--window', type=float, default=5, help="maximum batching window, seconds (terraform: 5)")
+    parser.add_argument('--visibility-timeout', type=float, default=30)
+    parser.add_argument('--poll-interval', type=float, default=1.0, help="dashboard sync interval, seconds")
+    parser.add_argument('--s3-latency', type=float, default=0.02)
+    parser.add_argument('--sqs-latency', type=float, default=0.01)
+    parser.add_argument('--db-latency', type=float, default=0.01)
+    parser.add_argument('--sns-latency', type=float, default=0.02)
+    parser.add_argument('--ocr-latency', type=float, default=0.5)
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of ledger writes throttled")
+    parser.add_argument('--drain-timeout', type=float, default=60, help="seconds to wait for the backlog to clear")
+    parser.add_argument('--json', help="write the full report here")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
@@ -0,0 +1,135 @@
+# Payload size and end-to-end time per receipt with and without the
+# pre-processing stage (lambda/preprocess.py).
+#
+# The corpus is receipt.png from the repo plus synthetic phone-camera shots
+# (12 MP RGB canvas with sensor noise, paper on a table, some rotated through
+# EXIF), which come out at the 2-4 MB of a real phone JPEG.
+# OCR time is modelled as a round trip plus upload at UPLINK_MBPS; set
+# OCR_API_KEY to time real OCR.space calls instead (or OCR_ENDPOINT to use
+# benchmarks/fake_ocr_server.py). "OCR" is that call alone, "e2e" adds the
+# pre-processing time.
+# Then a 3-frame TIFF must come out with every frame as a page that pdf_pages
+# sends to OCR on its own; exits 1 if a frame is lost.
+#
+#   python benchmarks/bench_preprocess.py
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter
+
+import ocr
+import pdf_pages
+import preprocess
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+OCR_RTT = 0.4       # seconds
+UPLINK_MBPS = 10    # Lambda -> OCR.space
+
+
+def synthetic_receipt(seed, fmt, orientation=None):
+    rng = random.Random(seed)
+    photo = Image.new('RGB', (3024, 4032), (90 + rng.randint(0, 40), 70, 50))
+    paper = Image.new('RGB', (1400, 2900), (245, 243, 236))
+    draw = ImageDraw.Draw(paper)
+    lines = ["CITY MART", "12 Market Road", f"Date: {rng.randint(1, 28):02d}-03-2025", ""]
+    lines += [f"{rng.choice(['Milk', 'Bread', 'Eggs', 'Coffee', 'Beer'])} x{rng.randint(1, 4)}   {rng.uniform(1, 30):7.2f}"
+              for _ in range(rng.randint(8, 25))]
+    lines += ["", "SUBTOTAL   123.45", "TAX   6.17", "TOTAL   129.62"]
+    for i, line in enumerate(lines):
+        draw.text((80, 80 + i * 70), line, fill=(20, 20, 20))
+    paper = paper.filter(ImageFilter.GaussianBlur(0.6))
+    photo.paste(paper.rotate(rng.uniform(-4, 4), expand=True, fillcolor=(90, 70, 50)), (800, 500))
+    # Sensor noise: without it a flat synthetic photo compresses far better than a real one
+    photo = ImageChops.add(photo, Image.merge('RGB', [Image.effect_noise(photo.size, 6)] * 3), 1.0, -128)
+
+    out = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+        photo = photo.rotate(90, expand=True)
+    if fmt == 'JPEG':
+        photo.save(out, fmt, quality=92, exif=exif)
+    else:
+        photo.save(out, fmt, exif=exif)
+    return out.getvalue()
+
+
+def corpus():
+    with open(os.path.join(ROOT, 'receipt.png'), 'rb') as f:
+        yield 'receipt.png', f.read()
+    for i in range(6):
+        fmt = 'JPEG' if i % 2 else 'PNG'
+        name = f"phone-{i}.{'jpg' if fmt == 'JPEG' else 'png'}"
+        yield name, synthetic_receipt(i, fmt, orientation=6 if i % 3 == 0 else None)
+
+
+class PageCounter:
+    # OCR backend that records what it was sent and answers one page per call
+    def __init__(self):
+        self.sent = []
+
+    def parse(self, fileobj, size, filename):
+        self.sent.append(fileobj.read())
+        return [f"page {len(self.sent)}"]
+
+
+def check_multi_frame(frames=3):
+    # Each frame a different receipt; all of them must reach OCR
+    images = [Image.open(io.BytesIO(synthetic_receipt(100 + i, 'PNG'))) for i in range(frames)]
+    out = io.BytesIO()
+    images[0].save(out, 'TIFF', save_all=True, append_images=images[1:], compression='tiff_deflate')
+    data = out.getvalue()
+    prepared = preprocess.preprocess_image(io.BytesIO(data), 'scan.tiff', len(data))
+    if not prepared:
+        print(f"multi-frame TIFF: {frames} frames, sent as is")
+        return True
+    upload, size, upload_name, stats = prepared
+    backend = PageCounter()
+    texts = pdf_pages.parse(backend, upload, size, upload_name)
+    ok = len(texts) == frames and len(set(backend.sent)) == frames
+    print(f"multi-frame TIFF: {frames} frames, {len(data):,} -> {size:,} bytes as {upload_name},"
+          f" {len(texts)} page(s) sent to OCR {'OK' if ok else 'LOST FRAMES'}")
+    return ok
+
+
+def ocr_seconds(fileobj, size, filename):
+    if os.environ.get('OCR_API_KEY'):
+        start = time.perf_counter()
+        ocr.get_backend().parse(fileobj, size, filename)
+        return time.perf_counter() - start
+    return OCR_RTT + size * 8 / (UPLINK_MBPS * 1_000_000)
+
+
+if __name__ == "__main__":
+    print(f"{'file':<14} {'bytes in':>10} {'bytes out':>10} {'saved':>7} {'prep ms':>8}"
+          f" {'OCR before s':>13} {'OCR after s':>12} {'e2e after s':>12}")
+    totals = [0, 0, 0.0, 0.0, 0.0]
+    receipts = 0
+    for name, data in corpus():
+        before = ocr_seconds(io.BytesIO(data), len(data), name)
+
+        start = time.perf_counter()
+        prepared = preprocess.preprocess_image(io.BytesIO(data), name, len(data))
+        prep = time.perf_counter() - start
+        if prepared:
+            upload, size, upload_name, _ = prepared
+        else:
+            upload, size, upload_name = io.BytesIO(data), len(data), name
+        ocr_after = ocr_seconds(upload, size, upload_name)
+
+        receipts += 1
+        totals = [totals[0] + len(data), totals[1] + size, totals[2] + prep, totals[3] + before, totals[4] + ocr_after]
+        print(f"{name:<14} {len(data):>10,} {size:>10,} {1 - size / len(data):>7.0%} {prep * 1000:>8.0f}"
+              f" {before:>13.2f} {ocr_after:>12.2f} {prep + ocr_after:>12.2f}")
+    print(f"{'total':<14} {totals[0]:>10,} {totals[1]:>10,} {1 - totals[1] / totals[0]:>7.0%} {totals[2] * 1000:>8.0f}"
+          f" {totals[3]:>13.2f} {totals[4]:>12.2f} {totals[2] + totals[4]:>12.2f}")
+    print(f"\nper receipt: OCR {totals[3] / receipts:.2f} s -> {totals[4] / receipts:.2f} s,"
+          f" pre-processing {totals[2] / receipts * 1000:.0f} ms,"
+          f" end to end {totals[3] / receipts:.2f} s -> {(totals[2] + totals[4]) / receipts:.2f} s")
+    if not check_multi_frame():
+        sys.exit(1)
@@ -0,0 +1,229 @@
+# Hit rate, latency and transfer of the reader's read cache (lambda/read_cache.py)
+# under a dashboard-like load, with the cache on and off.
+#
+# --clients sync clients each load the whole ledger once and then poll the delta
+# (?since=<newest UpdatedAt - 30s>) every --poll-interval seconds, sending
+# If-None-Match. Meanwhile a writer adds a receipt every
+# --write-interval seconds and bumps the ledger version like the processor.
+# The reader's table is a fakes.FakeTable with --latency per call.
+#
+# Exits non-zero if any dashboard ends up with a ledger that differs from the table.
+#
+#   python benchmarks/bench_read_cache.py --clients 20 --duration 10
+import argparse
+import base64
+import datetime
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+
+import fakes
+import read_cache
+import reader
+from bench_pipeline import percentile
+
+SYNC_OVERLAP = datetime.timedelta(seconds=30)
+
+
+class CountingTable(fakes.FakeTable):
+    # Adds up the read units and calls the reader spends
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.units = 0.0
+        self.calls = {'query': 0, 'get_item': 0}
+        self.count_lock = threading.Lock()
+
+    def query(self, **kwargs):
+        response = super().query(**kwargs)
+        with self.count_lock:
+            self.calls['query'] += 1
+            self.units += response.get('ConsumedCapacity', {}).get('CapacityUnits', 0)
+        return response
+
+    def get_item(self, **kwargs):
+        response = super().get_item(**kwargs)
+        with self.count_lock:
+            self.calls['get_item'] += 1
+            self.units += 0.5
+        return response
+
+
+def receipt(i, when):
+    stamp = when.isoformat()
+    return {
+        'ReceiptID': f"{i:064x}",
+        'RecordType': 'RECEIPT',
+        'Filename': f"receipt-{i}.png",
+        'UploadDate': stamp,
+        'UpdatedAt': stamp,
+        'Status': 'Analyzed',
+        'ExtractedText': "CITY MART\nMilk 2.50\nBread 1.20\nTOTAL 3.70",
+        'RiskScore': 50 if i % 5 == 0 else 0,
+        'RiskFlags': ["Suspicious Item: beer"] if i % 5 == 0 else [],
+    }
+
+
+class Dashboard:
+    # A delta-sync client: full load, then since= polls revalidated by ETag
+    def __init__(self, stats):
+        self.ledger = {}
+        self.watermark = None
+        self.delta_pages = {}
+        self.stats = stats
+
+    def get(self, params, etag=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if etag:
+            headers['If-None-Match'] = etag
+        start = time.perf_counter()
+        response = reader.lambda_handler({'queryStringParameters': params, 'headers': headers}, None)
+        self.stats.record(response, time.perf_counter() - start)
+        return response
+
+    def sync(self):
+        since = None
+        if self.watermark:
+            since = (datetime.datetime.fromisoformat(self.watermark) - SYNC_OVERLAP).isoformat()
+        pages, cursor = {}, None
+        while True:
+            params = {'limit': '1000'}
+            if since:
+                params['since'] = since
+            if cursor:
+                params['cursor'] = cursor
+            key = tuple(sorted(params.items()))
+            known = self.delta_pages.get(key)
+            response = self.get(params, known[0] if known else None)
+            if response['statusCode'] == 304:
+                page = known[1]
+            else:
+                body = response['body']
+                if response.get('isBase64Encoded'):
+                    body = gzip.decompress(base64.b64decode(body))
+                page = json.loads(body)
+            if since:
+                pages[key] = (response['headers']['ETag'], page)
+            for item in page['items']:
+                self.ledger[item['ReceiptID']] = item
+                self.watermark = max(self.watermark or '', item['UpdatedAt'])
+            cursor = page['next_cursor']
+            if not cursor:
+                self.delta_pages = pages
+                return
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # X-Cache -> seconds
+        self.by_cache = {}
+        self.by_status = {}
+        self.bytes_sent = 0
+
+    def record(self, response, seconds):
+        headers = response.get('headers', {})
+        with self.lock:
+            cache = headers.get('X-Cache', '-')
+            self.latencies.setdefault(cache, []).append(seconds)
+            self.by_cache[cache] = self.by_cache.get(cache, 0) + 1
+            self.by_status[response['statusCode']] = self.by_status.get(response['statusCode'], 0) + 1
+            body = response.get('body', '')
+            self.bytes_sent += len(base64.b64decode(body)) if response.get('isBase64Encoded') else len(body.encode('utf-8'))
+
+
+def run(args, enabled):
+    table = CountingTable(latency=args.latency)
+    start = datetime.datetime(2025, 1, 1)
+    for i in range(args.rows):
+        row = receipt(i, start + datetime.timedelta(seconds=i))
+        table.items[row['ReceiptID']] = row
+    table.query(IndexName='UploadDateIndex', KeyConditionExpression=reader.Key('RecordType').eq('RECEIPT'))
+
+    cache = read_cache.ReadCache(ttl=args.ttl, version_ttl=args.version_ttl)
+    stats = Stats()
+    stop = threading.Event()
+    dashboards = [Dashboard(stats) for _ in range(args.clients)]
+
+    def writer():
+        i = args.rows
+        while not stop.wait(args.write_interval):
+            table.put_item(Item=receipt(i, datetime.datetime.now()))
+            read_cache.bump_version(table)
+            i += 1
+
+    def poll(dashboard):
+        while not stop.is_set():
+            dashboard.sync()
+            stop.wait(args.poll_interval)
+
+    with mock.patch('builtins.print'), \
+         mock.patch.object(reader, 'table', table), \
+         mock.patch.object(reader, 'cache', cache), \
+         mock.patch.object(read_cache, 'ENABLED', enabled):
+        threads = [threading.Thread(target=writer, daemon=True)]
+        threads += [threading.Thread(target=poll, args=(d,), daemon=True) for d in dashboards]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - began
+
+        # Once the version check comes round again, every dashboard must hold the whole ledger
+        time.sleep(args.version_ttl)
+        for dashboard in dashboards:
+            dashboard.sync()
+
+    expected = {key: item for key, item in table.items.items() if item.get('RecordType') == 'RECEIPT'}
+    stale = sum(1 for d in dashboards if d.ledger.keys() != expected.keys())
+    return stats, table, seconds, stale
+
+
+def report(name, stats, table, seconds, stale):
+    requests = sum(stats.by_cache.values())
+    hits = stats.by_cache.get('HIT', 0)
+    print(f"\n{name}: {requests:,} requests in {seconds:.1f}s ({requests / seconds:,.0f}/s)")
+    print(f"  hit rate        {hits / requests:.1%}")
+    print(f"  status          {dict(sorted(stats.by_status.items()))}")
+    for cache, latencies in sorted(stats.latencies.items()):
+        ordered = sorted(latencies)
+        print(f"  {cache + ' ms':<16}p50 {percentile(ordered, 50) * 1000:.2f}  p95 {percentile(ordered, 95) * 1000:.2f}"
+              f"  p99 {percentile(ordered, 99) * 1000:.2f}  ({len(ordered):,} requests)")
+    print(f"  DynamoDB        {table.calls['query']:,} queries, {table.calls['get_item']:,} version reads,"
+          f" {table.units:,.0f} RCU")
+    print(f"  response bytes  {stats.bytes_sent / 1e6:,.1f} MB")
+    print(f"  stale ledgers   {stale}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read cache hit rate and latency")
+    parser.add_argument('--rows', type=int, default=5000, help="receipts in the ledger at the start")
+    parser.add_argument('--clients', type=int, default=20, help="dashboards polling at the same time")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="seconds between dashboard refreshes")
+    parser.add_argument('--write-interval', type=float, default=3.0, help="seconds between new receipts")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds per DynamoDB call")
+    parser.add_argument('--ttl', type=float, default=read_cache.TTL)
+    parser.add_argument('--version-ttl', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{args.rows:,} rows, {args.clients} dashboards every {args.poll_interval}s,"
+          f" a new receipt every {args.write_interval}s, {args.latency * 1000:.0f} ms per DynamoDB call")
+    results = {}
+    for name, enabled in (('no cache', False), ('read cache', True)):
+        results[name] = run(args, enabled)
+        report(name, *results[name])
+
+    if any(result[3] for result in results.values()):
+        sys.exit("Some dashboards did not converge to the table contents")
@@ -0,0 +1,121 @@
+# Latency and consumed read capacity of the old full-table Scan against one
+# page of the UploadDate index Query, at 1k / 100k / 1M ledger rows.
+# Then walks filtered pages (min_risk on the date-sorted index) over a sparse
+# and a dense ledger: every page must be full until the last, and the pages
+# together must hold each match exactly once. Exits non-zero if not.
+#
+#   python benchmarks/bench_reader.py
+import datetime
+import json
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+
+import fakes
+import reader
+
+SIZES = (1_000, 100_000, 1_000_000)
+
+
+def build_table(n):
+    table = fakes.FakeTable()
+    start = datetime.datetime(2025, 1, 1)
+    for i in range(n):
+        risk = random.choice((0, 0, 0, 50, 100))
+        table.items[f"{i:064x}"] = {
+            'ReceiptID': f"{i:064x}",
+            'RecordType': 'RECEIPT',
+            'Filename': f"receipt-{i}.png",
+            'UploadDate': (start + datetime.timedelta(seconds=i)).isoformat(),
+            'Status': 'Analyzed',
+            'ExtractedText': "CITY MART Milk 2.50 TOTAL 2.50...",
+            'RiskScore': risk,
+            'RiskFlags': ["Suspicious Item: beer"] if risk else [],
+        }
+    return table
+
+
+def full_scan(table):
+    # What the reader used to do, but following every page so nothing is truncated
+    units, items, kwargs = 0, 0, {'ReturnConsumedCapacity': 'TOTAL'}
+    while True:
+        response = table.scan(**kwargs)
+        units += response['ConsumedCapacity']['CapacityUnits']
+        items += len(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return items, units
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_page(table, params):
+    # The read cache would answer repeats from memory; this measures the Query itself
+    with mock.patch.object(reader, 'table', table), mock.patch.object(reader.read_cache, 'ENABLED', False):
+        response = reader.lambda_handler({'queryStringParameters': params}, None)
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def walk(table, params):
+    # -> (page sizes, ReceiptIDs in order) following next_cursor to the end
+    sizes, ids, cursor = [], [], None
+    with mock.patch('builtins.print'):
+        while True:
+            page = query_page(table, dict(params, cursor=cursor) if cursor else params)
+            sizes.append(len(page['items']))
+            ids.extend(item['ReceiptID'] for item in page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return sizes, ids
+
+
+def check_filtered_pages():
+    ok = True
+    for name, flagged_every in (('sparse (0.5%)', 200), ('dense (50%)', 2)):
+        table = build_table(1000)
+        for i, item in enumerate(table.items.values()):
+            item['RiskScore'] = 50 if i % flagged_every == 0 else 0
+        expected = [item['ReceiptID'] for item in sorted(table.items.values(), key=lambda item: item['UploadDate'],
+                                                         reverse=True) if item['RiskScore'] >= 50]
+        sizes, ids = walk(table, {'limit': '50', 'min_risk': '50'})
+        good = ids == expected and all(size == 50 for size in sizes[:-1])
+        print(f"  {name:<14} limit=50&min_risk=50: {len(sizes)} page(s) of {sizes[:4]}{'...' if len(sizes) > 4 else ''},"
+              f" {len(ids)} of {len(expected)} matches {'OK' if good else 'WRONG'}")
+        ok = ok and good
+    return ok
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    print(f"{'rows':>9} {'scan ms':>10} {'scan RCU':>10} {'query ms':>10} {'query RCU':>10} {'filtered ms':>12}")
+    for n in SIZES:
+        table = build_table(n)
+        table.query(IndexName='UploadDateIndex', KeyConditionExpression=reader.Key('RecordType').eq('RECEIPT'))  # build the index once
+
+        (_, scan_units), scan_ms = timed(full_scan, table)
+
+        # The reader logs the consumed capacity; capture it for the report
+        with mock.patch('builtins.print') as log:
+            page, query_ms = timed(query_page, table, {'limit': '100'})
+        query_units = log.call_args[0][0].split('consumed ')[1].split(' ')[0]
+
+        with mock.patch('builtins.print'):
+            _, filtered_ms = timed(query_page, table, {'limit': '100', 'min_risk': '50'})
+
+        assert len(page['items']) == 100 and page['next_cursor']
+        print(f"{n:>9} {scan_ms:>10.1f} {scan_units:>10.1f} {query_ms:>10.1f} {query_units:>10} {filtered_ms:>12.1f}")
+
+    print("\nFiltered pages on 1,000 rows")
+    if not check_filtered_pages():
+        sys.exit("Filtered pages are short or miss matches")
@@ -0,0 +1,192 @@
+# Rows/second of the vectorized bulk re-score (tools/rescore.py) against
+# calling RiskEngine.assess once per receipt, on a synthetic 1M-row ledger.
+# Also checks both give identical scores and flags, and runs the full
+# scan -> score -> write-back job on a fake table. Like the processor's, the
+# ledger rows keep only 100 characters of text and the rest is in a fake search
+# table: re-scoring with the rules the ledger was scored with must change
+# nothing, with or without the search table. Exits 1 when it does, or when a
+# receipt deleted during the run aborts the job, or UpdatedAt isn't UTC.
+#
+#   python benchmarks/bench_rescore.py [rows]
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from unittest import mock
+
+import rescore
+import search_index
+from fakes import FakeDynamoDB, FakeTable
+from risk_engine import RiskEngine
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BATCH = 100_000
+LOOP_SAMPLE = 50_000
+TABLE_ROWS = 20_000
+
+RULES = {
+    'keywords': {'casino': 50, 'alcohol': 50, 'bar': 50, 'beer': 50, 'wine': 50, 'vodka': 50,
+                 'gift card': 30, 'tobacco': 40},
+    'patterns': {'ROUND_TOTAL': {'pattern': r"total\s*:?\s*\d+\.00\b", 'weight': 10}},
+    'amount_threshold': 5000,
+    'amount_weight': 20,
+    'weekdays': [5, 6],
+    'weekday_weight': 10,
+}
+# The rule set the ledger was scored with before the change
+OLD_RULES = {'keywords': {'casino': 50, 'alcohol': 50, 'bar': 50, 'beer': 50, 'wine': 50, 'vodka': 50}}
+
+
+def make_rows(n, seed=7):
+    rng = random.Random(seed)
+    vocab = ["CITY", "MART", "Milk", "Bread", "barcode", "Cashier", "Thank", "you", "GST", "Eggs", "Rice"]
+    extras = ["Beer", "Gift Card", "Tobacco", "CASINO", "wine", "vodka"]
+    day0 = datetime.date(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        # Some receipts are longer than the ledger's 100-character preview
+        words = [rng.choice(vocab) for _ in range(rng.choice((8, 12, 24)))]
+        if rng.random() < 0.1:
+            words.insert(rng.randrange(len(words)), rng.choice(extras))
+        total = round(rng.uniform(1, 8000), rng.choice((0, 2)))
+        text = ' '.join(words) + f" TOTAL: {total:.2f}"
+        rows.append({
+            'ReceiptID': f"{i:064x}",
+            'RecordType': 'RECEIPT',
+            'ExtractedText': text[:100] + "...",
+            'Total': total,
+            'Date': (day0 + datetime.timedelta(days=rng.randrange(365))).isoformat(),
+            'FullText': text,  # not a ledger attribute: goes to the search table
+        })
+        if rng.random() < 0.02:
+            rows[-1]['NearDuplicateOf'] = f"{rng.randrange(i + 1):064x}"
+    return rows
+
+
+def score_with(engine, rows):
+    # Scored like the processor does: on the whole text
+    for row in rows:
+        row['RiskScore'], row['RiskFlags'] = engine.assess(row['FullText'], row['Total'], row['Date'],
+                                                           'NearDuplicateOf' in row)
+    return rows
+
+
+def full_frame(rows):
+    # A batch as rescore() scores it, once the full texts have been looked up
+    frame = rescore.to_frame(rows)
+    frame['Text'] = [row['FullText'] for row in rows]
+    return frame
+
+
+def fake_ledger(rows):
+    # -> (ledger, FullTexts over a search table holding every text)
+    table = FakeTable()
+    index = FakeTable(key='Term', range_key='Block', indexes={}, name='BillE_SearchIndex')
+    for row in rows:
+        table.put_item(Item={k: v for k, v in row.items() if k != 'FullText'})
+    search_index.index(index, [(row['ReceiptID'], row['FullText']) for row in rows])
+    return table, rescore.FullTexts(FakeDynamoDB(table, index), index)
+
+
+if __name__ == "__main__":
+    engine = RiskEngine(RULES)
+    print(f"Building {ROWS:,} synthetic receipts...")
+    frames = [full_frame(score_with(RiskEngine(OLD_RULES), make_rows(min(BATCH, ROWS - start), seed=start)))
+              for start in range(0, ROWS, BATCH)]
+
+    # 1. Row-at-a-time baseline on a sample
+    sample = frames[0].head(LOOP_SAMPLE)
+    start = time.perf_counter()
+    expected = [engine.assess(t, a, d, n) for t, a, d, n in
+                zip(sample['Text'], sample['Total'], sample['Date'], sample['NearDuplicateOf'].notna())]
+    loop_rate = len(sample) / (time.perf_counter() - start)
+
+    # 2. Vectorized, over every batch
+    changed = 0
+    start = time.perf_counter()
+    for frame in frames:
+        scores, flags = rescore.score_frame(engine, frame)
+        changed += len(rescore.changed_rows(frame, scores, flags))
+    vector_seconds = time.perf_counter() - start
+
+    scores, flags = rescore.score_frame(engine, sample)
+    mismatches = sum(1 for (s, f), vs, vf in zip(expected, scores, flags) if s != vs or f != vf)
+
+    print(f"{'method':<12} {'rows/s':>12} {'1M rows':>10}")
+    print(f"{'per-row':<12} {loop_rate:>12,.0f} {1_000_000 / loop_rate:>9.1f}s")
+    print(f"{'vectorized':<12} {ROWS / vector_seconds:>12,.0f} {1_000_000 * vector_seconds / ROWS:>9.1f}s")
+    print(f"Changed rows: {changed:,} of {ROWS:,} ({changed / ROWS:.1%}); "
+          f"mismatches vs engine.assess on {len(sample):,} rows: {mismatches}")
+
+    # 3. Same rules the ledger was scored with: nothing may change, however
+    # much of the text is past the preview
+    rows = score_with(RiskEngine(OLD_RULES), make_rows(TABLE_ROWS))
+    long_texts = sum(1 for row in rows if len(row['FullText']) >= rescore.PREVIEW_CHARS)
+    table, texts = fake_ledger(rows)
+    with mock.patch('builtins.print'):
+        _, unchanged_full, _ = rescore.rescore(table, RiskEngine(OLD_RULES), batch_size=5000, dry_run=True, texts=texts)
+        _, unchanged_preview, skipped = rescore.rescore(table, RiskEngine(OLD_RULES), batch_size=5000, dry_run=True)
+    print(f"Unchanged rules on {TABLE_ROWS:,} rows ({long_texts:,} longer than the preview): "
+          f"{unchanged_full} changed with the search table; without it {unchanged_preview} changed, "
+          f"{skipped:,} skipped")
+    failed = unchanged_full or unchanged_preview or skipped != long_texts
+
+    # 4. Whole job on a fake table: parallel scan, score, write back only changes
+    with mock.patch('builtins.print'):
+        start = time.perf_counter()
+        seen, written, _ = rescore.rescore(table, engine, segments=4, batch_size=5000, texts=texts)
+        job_seconds = time.perf_counter() - start
+        again = rescore.rescore(table, engine, segments=4, batch_size=5000, dry_run=True, texts=texts)[1]
+    expected = {row['ReceiptID']: engine.assess(row['FullText'], row['Total'], row['Date'], 'NearDuplicateOf' in row)
+                for row in rows}
+    wrong = sum(1 for receipt_id, (score, flags) in expected.items()
+                if (table.items[receipt_id]['RiskScore'], table.items[receipt_id]['RiskFlags']) != (score, flags))
+    print(f"Job on {seen:,}-row fake table: {written:,} updated in {job_seconds:.1f}s; "
+          f"second pass finds {again} to change; {wrong} rows differ from engine.assess on the full text")
+
+    # 5. Receipts deleted between the Scan and the write-back are skipped, not
+    # recreated, and the job goes on; stamps are UTC in a non-UTC time zone
+    rows = score_with(RiskEngine(OLD_RULES), make_rows(2000, seed=11))
+    table, texts = fake_ledger(rows)
+    gone = []
+
+    def delete_some(frame, scores, flags):
+        changes = changed_rows(frame, scores, flags)
+        for receipt_id in changes['ReceiptID'].iloc[::10]:
+            table.delete_item(Key={'ReceiptID': receipt_id})
+            gone.append(receipt_id)
+        return changes
+
+    changed_rows = rescore.changed_rows
+    zone = os.environ.get('TZ')
+    os.environ['TZ'] = 'Asia/Kolkata'
+    time.tzset()
+    try:
+        with mock.patch('builtins.print'), mock.patch.object(rescore, 'changed_rows', delete_some):
+            before = datetime.datetime.utcnow()
+            _, written, skipped = rescore.rescore(table, engine, segments=2, batch_size=500, texts=texts)
+            after = datetime.datetime.utcnow()
+        deleted_ok = skipped == len(gone) and not any(receipt_id in table.items for receipt_id in gone)
+    except Exception as e:
+        print(f"  job aborted: {e!r}")
+        deleted_ok, written = False, 0
+    finally:
+        if zone is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = zone
+        time.tzset()
+    stamps = [datetime.datetime.fromisoformat(item['UpdatedAt']) for item in table.items.values()
+              if 'UpdatedAt' in item]
+    utc_ok = deleted_ok and len(stamps) == written and all(
+        before - datetime.timedelta(seconds=1) <= stamp <= after + datetime.timedelta(seconds=1) for stamp in stamps)
+    print(f"Deleted mid-run: {len(gone)} of {written + len(gone)} changes, job {'finished' if deleted_ok else 'FAILED'};"
+          f" UpdatedAt {'UTC' if utc_ok else 'NOT UTC'}")
+    if failed or again or wrong or mismatches or not deleted_ok or not utc_ok:
+        sys.exit(1)
@@ -0,0 +1,211 @@
+# Texts/second of the risk engine against what it replaced, as the rule count
+# grows: keywords against the old one-substring-search-per-keyword loop, and
+# regex rules (next to the default keywords) against that loop plus a search
+# of each rule's regex on its own. Also prints the few-keyword scan next to
+# the combined matcher around FAST_KEYWORD_LIMIT.
+# Exits 1 when the engine at the default rules (the few-keyword scan, not the
+# combined matcher) is slower than the old loop,
+# or when the scan, the combined matcher and evaluating each rule on its own
+# disagree on any text (overlapping patterns and phrases included).
+#
+#   python benchmarks/bench_risk_engine.py
+import os
+import random
+import re
+import string
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+
+import risk_engine
+from risk_engine import DEFAULT_RULES, FAST_KEYWORD_LIMIT, RiskEngine
+
+RULE_COUNTS = (6, 50, 500, 5000)
+PATTERN_COUNTS = (1, 10, 100, 1000)
+CROSSOVER_COUNTS = (40, 50, 60, 70, 80)
+TEXTS = 2000
+MIN_DEFAULT_SPEED = 1.0
+
+
+def make_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+
+def make_keywords(n):
+    keywords = dict(DEFAULT_RULES['keywords'])
+    rng = random.Random(n)
+    while len(keywords) < n:
+        keywords[make_word(rng)] = 10
+    return keywords
+
+
+def make_patterns(n):
+    # Rules of the shapes a rule set uses: an item with an amount, a numbered
+    # reference, either of two words
+    rng = random.Random(n)
+    shapes = (r"\b{0}\s+\d+\.\d\d\b", r"\b{0}\W*#\d{{4,}}", r"\b(?:{0}|{1})\s*x\d+")
+    patterns = {}
+    while len(patterns) < n:
+        word, other = make_word(rng), make_word(rng)
+        patterns[word] = {'pattern': rng.choice(shapes).format(word, other), 'weight': 10}
+    return patterns
+
+
+def make_texts(keywords, patterns=None):
+    rng = random.Random(42)
+    vocab = ["TOTAL", "Subtotal", "Milk", "Bread", "barcode", "Cashier", "Thank you", "12.50", "GST"]
+    words = list(keywords)
+    texts = []
+    for _ in range(TEXTS):
+        lines = [' '.join(rng.choice(vocab) for _ in range(6)) for _ in range(12)]
+        if words and rng.random() < 0.2:
+            lines.append(f"1x {rng.choice(words)} 9.99")
+        if patterns and rng.random() < 0.2:
+            word = rng.choice(list(patterns))
+            lines.append(rng.choice((f"{word} 4.50", f"{word.upper()} #12345", f"{word} x2")))
+        texts.append('\n'.join(lines))
+    return texts
+
+
+def old_loop(keywords, text):
+    # The processor before the shared engine
+    lower_text = text.lower()
+    score, flags = 0, []
+    for word in keywords:
+        if word in lower_text:
+            score += keywords[word]
+            flags.append(f"Suspicious Item: {word}")
+    return score, flags
+
+
+def each_rule(rules, text):
+    # Every keyword and regex rule searched on its own, in rule-set order
+    score, flags = 0, []
+    for word, weight in rules.get('keywords', {}).items():
+        words = re.findall(r"\w+", word.lower())
+        flag = f"Suspicious Item: {' '.join(words)}"
+        if re.search(r"(?<!\w)" + r"\W+".join(map(re.escape, words)) + r"(?!\w)", text.lower()) and flag not in flags:
+            score += weight
+            flags.append(flag)
+    for name, rule in rules.get('patterns', {}).items():
+        if re.search(rule['pattern'], text, re.IGNORECASE):
+            score += rule['weight']
+            flags.append(f"Pattern: {name}")
+    return score, flags
+
+
+# Overlapping rules: "gift card" contains "card", "TOTAL 100.00" is also a round
+# amount, and "red wine" starts with the keyword "red" and ends with "wine"
+OVERLAP_RULES = {
+    'keywords': {'red': 5, 'red wine': 20, 'wine': 10, 'wine bar': 15, 'gift': 3},
+    'patterns': {
+        'gift card': {'pattern': r"gift\s*card", 'weight': 40},
+        'card': {'pattern': r"\bcard\b", 'weight': 5},
+        'total 100': {'pattern': r"total\s+100\.00", 'weight': 20},
+        'round amount': {'pattern': r"\b\d+\.00\b", 'weight': 10},
+        'cash': {'pattern': r"\bcash\b", 'weight': 1},
+    },
+}
+OVERLAP_TEXTS = [
+    "1x Gift Card 25.00",
+    "Paid by card\nTOTAL 100.00",
+    "GIFT CARD\nCASH 12.50\nTOTAL 100.00",
+    "giftcard giftcard",
+    "Red Wine Bar",
+    "red, wine",
+    "Milk 2.50\nTOTAL 12.50",
+    "",
+]
+
+
+def check_overlaps():
+    engine = RiskEngine(OVERLAP_RULES)
+    rng = random.Random(7)
+    texts = list(OVERLAP_TEXTS)
+    pieces = ["Gift Card", "card", "TOTAL 100.00", "3.00", "Cash", "Milk 2.50", "giftcard", "TOTAL 9.99",
+              "Red", "red wine", "Wine Bar", "redwine", "wine-bar", "gift"]
+    texts += ['\n'.join(rng.sample(pieces, rng.randint(1, 4))) for _ in range(500)]
+    mismatches = 0
+    for text in texts:
+        expected = each_rule(OVERLAP_RULES, text)
+        got = engine.match_text(text)
+        if got != expected:
+            mismatches += 1
+            print(f"  MISMATCH {text!r}: engine {got}, each rule {expected}")
+    print(f"\noverlapping rules: {len(texts)} texts, {mismatches} differ from evaluating each rule alone")
+    return mismatches
+
+
+def check_keyword_paths():
+    # Few keywords are scanned for one by one, more go through the combined
+    # matcher: both must find what each keyword's own search finds
+    keywords = {'casino': 50, 'bar': 50, 'gift card': 30, 'red wine': 20, 'b_2': 5, 'café': 10}
+    scan = RiskEngine({'keywords': keywords})
+    matcher = RiskEngine({'keywords': keywords})
+    matcher.keyword_scans = None
+    rng = random.Random(11)
+    pieces = ["Barcode", "BAR", "bar.", "Gift Card", "gift-card", "giftcard", "Red\nWine", "red wines",
+              "casino_1", "b_2", "ab_2", "CAFÉ", "cafés", "Milk 2.50", "TOTAL 9.99", "x"]
+    texts = [' '.join(rng.sample(pieces, rng.randint(1, 5))) for _ in range(1000)]
+    mismatches = 0
+    for text in texts:
+        expected = each_rule({'keywords': keywords}, text)
+        if scan.match_text(text) != expected or matcher.match_text(text) != expected:
+            mismatches += 1
+            print(f"  MISMATCH {text!r}: scan {scan.match_text(text)}, matcher {matcher.match_text(text)},"
+                  f" each rule {expected}")
+    print(f"keyword paths: {len(texts)} texts, {mismatches} differ between scan, matcher and each rule")
+    return mismatches
+
+
+def rate(fn, texts):
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return len(texts) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"{'keywords':>8} {'loop texts/s':>14} {'engine texts/s':>16} {'compile ms':>11}")
+    slow = False
+    for n in RULE_COUNTS:
+        keywords = make_keywords(n)
+        texts = make_texts(keywords)
+        start = time.perf_counter()
+        engine = RiskEngine({'keywords': keywords})
+        compile_ms = (time.perf_counter() - start) * 1000
+        loop = rate(lambda text: old_loop(keywords, text), texts)
+        compiled = rate(engine.assess, texts)
+        print(f"{n:>8} {loop:>14,.0f} {compiled:>16,.0f} {compile_ms:>11.1f}")
+        if n == len(DEFAULT_RULES['keywords']) and compiled < MIN_DEFAULT_SPEED * loop:
+            print(f"  engine at the default {n} rules runs at {compiled / loop:.2f}x the loop's rate"
+                  f" (needs {MIN_DEFAULT_SPEED:.2f}x)")
+            slow = True
+
+    print(f"\n{'patterns':>8} {'loop + each regex texts/s':>26} {'engine texts/s':>16} {'compile ms':>11}")
+    for n in PATTERN_COUNTS:
+        rules = {'keywords': dict(DEFAULT_RULES['keywords']), 'patterns': make_patterns(n)}
+        texts = make_texts(rules['keywords'], rules['patterns'])
+        start = time.perf_counter()
+        engine = RiskEngine(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+        compiled_rules = [re.compile(rule['pattern'], re.IGNORECASE) for rule in rules['patterns'].values()]
+        separate = rate(lambda text: (old_loop(rules['keywords'], text),
+                                      [regex.search(text) for regex in compiled_rules]), texts)
+        compiled = rate(engine.assess, texts)
+        print(f"{n:>8} {separate:>26,.0f} {compiled:>16,.0f} {compile_ms:>11.1f}")
+
+    print(f"\n{'keywords':>8} {'scan texts/s':>14} {'matcher texts/s':>16}   (FAST_KEYWORD_LIMIT={FAST_KEYWORD_LIMIT})")
+    for n in CROSSOVER_COUNTS:
+        keywords = make_keywords(n)
+        texts = make_texts(keywords)
+        with mock.patch.object(risk_engine, 'FAST_KEYWORD_LIMIT', n):
+            scan = RiskEngine({'keywords': keywords})
+        matcher = RiskEngine({'keywords': keywords})
+        matcher.keyword_scans = None
+        print(f"{n:>8} {rate(scan.assess, texts):>14,.0f} {rate(matcher.assess, texts):>16,.0f}")
+
+    if check_overlaps() | check_keyword_paths() or slow:
+        sys.exit(1)
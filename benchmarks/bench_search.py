@@ -0,0 +1,230 @@
+# GET /search against the scan-and-filter it replaces, at 100k and 1M receipts.
+#
+#   scan     every ledger row (as if it held the full OCR text) read with a
+#            4-segment parallel Scan and filtered in Python: what searching
+#            takes without an index
+#   search   reader.lambda_handler on /search?q=: postings from the search
+#            index table, BM25, one page of hits (limit 20) with snippets
+#
+# Receipts are synthetic, with Zipf-distributed merchants and items, so the
+# queries range from a rare item to a word on every receipt. The index is
+# built through search_index.index, --block receipts per call (the processor
+# indexes one SQS batch, 10 at most). Both tables are fakes.FakeTable with
+# --latency seconds per call and 1 MB pages; "KB read" is what DynamoDB would
+# bill. Every query's hit count must equal the scan's, and paging a query to
+# the end must return exactly the scan's receipts, best first; otherwise the
+# run exits non-zero.
+#
+#   python benchmarks/bench_search.py --receipts 100000 1000000 --block 100
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fakes
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+
+import read_cache
+import reader
+import search_index
+
+SEED = 23
+SCAN_SEGMENTS = 4
+SYLLABLES = [c + v for c in 'bcdfghjklmnprstvz' for v in ('a', 'e', 'i', 'o', 'u', 'ai', 'ou')]
+
+
+# --- RECEIPTS ---
+def vocabulary(rng, size, syllables):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(syllables)))
+    return sorted(words)
+
+
+def zipf_weights(size):
+    total, weights = 0.0, []
+    for rank in range(1, size + 1):
+        total += 1.0 / rank
+        weights.append(total)  # cumulative, for rng.choices(cum_weights=)
+    return weights
+
+
+class ReceiptMaker:
+    def __init__(self, seed=SEED):
+        rng = random.Random(seed)
+        self.items = vocabulary(rng, 3000, 3)
+        names = vocabulary(rng, 400, 2)
+        kinds = ['Mart', 'Cafe', 'Bistro', 'Fuels', 'Pharmacy', 'Grill', 'Hotel', 'Stores', 'Bakery', 'Taxi']
+        self.merchants = [f"{name.title()} {rng.choice(kinds)}" for name in names]
+        self.item_weights = zipf_weights(len(self.items))
+        self.merchant_weights = zipf_weights(len(self.merchants))
+
+    def text(self, rng):
+        merchant = rng.choices(self.merchants, cum_weights=self.merchant_weights)[0]
+        lines = [merchant.upper(), f"Date: {rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2025", ""]
+        total = 0.0
+        for name in rng.choices(self.items, cum_weights=self.item_weights, k=rng.randint(3, 12)):
+            price = round(rng.uniform(20, 900), 2)
+            total += price
+            lines.append(f"{name.title()}  {price:.2f}")
+        lines += ["", f"TOTAL  {total:.2f}", "Thank you, visit again"]
+        return merchant, total, '\n'.join(lines)
+
+
+def build(count, block, maker):
+    ledger = fakes.FakeTable()
+    index = fakes.FakeTable(key='Term', range_key='Block', indexes={}, name='BillE_SearchIndex')
+    rng = random.Random(SEED)
+    receipts, started = [], time.perf_counter()
+    for i in range(count):
+        merchant, total, text = maker.text(rng)
+        receipt_id = f"{i:064x}"
+        ledger.items[receipt_id] = {
+            'ReceiptID': receipt_id, 'RecordType': 'RECEIPT', 'Filename': f"uploads/r{i:07d}.png",
+            'UploadDate': f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T10:00:00", 'Status': 'Analyzed',
+            'RiskScore': 0, 'Merchant': merchant, 'Total': round(total, 2), 'ExtractedText': text,
+        }
+        receipts.append((receipt_id, text))
+        if len(receipts) == block:
+            search_index.index(index, receipts)
+            receipts = []
+    search_index.index(index, receipts)
+    return ledger, index, time.perf_counter() - started
+
+
+# --- QUERIES ---
+def pick_queries(maker):
+    # A rare item, a mid one, a common one, two words, a merchant, a word on every receipt
+    items = maker.items
+    merchant = maker.merchants[5].lower()
+    return [items[2500], items[300], items[3], f"{items[10]} {items[40]}", merchant, "total"]
+
+
+def counting(table):
+    # Wraps table.query/scan to add up what DynamoDB would read
+    stats = {'calls': 0, 'bytes': 0}
+    lock = threading.Lock()
+    for name in ('query', 'scan'):
+        original = getattr(table, name)
+
+        def call(_original=original, **kwargs):
+            response = _original(**kwargs)
+            size = sum(fakes.item_size(item) for item in response['Items'])
+            with lock:
+                stats['calls'] += 1
+                stats['bytes'] += size
+            return response
+        setattr(table, name, call)
+    return stats
+
+
+def scan_filter(ledger, terms):
+    # -> ReceiptIDs whose text has every term, reading the whole ledger
+    def segment(n):
+        found, request = [], {'Segment': n, 'TotalSegments': SCAN_SEGMENTS}
+        while True:
+            response = ledger.scan(**request)
+            for item in response['Items']:
+                words = set(search_index.tokenize(item.get('ExtractedText', '')))
+                if all(term in words for term in terms):
+                    found.append(item['ReceiptID'])
+            if 'LastEvaluatedKey' not in response:
+                return found
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    with ThreadPoolExecutor(max_workers=SCAN_SEGMENTS) as pool:
+        return {receipt_id for found in pool.map(segment, range(SCAN_SEGMENTS)) for receipt_id in found}
+
+
+def search(params):
+    response = reader.lambda_handler({'rawPath': '/search', 'queryStringParameters': params}, None)
+    if response['statusCode'] != 200:
+        raise RuntimeError(f"/search {params}: {response['statusCode']} {response['body']}")
+    return json.loads(response['body'])
+
+
+def page_through(query):
+    # Every hit of a query, 100 per page; scores must never go up
+    hits, cursor, last = [], None, float('inf')
+    while True:
+        params = {'q': query, 'limit': '100', **({'cursor': cursor} if cursor else {})}
+        result = search(params)
+        for hit in result['items']:
+            if hit['Score'] > last:
+                raise RuntimeError(f"{query}: hits out of order")
+            last = hit['Score']
+        hits.extend(hit['ReceiptID'] for hit in result['items'])
+        cursor = result['next_cursor']
+        if not cursor:
+            return hits
+
+
+def run(count, args, maker):
+    ledger, index, build_seconds = build(count, args.block, maker)
+    postings = sum(1 for key in index.items if key[0] not in (search_index.DOC, search_index.META))
+    print(f"\n{count:,} receipts: index built in {build_seconds:.1f}s, {postings:,} postings items "
+          f"({args.block} receipts per write)")
+    print(f"  {'query':<28} {'hits':>9} {'scan ms':>10} {'scan KB':>11} {'search ms':>10} {'search KB':>10} "
+          f"{'speedup':>9} {'match':>6}")
+    ledger.latency = index.latency = args.latency
+    dynamodb = fakes.FakeDynamoDB(ledger, index, latency=args.latency)
+    ok = True
+    with mock.patch('builtins.print'), \
+         mock.patch.object(reader, 'table', ledger), \
+         mock.patch.object(reader, 'search_table', index), \
+         mock.patch.object(reader, 'dynamodb', dynamodb), \
+         mock.patch.object(read_cache, 'ENABLED', False):
+        scan_stats, index_stats = counting(ledger), counting(index)
+        rows = []
+        for query in pick_queries(maker):
+            terms = search_index.tokenize(query)
+            began = time.perf_counter()
+            expected = scan_filter(ledger, terms)
+            scan_seconds = time.perf_counter() - began
+            scan_kb = scan_stats['bytes'] / 1024
+            scan_stats['bytes'] = 0
+
+            timings = []
+            for _ in range(args.repeat):
+                index_stats['bytes'] = 0
+                began = time.perf_counter()
+                result = search({'q': query, 'limit': '20'})
+                timings.append(time.perf_counter() - began)
+            search_kb = index_stats['bytes'] / 1024
+            match = result['total'] == len(expected)
+            if match and len(expected) <= args.verify_up_to:
+                hits = page_through(query)
+                match = len(hits) == len(set(hits)) and set(hits) == expected
+            ok = ok and match
+            rows.append((query, len(expected), scan_seconds, scan_kb, statistics.median(timings), search_kb, match))
+    for query, hits, scan_seconds, scan_kb, search_seconds, search_kb, match in rows:
+        print(f"  {query:<28} {hits:>9,} {scan_seconds * 1000:>10.0f} {scan_kb:>11,.0f} "
+              f"{search_seconds * 1000:>10.1f} {search_kb:>10,.0f} {scan_seconds / search_seconds:>8.0f}x {str(match):>6}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search vs scan-and-filter")
+    parser.add_argument('--receipts', type=int, nargs='*', default=[100000, 1000000])
+    parser.add_argument('--block', type=int, default=100, help="receipts per search_index.index call")
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds per DynamoDB call")
+    parser.add_argument('--repeat', type=int, default=3, help="timed searches per query (median)")
+    parser.add_argument('--verify-up-to', type=int, default=5000, help="page through queries with this many hits")
+    args = parser.parse_args()
+
+    maker = ReceiptMaker()
+    ok = True
+    for count in args.receipts:
+        ok = run(count, args, maker) and ok
+    if not ok:
+        sys.exit("Search results differ from scan-and-filter")
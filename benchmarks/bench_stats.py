@@ -0,0 +1,208 @@
+# GET /stats (rollups) against recomputing the KPIs from a full Scan, like
+# Legacy_v1/dashboard.py and app.py do, at 1k / 100k / 1M ledger rows.
+#
+# Before that, --receipts receipts go through the real processor from several
+# concurrent "Lambdas", and the rollups it maintained must match the ones
+# tools/reconcile_rollups.py rebuilds from the ledger. They must still match
+# after the same receipts are delivered again, after tools/rescore.py re-scores
+# the ledger with other rules, and after tools/bulk_ingest.py seeds rows (twice).
+# A counter is then corrupted on purpose and reconciliation must find and
+# repair it. Exits non-zero if any check fails.
+#
+#   python benchmarks/bench_stats.py
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pandas as pd
+from boto3.dynamodb.conditions import Attr
+
+import fakes
+from bench_pipeline import OcrPool, receipt_image
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-south-1')
+os.environ.setdefault('TABLE_NAME', 'BillE_Expenses')
+os.environ.setdefault('OCR_API_KEY', 'bench')
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:local:000000000000:bench')
+
+import bulk_ingest
+import processor
+import read_cache
+import reader
+import reconcile_rollups
+import rescore
+import rollups
+from risk_engine import RiskEngine
+
+SIZES = (1_000, 100_000, 1_000_000)
+MERCHANTS = ["CITY MART", "The Leela Palace", "Starbucks Coffee", "Royal Casino", "Apollo Pharmacy"]
+
+
+# --- ROLLUPS KEPT BY THE PROCESSOR ---
+def process_receipts(count, lambdas, batch_size=10, table=None):
+    # Every "Lambda" works through its own SQS batches at the same time
+    s3 = fakes.FakeS3(latency=0.002)
+    table = table or fakes.FakeTable(latency=0.002)
+    dynamodb = fakes.FakeDynamoDB(table, latency=0.002)
+    batches = []
+    for start in range(0, count, batch_size):
+        records = []
+        for i in range(start, min(start + batch_size, count)):
+            key = f"receipt-{i}.png"
+            s3.put_object(Bucket='bench', Key=key, Body=receipt_image(i))
+            records.append(fakes.s3_event_record('bench', key, f"msg-{i}"))
+        batches.append(records)
+
+    def worker(mine):
+        for records in mine:
+            result = processor.lambda_handler({'Records': records}, None)
+            assert not result['batchItemFailures'], result
+
+    processor._seen_hashes.clear()
+    with mock.patch('builtins.print'), \
+         mock.patch.object(processor, 's3', s3), \
+         mock.patch.object(processor, 'sns', fakes.FakeSNS()), \
+         mock.patch.object(processor, 'table', table), \
+         mock.patch.object(processor, 'dynamodb', dynamodb), \
+         mock.patch.object(processor.ocr_backend, 'http', OcrPool(0.001)):
+        threads = [threading.Thread(target=worker, args=(batches[n::lambdas],)) for n in range(lambdas)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return table
+
+
+def check_processor_rollups(args):
+    table = process_receipts(args.receipts, args.lambdas)
+    receipts = sum(1 for item in table.items.values() if item.get('RecordType') == 'RECEIPT')
+    with mock.patch('builtins.print'):
+        drift = reconcile_rollups.reconcile(table)
+    summary = table.items[rollups.SUMMARY_KEY]
+    print(f"Processor: {receipts} receipts from {args.lambdas} concurrent Lambdas,"
+          f" {len(summary['TopMerchants'])} top merchants, spend {summary['Spend']}")
+    print(f"  rollups vs rebuilt from the ledger: {len(drift)} differences")
+    ok = not drift and summary['Receipts'] == receipts
+
+    # Writers other than a first delivery must keep them right too
+    def drift_after(step):
+        with mock.patch('builtins.print'):
+            step()
+            return len(reconcile_rollups.reconcile(table))
+
+    steps = [
+        ("same receipts delivered again", lambda: process_receipts(args.receipts, args.lambdas, table=table)),
+        ("rescore with an amount-only rule set",
+         lambda: rescore.rescore(table, RiskEngine({'keywords': {}, 'amount_threshold': 1000, 'amount_weight': 40}))),
+        ("seed 3,000 rows", lambda: bulk_ingest.seed(fakes.FakeDynamoDB(table), table, 3000, workers=4)),
+        ("seed the same 3,000 again", lambda: bulk_ingest.seed(fakes.FakeDynamoDB(table), table, 3000, workers=4)),
+    ]
+    for name, step in steps:
+        differences = drift_after(step)
+        print(f"  after {name}: {differences} differences")
+        ok = ok and not differences
+    receipts = sum(1 for item in table.items.values() if item.get('RecordType') == 'RECEIPT')
+    print(f"  ledger now {receipts} receipts, STATS#ALL counts {summary['Receipts']}")
+    ok = ok and summary['Receipts'] == receipts
+
+    # Lose an update on purpose: reconciliation must see it and put it right
+    summary['Flagged'] -= 1
+    with mock.patch('builtins.print'):
+        found = reconcile_rollups.reconcile(table, apply=True)
+        after = reconcile_rollups.reconcile(table)
+    print(f"  after corrupting Flagged: {len(found)} found, {len(after)} left after --fix")
+    return ok and len(found) == 1 and not after
+
+
+# --- READ COST ---
+def build_table(n):
+    table = fakes.FakeTable()
+    dynamodb = fakes.FakeDynamoDB(table)
+    rng = random.Random(n)
+    today = datetime.date.today()
+    for i in range(n):
+        risk = rng.choice((0, 0, 0, 30, 50, 100))
+        table.items[f"{i:064x}"] = {
+            'ReceiptID': f"{i:064x}",
+            'RecordType': 'RECEIPT',
+            'Filename': f"receipt-{i}.png",
+            'UploadDate': f"{today - datetime.timedelta(days=i % 365)}T10:00:00",
+            'Date': str(today - datetime.timedelta(days=i % 365)),
+            'Status': 'Analyzed',
+            'Merchant': rng.choice(MERCHANTS),
+            'Total': Decimal(rng.randint(100, 500000)) / 100,
+            'ExtractedText': "CITY MART Milk 2.50 TOTAL 2.50...",
+            'RiskScore': risk,
+            'RiskFlags': ["Suspicious Item: beer"] if risk else [],
+        }
+    expected, _, _ = reconcile_rollups.rebuild(table)
+    with table.lock:
+        table.items.update(expected)
+    return table, dynamodb
+
+
+def legacy_kpis(table):
+    # Full Scan into pandas on every render, as Legacy_v1/dashboard.py does
+    items, kwargs = [], {'FilterExpression': Attr('RecordType').eq('RECEIPT')}
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    df = pd.DataFrame(items)
+    df['Total'] = pd.to_numeric(df['Total'])
+    flagged = df['RiskScore'] > 0
+    return {
+        'Spend': df['Total'].sum(), 'Receipts': len(df), 'Flagged': int(flagged.sum()),
+        'AverageTicket': df['Total'].mean(), 'Risk': flagged.value_counts(),
+        'Top': df.nlargest(5, 'Total')[['Merchant', 'Total']],
+    }
+
+
+def stats_request(table, dynamodb):
+    with mock.patch.object(reader, 'table', table), mock.patch.object(reader, 'dynamodb', dynamodb), \
+         mock.patch.object(read_cache, 'ENABLED', False):
+        response = reader.lambda_handler({'rawPath': '/stats', 'queryStringParameters': {'days': '30'}}, None)
+    assert response['statusCode'] == 200, response
+    return json.loads(response['body'])
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rollup correctness and GET /stats cost")
+    parser.add_argument('--receipts', type=int, default=400, help="receipts sent through the processor")
+    parser.add_argument('--lambdas', type=int, default=8, help="concurrent processor invocations")
+    parser.add_argument('--sizes', type=int, nargs='*', default=SIZES)
+    args = parser.parse_args()
+
+    ok = check_processor_rollups(args)
+
+    print(f"\n{'rows':>9} {'scan+pandas ms':>15} {'/stats ms':>10} {'items read':>11}   spend match")
+    for n in args.sizes:
+        table, dynamodb = build_table(n)
+        legacy, legacy_ms = timed(legacy_kpis, table)
+        stats, stats_ms = timed(stats_request, table, dynamodb)
+        read = 1 + len(stats['Days'])  # STATS#ALL plus the day buckets found
+        match = abs(Decimal(stats['Spend']) - Decimal(str(legacy['Spend']))) < Decimal('0.01') * n
+        ok = ok and match and int(stats['Receipts']) == legacy['Receipts']
+        print(f"{n:>9} {legacy_ms:>15.1f} {stats_ms:>10.2f} {read:>11}   {match}")
+
+    if not ok:
+        sys.exit("Rollups do not match the ledger")
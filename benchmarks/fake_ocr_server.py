@@ -0,0 +1,165 @@
+# Deterministic stand-in for https://api.ocr.space/parse/image.
+# It accepts the same multipart upload and answers in the same JSON shape. The
+# "OCR text" is derived from the SHA-256 of the uploaded bytes, so the same
+# file always reads the same and a run can be replayed exactly.
+#
+#
+# With --quota it also meters calls like an OCR.space plan: past N calls in a
+# window of S seconds it answers HTTP 429 with Retry-After, or (--throttle-style
+# errored) OCR.space's IsErroredOnProcessing "maximum N number of times within
+# S seconds". With --capacity, every call in flight beyond it slows all of them.
+#
+#   python benchmarks/fake_ocr_server.py --port 8089 --latency 0.3
+#   python benchmarks/fake_ocr_server.py --latency 0.3 --quota 60 --window 60
+#   OCR_ENDPOINT=http://127.0.0.1:8089/parse/image python ...
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import math
+import random
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MERCHANTS = ["CITY MART", "The Leela Palace", "Starbucks", "Royal Casino", "Local Taxi", "Corner Bar & Grill"]
+ITEMS = ["Milk", "Bread", "Coffee", "Eggs", "Beer", "Red Wine", "Paneer", "Room Service", "Taxi Fare"]
+
+
+def receipt_text(data):
+    # Same bytes -> same receipt
+    rng = random.Random(hashlib.sha256(data).hexdigest())
+    lines = [rng.choice(MERCHANTS), f"Date: {rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-2025", ""]
+    total = 0.0
+    for _ in range(rng.randint(2, 8)):
+        price = round(rng.uniform(20, 900), 2)
+        total += price
+        lines.append(f"{rng.choice(ITEMS)}  {price:.2f}")
+    lines += ["", f"TOTAL  {total:.2f}"]
+    return '\n'.join(lines)
+
+
+def parse_multipart(content_type, body):
+    message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        fields[name] = part.get_payload(decode=True)
+    return fields
+
+
+class FakeOcrHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    disable_nagle_algorithm = True
+    latency = 0.0
+    quota = 0  # calls per window, 0 = unmetered
+    window = 60.0
+    throttle_style = '429'
+    capacity = 0  # calls in flight before latency grows, 0 = never
+    state = None  # counters shared by every request of one server, see start_server
+
+    def over_quota(self):
+        # -> seconds until the window resets if this call is over the quota, else None
+        state = self.state
+        with state['lock']:
+            state['requests'] += 1
+            now = time.monotonic()
+            if now - state['window_start'] >= self.window:
+                state['window_start'], state['used'] = now, 0
+            if self.quota and state['used'] >= self.quota:
+                state['throttled'] += 1
+                return self.window - (now - state['window_start'])
+            state['used'] += 1
+            return None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        reset = self.over_quota()
+        if reset is not None:
+            if self.throttle_style == 'errored':
+                self.reply(200, {'IsErroredOnProcessing': True, 'OCRExitCode': 99, 'ErrorMessage': [
+                    f"You may only perform this action upto maximum {self.quota} number of times "
+                    f"within {self.window:g} seconds"]})
+            else:
+                self.reply(429, {'IsErroredOnProcessing': True, 'ErrorMessage': ["Too Many Requests"]},
+                           {'Retry-After': str(math.ceil(reset))})
+            return
+
+        state = self.state
+        with state['lock']:
+            state['in_flight'] += 1
+            state['peak_in_flight'] = max(state['peak_in_flight'], state['in_flight'])
+            load = state['in_flight'] / self.capacity if self.capacity else 1
+        try:
+            time.sleep(self.latency * max(1, load))
+        finally:
+            with state['lock']:
+                state['in_flight'] -= 1
+        fields = parse_multipart(self.headers['Content-Type'], body)
+        if 'file' not in fields:
+            self.reply(200, {'IsErroredOnProcessing': True, 'ErrorMessage': ["No file uploaded"]})
+            return
+        self.reply(200, {
+            'ParsedResults': [{'ParsedText': receipt_text(fields['file']), 'FileParseExitCode': 1}],
+            'OCRExitCode': 1,
+            'IsErroredOnProcessing': False,
+        })
+
+    def reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port=0, latency=0.0, certfile=None, keyfile=None, quota=0, window=60.0, throttle_style='429',
+                 capacity=0):
+    # Runs in a daemon thread; returns (server, endpoint url). server.shutdown() stops it.
+    # With a certfile it serves HTTPS, so TLS handshakes can be measured too.
+    # server.RequestHandlerClass.state counts requests, throttled ones and the peak in flight.
+    state = {'lock': threading.Lock(), 'window_start': time.monotonic(), 'used': 0, 'requests': 0,
+             'throttled': 0, 'in_flight': 0, 'peak_in_flight': 0}
+    handler = type('Handler', (FakeOcrHandler,), {
+        'latency': latency, 'quota': quota, 'window': window, 'throttle_style': throttle_style,
+        'capacity': capacity, 'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    scheme = 'http'
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}/parse/image"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OCR.space endpoint")
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds to wait per request")
+    parser.add_argument('--certfile', help="serve HTTPS with this certificate")
+    parser.add_argument('--keyfile')
+    parser.add_argument('--quota', type=int, default=0, help="calls allowed per window (0: unmetered)")
+    parser.add_argument('--window', type=float, default=60.0, help="quota window, seconds")
+    parser.add_argument('--throttle-style', choices=['429', 'errored'], default='429',
+                        help="HTTP 429 + Retry-After, or IsErroredOnProcessing like OCR.space")
+    parser.add_argument('--capacity', type=int, default=0, help="calls in flight before latency grows")
+    args = parser.parse_args()
+    server, url = start_server(args.port, args.latency, args.certfile, args.keyfile, args.quota, args.window,
+                               args.throttle_style, args.capacity)
+    print(f"Fake OCR listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
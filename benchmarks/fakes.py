@@ -0,0 +1,569 @@
+# Local stand-ins for the AWS services and the OCR endpoint used by the lambdas.
+# They only implement the calls our code makes, and sleep for `latency` seconds
+# per call so benchmarks can model network round trips.
+import bisect
+import collections
+import io
+import json
+import math
+import queue
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+PAGE_BYTES = 1024 * 1024  # DynamoDB stops a Scan/Query page at 1 MB
+RCU_BYTES = 4096          # One (strongly consistent) read unit per 4 KB
+ITEM_BYTES = 400 * 1024   # DynamoDB's item size limit
+
+
+class FakeBody:
+    def __init__(self, data):
+        self._stream = io.BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+
+class FakeS3:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        time.sleep(self.latency)
+        data = self.objects[(Bucket, Key)]
+        return {'Body': FakeBody(data), 'ContentLength': len(data)}
+
+
+def item_size(item):
+    # Rough DynamoDB item size: attribute names plus their values
+    return sum(len(k) + (len(v) if isinstance(v, bytes) else len(str(v))) for k, v in item.items())
+
+
+def evaluate(condition, item):
+    # Evaluates boto3.dynamodb.conditions Key()/Attr() expressions against a dict
+    op = condition.expression_operator
+    values = condition._values
+    if op == 'AND':
+        return all(evaluate(v, item) for v in values)
+    if op == 'OR':
+        return any(evaluate(v, item) for v in values)
+    if op == 'NOT':
+        return not evaluate(values[0], item)
+
+    name = values[0].name
+    if op == 'attribute_exists':
+        return name in item
+    if op == 'attribute_not_exists':
+        return name not in item
+    if name not in item:
+        return False
+    value = item[name]
+    args = values[1:]
+    if op == '=':
+        return value == args[0]
+    if op == '<>':
+        return value != args[0]
+    if op == '<':
+        return value < args[0]
+    if op == '<=':
+        return value <= args[0]
+    if op == '>':
+        return value > args[0]
+    if op == '>=':
+        return value >= args[0]
+    if op == 'BETWEEN':
+        return args[0] <= value <= args[1]
+    if op == 'begins_with':
+        return str(value).startswith(args[0])
+    if op == 'contains':
+        return args[0] in value
+    if op == 'IN':
+        return value in args[0]
+    raise NotImplementedError(op)
+
+
+def check(condition, item, operation):
+    # Raises like DynamoDB when a write's Attr() condition doesn't hold
+    if condition is not None and not evaluate(condition, item or {}):
+        raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException',
+                                     'Message': 'The conditional request failed'}}, operation)
+
+
+def split_key_condition(condition, hash_key):
+    # -> (hash value, range condition or None)
+    if condition.expression_operator == 'AND':
+        first, second = condition._values
+        if first._values[0].name == hash_key:
+            return first._values[1], second
+        return second._values[1], first
+    return condition._values[1], None
+
+
+class FakeTable:
+    def __init__(self, latency=0.0, key='ReceiptID', indexes=None, name='BillE_Expenses', range_key=None,
+                 throttle_rate=0.0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate  # fraction of put_item calls "throttled"
+        self.name = name
+        self.key = key
+        self.range_key = range_key  # composite primary key: items are stored under (hash, range)
+        self.items = {}
+        self.lock = threading.Lock()
+        # name -> (hash key, range key), like the GSIs in terraform/main.tf
+        self.indexes = dict(indexes) if indexes is not None else {
+            'UploadDateIndex': ('RecordType', 'UploadDate'),
+            'UpdatedAtIndex': ('RecordType', 'UpdatedAt'),
+            'StatusIndex': ('Status', 'UploadDate'),
+            'RiskScoreIndex': ('RecordType', 'RiskScore'),
+        }
+        if range_key:
+            self.indexes[None] = (key, range_key)  # Query on the table itself
+        self._sorted = {}
+
+    def key_of(self, item):
+        return (item[self.key], item[self.range_key]) if self.range_key else item[self.key]
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        time.sleep(self.latency)
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException',
+                                         'Message': 'Rate of requests exceeds the allowed throughput'}}, 'PutItem')
+        with self.lock:
+            check(ConditionExpression, self.items.get(self.key_of(Item)), 'PutItem')
+            self.items[self.key_of(Item)] = dict(Item)
+            self._sorted.clear()
+        return {}
+
+    def delete_item(self, Key, ConditionExpression=None, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            check(ConditionExpression, self.items.get(self.key_of(Key)), 'DeleteItem')
+            self.items.pop(self.key_of(Key), None)
+            self._sorted.clear()
+        return {}
+
+    def batch_writer(self):
+        return FakeBatchWriter(self)
+
+    def get_item(self, Key, **kwargs):
+        time.sleep(self.latency)
+        item = self.items.get(self.key_of(Key))
+        return {'Item': dict(item)} if item else {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ConditionExpression=None, ReturnValues='NONE', **kwargs):
+        # Only "SET a = :x, b = :y", "ADD counter :n, members :set" or "REMOVE a, b"
+        # updates, with #name placeholders and a Key()/Attr() condition
+        time.sleep(self.latency)
+        names = ExpressionAttributeNames or {}
+        with self.lock:
+            current = self.items.get(self.key_of(Key))
+            check(ConditionExpression, current, 'UpdateItem')
+            if current is None:
+                self._sorted.clear()
+            item = self.items.setdefault(self.key_of(Key), dict(Key))
+            old = dict(current or {})
+            action, _, clauses = UpdateExpression.partition(' ')
+            updated = {}
+            for clause in clauses.split(','):
+                if action == 'REMOVE':
+                    name = names.get(clause.strip(), clause.strip())
+                    item.pop(name, None)
+                    updated[name] = None
+                    continue
+                if action == 'ADD':
+                    name, value = clause.split()
+                    name = names.get(name, name)
+                    value = ExpressionAttributeValues[value]
+                    # Sets gain members, numbers are added to
+                    item[name] = item.get(name, set()) | value if isinstance(value, set) else item.get(name, 0) + value
+                else:
+                    name, value = (part.strip() for part in clause.split('='))
+                    name = names.get(name, name)
+                    item[name] = ExpressionAttributeValues[value]
+                updated[name] = item[name]
+            if item_size(item) > ITEM_BYTES:
+                # Rejected whole, like DynamoDB does
+                if current is None:
+                    del self.items[self.key_of(Key)]
+                else:
+                    self.items[self.key_of(Key)] = old
+                raise ClientError({'Error': {'Code': 'ValidationException',
+                                             'Message': 'Item size has exceeded the maximum allowed size'}},
+                                  'UpdateItem')
+            # Counter items (no index attributes) leave the indexes as they were
+            if any(name in keys for keys in self.indexes.values() for name in updated):
+                self._sorted.clear()
+        if ReturnValues == 'ALL_OLD':
+            return {'Attributes': old} if old else {}
+        return {'Attributes': updated} if ReturnValues == 'UPDATED_NEW' else {}
+
+    def _capacity(self, read_bytes, kwargs):
+        if kwargs.get('ReturnConsumedCapacity') in (None, 'NONE'):
+            return {}
+        # Scan/Query are eventually consistent by default: half a unit per 4 KB
+        units = math.ceil(read_bytes / RCU_BYTES) * 0.5
+        return {'ConsumedCapacity': {'CapacityUnits': units}}
+
+    def _page(self, candidates, kwargs, last_key_of):
+        limit = kwargs.get('Limit')
+        condition = kwargs.get('FilterExpression')
+        items, read_bytes, examined, last = [], 0, 0, None
+        for item in candidates:
+            size = item_size(item)
+            if read_bytes + size > PAGE_BYTES:
+                break
+            read_bytes += size
+            examined += 1
+            last = item
+            if condition is None or evaluate(condition, item):
+                items.append(dict(item))
+            if limit and examined >= limit:
+                break
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': examined}
+        more = last is not None and examined < len(candidates)
+        if more:
+            response['LastEvaluatedKey'] = last_key_of(last)
+        response.update(self._capacity(read_bytes, kwargs))
+        return response
+
+    def scan(self, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            if '__table__' not in self._sorted:
+                self._sorted['__table__'] = sorted(self.items)
+            keys = self._sorted['__table__']
+        if kwargs.get('TotalSegments'):
+            # Parallel scan: each segment owns every n-th key
+            keys = keys[kwargs['Segment']::kwargs['TotalSegments']]
+        start = 0
+        if kwargs.get('ExclusiveStartKey'):
+            start = bisect.bisect_right(keys, self.key_of(kwargs['ExclusiveStartKey']))
+
+        candidates, size = [], 0
+        for i in range(start, len(keys)):
+            item = self.items[keys[i]]
+            candidates.append(item)
+            size += item_size(item)
+            if kwargs.get('Limit') and len(candidates) > kwargs['Limit']:
+                break
+            if size > PAGE_BYTES:
+                break
+        return self._page(candidates, kwargs, lambda item: {k: item[k] for k in (self.key, self.range_key) if k})
+
+    def _index(self, name):
+        # Built under the lock so a concurrent put can't be left out of it
+        with self.lock:
+            if name not in self._sorted:
+                hash_key, range_key = self.indexes[name]
+                partitions = {}
+                for item in self.items.values():
+                    if hash_key in item and range_key in item:
+                        partitions.setdefault(item[hash_key], []).append(
+                            ((item[range_key], item[self.key]), item))
+                for value, rows in partitions.items():
+                    rows.sort(key=lambda row: row[0])
+                    partitions[value] = ([row[0] for row in rows], [row[1] for row in rows])
+                self._sorted[name] = partitions
+            return self._sorted[name]
+
+    def query(self, IndexName=None, KeyConditionExpression=None, ScanIndexForward=True, **kwargs):
+        time.sleep(self.latency)
+        hash_key, range_key = self.indexes[IndexName]
+        hash_value, range_condition = split_key_condition(KeyConditionExpression, hash_key)
+        sort_keys, rows = self._index(IndexName).get(hash_value, ([], []))
+
+        # Binary search the range condition and the cursor like a real B-tree seek
+        lo, hi = range_bounds(sort_keys, range_condition)
+        start_key = kwargs.get('ExclusiveStartKey')
+        if start_key:
+            position = (start_key[range_key], start_key[self.key])
+            if ScanIndexForward:
+                lo = max(lo, bisect.bisect_right(sort_keys, position))
+            else:
+                hi = min(hi, bisect.bisect_left(sort_keys, position))
+        positions = range(lo, hi) if ScanIndexForward else range(hi - 1, lo - 1, -1)
+
+        # Only materialise what one page can hold (plus one row to know there is more)
+        candidates, size = [], 0
+        for i in positions:
+            item = rows[i]
+            candidates.append(item)
+            size += item_size(item)
+            if kwargs.get('Limit') and len(candidates) > kwargs['Limit']:
+                break
+            if size > PAGE_BYTES:
+                break
+
+        def last_key_of(item):
+            return {self.key: item[self.key], hash_key: item[hash_key], range_key: item[range_key]}
+        return self._page(candidates, kwargs, last_key_of)
+
+
+class FakeBatchWriter:
+    # table.batch_writer(): buffers 25 writes per (simulated) BatchWriteItem
+    def __init__(self, table):
+        self.table = table
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def put_item(self, Item):
+        self.pending.append(('put', Item))
+        if len(self.pending) >= 25:
+            self.flush()
+
+    def delete_item(self, Key):
+        self.pending.append(('delete', Key))
+        if len(self.pending) >= 25:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        time.sleep(self.table.latency)
+        with self.table.lock:
+            for action, value in self.pending:
+                if action == 'put':
+                    self.table.items[self.table.key_of(value)] = dict(value)
+                else:
+                    self.table.items.pop(self.table.key_of(value), None)
+            self.table._sorted.clear()
+        self.pending = []
+
+
+def range_bounds(sort_keys, condition):
+    # [lo, hi) slice of a sorted (range value, primary key) list matching a range condition
+    if condition is None:
+        return 0, len(sort_keys)
+    op = condition.expression_operator
+    args = condition._values[1:]
+    low, high = (args[0],), (args[0], chr(0x10FFFF))
+    if op == '=':
+        return bisect.bisect_left(sort_keys, low), bisect.bisect_right(sort_keys, high)
+    if op == '>':
+        return bisect.bisect_right(sort_keys, high), len(sort_keys)
+    if op == '>=':
+        return bisect.bisect_left(sort_keys, low), len(sort_keys)
+    if op == '<':
+        return 0, bisect.bisect_left(sort_keys, low)
+    if op == '<=':
+        return 0, bisect.bisect_right(sort_keys, high)
+    if op == 'BETWEEN':
+        return (bisect.bisect_left(sort_keys, (args[0],)),
+                bisect.bisect_right(sort_keys, (args[1], chr(0x10FFFF))))
+    if op == 'begins_with':
+        return (bisect.bisect_left(sort_keys, low),
+                bisect.bisect_left(sort_keys, (args[0] + chr(0x10FFFF),)))
+    raise NotImplementedError(op)
+
+
+class FakeDynamoDB:
+    # The resource-level calls: Table(), batch_get_item() and batch_write_item()
+    def __init__(self, *tables, latency=0.0, unprocessed_rate=0.0):
+        self.tables = {table.name: table for table in tables}
+        self.latency = latency
+        self.unprocessed_rate = unprocessed_rate  # fraction of puts "throttled" per call
+        self.calls = 0
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        time.sleep(self.latency)
+        self.calls += 1
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            found = (table.items.get(table.key_of(key)) for key in request['Keys'])
+            responses[name] = [dict(item) for item in found if item]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems):
+        time.sleep(self.latency)
+        self.calls += 1
+        unprocessed = {}
+        for name, requests in RequestItems.items():
+            table = self.tables[name]
+            for request in requests:
+                if random.random() < self.unprocessed_rate:
+                    unprocessed.setdefault(name, []).append(request)
+                elif 'PutRequest' in request:
+                    with table.lock:
+                        table.items[table.key_of(request['PutRequest']['Item'])] = dict(request['PutRequest']['Item'])
+                        table._sorted.clear()
+                else:
+                    with table.lock:
+                        table.items.pop(table.key_of(request['DeleteRequest']['Key']), None)
+                        table._sorted.clear()
+        return {'UnprocessedItems': unprocessed}
+
+
+class FakeSNS:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = []
+
+    def publish(self, **kwargs):
+        time.sleep(self.latency)
+        self.messages.append(kwargs)
+        return {'MessageId': str(len(self.messages))}
+
+
+class FakeSocketGateway:
+    # apigatewaymanagementapi for a WebSocket API: each connected client gets a
+    # queue, post_to_connection puts the message on it
+    class exceptions:
+        class GoneException(Exception):
+            pass
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.sockets = {}
+        self.lock = threading.Lock()
+
+    def connect(self, connection_id):
+        with self.lock:
+            return self.sockets.setdefault(connection_id, queue.Queue())
+
+    def disconnect(self, connection_id):
+        with self.lock:
+            self.sockets.pop(connection_id, None)
+
+    def post_to_connection(self, ConnectionId, Data):
+        time.sleep(self.latency)
+        with self.lock:
+            socket = self.sockets.get(ConnectionId)
+        if socket is None:
+            raise self.exceptions.GoneException(f"{ConnectionId} is gone")
+        socket.put(Data)
+        return {}
+
+
+class FakeHttpResponse:
+    def __init__(self, payload, status=200, headers=None):
+        self.status = status
+        self.data = json.dumps(payload).encode('utf-8')
+        self.headers = headers or {}
+
+
+class FakeHttpPool:
+    # Drop-in for ocr.HTTP (a urllib3 PoolManager) that answers like OCR.space
+    def __init__(self, latency=0.0, text="CITY MART\nMilk 2.50\nTOTAL 2.50"):
+        self.latency = latency
+        self.text = text
+
+    def urlopen(self, method, url, body=None, headers=None, **kwargs):
+        # Consume a streamed body the way a socket would
+        if body is not None and not isinstance(body, bytes):
+            for _ in body:
+                pass
+        time.sleep(self.latency)
+        return FakeHttpResponse({
+            'ParsedResults': [{'ParsedText': self.text}],
+            'IsErroredOnProcessing': False,
+        })
+
+
+def s3_event_record(bucket, key, message_id):
+    body = {'Records': [{'s3': {'bucket': {'name': bucket}, 'object': {'key': key}}}]}
+    return {'messageId': message_id, 'body': json.dumps(body)}
+
+
+class StreamingBody:
+    # Like botocore's StreamingBody for a `size` byte object, but generated on
+    # the fly so the benchmark itself doesn't hold the whole file in memory
+    def __init__(self, size, chunk=b'\x89PNG receipt pixels ' * 3277):
+        self.remaining = size
+        self.chunk = chunk
+
+    def read(self, amt=None):
+        amt = self.remaining if amt is None else min(amt, self.remaining)
+        self.remaining -= amt
+        whole, rest = divmod(amt, len(self.chunk))
+        return b''.join([self.chunk] * whole + [self.chunk[:rest]])
+
+
+class FakeSQS:
+    # A standard queue: sent messages are visible to receive_message() (after
+    # DelaySeconds), and a received one comes back after visibility_timeout
+    # unless it is deleted. With max_receive_count, a message received that many
+    # times goes to .dead instead, like a redrive policy to a DLQ.
+    def __init__(self, latency=0.0, visibility_timeout=30.0, max_receive_count=None):
+        self.latency = latency
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        self.visible = collections.deque()
+        self.delayed = []    # (visible at, message)
+        self.in_flight = {}  # receipt handle -> (visible again at, message)
+        self.dead = []
+        self.sent = 0
+        self.cond = threading.Condition()
+
+    def send_message(self, QueueUrl, MessageBody, DelaySeconds=0, MessageAttributes=None, **kwargs):
+        time.sleep(self.latency)
+        with self.cond:
+            self.sent += 1
+            message = {'MessageId': f"msg-{self.sent}", 'Body': MessageBody,
+                       'Attributes': {'SentTimestamp': str(int(time.time() * 1000)), 'ApproximateReceiveCount': '0'},
+                       'MessageAttributes': MessageAttributes or {}}
+            if DelaySeconds:
+                self.delayed.append((time.monotonic() + DelaySeconds, message))
+            else:
+                self.visible.append(message)
+            self.cond.notify()
+        return {'MessageId': message['MessageId']}
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        for handle, (deadline, message) in list(self.in_flight.items()):
+            if deadline <= now:
+                del self.in_flight[handle]
+                self.visible.append(message)
+        if self.delayed:
+            self.visible.extend(message for at, message in self.delayed if at <= now)
+            self.delayed = [(at, message) for at, message in self.delayed if at > now]
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, **kwargs):
+        time.sleep(self.latency)
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self.cond:
+            while True:
+                self._requeue_expired()
+                if self.visible or time.monotonic() >= deadline:
+                    break
+                self.cond.wait(min(0.05, max(0.0, deadline - time.monotonic())))
+            messages = []
+            while self.visible and len(messages) < MaxNumberOfMessages:
+                message = self.visible.popleft()
+                received = int(message['Attributes']['ApproximateReceiveCount'])
+                if self.max_receive_count and received >= self.max_receive_count:
+                    self.dead.append(message)
+                    continue
+                message['Attributes']['ApproximateReceiveCount'] = str(received + 1)
+                handle = f"{message['MessageId']}:{time.monotonic()}"
+                self.in_flight[handle] = (time.monotonic() + self.visibility_timeout, message)
+                messages.append(dict(message, ReceiptHandle=handle))
+        return {'Messages': messages} if messages else {}
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        time.sleep(self.latency)
+        with self.cond:
+            self.in_flight.pop(ReceiptHandle, None)
+        return {}
+
+    def depth(self):
+        # -> (visible, in flight), like ApproximateNumberOfMessages(NotVisible); delayed ones count as visible
+        with self.cond:
+            self._requeue_expired()
+            return len(self.visible) + len(self.delayed), len(self.in_flight)
@@ -0,0 +1,138 @@
+import datetime
+import json
+import os
+import time
+
+from boto3.dynamodb.conditions import Key
+
+import read_cache
+
+# --- CHANGE EVENTS ---
+# After every batch it writes, the processor announces the change twice:
+#
+#   - with CHANGES_TOPIC_ARN set, a small event goes to that SNS topic. push.py
+#     is subscribed to it and sends the event down every dashboard's WebSocket;
+#     the dashboard then reads the rows with one GET /expenses/changes?wait=0.
+#   - the ledger version (META#LEDGER_VERSION, see read_cache.bump_version)
+#     moves. Without a socket (no topic, DynamoDB Local, the benchmark fakes)
+#     GET /expenses/changes long-polls wait on it instead.
+#
+# A long-poll checks the version every POLL_INTERVAL seconds at first and backs
+# off, doubling up to MAX_POLL_INTERVAL, for as long as nothing changes.
+TOPIC_ARN = os.environ.get('CHANGES_TOPIC_ARN')
+MAX_WAIT = 25  # API Gateway HTTP APIs end every request at 30 s
+DEFAULT_WAIT = 20
+POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', '0.5'))
+MAX_POLL_INTERVAL = float(os.environ.get('CHANGES_MAX_POLL_INTERVAL', '4'))
+# Rows are handed out only once they are SETTLE seconds old, so a batch stamped
+# earlier but still being written can't end up behind a client's `since`
+SETTLE = float(os.environ.get('CHANGES_SETTLE', '0.5'))
+INDEX_LAG = 2.0  # how long after a version bump the index may still be catching up
+FLOOR = '0000-00-00'  # before every UpdatedAt
+
+
+def publish(sns, items, version):
+    # Fan-out event for one written batch. Never fails the batch: the ledger is
+    # already written, and a dashboard that missed an event catches up on the next
+    if not TOPIC_ARN or not items:
+        return
+    event = {
+        'Version': version,
+        'UpdatedAt': max(item['UpdatedAt'] for item in items),
+        'Receipts': [
+            {'ReceiptID': item['ReceiptID'], 'Filename': item['Filename'],
+             'RiskScore': int(item['RiskScore']), 'Status': item['Status']}
+            for item in items
+        ],
+    }
+    try:
+        sns.publish(TopicArn=TOPIC_ARN, Message=json.dumps(event), Subject="BILL-E ledger change")
+    except Exception as e:
+        print(f"Change event publish failed: {e}")
+
+
+def parse_changes_params(params):
+    # ?since=<UpdatedAt>&wait=<seconds>&limit=
+    wait = int(params.get('wait') or DEFAULT_WAIT)
+    if not 0 <= wait <= MAX_WAIT:
+        raise ValueError(f"wait must be between 0 and {MAX_WAIT}")
+    limit = int(params.get('limit') or 100)
+    if not 1 <= limit <= 1000:
+        raise ValueError("limit must be between 1 and 1000")
+    return {'since': params.get('since'), 'wait': wait, 'limit': limit}
+
+
+def ledger_version(table):
+    item = table.get_item(Key=read_cache.VERSION_KEY, ProjectionExpression='Version').get('Item', {})
+    return int(item.get('Version', 0))
+
+
+def newest_change(table):
+    # Where a client that is just starting to listen begins
+    response = table.query(
+        IndexName='UpdatedAtIndex',
+        KeyConditionExpression=Key('RecordType').eq('RECEIPT'),
+        ScanIndexForward=False,
+        Limit=1,
+    )
+    items = response.get('Items', [])
+    return items[0]['UpdatedAt'] if items else FLOOR
+
+
+def settled(table, since, limit):
+    # -> (rows older than the settle horizon, seconds until the next younger one settles or None)
+    response = table.query(
+        IndexName='UpdatedAtIndex',
+        KeyConditionExpression=Key('RecordType').eq('RECEIPT') & Key('UpdatedAt').gt(since),
+        ScanIndexForward=True,
+        Limit=limit,
+    )
+    items = response.get('Items', [])
+    now = datetime.datetime.now()
+    horizon = (now - datetime.timedelta(seconds=SETTLE)).isoformat()
+    ready = [item for item in items if item['UpdatedAt'] <= horizon]
+    if len(items) == limit and ready and ready[-1]['UpdatedAt'] == items[-1]['UpdatedAt']:
+        # A batch shares one UpdatedAt: don't cut it in half, or `since` skips the rest
+        tail = items[-1]['UpdatedAt']
+        ready = [item for item in ready if item['UpdatedAt'] != tail] or ready
+    if len(ready) == len(items):
+        return ready, None
+    young = datetime.datetime.fromisoformat(items[len(ready)]['UpdatedAt'])
+    return ready, max(0.0, (young - now).total_seconds() + SETTLE)
+
+
+def wait_for_changes(table, since, wait, limit=100):
+    # -> {'items': rows changed after `since`, oldest first, 'since': where to resume}
+    # Returns as soon as there are any, or with no items after `wait` seconds.
+    if not since:
+        return {'items': [], 'since': newest_change(table)}
+
+    deadline = time.monotonic() + wait
+    version, look_until = None, 0.0
+    interval = POLL_INTERVAL
+    while True:
+        # 1. A version bump means the processor wrote something (one small GetItem).
+        # While it stands still, each check waits twice as long as the last one.
+        current = ledger_version(table)
+        if current != version:
+            version, look_until = current, time.monotonic() + INDEX_LAG
+            interval = POLL_INTERVAL
+        elif time.monotonic() > look_until:
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+        sleep = interval
+
+        # 2. Read the rows after a bump, and for a moment after it: the index trails the table
+        if time.monotonic() <= look_until:
+            ready, settles_in = settled(table, since, limit)
+            if ready:
+                return {'items': ready, 'since': ready[-1]['UpdatedAt']}
+            if settles_in is not None:
+                # Written but too young: come back the moment it is old enough
+                sleep = min(sleep, settles_in + 0.01)
+                look_until = time.monotonic() + sleep + INDEX_LAG
+
+        # 3. Nothing yet: sleep until the next check or the end of the wait
+        left = deadline - time.monotonic()
+        if left <= 0:
+            return {'items': [], 'since': since}
+        time.sleep(min(sleep, left))
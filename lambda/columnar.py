@@ -0,0 +1,91 @@
+import json
+from decimal import Decimal
+
+# pyarrow is not in the bare Lambda runtime either; ?format=arrow needs a layer
+# with it (e.g. AWS SDK for pandas). Without it only the JSON formats are served.
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# --- RESPONSE FORMATS ---
+# GET /expenses?format=
+#
+#   json     {"items": [{...}, ...], "next_cursor"}: one object per receipt,
+#            numbers as strings (the original format)
+#   columns  {"columns": {"Total": [...], ...}, "count", "next_cursor"}: every
+#            field name once, then its values for every receipt (null where a
+#            receipt doesn't have it), numbers as JSON numbers.
+#            pd.DataFrame(page['columns']) is the page, no dict per row.
+#   arrow    the same columns as an Arrow IPC stream; next_cursor and count are
+#            in the schema metadata. pa.ipc.open_stream(body).read_pandas()
+FORMATS = ('json', 'columns', 'arrow')
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def parse_format(params):
+    fmt = params.get('format') or 'json'
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == 'arrow' and pa is None:
+        raise ValueError("format=arrow is not available here (no pyarrow)")
+    return fmt
+
+
+def plain(value):
+    # DynamoDB numbers come back as Decimal: whole ones become ints, the rest floats
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: plain(v) for k, v in value.items()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(plain(v) for v in value)
+    return value
+
+
+def to_columns(items):
+    # -> {field: [value per item]}, fields in the order they first appear
+    names = {}
+    for item in items:
+        names.update(dict.fromkeys(item))
+    columns = {}
+    for name in names:
+        values = [item.get(name) for item in items]
+        # Plain string columns (most of them) are kept as they are
+        if not all(value is None or type(value) is str for value in values):
+            values = [plain(value) for value in values]
+        columns[name] = values
+    return columns
+
+
+def arrow_array(values):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed types (e.g. an old row with Total as a string) go as text
+        return pa.array([v if v is None or isinstance(v, str) else json.dumps(v) for v in values])
+
+
+def to_arrow(columns, next_cursor):
+    # -> Arrow IPC stream bytes; column types are inferred (Total double,
+    # RiskScore int64, RiskFlags list<string>, ...)
+    table = pa.table({name: arrow_array(values) for name, values in columns.items()})
+    count = len(next(iter(columns.values()), []))
+    table = table.replace_schema_metadata({'next_cursor': next_cursor or '', 'count': str(count)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode_page(items, next_cursor, fmt, default=str):
+    # -> (body, content type). JSON bodies are str, Arrow bodies bytes.
+    if fmt == 'columns':
+        columns = to_columns(items)
+        body = {'columns': columns, 'count': len(items), 'next_cursor': next_cursor}
+        return json.dumps(body, separators=(',', ':'), default=default), 'application/json'
+    if fmt == 'arrow':
+        return to_arrow(to_columns(items), next_cursor), ARROW_TYPE
+    return json.dumps({'items': items, 'next_cursor': next_cursor}, default=default), 'application/json'
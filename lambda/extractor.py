@@ -0,0 +1,165 @@
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+# --- PATTERNS ---
+# Compiled once per container. extract() walks the receipt line by line a single
+# time; each line gets at most one search per pattern.
+
+# DD-MM-YYYY / DD/MM/YYYY / DD.MM.YYYY (or MM/DD/YYYY), or YYYY-MM-DD
+DATE = re.compile(r'(?<!\d)(?:(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})|(\d{4})[/.-](\d{1,2})[/.-](\d{1,2}))(?!\d)')
+
+# An amount: 45, 45.5, 1,200.50. Not part of a date (12-05-2025), a time (10:45),
+# a phone number (080-2345) or a percentage (GST 5%). It starts with a bare \d
+# (the lookbehind comes after it) so the regex engine can skip ahead to digits.
+MONEY = re.compile(
+    r'\d(?<![\d:/.,-]\d)(?:\d{0,2}(?:,\d{3})+(?:\.\d{1,2})?|\d*(?:\.\d{1,2})?)(?![\d:/-]|\s*%|[.,]\d)'
+)
+# The right-most amount on a line, in one match: the greedy .* backtracks from
+# the end of the line. An amount can't start inside another one (the lookbehind
+# rejects a digit after a digit, ',' or '.'), so it is finditer's last match.
+LAST_MONEY = re.compile(r'.*(' + MONEY.pattern + ')')
+# What comes right before an identifier, not money: "#1234", "Store # 12",
+# a masked card "**** 4321" / "XXXXXXXX4321"
+ID_PREFIXES = ('#', '№', '***', 'xxx', 'XXX', '•••')
+# Currency right before an amount
+CURRENCY = re.compile(r'(?:([$£€₹])|\b(rs\.?|inr|usd|eur|gbp))\s*$', re.IGNORECASE)
+
+# Line labels, in priority order: the first group that matches names the line.
+# Searched in the lower-cased line (faster than IGNORECASE over this many words).
+LABEL = re.compile(
+    r'\b(?:(?P<subtotal>sub\s*-?\s*total)|(?P<tax>c?gst|sgst|igst|vat|tax)'
+    r'|(?P<noise>change|tender(?:ed)?|cash|card|balance|tel|phone|ph|mobile|gstin|invoice|bill\s*no|order\s*no|txn'
+    r'|store|branch|terminal|pos|till|register|lane|cashier|table|auth|approval|ref|rrn|trace'
+    r'|visa|mastercard|amex|rupay|maestro|debit|credit)'
+    r'|(?P<total>total|amount|due|payable))\b'
+)
+TOTAL_SCORES = (('total', 10), ('amount', 5), ('due', 5), ('payable', 5))
+
+QUANTITY = re.compile(r'^\s*(\d{1,3})\s*[xX@*]\s+')
+LETTERS = re.compile(r'[A-Za-z]{2,}')
+
+CURRENCIES = {'$': 'USD', '£': 'GBP', '€': 'EUR', '₹': 'INR',
+              'rs': 'INR', 'rs.': 'INR', 'inr': 'INR', 'usd': 'USD', 'eur': 'EUR', 'gbp': 'GBP'}
+
+MAX_AMOUNT = 200000  # bigger "amounts" are phone numbers or IDs
+
+
+def to_amount(number):
+    try:
+        return Decimal(number.replace(',', ''))
+    except InvalidOperation:
+        return None
+
+
+def read_amount(line, number, start):
+    # -> (amount, the text before it), or None for a year, an ID or a phone number
+    value = to_amount(number)
+    if value is None or value > MAX_AMOUNT or (2018 <= value <= 2030 and '.' not in number):
+        return None
+    head = line[:start].rstrip()
+    if head.rstrip(' \t:-').endswith(ID_PREFIXES):
+        return None
+    return value, head
+
+
+def normalize_date(match):
+    # -> "YYYY-MM-DD", or None for impossible dates (31-31-2024, 31/02/2024).
+    # Day first, unless only the US month-first reading exists (03/14/2024);
+    # one that works both ways (01/07/2025) stays day first.
+    day, month, year, iso_year, iso_month, iso_day = match.groups()
+    if iso_year:
+        year, month, day = iso_year, iso_month, iso_day
+    for day, month in ((day, month), (month, day))[:1 if iso_year else 2]:
+        try:
+            return datetime.date(int(year), int(month), int(day)).isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def extract(text):
+    """
+    Structured fields from one receipt's OCR text, in one pass over its lines:
+        Merchant, Date (YYYY-MM-DD), Total, Tax (Decimal), Currency (ISO code),
+        LineItems ([{'Description', 'Quantity', 'Amount'}])
+    Fields that can't be found are None (LineItems: []).
+    """
+    merchant = date = currency = None
+    tax = None
+    items = []
+    best_total = None  # (score, amount)
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        # Date: the first one wins (MONEY already skips date digits)
+        if date is None:
+            date_match = DATE.search(line)
+            if date_match:
+                date = normalize_date(date_match)
+
+        # Merchant: the first line with words in it
+        if merchant is None and LETTERS.search(line):
+            merchant = line
+            continue
+
+        # The right-most amount on a line is its value. Usually that is the last
+        # number; only when it's an ID or a year are the others looked at.
+        last = LAST_MONEY.match(line)
+        if last is None:
+            continue
+        found = read_amount(line, last.group(1), last.start(1))
+        if found is None:
+            for money in reversed(list(MONEY.finditer(line))[:-1]):
+                found = read_amount(line, money.group(), money.start())
+                if found:
+                    break
+            else:
+                continue
+        amount, head = found
+
+        lower = line.lower()
+        label = LABEL.search(lower)
+        kind = label.lastgroup if label else None
+
+        # Currency right before the amount: only the last few characters can hold
+        # one. Once it is known, only an item's description needs it taken off.
+        if currency is None or kind is None:
+            symbol = CURRENCY.search(head, max(0, len(head) - 4))
+            if symbol:
+                if currency is None:
+                    currency = CURRENCIES[(symbol.group(1) or symbol.group(2)).lower()]
+                head = head[:symbol.start()]
+
+        if kind == 'tax':
+            tax = amount if tax is None else tax + amount
+        elif kind in ('subtotal', 'noise'):
+            continue
+        elif kind == 'total':
+            score = sum(points for word, points in TOTAL_SCORES if word in lower)
+            if best_total is None or (score, amount) > best_total:
+                best_total = (score, amount)
+        else:
+            # An item line: "2 x Coffee   120.00"
+            description = head.strip(' .:-\t')
+            quantity = 1
+            qty = QUANTITY.match(description)
+            if qty:
+                quantity = int(qty.group(1))
+                description = description[qty.end():]
+            if LETTERS.search(description):
+                items.append({'Description': description, 'Quantity': quantity, 'Amount': amount})
+            if best_total is None or (0, amount) > best_total:
+                best_total = (0, amount)
+
+    return {
+        'Merchant': merchant,
+        'Date': date,
+        'Total': best_total[1] if best_total else None,
+        'Tax': tax,
+        'Currency': currency,
+        'LineItems': items,
+    }
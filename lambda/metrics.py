@@ -0,0 +1,140 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# --- STRUCTURED METRICS ---
+# One JSON line per unit of work in CloudWatch Embedded Metric Format: Lambda
+# ships stdout to CloudWatch Logs, which turns the "_aws" block into metrics.
+# Everything else on the line (receipt hash, file key, ...) stays searchable in
+# Logs Insights without becoming a high-cardinality dimension.
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'BillE')
+ENABLED = os.environ.get('METRICS', 'true').lower() != 'false'
+
+
+class Timer:
+    """
+    Stage timings and properties for one receipt (or one batch).
+
+        timer = Timer('receipt', dimensions=('Outcome',), FileKey=key)
+        with timer.stage('Ocr'):
+            ...
+        timer.emit('analyzed')
+    """
+
+    def __init__(self, kind, dimensions=('Outcome',), **properties):
+        self.kind = kind
+        self.dimensions = ['Kind'] + list(dimensions)
+        self.properties = properties
+        self.values = {}  # metric name -> (value, unit)
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        # Adds to <name>Ms, so a stage that runs twice is counted in full
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f"{name}Ms", (time.perf_counter() - start) * 1000, 'Milliseconds')
+
+    def add(self, name, value, unit='Count'):
+        previous = self.values.get(name, (0, unit))[0]
+        self.values[name] = (previous + value, unit)
+
+    def set(self, **properties):
+        self.properties.update(properties)
+
+    def emit(self, outcome, **properties):
+        if not ENABLED:
+            return
+        self.add('TotalMs', (time.perf_counter() - self.start) * 1000, 'Milliseconds')
+        line = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [self.dimensions],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in self.values.items()],
+                }],
+            },
+            'Kind': self.kind,
+            'Outcome': outcome,
+        }
+        line.update(self.properties)
+        line.update(properties)
+        line.update((name, round(value, 3)) for name, (value, _) in self.values.items())
+        print(json.dumps(line))
+
+
+# --- SAMPLING PROFILER ---
+# For a PROFILE_SAMPLE_RATE fraction of invocations a background thread snapshots
+# every thread's stack each PROFILE_INTERVAL seconds. If the invocation then takes
+# longer than PROFILE_SLOW_MS, the most frequent stacks are logged. Off by default.
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '10000'))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.01'))
+PROFILE_TOP = 20
+PROFILE_DEPTH = 30
+
+
+class StackSampler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                # Collapsed, root first: "lambda_handler (...);process_record (...);..."
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+@contextmanager
+def profile_if_slow(name):
+    # Works as a decorator too: @profile_if_slow('processor')
+    sampler = None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        sampler = StackSampler().start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if sampler:
+            stacks = sampler.stop()
+            duration_ms = (time.perf_counter() - start) * 1000
+            if duration_ms >= PROFILE_SLOW_MS:
+                print(json.dumps({
+                    'Kind': 'profile',
+                    'Name': name,
+                    'DurationMs': round(duration_ms, 1),
+                    'Samples': sampler.samples,
+                    'IntervalMs': sampler.interval * 1000,
+                    'TopStacks': [{'Stack': stack, 'Count': count}
+                                  for stack, count in stacks.most_common(PROFILE_TOP)],
+                }))
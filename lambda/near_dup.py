@@ -0,0 +1,246 @@
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# Pillow comes from a layer, like for preprocess.py. Without it receipts get no
+# perceptual hash and only byte-identical copies are caught (the ReceiptID).
+try:
+    from PIL import Image, ImageChops, ImageFilter, ImageOps
+except ImportError:
+    Image = None
+
+import preprocess
+import search_index
+
+# --- NEAR-DUPLICATES ---
+# The SHA-256 ReceiptID only catches the same bytes uploaded twice. A copy that
+# was photographed again, re-cropped or re-compressed gets a new hash, so every
+# receipt image also gets a 64-bit perceptual hash: the receipt cut out of the
+# picture, shrunk to 4 x 16 gray cells, one bit per cell (brighter than the
+# mean or not). Copies of one receipt land a few bits apart.
+#
+# Receipts look alike at 4 x 16 (text in lines on white paper), so the hash
+# alone would match unrelated receipts with the same layout. A double claim is
+# for the same amount, so a match also needs the same Total. Receipts without a
+# Total are not checked.
+#
+# The index is LSH banding in the ledger table, under PHASH# keys without
+# RecordType (like the STATS# rollups):
+#
+#   PHASH#<total>#<band>:<16 bits hex>     Members: {"<hash hex>:<ReceiptID>", ...}, Entries, Pages
+#   PHASH#<total>#<band>:<16 bits hex>~1   the bucket's next PAGE_SIZE members, Entries
+#
+# A DynamoDB item stops at 400 KB (about 4,900 members), and a popular Total
+# with a common layout fills a bucket, so a bucket is split in pages of at most
+# PAGE_SIZE members. Pages, on the first page, says how many there are.
+#
+# Each hash is split in BANDS bands of 16 bits. Two hashes DISTANCE bits apart
+# have at least one band within DISTANCE // BANDS bits of each other, so a
+# lookup reads every bucket within that radius of each band (4 x 17 keys at the
+# default distance, one BatchGetItem) and checks the real distance of the few
+# members it finds. It costs the same at a thousand receipts as at millions.
+PREFIX = 'PHASH#'
+DISTANCE = int(os.environ.get('NEAR_DUP_DISTANCE', '7'))  # differing bits of 64 still called a copy
+BANDS = 4
+BAND_BITS = 64 // BANDS
+RADIUS = DISTANCE // BANDS
+UPDATE_WORKERS = 8
+PAGE_SIZE = int(os.environ.get('NEAR_DUP_PAGE_SIZE', '2000'))  # members per item, ~160 KB
+ENABLED = Image is not None
+
+# How the receipt is found in the picture
+SIDE = 256               # the picture is shrunk to this first
+PAPER_LEVEL = 170        # brighter than this (after auto-contrast) is paper
+INK_LEVEL = 110          # darker than this is print
+EDGE = 7                 # print this close to the edge of the paper is the table, a shadow or a fold
+MIN_BITS, MAX_BITS = 8, 56  # a hash with fewer/more bits set is a blank or black picture
+
+
+# --- HASHING ---
+def receipt_area(gray):
+    # Bounding box of the print that lies on the paper: the table, the
+    # background and the paper's own edges don't move the box, so a photo and
+    # a scan of one receipt are cut the same way
+    gray = ImageOps.autocontrast(gray, cutoff=1)
+    paper = gray.point(lambda p: 255 if p > PAPER_LEVEL else 0)
+    # Close the holes the print leaves in the paper, then pull the edges in
+    paper = paper.filter(ImageFilter.MaxFilter(5)).filter(ImageFilter.MinFilter(5)).filter(ImageFilter.MinFilter(EDGE))
+    ink = ImageChops.multiply(gray.point(lambda p: 255 if p < INK_LEVEL else 0), paper)
+    box = ink.getbbox()
+    return gray.crop(box) if box else gray
+
+
+def image_hash(fileobj, filename):
+    # -> 64-bit perceptual hash of a receipt picture, or None (not an image,
+    # no Pillow, nothing on it). Leaves fileobj at 0 for the next reader.
+    if Image is None or not preprocess.is_image(filename):
+        return None
+    try:
+        image = Image.open(fileobj)
+        image.draft('L', (SIDE, SIDE))  # JPEGs decode straight at a fraction of their size
+        image = ImageOps.exif_transpose(image).convert('L')
+        image.thumbnail((SIDE, SIDE))
+        cells = receipt_area(image).resize((4, 16), Image.BOX).tobytes()
+    finally:
+        fileobj.seek(0)
+    mean = sum(cells) / len(cells)
+    phash = 0
+    for cell in cells:
+        phash = phash << 1 | (cell > mean)
+    if not MIN_BITS <= bin(phash).count('1') <= MAX_BITS:
+        return None
+    return phash
+
+
+def distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+# --- INDEX ---
+def total_key(total):
+    return str(Decimal(str(total)).quantize(Decimal('0.01')))
+
+
+def bands(phash):
+    # -> the BANDS 16-bit slices of a hash, first band = top bits
+    mask = (1 << BAND_BITS) - 1
+    return [phash >> (BAND_BITS * (BANDS - 1 - band)) & mask for band in range(BANDS)]
+
+
+def bucket_key(total, band, value):
+    return f"{PREFIX}{total_key(total)}#{band}:{value:04x}"
+
+
+def page_key(key, page):
+    return f"{key}~{page}" if page else key
+
+
+def probe_keys(phash, total):
+    # Every bucket within RADIUS bits of each band of the hash
+    keys = []
+    for band, value in enumerate(bands(phash)):
+        for radius in range(RADIUS + 1):
+            for bits in itertools.combinations(range(BAND_BITS), radius):
+                flipped = value
+                for bit in bits:
+                    flipped ^= 1 << bit
+                keys.append(bucket_key(total, band, flipped))
+    return keys
+
+
+def member(phash, receipt_id):
+    return f"{phash:016x}:{receipt_id}"
+
+
+def find(dynamodb, table, phash, total, exclude=None):
+    # -> (ReceiptID, distance) of the closest receipt already indexed with the
+    # same Total and a hash within DISTANCE bits, or None
+    keys = [{'ReceiptID': key} for key in probe_keys(phash, total)]
+    buckets = search_index.batch_get(dynamodb, table.name, keys, ('ReceiptID', 'Members', 'Pages'))
+    # Buckets that outgrew one item go on in further pages
+    more = [{'ReceiptID': page_key(bucket['ReceiptID'], page)}
+            for bucket in buckets for page in range(1, int(bucket.get('Pages', 1)))]
+    if more:
+        buckets += search_index.batch_get(dynamodb, table.name, more, ('Members',))
+    matches = []
+    for bucket in buckets:
+        for entry in bucket.get('Members', ()):
+            other, _, receipt_id = entry.partition(':')
+            bits = distance(phash, int(other, 16))
+            if bits <= DISTANCE and receipt_id != exclude:
+                matches.append((bits, receipt_id))
+    if not matches:
+        return None
+    bits, receipt_id = min(matches)
+    return receipt_id, bits
+
+
+def within_batch(items):
+    # Copies that arrive in the same batch are not in the index yet.
+    # -> [(item, ReceiptID of an earlier item in the batch, distance)]
+    found = []
+    for i, item in enumerate(items):
+        if item.get('PHash') is None or item.get('Total') is None or item.get('NearDuplicateOf'):
+            continue
+        phash = int(item['PHash'], 16)
+        for earlier in items[:i]:
+            if earlier.get('PHash') is None or earlier.get('Total') is None:
+                continue
+            bits = distance(phash, int(earlier['PHash'], 16))
+            if bits <= DISTANCE and total_key(earlier['Total']) == total_key(item['Total']):
+                found.append((item, earlier['ReceiptID'], bits))
+                break
+    return found
+
+
+def is_full(error):
+    # A page at PAGE_SIZE fails the Entries condition; one filled before pages
+    # existed fails on DynamoDB's item size limit
+    code = error.response['Error']['Code']
+    return code == 'ConditionalCheckFailedException' or (
+        code == 'ValidationException' and 'size' in error.response['Error'].get('Message', ''))
+
+
+def add_members(table, key, members):
+    # Into the first page of the bucket with room for them. Members are added
+    # with ADD, so concurrent processors never lose one.
+    page = 0
+    while True:
+        try:
+            table.update_item(
+                Key={'ReceiptID': page_key(key, page)},
+                UpdateExpression='ADD Members :m, Entries :n',
+                ConditionExpression=Attr('Entries').not_exists() | Attr('Entries').lte(PAGE_SIZE - len(members)),
+                ExpressionAttributeValues={':m': members, ':n': len(members)},
+            )
+            return
+        except ClientError as e:
+            if not is_full(e):
+                raise
+        if page == 0:
+            # Skip the pages other processors already filled
+            first = table.get_item(Key={'ReceiptID': key}, ConsistentRead=True,
+                                   ProjectionExpression='Pages').get('Item', {})
+            page = max(1, int(first.get('Pages', 1)) - 1)
+        else:
+            page += 1
+        # Lookups must know about a page before it holds anything
+        try:
+            table.update_item(
+                Key={'ReceiptID': key},
+                UpdateExpression='SET Pages = :p',
+                ConditionExpression=Attr('Pages').not_exists() | Attr('Pages').lt(page + 1),
+                ExpressionAttributeValues={':p': page + 1},
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+def record(table, items):
+    # Called by the processor right after a batch is written to the ledger.
+    # -> how many buckets could not be updated (each one is logged)
+    buckets = {}
+    for item in items:
+        if item.get('PHash') is None or item.get('Total') is None:
+            continue
+        phash = int(item['PHash'], 16)
+        for band, value in enumerate(bands(phash)):
+            buckets.setdefault(bucket_key(item['Total'], band, value), set()).add(member(phash, item['ReceiptID']))
+    if not buckets:
+        return 0
+
+    def add(key, members):
+        try:
+            add_members(table, key, members)
+            return True
+        except Exception as e:
+            print(f"Near-duplicate bucket {key} not updated, its receipts can't be matched: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=min(UPDATE_WORKERS, len(buckets))) as pool:
+        return sum(1 for ok in pool.map(add, buckets, buckets.values()) if not ok)
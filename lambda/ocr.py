@@ -0,0 +1,198 @@
+import json
+import mimetypes
+import os
+import re
+import uuid
+
+import urllib3
+
+import ocr_scheduler
+import pdf_pages
+
+# Tesseract runs in-process and needs the binary plus pytesseract (a layer/container image)
+try:
+    import pytesseract
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+CHUNK_SIZE = 1024 * 1024
+OCR_ENDPOINT = os.environ.get('OCR_ENDPOINT', "https://api.ocr.space/parse/image")
+
+# --- CONNECTION POOL ---
+# One keep-alive pool per container: after the first request, OCR calls reuse an
+# open TLS connection instead of paying a new handshake per receipt.
+# block=True makes extra threads wait for a free connection rather than open more.
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', '10'))
+OCR_CONNECT_TIMEOUT = float(os.environ.get('OCR_CONNECT_TIMEOUT', '5'))
+OCR_READ_TIMEOUT = float(os.environ.get('OCR_READ_TIMEOUT', '60'))
+HTTP = urllib3.PoolManager(
+    maxsize=OCR_POOL_SIZE,
+    block=True,
+    timeout=urllib3.Timeout(connect=OCR_CONNECT_TIMEOUT, read=OCR_READ_TIMEOUT),
+    retries=False,
+)
+# Token bucket, adaptive concurrency and backoff for every OCR.space call (ocr_scheduler.py)
+SCHEDULER = ocr_scheduler.Scheduler()
+
+
+class OcrError(Exception):
+    pass
+
+
+class OcrThrottled(ocr_scheduler.Throttled, OcrError):
+    # Rate limited, over quota or too busy: worth retrying later, unlike other OcrErrors
+    pass
+
+
+# OCR.space's own words when a key is over its limit or the engine is overloaded
+THROTTLE_MESSAGE = re.compile(r'maximum \d+ number of times|rate limit|too many requests|server busy|timed out',
+                              re.IGNORECASE)
+QUOTA_WINDOW = re.compile(r'within (\d+) seconds', re.IGNORECASE)  # the quota resets within this
+
+
+class OcrBackend:
+    """
+    Every OCR engine answers the same call:
+        parse(fileobj, size, filename) -> [text of page 1, text of page 2, ...]
+    An empty list means the engine found no text.
+    """
+    name = 'base'
+
+    def parse(self, fileobj, size, filename):
+        raise NotImplementedError
+
+
+# --- OCR.space (and anything that speaks its API, like the fake server) ---
+def multipart_body(fields, filename, fileobj, size):
+    # -> (chunk generator, Content-Length, Content-Type) for a multipart/form-data
+    # upload with the file in the 'file' field. Streams the file, never copies it.
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    head = ''.join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in fields.items()
+    )
+    head += (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+        f'filename="{os.path.basename(filename)}"\r\nContent-Type: {content_type}\r\n\r\n'
+    )
+    head = head.encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    def chunks():
+        yield head
+        for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+            yield chunk
+        yield tail
+
+    return chunks(), len(head) + size + len(tail), f'multipart/form-data; boundary={boundary}'
+
+
+def retry_after(response):
+    # Retry-After in seconds, or the quota window named in a 403 body, if any
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        window = QUOTA_WINDOW.search(response.data.decode('utf-8', 'replace'))
+        return float(window.group(1)) if window else None
+
+
+class OcrSpaceBackend(OcrBackend):
+    name = 'ocrspace'
+
+    def __init__(self, api_key, endpoint=None, http=None, scheduler=None, **options):
+        self.api_key = api_key
+        self.endpoint = endpoint or OCR_ENDPOINT
+        self.http = http or HTTP
+        self.scheduler = scheduler or SCHEDULER
+        # Engine 2 is what the processor has always used; callers can override any field
+        self.fields = {'language': 'eng', 'scale': 'true', 'OCREngine': '2'}
+        self.fields.update(options)
+
+    def parse(self, fileobj, size, filename):
+        start = fileobj.tell()
+
+        def call():
+            # Every attempt streams the file again from where it started
+            fileobj.seek(start)
+            return self.post(fileobj, size, filename)
+
+        return self.scheduler.run(call)
+
+    def post(self, fileobj, size, filename):
+        body, length, content_type = multipart_body(
+            dict(self.fields, apikey=self.api_key), filename, fileobj, size)
+        try:
+            response = self.http.urlopen('POST', self.endpoint, body=body, headers={
+                'Content-Type': content_type,
+                'Content-Length': str(length),
+            })
+        except urllib3.exceptions.TimeoutError as e:
+            raise OcrThrottled(f"OCR.space: {e}")
+        if response.status in (429, 503) or (response.status == 403 and THROTTLE_MESSAGE.search(
+                response.data.decode('utf-8', 'replace'))):
+            raise OcrThrottled(f"OCR.space: HTTP {response.status}", retry_after(response))
+        if response.status >= 400:
+            raise OcrError(f"OCR.space: HTTP {response.status}")
+        return self.pages(json.loads(response.data.decode('utf-8')))
+
+    @staticmethod
+    def pages(result):
+        if result.get('IsErroredOnProcessing'):
+            message = result.get('ErrorMessage') or 'unknown error'
+            if isinstance(message, list):
+                message = '; '.join(message)
+            if THROTTLE_MESSAGE.search(message):
+                window = QUOTA_WINDOW.search(message)
+                raise OcrThrottled(f"OCR.space: {message}", float(window.group(1)) if window else None)
+            raise OcrError(f"OCR.space: {message}")
+        return [page.get('ParsedText', '') for page in result.get('ParsedResults') or []]
+
+
+# --- Local Tesseract (no network) ---
+class TesseractBackend(OcrBackend):
+    name = 'tesseract'
+
+    def __init__(self, language='eng', config='', **ocrspace_fields):
+        # OCR.space-only fields (isTable, OCREngine, ...) don't apply here
+        if pytesseract is None:
+            raise OcrError("Tesseract backend needs pytesseract and Pillow installed")
+        self.language = language
+        self.config = config
+
+    def read_image(self, image):
+        return pytesseract.image_to_string(image, lang=self.language, config=self.config)
+
+    def parse(self, fileobj, size, filename):
+        # Tesseract can't open a PDF: pdf_pages reads its text layer or its images
+        if pdf_pages.is_pdf(fileobj, filename):
+            if pdf_pages.pypdf is None:
+                raise OcrError("Tesseract backend needs pypdf installed to read PDFs")
+            return pdf_pages.page_texts(fileobj, self.read_image)
+        image = Image.open(fileobj)
+        pages = []
+        # Multi-frame TIFFs come back one page per frame
+        for frame in range(getattr(image, 'n_frames', 1)):
+            image.seek(frame)
+            pages.append(self.read_image(image))
+        return pages
+
+
+BACKENDS = {
+    'ocrspace': OcrSpaceBackend,
+    'tesseract': TesseractBackend,
+}
+
+
+def get_backend(name=None, api_key=None, **options):
+    """
+    OCR_BACKEND picks the engine (default: ocrspace). Point OCR_ENDPOINT at
+    benchmarks/fake_ocr_server.py to run the OCR.space backend offline.
+    """
+    name = name or os.environ.get('OCR_BACKEND', 'ocrspace')
+    if name not in BACKENDS:
+        raise OcrError(f"Unknown OCR backend: {name}")
+    if name == 'ocrspace':
+        return OcrSpaceBackend(api_key or os.environ.get('OCR_API_KEY', ''), **options)
+    return BACKENDS[name](**options)
@@ -0,0 +1,207 @@
+import os
+import random
+import threading
+import time
+
+# --- OCR DISPATCH ---
+# OCR.space meters every API key: past the plan's rate it answers HTTP 429 (or
+# IsErroredOnProcessing with "maximum N number of times within S seconds"),
+# and a busy engine just gets slow. Every OCR call from a container goes
+# through one Scheduler, which
+#
+#   - spends a token per call from a bucket refilled at the plan's rate
+#     (OCR_RATE_PER_MINUTE, per container: divide the plan's limit by the
+#     event source mapping's maximum_concurrency), so we don't cause the 429s
+#   - caps the calls in flight with an AIMD limit: one more slot per window of
+#     fast answers, halved on a throttle, cut by 10% when answers get slower
+#     than OCR_TARGET_LATENCY
+#   - retries a throttled call after a jittered exponential backoff, and pauses
+#     the whole bucket meanwhile (the quota is shared, so are the 429s)
+#
+# A call that can't be made within OCR_MAX_WAIT seconds, or before the cutoff
+# the processor sets from the Lambda's remaining time, raises Throttled; the
+# processor then sends the receipt back to SQS with a delay (see defer_record).
+RATE_PER_MINUTE = float(os.environ.get('OCR_RATE_PER_MINUTE', '0'))  # 0 = unmetered
+BURST = int(os.environ.get('OCR_BURST', '5'))
+MAX_CONCURRENCY = int(os.environ.get('OCR_MAX_CONCURRENCY', '10'))
+TARGET_LATENCY = float(os.environ.get('OCR_TARGET_LATENCY', '8'))
+MAX_WAIT = float(os.environ.get('OCR_MAX_WAIT', '20'))
+RETRIES = int(os.environ.get('OCR_RETRIES', '3'))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 15.0
+
+
+class Throttled(Exception):
+    # The provider pushed back (rate limit, quota, busy). retry_after: its hint in seconds, if any
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff(attempt):
+    # Full jitter: retries of calls throttled together don't come back together
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiting = 0  # callers queued in acquire()
+        self.next_slot = 0.0  # handed out by reserve()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        start = max(self.updated, self.paused_until)
+        if now > start:
+            self.tokens = min(self.burst, self.tokens + (now - start) * self.rate)
+        self.updated = max(now, self.updated)
+
+    def wait_time(self):
+        # Seconds until the next token (or the end of a pause, when unmetered)
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            paused = max(0.0, self.paused_until - now)
+            if not self.rate or self.tokens >= 1:
+                return paused
+            return paused + (1 - self.tokens) / self.rate
+
+    def backlog_time(self):
+        # Seconds until a caller arriving now would get its token, behind everyone queued
+        wait = self.wait_time()
+        return wait + self.waiting / self.rate if self.rate else wait
+
+    def reserve(self):
+        # Seconds until a turn for a call that can't wait here (it goes back to SQS):
+        # each one gets its own later slot, so they don't all come back at once
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+        slot = max(slot, now + self.backlog_time())
+        with self.lock:
+            self.next_slot = slot + (1 / self.rate if self.rate else 0)
+        return slot - now
+
+    def acquire(self, deadline):
+        # -> True with a token, False as soon as it's clear none comes before `deadline` (time.monotonic())
+        if time.monotonic() + self.backlog_time() > deadline:
+            return False
+        with self.lock:
+            self.waiting += 1
+        try:
+            while True:
+                wait = self.wait_time()
+                if wait <= 0:
+                    if not self.rate:
+                        return True
+                    with self.lock:
+                        self._refill(time.monotonic())
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            return True
+                    continue  # another thread got it first
+                if time.monotonic() + wait > deadline:
+                    return False
+                time.sleep(wait)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+    def pause(self, seconds):
+        # Throttled anyway: spend nothing for `seconds`, then refill from empty
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0)
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveLimit:
+    def __init__(self, maximum, target_latency, minimum=1):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.target_latency = target_latency
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self.hold_until = 0.0
+        self.cond = threading.Condition()
+
+    def acquire(self, deadline):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self.cond.wait(left)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, throttled=False):
+        # latency=None: the call failed for some other reason, no signal either way
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled or (latency is not None and latency > self.target_latency):
+                # One decrease per round trip, not one per call that was in flight
+                if now >= self.hold_until:
+                    self.limit = max(self.minimum, self.limit * (0.5 if throttled else 0.9))
+                    self.hold_until = now + (latency or self.target_latency)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.cond.notify_all()
+
+
+class Scheduler:
+    def __init__(self, rate_per_minute=RATE_PER_MINUTE, burst=BURST, max_concurrency=MAX_CONCURRENCY,
+                 target_latency=TARGET_LATENCY, max_wait=MAX_WAIT, retries=RETRIES):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.limit = AdaptiveLimit(max_concurrency, target_latency)
+        self.max_wait = max_wait
+        self.cutoff = None  # time.monotonic() after which no call may start (set per invocation)
+        self.retries = retries
+        self.stats = {'calls': 0, 'throttled': 0, 'retries': 0, 'gave_up': 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def snapshot(self):
+        with self.stats_lock:
+            return dict(self.stats, limit=round(self.limit.limit, 1))
+
+    def give_up(self, message, retry_after):
+        self.count('gave_up')
+        raise Throttled(message, retry_after)
+
+    def run(self, call):
+        # -> call(), made when the bucket and the limit allow it, retried while throttled
+        deadline = time.monotonic() + self.max_wait
+        if self.cutoff is not None:
+            deadline = min(deadline, self.cutoff)
+        for attempt in range(self.retries + 1):
+            if not self.bucket.acquire(deadline):
+                self.give_up("OCR rate limit: no call left within the wait budget", self.bucket.reserve())
+            if not self.limit.acquire(deadline):
+                self.give_up("OCR concurrency limit: no free slot within the wait budget", None)
+            self.count('calls')
+            began = time.monotonic()
+            try:
+                result = call()
+            except Throttled as e:
+                self.limit.release(throttled=True)
+                self.count('throttled')
+                delay = max(e.retry_after or 0.0, backoff(attempt))
+                self.bucket.pause(delay)
+                if attempt == self.retries or time.monotonic() + delay > deadline:
+                    self.give_up(str(e), self.bucket.reserve())
+                self.count('retries')
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.limit.release()
+                raise
+            self.limit.release(time.monotonic() - began)
+            return result
@@ -0,0 +1,85 @@
+import io
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Splitting needs pypdf (a layer, like Pillow for preprocessing). Without it a
+# PDF goes to the OCR backend whole, which OCR.space reads page after page.
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+# --- MULTI-PAGE PDFs ---
+# A PDF is split into single-page PDFs that are OCR'd PAGE_WORKERS at a time
+# (every call still goes through the OCR scheduler), and the texts are put back
+# in page order. Pages are cut from the spooled upload one by one as workers
+# free up, so no more than 2 x PAGE_WORKERS page copies exist at once, however
+# long the document is.
+PAGE_WORKERS = int(os.environ.get('PDF_PAGE_WORKERS', '4'))
+
+
+def is_pdf(fileobj, filename):
+    start = fileobj.tell()
+    magic = fileobj.read(5)
+    fileobj.seek(start)
+    return magic == b'%PDF-' or filename.lower().endswith('.pdf')
+
+
+def page_pdf(page):
+    # One page as a PDF of its own
+    writer = pypdf.PdfWriter()
+    writer.add_page(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def page_texts(fileobj, read_image):
+    # -> [text per page] for engines that only read images (Tesseract). A page
+    # with a text layer gives that text; otherwise read_image(PIL image) is run
+    # on the pictures it carries, which is what a scanned or photographed
+    # receipt PDF is. Pages are never rendered, so vector-only pages stay empty.
+    texts = []
+    for page in pypdf.PdfReader(fileobj).pages:
+        text = page.extract_text() or ''
+        if not text.strip():
+            text = '\n'.join(read_image(picture.image) for picture in page.images)
+        texts.append(text)
+    return texts
+
+
+def parse(backend, fileobj, size, filename, workers=None):
+    # -> [text of page 1, text of page 2, ...] for any upload; only PDFs are split
+    if pypdf is None or not is_pdf(fileobj, filename):
+        return backend.parse(fileobj, size, filename)
+    start = fileobj.tell()
+    reader = pypdf.PdfReader(fileobj)
+    count = len(reader.pages)
+    if count <= 1:
+        fileobj.seek(start)
+        return backend.parse(fileobj, size, filename)
+
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    workers = workers or PAGE_WORKERS
+    texts = [None] * count
+
+    def ocr_page(number, data):
+        texts[number] = backend.parse(io.BytesIO(data), len(data), f"{stem}-page{number + 1:04d}.pdf")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = set()
+        try:
+            for number in range(count):
+                if len(running) >= 2 * workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()  # the first failed page fails the document
+                running.add(pool.submit(ocr_page, number, page_pdf(reader.pages[number])))
+            for future in running:
+                future.result()
+        except Exception:
+            # Don't spend OCR calls on a document that has already failed
+            for future in running:
+                future.cancel()
+            raise
+    return [text for page in texts for text in page]
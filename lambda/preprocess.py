@@ -0,0 +1,91 @@
+import io
+import os
+
+# Pillow isn't in the bare Lambda runtime; it comes from a layer.
+# Without it the stage quietly does nothing and the original image is sent.
+try:
+    from PIL import Image, ImageOps, ImageSequence
+except ImportError:
+    Image = None
+
+# --- SETTINGS ---
+ENABLED = os.environ.get('PREPROCESS_IMAGES', 'false').lower() == 'true'
+TARGET_DPI = int(os.environ.get('PREPROCESS_DPI', '200'))
+ASSUMED_DPI = 300        # Phone photos rarely carry a real DPI; treat them as 300
+MAX_EDGE = 3000          # Never send more than this many pixels on the long edge
+JPEG_QUALITY = int(os.environ.get('PREPROCESS_JPEG_QUALITY', '75'))
+INK_THRESHOLD = 200      # Gray level below which a pixel counts as content, not paper
+CROP_MARGIN = 20         # Pixels of paper kept around the content
+INK_LUT = [255 if level < INK_THRESHOLD else 0 for level in range(256)]
+
+IMAGE_TYPES = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def is_image(filename):
+    return os.path.splitext(filename.lower())[1] in IMAGE_TYPES
+
+
+def crop_to_content(gray):
+    # Bounding box of everything darker than the paper, plus a small margin
+    box = gray.point(INK_LUT).getbbox()
+    if not box:
+        return gray
+    left, top, right, bottom = box
+    return gray.crop((
+        max(0, left - CROP_MARGIN),
+        max(0, top - CROP_MARGIN),
+        min(gray.width, right + CROP_MARGIN),
+        min(gray.height, bottom + CROP_MARGIN),
+    ))
+
+
+def prepare_frame(image):
+    # 1. Work out the output size first, so nothing runs at full resolution:
+    # JPEGs are decoded already shrunk (and in grayscale) by draft()
+    source_dpi = (image.info.get('dpi') or (ASSUMED_DPI,))[0] or ASSUMED_DPI
+    scale = min(1.0, TARGET_DPI / float(source_dpi), MAX_EDGE / float(max(image.size)))
+    target = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    image.draft('L', target)
+    gray = image.convert('L')
+    if gray.size != target:
+        gray = gray.resize(target, Image.BILINEAR, reducing_gap=2.0)
+
+    # 2. Orientation and crop on the small image (convert/resize keep the EXIF)
+    return crop_to_content(ImageOps.exif_transpose(gray))
+
+
+def preprocess_image(fileobj, filename, size):
+    """
+    Downscale to TARGET_DPI, grayscale, auto-orient, crop to content and
+    recompress as JPEG. Returns (fileobj, size, filename, stats) for the OCR
+    upload, or None when the original should be sent as it is.
+
+    Every frame of a multi-frame TIFF is prepared the same way, and they go out
+    as one multi-page PDF of JPEG pages, which pdf_pages splits and OCRs page
+    by page like any other PDF.
+    """
+    if Image is None or not is_image(filename):
+        return None
+
+    image = Image.open(fileobj)
+    out = io.BytesIO()
+    if getattr(image, 'n_frames', 1) > 1:
+        pages = [prepare_frame(frame) for frame in ImageSequence.Iterator(image)]
+        pages[0].save(out, 'PDF', save_all=True, append_images=pages[1:], resolution=TARGET_DPI,
+                      quality=JPEG_QUALITY)
+        gray, extension = pages[0], '.pdf'
+    else:
+        pages = [prepare_frame(image)]
+        gray, extension = pages[0], '.jpg'
+        gray.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, dpi=(TARGET_DPI, TARGET_DPI))
+    new_size = out.tell()
+
+    # Already-small scans can come out bigger; then the original wins
+    fileobj.seek(0)
+    if new_size >= size:
+        return None
+
+    out.seek(0)
+    stats = {'bytes_in': size, 'bytes_out': new_size, 'bytes_saved': size - new_size,
+             'width': gray.width, 'height': gray.height, 'pages': len(pages)}
+    return out, new_size, os.path.splitext(filename)[0] + extension, stats
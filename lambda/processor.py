@@ -1,106 +1,576 @@
 import json
 import boto3
 import urllib.parse
-import urllib.request
 import os
-import base64
 import datetime
 import hashlib
+import random
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Attr
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import changes
+import extractor
+import metrics
+import near_dup
+import ocr
+import ocr_scheduler
+import pdf_pages
+import preprocess
+import read_cache
+import rollups
+import search_index
+from risk_engine import RiskEngine, load_rules
 
+# How many receipts from one SQS batch we work on at the same time.
+# Every stage is network I/O (S3, OCR, SNS, DynamoDB) so threads overlap nicely.
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '10'))
+
+# --- CLIENTS ---
+# Built once per container at import time and shared by every invocation and
+# worker thread, so warm invocations skip client setup and reuse open connections.
+AWS_CONFIG = Config(
+    max_pool_connections=max(10, MAX_WORKERS),
+    connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', '30')),
+)
+s3 = boto3.client('s3', config=AWS_CONFIG)
+dynamodb = boto3.resource('dynamodb', config=AWS_CONFIG)
+sns = boto3.client('sns', config=AWS_CONFIG)  # <---  Connect to SNS
+sqs = boto3.client('sqs', config=AWS_CONFIG)  # Throttled receipts go back on the ingest queue
+table = dynamodb.Table(os.environ['TABLE_NAME'])
+# Full OCR text + inverted index for GET /search; off without SEARCH_TABLE_NAME
+search_table = dynamodb.Table(search_index.TABLE_NAME) if search_index.TABLE_NAME else None
+ocr_backend = ocr.get_backend()  # Keeps its own keep-alive connection pool (ocr.HTTP)
+
+# Compiled once per container; RISK_RULES_FILE can point at a custom rule set
+RISK_ENGINE = RiskEngine(load_rules())
+
+# --- DEDUP CACHE ---
+# Receipt hashes we already audited. Lives at module scope so it stays warm
+# across invocations of the same Lambda container; DynamoDB is the source of truth.
+DEDUP_CACHE_SIZE = int(os.environ.get('DEDUP_CACHE_SIZE', '10000'))
+_seen_hashes = OrderedDict()
+_dedup_lock = threading.Lock()
+dedup_stats = {'cache_hits': 0, 'table_hits': 0, 'misses': 0}
+
+
+def remember_hash(file_hash):
+    with _dedup_lock:
+        _seen_hashes[file_hash] = True
+        _seen_hashes.move_to_end(file_hash)
+        while len(_seen_hashes) > DEDUP_CACHE_SIZE:
+            _seen_hashes.popitem(last=False)
+
+
+def dedup_check(file_hash, table):
+    # -> 'new', 'duplicate', or 'alert_pending': the receipt is in the ledger but
+    # the batch that wrote it stopped before its alert went out (ALERT_PENDING)
+    # 1. Warm in-process LRU
+    with _dedup_lock:
+        if file_hash in _seen_hashes:
+            _seen_hashes.move_to_end(file_hash)
+            dedup_stats['cache_hits'] += 1
+            return 'duplicate'
+
+    # 2. Ledger lookup (the hash is the ReceiptID)
+    response = table.get_item(Key={'ReceiptID': file_hash}, ProjectionExpression=f'ReceiptID, {ALERT_PENDING}')
+    if 'Item' in response:
+        with _dedup_lock:
+            dedup_stats['table_hits'] += 1
+        if response['Item'].get(ALERT_PENDING):
+            return 'alert_pending'
+        remember_hash(file_hash)
+        return 'duplicate'
+
+    with _dedup_lock:
+        dedup_stats['misses'] += 1
+    return 'new'
+
+
+# --- STREAMING I/O ---
+# Receipts are read and uploaded in chunks (see ocr.multipart_body), so a big PDF
+# never sits in memory as bytes + base64 + urlencoded copies at once.
+# Anything larger than SPOOL_LIMIT spills from memory to /tmp.
+CHUNK_SIZE = 1024 * 1024
+SPOOL_LIMIT = int(os.environ.get('SPOOL_LIMIT', str(8 * 1024 * 1024)))
+
+
+def download_receipt(s3, bucket_name, file_key):
+    # -> (spooled file positioned at 0, sha256 hex digest, size in bytes)
+    response = s3.get_object(Bucket=bucket_name, Key=file_key)
+    body = response['Body']
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT)
+    size = 0
+    for chunk in iter(lambda: body.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def process_record(record, s3, table, ocr_backend):
+    # One structured metrics line per receipt: stage timings, hash, size, engine, outcome
+    timer = metrics.Timer('receipt', dimensions=('Outcome', 'OcrEngine'),
+                          OcrEngine=ocr_backend.name, MessageId=record.get('messageId'))
+    # -> (ledger item, full OCR text, all line items), or None when there is nothing
+    # to write. The text is None for a receipt already in the ledger whose alert is still owed.
+    try:
+        result = analyze_record(record, s3, table, ocr_backend, timer)
+    except ocr_scheduler.Throttled as e:
+        timer.emit('throttled', Error=str(e))
+        raise
+    except Exception as e:
+        timer.emit('error', Error=str(e))
+        raise
+    timer.emit('analyzed' if result else 'duplicate')
+    return result
+
+
+def analyze_record(record, s3, table, ocr_backend, timer):
+    # 1. Parse Event
+    payload = json.loads(record['body'])
+    s3_event = payload['Records'][0]['s3']
+    bucket_name = s3_event['bucket']['name']
+    file_key = urllib.parse.unquote_plus(s3_event['object']['key'])
+    timer.set(FileKey=file_key)
+
+    print(f"Processing: {file_key}")
+
+    # 2. Stream the image from S3 (3. hashing it on the way)
+    with timer.stage('S3Get'):
+        spool, file_hash, size = download_receipt(s3, bucket_name, file_key)
+    timer.set(ReceiptHash=file_hash)
+    timer.add('Bytes', size, 'Bytes')
+
+    with spool:
+        # Same bytes were already audited (re-upload, versioning replay, SQS redelivery)
+        with timer.stage('Dedup'):
+            status = dedup_check(file_hash, table)
+        if status == 'duplicate':
+            print(f"Duplicate receipt {file_hash[:12]} for {file_key}. Skipping OCR.")
+            return None
+        if status == 'alert_pending':
+            # Written by a run that died before alerting: the stored row has all
+            # the alert needs, so it is sent again without another OCR call
+            print(f"Receipt {file_hash[:12]} is in the ledger but its alert was never sent. Sending it now.")
+            return table.get_item(Key={'ReceiptID': file_hash}, ConsistentRead=True)['Item'], None, None
+
+        # Perceptual hash of the picture, looked up once OCR has read the Total (near_dup.py)
+        phash = None
+        if near_dup.ENABLED:
+            try:
+                with timer.stage('PHash'):
+                    phash = near_dup.image_hash(spool, file_key)
+            except Exception as e:
+                print(f"Perceptual hash failed: {e}")
+
+        # 4. Optional clean-up before OCR (PREPROCESS_IMAGES=true): smaller uploads
+        upload, upload_size, upload_name = spool, size, file_key
+        if preprocess.ENABLED:
+            try:
+                with timer.stage('Preprocess'):
+                    prepared = preprocess.preprocess_image(spool, file_key, size)
+            except Exception as e:
+                print(f"Preprocess failed, sending original: {e}")
+                spool.seek(0)
+                prepared = None
+            if prepared:
+                upload, upload_size, upload_name, stats = prepared
+                print(f"Preprocess: {size} -> {upload_size} bytes (saved {stats['bytes_saved']})")
+        timer.add('OcrBytes', upload_size, 'Bytes')
+
+        # Call OCR (OCR.space Engine 2 unless OCR_BACKEND says otherwise).
+        # PDFs are OCR'd page by page, several pages at a time (pdf_pages.py)
+        with timer.stage('Ocr'):
+            pages = pdf_pages.parse(ocr_backend, upload, upload_size, upload_name)
+    timer.add('Pages', len(pages))
+
+    # 5. Extract Text & Analyze Risk
+    extracted_text = "No text found"
+    fields = {}
+    near = None
+    risk_score = 0
+    risk_flags = []
+
+    if any(page.strip() for page in pages):
+        # The whole document, every page in order, is extracted and scored
+        extracted_text = "\n\n".join(pages)
+
+        # Merchant, Date, Total, Tax, Currency, LineItems in one pass
+        with timer.stage('Extract'):
+            fields = extractor.extract(extracted_text)
+
+        # A re-photographed or re-cropped copy of a receipt already in the ledger
+        if phash is not None and fields.get('Total') is not None:
+            try:
+                with timer.stage('NearDup'):
+                    near = near_dup.find(dynamodb, table, phash, fields['Total'], exclude=file_hash)
+            except Exception as e:
+                print(f"Near-duplicate lookup failed: {e}")
+        if near:
+            print(f"Near duplicate of {near[0][:12]} ({near[1]} bits apart): {file_key}")
+
+        # --- RISK ENGINE ---
+        with timer.stage('Risk'):
+            risk_score, risk_flags = RISK_ENGINE.assess(extracted_text, fields.get('Total'), fields.get('Date'),
+                                                        near is not None)
+    timer.add('RiskScore', risk_score)
+
+    if risk_score > 0:
+        print(f" HIGH RISK DETECTED: {risk_score} in {file_key}")
+
+    # 6./7. Alerting and saving happen once per batch, see lambda_handler
+    item = {
+        'ReceiptID': file_hash,
+        'RecordType': 'RECEIPT',  # Partition key of the UploadDate index the reader queries
+        'Filename': file_key,
+        'UploadDate': datetime.datetime.now().isoformat(),
+        'Status': 'Analyzed',
+        'ExtractedText': extracted_text[:100] + "...",
+        'RiskScore': risk_score,
+        'RiskFlags': risk_flags
+    }
+    # Typed attributes: Total/Tax (and item amounts) are DynamoDB numbers, Date is YYYY-MM-DD.
+    # Fields the extractor couldn't find are left off the item.
+    line_items = fields.pop('LineItems', None) or []
+    item.update((name, value) for name, value in fields.items() if value is not None)
+    if line_items:
+        item['LineItems'], dropped = ledger_line_items(line_items)
+        if dropped:
+            item['LineItemsTruncated'] = dropped
+    if phash is not None:
+        item['PHash'] = f"{phash:016x}"
+    if near:
+        item['NearDuplicateOf'], item['NearDuplicateDistance'] = near
+    # The ledger keeps a snippet; the whole text and every line item go to the search index
+    return item, "\n\n".join(pages), line_items
+
+
+# The ledger row keeps the first line items, up to this many bytes of JSON, and
+# LineItemsTruncated (how many were left off). A 120-page invoice reads as
+# thousands of items: over DynamoDB's 400 KB item limit, and a 1000-row
+# /expenses page of them would pass Lambda's 6 MB response limit. The full
+# list goes to the search index's #DOC item (search_index.MAX_LINE_ITEMS).
+MAX_LINE_ITEMS_BYTES = int(os.environ.get('MAX_LINE_ITEMS_BYTES', '4096'))
+
+
+def ledger_line_items(line_items):
+    # -> (the items that fit on the ledger row, how many were left off)
+    size = 0
+    for count, line in enumerate(line_items):
+        size += len(json.dumps(line, default=str))
+        if size > MAX_LINE_ITEMS_BYTES:
+            return line_items[:count], len(line_items) - count
+    return line_items, 0
+
+
+# --- BATCHED OUTPUT ---
+# A burst of flagged receipts becomes a handful of digest emails instead of one
+# SNS publish per receipt, and its ledger rows are written in parallel.
+ALERTS_PER_MESSAGE = 25  # keeps every digest far below SNS's 256 KB message limit
+WRITE_WORKERS = int(os.environ.get('WRITE_WORKERS', '10'))
+WRITE_RETRIES = int(os.environ.get('WRITE_RETRIES', '5'))
+NEW_RECEIPT = Attr('ReceiptID').not_exists()
+# Throttling and DynamoDB-side faults clear up on their own; anything else
+# (ValidationException, AccessDeniedException, ...) fails the same way every time
+RETRYABLE_WRITE_ERRORS = {'ProvisionedThroughputExceededException', 'ThrottlingException',
+                          'RequestLimitExceeded', 'InternalServerError'}
+# Set on a flagged receipt's row when it is written and removed once its alert
+# is out. A redelivered message whose row still has it sends the alert again.
+ALERT_PENDING = 'AlertPending'
+
+
+def publish_alerts(sns, sns_topic_arn, items):
+    # 6. --- THE SNITCH PROTOCOL  ---
+    # One digest per batch, with every receipt's details kept.
+    # -> ReceiptIDs whose alert could not be sent
+    unsent = []
+    for start in range(0, len(items), ALERTS_PER_MESSAGE):
+        chunk = items[start:start + ALERTS_PER_MESSAGE]
+        message = f"ALERT: {len(chunk)} High Risk Receipt(s) Detected!\n"
+        for item in chunk:
+            message += (
+                f"\nFile: {item['Filename']}\n"
+                f"Risk Score: {item['RiskScore']}\n"
+                f"Flags: {item['RiskFlags']}\n"
+                f"Text Snippet: {item['ExtractedText']}\n"
+            )
+            if item.get('NearDuplicateOf'):
+                message += f"Near Duplicate Of: {item['NearDuplicateOf']}\n"
+        top_score = max(item['RiskScore'] for item in chunk)
+        try:
+            sns.publish(
+                TopicArn=sns_topic_arn,
+                Message=message,
+                Subject=f"BILL-E ALERT: {len(chunk)} receipt(s), top Risk Score {top_score}"
+            )
+            print(f"Alert Email Sent for {len(chunk)} receipt(s)!")
+        except Exception as e:
+            print(f"Failed to send email: {e}")
+            unsent.extend(item['ReceiptID'] for item in chunk)
+    return unsent
+
+
+def insert_receipt(table, item):
+    # -> 'inserted', 'duplicate' (the ReceiptID is already in the ledger) or
+    # 'unwritten'. Throttled writes and DynamoDB 5xx errors are retried with jittered
+    # exponential backoff; any other error gives up at once.
+    for attempt in range(WRITE_RETRIES + 1):
+        if attempt:
+            time.sleep(random.uniform(0, min(2.0, 0.05 * 2 ** attempt)))
+        try:
+            table.put_item(Item=item, ConditionExpression=NEW_RECEIPT)
+            return 'inserted'
+        except ClientError as e:
+            code = e.response['Error']['Code']
+            if code == 'ConditionalCheckFailedException':
+                return 'duplicate'
+            print(f"Ledger write failed for {item['ReceiptID'][:12]} (attempt {attempt + 1}): {e}")
+            if code not in RETRYABLE_WRITE_ERRORS:
+                return 'unwritten'
+    return 'unwritten'
+
+
+def write_ledger(table, items):
+    # 7. Save to DynamoDB: one conditional PutItem per receipt, WRITE_WORKERS at
+    # a time. The condition keeps the insert idempotent: a copy that got past
+    # the dedup check (the same bytes in two batches at once) finds the first
+    # copy's row and comes back as a duplicate instead of overwriting it.
+    # -> {ReceiptID: 'inserted' | 'duplicate' | 'unwritten'}
+    if not items:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(WRITE_WORKERS, len(items))) as pool:
+        outcomes = list(pool.map(lambda item: insert_receipt(table, item), items))
+    return {item['ReceiptID']: outcome for item, outcome in zip(items, outcomes)}
+
+
+def mark_alerted(table, items):
+    # Clears ALERT_PENDING once the digest is out. A row left marked (this
+    # failing) only costs a repeat alert if the same bytes come in again.
+    for item in items:
+        try:
+            table.update_item(Key={'ReceiptID': item['ReceiptID']}, UpdateExpression=f'REMOVE {ALERT_PENDING}',
+                              ConditionExpression=Attr('ReceiptID').exists())
+        except ClientError as e:
+            print(f"Could not clear {ALERT_PENDING} on {item['ReceiptID'][:12]}: {e}")
+
+
+def take_back(table, items):
+    # Deletes rows this batch inserted whose alert could not be sent, so their
+    # messages come back from SQS and the alert is retried, never lost. The
+    # condition on our UpdatedAt stamp makes sure only our own row goes.
+    # -> ReceiptIDs whose row is still there
+    kept = []
+    for item in items:
+        try:
+            table.delete_item(Key={'ReceiptID': item['ReceiptID']},
+                              ConditionExpression=Attr('UpdatedAt').eq(item['UpdatedAt']))
+        except ClientError as e:
+            print(f"Could not take back {item['ReceiptID'][:12]} after its alert failed: {e}")
+            kept.append(item['ReceiptID'])
+    return kept
+
+
+# --- THROTTLED OCR ---
+# A receipt the OCR scheduler couldn't get through (rate limit, quota, busy
+# engine) is sent back to the ingest queue with a delay and its original
+# message counts as done. Failing it instead would make SQS redeliver it blindly
+# and burn one of its 3 receives toward the DLQ every time.
+INGEST_QUEUE_URL = os.environ.get('INGEST_QUEUE_URL')
+DEFER_SECONDS = float(os.environ.get('OCR_DEFER_SECONDS', '30'))
+MAX_DEFERRALS = int(os.environ.get('OCR_MAX_DEFERRALS', '8'))
+
+
+def defer_record(sqs, record, error):
+    # -> True if the receipt is queued again; False leaves it to the normal retry
+    if not INGEST_QUEUE_URL:
+        return False
+    deferrals = int(record.get('messageAttributes', {}).get('OcrDeferrals', {}).get('stringValue', '0')) + 1
+    if deferrals > MAX_DEFERRALS:
+        print(f"Giving up deferring message {record.get('messageId')} after {MAX_DEFERRALS} tries")
+        return False
+    # Jittered exponential delay (SQS allows up to 15 minutes), never sooner than OCR.space asked
+    delay = min(900, max(error.retry_after or 0, DEFER_SECONDS * 2 ** (deferrals - 1) * random.uniform(0.5, 1.5)))
+    try:
+        sqs.send_message(
+            QueueUrl=INGEST_QUEUE_URL,
+            MessageBody=record['body'],
+            DelaySeconds=int(delay),
+            MessageAttributes={'OcrDeferrals': {'DataType': 'Number', 'StringValue': str(deferrals)}},
+        )
+    except Exception as e:
+        print(f"Could not defer message {record.get('messageId')}: {e}")
+        return False
+    print(f"OCR throttled, message {record.get('messageId')} back in the queue in {int(delay)}s ({deferrals})")
+    return True
+
+
+# --- TIME BUDGET ---
+# An OCR call may only start while it can still finish (connect + read timeout)
+# with FINISH_SECONDS left for the ledger, alert and index writes before the
+# function times out. Receipts that would start later are deferred like
+# throttled ones, instead of the whole batch being killed mid-write.
+FINISH_SECONDS = float(os.environ.get('FINISH_SECONDS', '10'))
+
+
+def ocr_cutoff(context):
+    # -> time.monotonic() by which the last OCR call must have started, or None outside Lambda
+    if context is None:
+        return None
+    left = context.get_remaining_time_in_millis() / 1000.0
+    budget = left - ocr.OCR_CONNECT_TIMEOUT - ocr.OCR_READ_TIMEOUT - FINISH_SECONDS
+    if budget <= 0:
+        print(f"Only {left:.0f}s left: the function timeout must exceed OCR_CONNECT_TIMEOUT + "
+              f"OCR_READ_TIMEOUT + FINISH_SECONDS, or every receipt is deferred")
+    return time.monotonic() + budget
+
+
+@metrics.profile_if_slow('processor')
 def lambda_handler(event, context):
-    s3 = boto3.client('s3')
-    dynamodb = boto3.resource('dynamodb')
-    sns = boto3.client('sns')  # <---  Connect to SNS
-    
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
-    ocr_api_key = os.environ['OCR_API_KEY']
     sns_topic_arn = os.environ['SNS_TOPIC_ARN'] # <---  Get the Topic Address
+    ocr.SCHEDULER.cutoff = ocr_cutoff(context)
 
-    for record in event['Records']:
-        try:
-            # 1. Parse Event
-            payload = json.loads(record['body'])
-            s3_event = payload['Records'][0]['s3']
-            bucket_name = s3_event['bucket']['name']
-            file_key = urllib.parse.unquote_plus(s3_event['object']['key'])
-            
-            print(f"Processing: {file_key}")
-
-            # 2. Get Image from S3
-            response = s3.get_object(Bucket=bucket_name, Key=file_key)
-            image_bytes = response['Body'].read()
-            
-            # 3. Create Hash
-            file_hash = hashlib.sha256(image_bytes).hexdigest()
-
-            # 4. Call OCR API (Engine 2)
-            b64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            data = urllib.parse.urlencode({
-                'apikey': ocr_api_key,
-                'base64Image': f"data:image/png;base64,{b64_image}",
-                'language': 'eng',
-                'scale': 'true',
-                'OCREngine': '2',
-            }).encode('ascii')
-
-            req = urllib.request.Request("https://api.ocr.space/parse/image", data=data)
-            
-            with urllib.request.urlopen(req) as f:
-                ocr_result = json.loads(f.read().decode('utf-8'))
-
-            # 5. Extract Text & Analyze Risk
-            extracted_text = "No text found"
-            risk_score = 0
-            risk_flags = []
-
-            if ocr_result.get('ParsedResults'):
-                extracted_text = ocr_result['ParsedResults'][0].get('ParsedText', '')
-                
-                # --- RISK ENGINE ---
-                lower_text = extracted_text.lower()
-                
-                suspicious_keywords = ['casino', 'alcohol', 'bar', 'beer', 'wine', 'vodka']
-                for word in suspicious_keywords:
-                    if word in lower_text:
-                        risk_score += 50
-                        risk_flags.append(f"Suspicious Item: {word}")
-
-            # 6. --- THE SNITCH PROTOCOL  --- 
-            if risk_score > 0:
-                print(f" HIGH RISK DETECTED: {risk_score}")
-                message = (
-                    f"ALERT: High Risk Receipt Detected!\n\n"
-                    f"File: {file_key}\n"
-                    f"Risk Score: {risk_score}\n"
-                    f"Flags: {risk_flags}\n"
-                    f"Text Snippet: {extracted_text[:100]}...\n"
-                )
+    records = event['Records']
+    failures = []
+    results = []
+    deferred = 0
+    timer = metrics.Timer('batch')
+
+    # Fan the batch out so the S3/OCR/DynamoDB waits of different receipts overlap.
+    # Each failed message is reported back to SQS on its own (ReportBatchItemFailures),
+    # so one bad receipt doesn't make the whole batch get redelivered.
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_WORKERS, len(records)))) as pool:
+        futures = [
+            (record, pool.submit(process_record, record, s3, table, ocr_backend))
+            for record in records
+        ]
+        for record, future in futures:
+            try:
+                result = future.result()
+            except ocr_scheduler.Throttled as e:
+                if defer_record(sqs, record, e):
+                    deferred += 1
+                else:
+                    failures.append({'itemIdentifier': record['messageId']})
+                continue
+            except Exception as e:
+                print(f"Error: {str(e)} (message {record.get('messageId')})")
+                failures.append({'itemIdentifier': record['messageId']})
+                continue
+            if result:
+                results.append((record['messageId'],) + result)
+
+    # The same bytes twice in one batch: keep the first. Both copies share one
+    # ReceiptID, so their conditional PutItems would race in write_ledger and
+    # report a single outcome for two messages.
+    # Receipts already in the ledger that still owe their alert are only alerted.
+    items = {}
+    texts = {}
+    line_items = {}
+    owed = {}
+    for message_id, item, text, lines in results:
+        if text is None:
+            owed[item['ReceiptID']] = (message_id, item)
+        elif item['ReceiptID'] in items:
+            print(f"Duplicate receipt {item['ReceiptID'][:12]} in the same batch. Keeping the first copy.")
+        else:
+            items[item['ReceiptID']] = (message_id, item)
+            texts[item['ReceiptID']] = text
+            line_items[item['ReceiptID']] = lines
+
+    # Two copies of one receipt in the same batch: neither is indexed yet, so the
+    # later one is flagged here. Copies racing in different batches can both miss.
+    for item, original, bits in near_dup.within_batch([item for _, item in items.values()]):
+        print(f"Near duplicate of {original[:12]} in the same batch ({bits} bits apart): {item['Filename']}")
+        item['NearDuplicateOf'], item['NearDuplicateDistance'] = original, bits
+        item['RiskScore'], item['RiskFlags'] = RISK_ENGINE.assess(
+            texts[item['ReceiptID']], item.get('Total'), item.get('Date'), True)
+
+    # UpdatedAt is stamped right before the write, not when the receipt was analyzed:
+    # change feeds (GET /expenses/changes, ?since=) resume from the newest one they saw
+    now = datetime.datetime.now().isoformat()
+    for _, item in items.values():
+        item['UpdatedAt'] = now
+        if item['RiskScore'] > 0:
+            item[ALERT_PENDING] = True
+    with timer.stage('LedgerWrite'):
+        outcomes = write_ledger(table, [item for _, item in items.values()])
+    duplicates = {receipt_id for receipt_id, outcome in outcomes.items() if outcome == 'duplicate'}
+    unwritten = {receipt_id for receipt_id, outcome in outcomes.items() if outcome == 'unwritten'}
+    inserted = [item for receipt_id, (_, item) in items.items() if outcomes.get(receipt_id) == 'inserted']
+
+    # Only receipts that are really new alert. A receipt whose alert failed is
+    # taken back out of the ledger, so its message comes back from SQS and the
+    # alert is retried, never lost. If this run dies before that, the row keeps
+    # ALERT_PENDING and the redelivered message sends the alert.
+    flagged = [item for item in inserted if item['RiskScore'] > 0] + [item for _, item in owed.values()]
+    with timer.stage('Alert'):
+        unsent = set(publish_alerts(sns, sns_topic_arn, flagged))
+        mark_alerted(table, [item for item in flagged if item['ReceiptID'] not in unsent])
+    kept = set(take_back(table, [item for item in inserted if item['ReceiptID'] in unsent])) if unsent else set()
+
+    # Everything downstream counts each receipt once: only rows this batch added
+    written = [item for item in inserted if item['ReceiptID'] not in unsent or item['ReceiptID'] in kept]
+    if written:
+        # KPI rollups for GET /stats; if this fails the ledger is still right
+        # and tools/reconcile_rollups.py rebuilds them
+        with timer.stage('Rollup'):
+            try:
+                rollups.record(table, written)
+            except Exception as e:
+                print(f"Rollup update failed: {e}")
+        # Indexed before the version bump, so no cached search outlives it.
+        # Like the rollups, a failure here never fails the written receipts.
+        if search_table is not None:
+            with timer.stage('SearchIndex'):
                 try:
-                    sns.publish(
-                        TopicArn=sns_topic_arn,
-                        Message=message,
-                        Subject=f"BILL-E ALERT: Risk Score {risk_score}"
-                    )
-                    print("Alert Email Sent!")
+                    search_index.index(search_table, [(item['ReceiptID'], texts[item['ReceiptID']]) for item in written],
+                                       {item['ReceiptID']: line_items[item['ReceiptID']] for item in written})
                 except Exception as e:
-                    print(f"Failed to send email: {e}")
-
-            # 7. Save to DynamoDB
-            item = {
-                'ReceiptID': file_hash,
-                'Filename': file_key,
-                'UploadDate': datetime.datetime.now().isoformat(),
-                'Status': 'Analyzed',
-                'ExtractedText': extracted_text[:100] + "...",
-                'RiskScore': risk_score,
-                'RiskFlags': risk_flags
-            }
-            
-            table.put_item(Item=item)
-            print(f"Analysis Complete for {file_key}. Risk Score: {risk_score}")
+                    print(f"Search index update failed: {e}")
+        # Perceptual hashes of the new receipts, for the next near-duplicate lookups.
+        # Buckets that couldn't be updated are counted in NearDupIndexFailures.
+        with timer.stage('NearDupIndex'):
+            try:
+                timer.add('NearDupIndexFailures', near_dup.record(table, written))
+            except Exception as e:
+                print(f"Near-duplicate index update failed: {e}")
+                timer.add('NearDupIndexFailures', 1)
+    if inserted:
+        # New rows (or rows just taken back): readers must stop serving their
+        # cached pages, and live dashboards waiting on GET /expenses/changes wake up
+        version = read_cache.bump_version(table)
+        if written:
+            changes.publish(sns, written, version)
 
-        except Exception as e:
-            print(f"Error: {str(e)}")
+    for receipt_id, (message_id, item) in owed.items():
+        if receipt_id in unsent:
+            failures.append({'itemIdentifier': message_id})
+        else:
+            remember_hash(receipt_id)
+            print(f"Owed alert sent for {item['Filename']}. Risk Score: {item['RiskScore']}")
+    for receipt_id, (message_id, item) in items.items():
+        if receipt_id in unsent or receipt_id in unwritten:
+            failures.append({'itemIdentifier': message_id})
+        elif receipt_id in duplicates:
+            remember_hash(receipt_id)
+            print(f"Duplicate receipt {receipt_id[:12]} was saved concurrently. Keeping the first copy.")
+        else:
+            remember_hash(receipt_id)
+            print(f"Analysis Complete for {item['Filename']}. Risk Score: {item['RiskScore']}")
 
-    return {'statusCode': 200}
+    print(f"Batch done: {len(records) - len(failures) - deferred} ok, {deferred} deferred, {len(failures)} failed")
+    timer.add('Records', len(records))
+    timer.add('Written', len(written))
+    timer.add('Duplicates', len(duplicates))
+    timer.add('Deferred', deferred)
+    timer.add('Failures', len(failures))
+    timer.emit('partial' if failures else 'ok', DedupStats=dict(dedup_stats), OcrScheduler=ocr.SCHEDULER.snapshot())
+    return {'batchItemFailures': failures}
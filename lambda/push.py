@@ -0,0 +1,90 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# --- WEBSOCKET PUSH ---
+# Live dashboards hold a WebSocket to API Gateway instead of a request open on
+# the reader. This function is behind both ends of it:
+#
+#   - $connect / $disconnect: the connection ID is kept in CONNECTIONS_TABLE_NAME
+#     (with an ExpiresAt TTL, since API Gateway drops a socket after 2 hours)
+#   - the ledger changes topic (changes.publish): each event is posted to every
+#     open connection; ones API Gateway no longer knows (410) are deleted
+#
+# An idle dashboard costs no Lambda time and no DynamoDB reads, only API
+# Gateway connection minutes. A notified client reads its rows with one
+# GET /expenses/changes.
+CONNECTION_TTL = 2 * 60 * 60
+POST_WORKERS = int(os.environ.get('PUSH_POST_WORKERS', '16'))
+
+# Built once per container and reused by warm invocations
+dynamodb = boto3.resource('dynamodb')
+connections = dynamodb.Table(os.environ.get('CONNECTIONS_TABLE_NAME', 'BillE_Connections'))
+# https://{api-id}.execute-api.{region}.amazonaws.com/{stage}
+CALLBACK_URL = os.environ.get('WEBSOCKET_CALLBACK_URL')
+api = boto3.client('apigatewaymanagementapi', endpoint_url=CALLBACK_URL) if CALLBACK_URL else None
+
+
+def open_connections(table):
+    # -> every stored connection ID (the table only holds open sockets, so a Scan is small)
+    ids = []
+    request = {'ProjectionExpression': 'ConnectionId'}
+    while True:
+        response = table.scan(**request)
+        ids.extend(item['ConnectionId'] for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return ids
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def post(api, table, connection_id, data):
+    # -> True if the message reached the connection
+    try:
+        api.post_to_connection(ConnectionId=connection_id, Data=data)
+        return True
+    except api.exceptions.GoneException:
+        # A failed cleanup must not abort the broadcast; the TTL removes the row later
+        try:
+            table.delete_item(Key={'ConnectionId': connection_id})
+        except Exception as e:
+            print(f"Could not remove closed connection {connection_id}: {e}")
+    except Exception as e:
+        print(f"Push to {connection_id} failed: {e}")
+    return False
+
+
+def broadcast(api, table, message):
+    # -> connections the message reached
+    ids = open_connections(table)
+    if not ids:
+        return 0
+    data = message.encode('utf-8')
+    with ThreadPoolExecutor(max_workers=min(POST_WORKERS, len(ids))) as pool:
+        return sum(pool.map(lambda connection_id: post(api, table, connection_id, data), ids))
+
+
+def lambda_handler(event, context):
+    # 1. API Gateway WebSocket routes
+    route = event.get('requestContext', {}).get('routeKey')
+    if route == '$connect':
+        connections.put_item(Item={'ConnectionId': event['requestContext']['connectionId'],
+                                   'ExpiresAt': int(time.time()) + CONNECTION_TTL})
+        return {'statusCode': 200}
+    if route == '$disconnect':
+        connections.delete_item(Key={'ConnectionId': event['requestContext']['connectionId']})
+        return {'statusCode': 200}
+    if route:
+        # Clients only listen; anything they send is ignored
+        return {'statusCode': 200}
+
+    # 2. Change events from SNS, passed on as they are
+    if api is None:
+        # Without the callback URL there is nowhere to post; dropping the event
+        # is safe because dashboards catch up through GET /expenses/changes
+        print("WEBSOCKET_CALLBACK_URL is not set; change events are not pushed")
+        return
+    for record in event.get('Records', []):
+        reached = broadcast(api, connections, record['Sns']['Message'])
+        print(f"Change event pushed to {reached} dashboard(s)")
@@ -0,0 +1,167 @@
+import base64
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Brotli isn't in the bare Lambda runtime; without it clients get gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- READ CACHE ---
+# Cache-aside snapshots of reader responses. Every viewer of the dashboard asks
+# for the same few pages (the delta since the newest UpdatedAt, the first page),
+# so one Query can answer all of them until the ledger changes.
+#
+# Invalidation: writers bump a version counter kept in the ledger itself
+# (bump_version). The reader checks it at most every VERSION_TTL seconds and a
+# snapshot taken under an older version is never served. TTL bounds staleness
+# for changes made behind our back (the console, a restore, ...).
+TTL = float(os.environ.get('READ_CACHE_TTL', '60'))
+VERSION_TTL = float(os.environ.get('READ_CACHE_VERSION_TTL', '2'))
+MAX_ENTRIES = int(os.environ.get('READ_CACHE_ENTRIES', '256'))
+ENABLED = os.environ.get('READ_CACHE', 'true').lower() != 'false'
+BROTLI_QUALITY = int(os.environ.get('READ_CACHE_BROTLI_QUALITY', '4'))  # as fast as gzip -6, and smaller
+
+# No RecordType, so none of the reader's (sparse) indexes ever return it
+VERSION_KEY = {'ReceiptID': 'META#LEDGER_VERSION'}
+
+
+def bump_version(table):
+    # Called after every write to the ledger; a failed bump only delays
+    # invalidation until the TTL runs out, so it never fails the write.
+    # -> the new version, or None if the bump failed
+    try:
+        response = table.update_item(Key=VERSION_KEY, UpdateExpression='ADD Version :one',
+                                     ExpressionAttributeValues={':one': 1}, ReturnValues='UPDATED_NEW')
+        return int(response['Attributes']['Version'])
+    except Exception as e:
+        print(f"Cache version bump failed: {e}")
+        return None
+
+
+class Snapshot:
+    # One serialized response: gzip body plus the ETag of the uncompressed body.
+    # JSON bodies are str, Arrow ones (columnar.py) bytes. The brotli copy is
+    # made the first time a client asks for it.
+    def __init__(self, version, body, content_type='application/json'):
+        self.binary = isinstance(body, bytes)
+        raw = body if self.binary else body.encode('utf-8')
+        self.version = version
+        self.content_type = content_type
+        self.created = time.monotonic()
+        self.etag = '"' + hashlib.sha256(raw).hexdigest()[:32] + '"'
+        self.gzipped = gzip.compress(raw, compresslevel=6)
+        self.brotli = None
+        self.size = len(raw)
+
+    def body(self):
+        raw = gzip.decompress(self.gzipped)
+        return raw if self.binary else raw.decode('utf-8')
+
+    def encoded(self, coding):
+        if coding == 'br':
+            if self.brotli is None:
+                self.brotli = brotli.compress(gzip.decompress(self.gzipped), quality=BROTLI_QUALITY)
+            return self.brotli
+        return self.gzipped
+
+
+class ReadCache:
+    def __init__(self, ttl=TTL, version_ttl=VERSION_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.version = None
+        self.version_checked = float('-inf')
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key(route, params):
+        return (route,) + tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+
+    def ledger_version(self, table):
+        # Cached for version_ttl, so a burst of requests costs one GetItem
+        now = time.monotonic()
+        if now - self.version_checked >= self.version_ttl:
+            response = table.get_item(Key=VERSION_KEY, ProjectionExpression='Version')
+            self.version = int(response.get('Item', {}).get('Version', 0))
+            self.version_checked = now
+        return self.version
+
+    def get(self, route, params, version):
+        key = self.key(route, params)
+        with self.lock:
+            snapshot = self.entries.get(key)
+            if snapshot and snapshot.version == version and time.monotonic() - snapshot.created < self.ttl:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return snapshot
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, route, params, version, body, content_type='application/json'):
+        key = self.key(route, params)
+        snapshot = Snapshot(version, body, content_type)
+        with self.lock:
+            self.entries[key] = snapshot
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return snapshot
+
+
+def negotiate(accept_encoding):
+    # -> 'br', 'gzip' or None for an Accept-Encoding header: the coding with the
+    # highest q the client accepts (q=0 refuses it), brotli on a tie
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        coding, _, params = part.partition(';')
+        q = 1.0
+        name, _, value = params.strip().partition('=')
+        if name == 'q':
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    best, best_q = None, 0.0
+    for coding in ('br', 'gzip') if brotli is not None else ('gzip',):
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def respond(snapshot, request_headers, cache_status):
+    # -> API Gateway (HTTP API) response for a snapshot: 304 when the client
+    # already holds this ETag, brotli or gzip when it accepts them
+    headers = {
+        'Content-Type': snapshot.content_type,
+        'Access-Control-Allow-Origin': '*',  # CORS: Allow any website to call this
+        'Cache-Control': 'no-cache',  # always revalidate with If-None-Match
+        'ETag': snapshot.etag,
+        'Vary': 'Accept-Encoding',
+        'X-Cache': cache_status,
+    }
+    if snapshot.etag in (request_headers.get('if-none-match') or '').split(', '):
+        return {'statusCode': 304, 'headers': headers, 'body': ''}
+    coding = negotiate(request_headers.get('accept-encoding'))
+    if coding:
+        headers['Content-Encoding'] = coding
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'isBase64Encoded': True,
+            'body': base64.b64encode(snapshot.encoded(coding)).decode('ascii'),
+        }
+    if snapshot.binary:
+        return {'statusCode': 200, 'headers': headers, 'isBase64Encoded': True,
+                'body': base64.b64encode(snapshot.body()).decode('ascii')}
+    return {'statusCode': 200, 'headers': headers, 'body': snapshot.body()}
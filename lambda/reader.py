@@ -1,6 +1,27 @@
+import datetime
 import json
+import os
+import base64
+import binascii
 import boto3
-from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.conditions import Key, Attr
+import changes
+import columnar
+import read_cache
+import rollups
+import search_index
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# DynamoDB applies Limit before a FilterExpression, so a filtered page is read
+# on until it holds `limit` matches; at most this many Query calls per request
+MAX_PAGE_READS = int(os.environ.get('MAX_PAGE_READS', '25'))
+
+# Built once per container and reused by warm invocations
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('TABLE_NAME', 'BillE_Expenses'))
+search_table = dynamodb.Table(search_index.TABLE_NAME) if search_index.TABLE_NAME else None
+cache = read_cache.ReadCache()
 
 # Helper to handle DynamoDB weird number formats
 def decimal_encoder(obj):
@@ -8,29 +29,242 @@ def decimal_encoder(obj):
         return str(obj)
     return str(obj)
 
+# --- CURSORS ---
+# LastEvaluatedKey goes back to the client as an opaque url-safe token.
+# Key attributes are strings, except RiskScore (RiskScoreIndex), which has to
+# come back as a number.
+def cursor_number(obj):
+    return int(obj) if obj == obj.to_integral_value() else str(obj)
+
+def encode_cursor(last_key):
+    if not last_key:
+        return None
+    raw = json.dumps(last_key, default=cursor_number, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+def date_range(params):
+    # ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) -> UploadDate bounds, or None
+    date_from, date_to = params.get('from'), params.get('to')
+    if not date_from and not date_to:
+        return None
+    try:
+        low = datetime.date.fromisoformat(date_from).isoformat() if date_from else '0000-00-00'
+        high = datetime.date.fromisoformat(date_to).isoformat() + 'T99' if date_to else '9999-99-99'
+    except ValueError:
+        raise ValueError("from and to must be YYYY-MM-DD dates")
+    return low, high
+
+def build_query(params):
+    """
+    Turns the query string into DynamoDB Query arguments.
+    ?limit=&cursor=&status=&min_risk=&max_risk=&order=asc|desc&sort=date|risk&from=&to=&since=
+    """
+    limit = int(params.get('limit') or DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    order = params.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be 'asc' or 'desc'")
+
+    sort = params.get('sort', 'date')
+    if sort not in ('date', 'risk'):
+        raise ValueError("sort must be 'date' or 'risk'")
+
+    min_risk = params.get('min_risk')
+    max_risk = params.get('max_risk')
+    min_risk = int(min_risk) if min_risk is not None else None
+    max_risk = int(max_risk) if max_risk is not None else None
+    dates = date_range(params)
+
+    filters = []
+    risk_in_key = dates_in_key = False
+    if params.get('since'):
+        # Delta sync: everything added or changed after `since`, oldest change first
+        query = {
+            'IndexName': 'UpdatedAtIndex',
+            'KeyConditionExpression': Key('RecordType').eq('RECEIPT') & Key('UpdatedAt').gt(params['since']),
+            'ScanIndexForward': True,
+        }
+        if params.get('status'):
+            filters.append(Attr('Status').eq(params['status']))
+    elif sort == 'risk':
+        # Highest (or lowest) risk first; the risk range narrows the key itself
+        condition = Key('RecordType').eq('RECEIPT')
+        if min_risk is not None and max_risk is not None:
+            condition = condition & Key('RiskScore').between(min_risk, max_risk)
+        elif min_risk is not None:
+            condition = condition & Key('RiskScore').gte(min_risk)
+        elif max_risk is not None:
+            condition = condition & Key('RiskScore').lte(max_risk)
+        query = {
+            'IndexName': 'RiskScoreIndex',
+            'KeyConditionExpression': condition,
+            'ScanIndexForward': order == 'asc',
+        }
+        risk_in_key = True
+        if params.get('status'):
+            filters.append(Attr('Status').eq(params['status']))
+    else:
+        # Both of these indexes are sorted by UploadDate, so a date range is a key condition
+        if params.get('status'):
+            index, condition = 'StatusIndex', Key('Status').eq(params['status'])
+        else:
+            index, condition = 'UploadDateIndex', Key('RecordType').eq('RECEIPT')
+        if dates:
+            condition = condition & Key('UploadDate').between(*dates)
+            dates_in_key = True
+        query = {
+            'IndexName': index,
+            'KeyConditionExpression': condition,
+            'ScanIndexForward': order == 'asc',
+        }
+    query['Limit'] = limit
+    query['ReturnConsumedCapacity'] = 'TOTAL'
+
+    # Whatever is not part of the index key is a filter on the page
+    if dates and not dates_in_key:
+        filters.append(Attr('UploadDate').between(*dates))
+    if not risk_in_key:
+        if min_risk is not None and max_risk is not None:
+            filters.append(Attr('RiskScore').between(min_risk, max_risk))
+        elif min_risk is not None:
+            filters.append(Attr('RiskScore').gte(min_risk))
+        elif max_risk is not None:
+            filters.append(Attr('RiskScore').lte(max_risk))
+    if filters:
+        condition = filters[0]
+        for extra in filters[1:]:
+            condition = condition & extra
+        query['FilterExpression'] = condition
+
+    if params.get('cursor'):
+        query['ExclusiveStartKey'] = decode_cursor(params['cursor'])
+
+    return query
+
+def query_page(table, request):
+    # -> (items, LastEvaluatedKey or None, RCU). Unfiltered queries are one call.
+    # Filtered ones continue from LastEvaluatedKey until `limit` items matched;
+    # the extra matches of the last call are dropped and the cursor is rebuilt
+    # from the last item kept, so the next page starts right after it.
+    limit = request['Limit']
+    request = dict(request)
+    items, units, key_names = [], 0, None
+    for _ in range(MAX_PAGE_READS):
+        response = table.query(**request)
+        items.extend(response.get('Items', []))
+        units += response.get('ConsumedCapacity', {}).get('CapacityUnits') or 0
+        last = response.get('LastEvaluatedKey')
+        if last:
+            key_names = list(last)
+        if len(items) > limit:
+            items = items[:limit]
+            last = {name: items[-1][name] for name in key_names}
+        if not last or len(items) == limit or 'FilterExpression' not in request:
+            break
+        request['ExclusiveStartKey'] = last
+    return items, last, units
+
+def route_of(event):
+    path = event.get('rawPath') or ''
+    if path.endswith('/stats'):
+        return 'stats'
+    if path.endswith('/changes'):
+        return 'changes'
+    if path.endswith('/search'):
+        return 'search'
+    return 'expenses'
+
 def lambda_handler(event, context):
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('BillE_Expenses')
-    
+    # GET /expenses (ledger pages), GET /expenses/changes (long-poll),
+    # GET /stats (rollups) and GET /search (full text) share this function
+    route = route_of(event)
+    params = event.get('queryStringParameters') or {}
+    if route == 'search' and search_table is None:
+        return {
+            'statusCode': 404,
+            'body': json.dumps("Search is not enabled (SEARCH_TABLE_NAME)")
+        }
     try:
-        # 1. Scan the table (Get all items)
-        # In a huge production app, we would Query, not Scan. 
-        # But for < 1000 items, Scan is perfectly fine
-        response = table.scan()
-        items = response.get('Items', [])
-        
-        # 2. Return the data as JSON
+        if route == 'stats':
+            request = rollups.parse_stats_params(params)
+        elif route == 'changes':
+            request = changes.parse_changes_params(params)
+        elif route == 'search':
+            request = search_index.parse_search_params(params)
+            if params.get('cursor'):
+                request['after'] = decode_cursor(params['cursor'])
+                if not isinstance(request['after'], dict) or not {'score', 'doc'} <= set(request['after']):
+                    raise ValueError("Invalid cursor")
+        else:
+            request = build_query(params)
+            fmt = columnar.parse_format(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps(f"Bad request: {str(e)}")
+        }
+    if route == 'changes':
+        # Held open until something changes; never cached
+        try:
+            body = changes.wait_for_changes(table, **request)
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'body': json.dumps(f"Error reading DB: {str(e)}")
+            }
         return {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*' # CORS: Allow any website to call this
+                'Access-Control-Allow-Origin': '*',
+                'Cache-Control': 'no-store',
             },
-            'body': json.dumps(items, default=decimal_encoder)
+            'body': json.dumps(body, default=decimal_encoder),
         }
-        
+    # API Gateway (HTTP API) already lower-cases header names
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+
+    try:
+        # 1. Serve the snapshot of this exact request if the ledger hasn't changed since
+        version = cache.ledger_version(table) if read_cache.ENABLED else None
+        snapshot = cache.get(route, params, version) if read_cache.ENABLED else None
+        if snapshot:
+            return read_cache.respond(snapshot, headers, 'HIT')
+
+        content_type = 'application/json'
+        if route == 'stats':
+            # 2. KPIs from the rollup items, not from the ledger itself
+            body = json.dumps(rollups.read_stats(dynamodb, table, **request), default=decimal_encoder)
+        elif route == 'search':
+            # 2. Ranked hits from the inverted index, one page of them
+            result = search_index.search(dynamodb, search_table, table, **request)
+            body = json.dumps({
+                'query': result['query'],
+                'total': result['total'],
+                'items': result['hits'],
+                'next_cursor': encode_cursor(result['next']),
+            }, default=decimal_encoder)
+        else:
+            # 2. Query one page of the ledger through one of the indexes
+            items, last_key, units = query_page(table, request)
+            print(f"Read {len(items)} items, consumed {units} RCU")
+
+            # 3. Return the page and the cursor for the next one, in the format asked for
+            body, content_type = columnar.encode_page(items, encode_cursor(last_key), fmt, default=decimal_encoder)
+        if not read_cache.ENABLED:
+            return read_cache.respond(read_cache.Snapshot(version, body, content_type), headers, 'BYPASS')
+        return read_cache.respond(cache.put(route, params, version, body, content_type), headers, 'MISS')
+
     except Exception as e:
         return {
             'statusCode': 500,
             'body': json.dumps(f"Error reading DB: {str(e)}")
-        }
\ No newline at end of file
+        }
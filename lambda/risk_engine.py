@@ -0,0 +1,214 @@
+import json
+import os
+import re
+from datetime import date, datetime
+
+# --- RULE SETS ---
+# A rule set is a plain dict so it can live in JSON (see RISK_RULES_FILE).
+# Every key is optional; missing ones fall back to these defaults.
+DEFAULT_RULES = {
+    # Keyword -> weight. Case-insensitive, whole words only ("bar" won't fire on "barcode")
+    'keywords': {'casino': 50, 'alcohol': 50, 'bar': 50, 'beer': 50, 'wine': 50, 'vodka': 50},
+    'keyword_flag': "Suspicious Item: {word}",
+    # Name -> {'pattern': regex, 'weight': n}, case-insensitive. Use (?:...) groups inside the pattern.
+    'patterns': {},
+    'pattern_flag': "Pattern: {name}",
+    # Amounts above this are flagged
+    'amount_threshold': None,
+    'amount_weight': 0,
+    'amount_flag': "HIGH_VALUE",
+    # Weekday numbers to flag (5=Saturday, 6=Sunday)
+    'weekdays': [],
+    'weekday_weight': 0,
+    'weekday_flag': "WEEKEND_EXPENSE",
+    # Another copy of the same receipt (re-photographed, re-cropped) is already in the ledger
+    'near_duplicate_weight': 50,
+    'near_duplicate_flag': "NEAR_DUPLICATE",
+}
+
+
+# Words are runs of letters/digits; keywords and receipt text are split the same way
+WORD = re.compile(r"\w+")
+
+# Keyword-only rule sets up to this size are matched one keyword at a time: a
+# substring test, then a whole-word check only for the keywords that are in the
+# text. Above it the combined matcher is faster; bench_risk_engine.py puts the
+# crossover at ~60 keywords.
+FAST_KEYWORD_LIMIT = 60
+
+
+def phrase_regex(phrase):
+    # "red wine" -> the words in order with any run of non-word characters between
+    # them ("Red\nWine"), not inside longer words ("bar" doesn't fire on "barcode").
+    # It starts with the literal word so re can jump between its occurrences. A
+    # single word checks the character after it first: that is what rules out
+    # most occurrences ("barcode"), and is cheaper than the lookbehind.
+    first, *rest = map(re.escape, phrase.split(' '))
+    if not rest:
+        return first + rf"(?!\w)(?<!\w{first})"
+    return first + rf"(?<!\w{first})" + ''.join(rf"\W+{word}" for word in rest) + r"(?!\w)"
+
+
+def trie_regex(phrases):
+    # Keyword phrase -> group name, compiled as one regex whose alternatives share
+    # their prefixes ("bar|beer" is "b(?:ar|eer)"), so a word start is compared with
+    # each distinct first letter once, not with every keyword. The empty group after a
+    # keyword tells which one matched; at one position the longest wins.
+    trie = {}
+    for phrase, name in phrases.items():
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[None] = name
+
+    def body(node):
+        parts = [(r"\W+" if char == ' ' else re.escape(char)) + body(child)
+                 for char, child in node.items() if char is not None]
+        if None in node:
+            parts.append(rf"(?!\w)(?P<{node[None]}>)")
+        return parts[0] if len(parts) == 1 else '(?:' + '|'.join(parts) + ')'
+
+    # \b, not (?<!\w): every keyword starts with a word character, and re factors
+    # a \b that starts every alternative (as regex rules often do) out of them all
+    return r"\b" + body(trie) if trie else None
+
+
+def lowercase_pattern(pattern):
+    # Regex rules match the lowercased text. One without capital letters (outside
+    # escapes like \W) finds the same there as with IGNORECASE, which is slower.
+    if any(char.isupper() for char in re.sub(r"\\.", "", pattern)):
+        return f"(?i:{pattern})"
+    return f"(?:{pattern})"
+
+
+class RiskEngine:
+    """
+    Compiles a rule set once. Keywords and regex rules are alternatives of one
+    regex, scanned once per receipt; each rule's empty named group tells which
+    one fired. A match hides the rules that would have matched inside it ("gift
+    card" hides "card"), so every position it covered is probed for all of them.
+    A few keywords and no regex rules are cheaper looked for one by one.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = dict(DEFAULT_RULES)
+        self.rules.update(rules or {})
+
+        # Rules are numbered in the order assess() lists flags: keywords by their
+        # place in the rule set, then the regex rules (as in tools/rescore.py).
+        # Each has its weight, its flag, and whether an equal flag folds into it.
+        self.rule_flags = {}
+
+        # 1. Keywords, normalized to their words ("Red  Wine" -> "red wine")
+        self.keywords = {}
+        for position, (word, weight) in enumerate(self.rules['keywords'].items()):
+            phrase = ' '.join(WORD.findall(word.lower()))
+            if phrase:
+                self.keywords[phrase] = (position, weight)
+        self.single_words = {phrase for phrase in self.keywords if ' ' not in phrase}
+        for phrase, (position, weight) in self.keywords.items():
+            self.rule_flags[position] = (weight, self.rules['keyword_flag'].format(word=phrase), True)
+        # A keyword also matches every keyword made of its first words ("red
+        # wine" -> "red"), which the trie's longest match hides
+        self.implied = {}
+        for phrase, (position, _) in self.keywords.items():
+            words = phrase.split(' ')
+            prefixes = (' '.join(words[:n]) for n in range(1, len(words) + 1))
+            self.implied[f"r{position}"] = [self.keywords[prefix][0] for prefix in prefixes if prefix in self.keywords]
+
+        # 2. Regex rules
+        patterns = {}
+        for i, (name, rule) in enumerate(self.rules['patterns'].items()):
+            number = len(self.rules['keywords']) + i
+            self.rule_flags[number] = (rule.get('weight', 0), self.rules['pattern_flag'].format(name=name), False)
+            patterns[f"r{number}"] = lowercase_pattern(rule['pattern'])
+
+        # 3. The matcher, and the probes for what a match hid: the keyword trie
+        # alone, and every regex rule as an optional lookahead at one position
+        trie = trie_regex({phrase: f"r{position}" for phrase, (position, _) in self.keywords.items()})
+        alternatives = ([trie] if trie else []) + [f"{pattern}(?P<{name}>)" for name, pattern in patterns.items()]
+        self.matcher = re.compile('|'.join(alternatives)) if alternatives else None
+        self.keyword_probe = re.compile(trie) if trie else None
+        self.pattern_probe = None
+        if patterns:
+            self.pattern_probe = re.compile(''.join(f"(?:(?={pattern}(?P<{name}>))|)" for name, pattern in patterns.items()))
+
+        # 4. Few keywords and no regex rules (DEFAULT_RULES among them):
+        # (number, first word, whole-phrase search)
+        self.keyword_scans = None
+        if not patterns and len(self.keywords) <= FAST_KEYWORD_LIMIT:
+            self.keyword_scans = [(position, phrase.split(' ')[0], re.compile(phrase_regex(phrase)).search)
+                                  for phrase, (position, _) in sorted(self.keywords.items(), key=lambda entry: entry[1][0])]
+
+    def probe(self, text, position, found):
+        # Adds every rule that matches starting at this position
+        if self.keyword_probe is not None:
+            match = self.keyword_probe.match(text, position)
+            if match:
+                found.update(self.implied[match.lastgroup])
+        if self.pattern_probe is not None:
+            match = self.pattern_probe.match(text, position)
+            found.update(int(name[1:]) for name, value in match.groupdict().items() if value is not None)
+
+    def match_rules(self, text):
+        # -> numbers of the keyword and regex rules found in the text, in order
+        lower = text.lower()
+        if self.keyword_scans is not None:
+            return [position for position, word, search in self.keyword_scans if word in lower and search(lower)]
+        found = set()
+        if self.matcher is not None:
+            for match in self.matcher.finditer(lower):
+                start, end = match.span()
+                for position in range(start, max(end, start + 1)):
+                    self.probe(lower, position, found)
+        return sorted(found)
+
+    def match_text(self, text):
+        # -> (score, flags) from the keyword and pattern rules.
+        # Each rule counts once per receipt, however often it appears.
+        score = 0
+        flags = []
+        if not text:
+            return score, flags
+
+        for number in self.match_rules(text):
+            weight, flag, shared = self.rule_flags[number]
+            score += weight
+            if not shared or flag not in flags:
+                flags.append(flag)
+        return score, flags
+
+    def assess(self, text, amount=None, date_str=None, near_duplicate=False):
+        score, flags = self.match_text(text)
+
+        # Amount rule
+        threshold = self.rules['amount_threshold']
+        if threshold is not None and amount is not None and amount > threshold:
+            score += self.rules['amount_weight']
+            flags.append(self.rules['amount_flag'])
+
+        # Weekday rule (dates are normalized to YYYY-MM-DD upstream)
+        if self.rules['weekdays'] and date_str:
+            try:
+                day = date_str if isinstance(date_str, date) else datetime.strptime(date_str, "%Y-%m-%d")
+                if day.weekday() in self.rules['weekdays']:
+                    score += self.rules['weekday_weight']
+                    flags.append(self.rules['weekday_flag'])
+            except Exception as e:
+                print(f"Risk Engine Date Error: {e}")
+
+        # Near-duplicate rule (the processor's perceptual-hash lookup, near_dup.py)
+        if near_duplicate:
+            score += self.rules['near_duplicate_weight']
+            flags.append(self.rules['near_duplicate_flag'])
+
+        return score, flags
+
+
+def load_rules(path=None):
+    # Rule set from a JSON file (RISK_RULES_FILE), or the built-in defaults
+    path = path or os.environ.get('RISK_RULES_FILE')
+    if not path:
+        return dict(DEFAULT_RULES)
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,253 @@
+import datetime
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+# --- ROLLUPS ---
+# Dashboard KPIs kept up to date as receipts are written, so GET /stats reads a
+# handful of items instead of the whole ledger. They live in the ledger table
+# under STATS# keys, without RecordType, so the reader's indexes never see them:
+#
+#   STATS#ALL                  counts, spend, risk histogram, top receipts/merchants
+#   STATS#DAY#2025-01-15       counts and spend for one day (receipt Date, else upload day)
+#   STATS#MERCHANT#CITY MART   counts and spend for one merchant
+#
+# Counters are updated with ADD, so concurrent processors never lose an
+# increment. The top-N lists are merged read-modify-write, guarded by TopVersion.
+# Only receipts new to the ledger are counted (the processor's conditional put,
+# bulk_ingest seed); tools/rescore.py moves a re-scored receipt between risk
+# buckets with rescored(). A crash between the ledger write and the rollup
+# update leaves them short; tools/reconcile_rollups.py rebuilds everything
+# from the ledger.
+STATS_PREFIX = 'STATS#'
+SUMMARY_KEY = 'STATS#ALL'
+DAY_PREFIX = 'STATS#DAY#'
+MERCHANT_PREFIX = 'STATS#MERCHANT#'
+TOP_N = int(os.environ.get('ROLLUP_TOP_N', '10'))
+MERGE_RETRIES = 10
+UPDATE_WORKERS = 8
+MAX_DAYS = 90  # days + the merchant fit in one BatchGetItem (100 keys)
+
+# (lowest score, counter on STATS#ALL, label in /stats)
+RISK_BUCKETS = (
+    (100, 'Risk_100_plus', '100+'),
+    (75, 'Risk_75_99', '75-99'),
+    (50, 'Risk_50_74', '50-74'),
+    (25, 'Risk_25_49', '25-49'),
+    (1, 'Risk_1_24', '1-24'),
+    (0, 'Risk_0', '0'),
+)
+
+
+def day_of(item):
+    return item.get('Date') or item['UploadDate'][:10]
+
+
+def merchant_of(item):
+    # OCR'd names vary in case and spacing: "City  Mart" and "CITY MART" are one merchant
+    merchant = ' '.join((item.get('Merchant') or '').split()).upper()
+    return merchant[:64] or None
+
+
+def risk_bucket(score):
+    for lowest, counter, _ in RISK_BUCKETS:
+        if score >= lowest:
+            return counter
+    return 'Risk_0'
+
+
+def contributions(item):
+    # -> {rollup key: {counter: delta}} that one receipt adds
+    score = int(item.get('RiskScore', 0))
+    flagged = 1 if score > 0 else 0
+    spend = Decimal(item.get('Total') or 0)
+    summary = {
+        'Receipts': 1,
+        'Analyzed': 1 if item.get('Status') == 'Analyzed' else 0,
+        'Flagged': flagged,
+        'Spend': spend,
+        'WithTotal': 1 if 'Total' in item else 0,
+        'RiskSum': score,
+        risk_bucket(score): 1,
+    }
+    out = {
+        SUMMARY_KEY: summary,
+        DAY_PREFIX + day_of(item): {'Receipts': 1, 'Flagged': flagged, 'Spend': spend},
+    }
+    merchant = merchant_of(item)
+    if merchant:
+        out[MERCHANT_PREFIX + merchant] = {'Receipts': 1, 'Flagged': flagged, 'Spend': spend}
+    return out
+
+
+def accumulate(items, totals=None):
+    # Sums the contributions of many receipts: one update per rollup item per batch
+    totals = {} if totals is None else totals
+    for item in items:
+        for key, counters in contributions(item).items():
+            bucket = totals.setdefault(key, {})
+            for name, value in counters.items():
+                bucket[name] = bucket.get(name, 0) + value
+    return totals
+
+
+def top_entry(item):
+    return {
+        'ReceiptID': item['ReceiptID'],
+        'Merchant': item.get('Merchant', ''),
+        'Total': item['Total'],
+        'Date': day_of(item),
+        'RiskScore': int(item.get('RiskScore', 0)),
+    }
+
+
+def merchant_entry(key, counters):
+    return {'Merchant': key[len(MERCHANT_PREFIX):], 'Spend': counters['Spend'], 'Receipts': counters['Receipts']}
+
+
+def merge_top(current, new, key, value):
+    # Keep the TOP_N largest. Merchant totals only grow, so when two writers race
+    # the entry with the bigger (value, Receipts) is the newer one.
+    merged = {entry[key]: entry for entry in current}
+    for entry in new:
+        old = merged.get(entry[key])
+        if old is None or (entry[value], entry.get('Receipts', 0)) >= (old[value], old.get('Receipts', 0)):
+            merged[entry[key]] = entry
+    return sorted(merged.values(), key=lambda entry: (-entry[value], entry[key]))[:TOP_N]
+
+
+def add_counters(table, key, counters, return_values='NONE'):
+    names = sorted(counters)
+    response = table.update_item(
+        Key={'ReceiptID': key},
+        UpdateExpression='ADD ' + ', '.join(f"#c{i} :c{i}" for i in range(len(names))),
+        ExpressionAttributeNames={f"#c{i}": name for i, name in enumerate(names)},
+        ExpressionAttributeValues={f":c{i}": counters[name] for i, name in enumerate(names)},
+        ReturnValues=return_values,
+    )
+    return response.get('Attributes', {})
+
+
+def update_top(table, receipts, merchants):
+    # Optimistic concurrency: re-read and retry when another writer got in first,
+    # after a jittered backoff so a crowd of writers doesn't collide again
+    for attempt in range(MERGE_RETRIES):
+        if attempt:
+            time.sleep(random.uniform(0, min(0.5, 0.01 * 2 ** attempt)))
+        current = table.get_item(Key={'ReceiptID': SUMMARY_KEY}, ConsistentRead=True,
+                                 ProjectionExpression='TopReceipts, TopMerchants, TopVersion').get('Item', {})
+        top_receipts = merge_top(current.get('TopReceipts', []), receipts, 'ReceiptID', 'Total')
+        top_merchants = merge_top(current.get('TopMerchants', []), merchants, 'Merchant', 'Spend')
+        if top_receipts == current.get('TopReceipts', []) and top_merchants == current.get('TopMerchants', []):
+            return
+        version = current.get('TopVersion')
+        try:
+            table.update_item(
+                Key={'ReceiptID': SUMMARY_KEY},
+                UpdateExpression='SET TopReceipts = :r, TopMerchants = :m, TopVersion = :v',
+                ConditionExpression=Attr('TopVersion').eq(version) if version else Attr('TopVersion').not_exists(),
+                ExpressionAttributeValues={':r': top_receipts, ':m': top_merchants, ':v': (version or 0) + 1},
+            )
+            return
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    print(f"Top lists still contended after {MERGE_RETRIES} tries; reconcile_rollups.py will catch up")
+
+
+def record(table, items):
+    # Called by the processor right after a batch of new receipts is written to the ledger
+    if not items:
+        return
+    apply(table, accumulate(items), [top_entry(item) for item in items if 'Total' in item])
+
+
+def apply(table, totals, top_receipts):
+    # Adds accumulated counters to their rollup items, then merges the top lists
+    def add(key, counters):
+        # UPDATED_NEW hands back a merchant's running totals for the top list
+        if key.startswith(MERCHANT_PREFIX) and 'Spend' in counters:
+            return merchant_entry(key, add_counters(table, key, counters, 'UPDATED_NEW'))
+        add_counters(table, key, counters)
+
+    # Every rollup item of the batch is updated at the same time
+    merchants = []
+    if totals:
+        with ThreadPoolExecutor(max_workers=min(UPDATE_WORKERS, len(totals))) as pool:
+            merchants = [entry for entry in pool.map(add, totals, totals.values()) if entry]
+    update_top(table, top_receipts, merchants)
+
+
+def rescored(table, changes):
+    # changes: [(ledger item before, its new RiskScore)] for receipts re-scored
+    # in place. Moves each from its old Flagged/risk bucket counts to the new ones.
+    totals = {}
+    for item, score in changes:
+        before = contributions(item)
+        for key, counters in contributions(dict(item, RiskScore=score)).items():
+            for name in set(counters) | set(before[key]):
+                if name == 'Spend':
+                    continue
+                delta = counters.get(name, 0) - before[key].get(name, 0)
+                if delta:
+                    bucket = totals.setdefault(key, {})
+                    bucket[name] = bucket.get(name, 0) + delta
+    totals = {key: {name: value for name, value in counters.items() if value}
+              for key, counters in totals.items() if any(counters.values())}
+    # Top receipts carry their RiskScore; merging refreshes the ones on the list
+    apply(table, totals, [top_entry(dict(item, RiskScore=score)) for item, score in changes if 'Total' in item])
+
+
+# --- READING ---
+def parse_stats_params(params):
+    # ?days=30&merchant=
+    days = int(params.get('days') or 30)
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+    merchant = merchant_of({'Merchant': params.get('merchant')})
+    return {'days': days, 'merchant': merchant}
+
+
+def read_stats(dynamodb, table, days=30, merchant=None, today=None):
+    # A GetItem and one BatchGetItem, however big the ledger is
+    summary = table.get_item(Key={'ReceiptID': SUMMARY_KEY}).get('Item', {})
+
+    today = today or datetime.date.today()
+    day_keys = [DAY_PREFIX + (today - datetime.timedelta(days=n)).isoformat() for n in range(days)]
+    keys = [{'ReceiptID': key} for key in day_keys]
+    if merchant:
+        merchant_key = MERCHANT_PREFIX + merchant
+        keys.append({'ReceiptID': merchant_key})
+    found = {}
+    request = {table.name: {'Keys': keys}}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        found.update((item['ReceiptID'], item) for item in response['Responses'].get(table.name, []))
+        request = response.get('UnprocessedKeys')
+
+    with_total = summary.get('WithTotal', 0)
+    stats = {
+        'Receipts': summary.get('Receipts', 0),
+        'Analyzed': summary.get('Analyzed', 0),
+        'Flagged': summary.get('Flagged', 0),
+        'Spend': summary.get('Spend', 0),
+        'AverageTicket': (summary['Spend'] / with_total).quantize(Decimal('0.01')) if with_total else None,
+        'RiskHistogram': {label: summary.get(counter, 0) for _, counter, label in reversed(RISK_BUCKETS)},
+        'TopReceipts': summary.get('TopReceipts', []),
+        'TopMerchants': summary.get('TopMerchants', []),
+        'Days': [
+            {'Day': key[len(DAY_PREFIX):], 'Receipts': found[key]['Receipts'],
+             'Flagged': found[key]['Flagged'], 'Spend': found[key]['Spend']}
+            for key in reversed(day_keys) if key in found
+        ],
+    }
+    if merchant:
+        bucket = found.get(merchant_key, {})
+        stats['Merchant'] = {'Merchant': merchant_key[len(MERCHANT_PREFIX):], 'Receipts': bucket.get('Receipts', 0),
+                             'Flagged': bucket.get('Flagged', 0), 'Spend': bucket.get('Spend', 0)}
+    return stats
@@ -0,0 +1,264 @@
+import heapq
+import json
+import math
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+# --- SEARCH INDEX ---
+# Full-text search over the OCR text of every receipt. The ledger keeps only the
+# first 100 characters, so the text and an inverted index live in a table of
+# their own (SEARCH_TABLE_NAME, key Term + Block):
+#
+#   Term=#META  Block=0       NextDoc (doc numbers handed out), Tokens (total length)
+#   Term=#DOC   Block=<doc>   ReceiptID, Length, Text (the full OCR text, zlib),
+#                             LineItems (every extracted line item as JSON, zlib)
+#   Term=<word> Block=<doc>   Postings of one processor batch, starting at doc
+#
+# Each batch the processor writes gets a run of doc numbers from one ADD on
+# #META, then puts one #DOC item per receipt and one postings item per word. A
+# posting is 3 bytes: the doc's offset in the block, the word's count and the
+# doc's length on a log scale. Blocks hold at most 255 receipts, so decoding a
+# postings item is three slices, not a loop over bytes.
+#
+# A search reads the postings of each word (Query, split in doc-number ranges
+# that are read in parallel), keeps the receipts that have every word, ranks
+# them with BM25 and fetches the text and ledger row of one page of hits.
+TABLE_NAME = os.environ.get('SEARCH_TABLE_NAME')
+META = '#META'
+DOC = '#DOC'
+MAX_TEXT = 64 * 1024  # characters of text kept per receipt (DynamoDB items stop at 400 KB)
+MAX_LINE_ITEMS = 256 * 1024  # compressed bytes of line items kept per receipt, next to the text
+MAX_BLOCK = 255  # receipts per postings item: offsets fit in a byte
+MAX_TERMS = 8
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SEGMENTS = int(os.environ.get('SEARCH_SEGMENTS', '4'))  # parallel Queries per word
+READ_WORKERS = 16
+K1 = 1.2
+B = 0.75
+SNIPPET_CHARS = 160
+
+# Ledger attributes returned with every hit
+HIT_FIELDS = ('ReceiptID', 'Filename', 'UploadDate', 'Status', 'RiskScore', 'Merchant', 'Date', 'Total', 'Currency')
+
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has in is it of on or that the to was were will with
+""".split())
+WORD = re.compile(r'[^\W_]+')
+
+
+# --- TOKENS ---
+def tokenize(text):
+    # -> lower-case words with at least one letter; amounts and dates are left
+    # to the ledger's typed Total/Date attributes
+    words = []
+    for word in WORD.findall(text.lower()):
+        if 2 <= len(word) <= 40 and not word.isdigit() and word not in STOP_WORDS:
+            words.append(word)
+    return words
+
+
+def norm(length):
+    # Doc length in one byte, ~4% steps (like Lucene's norms)
+    return min(255, round(math.log2(length + 1) * 16))
+
+
+def length_of(norm_byte):
+    return 2 ** (norm_byte / 16) - 1
+
+
+# --- POSTINGS ---
+def encode_postings(block, postings):
+    # [(doc, count, norm)] -> bytes, 3 per posting (a count over 255 is kept as 255)
+    out = bytearray()
+    for doc, count, doc_norm in postings:
+        out += bytes((doc - block, min(count, 255), doc_norm))
+    return bytes(out)
+
+
+def decode_postings(block, data, into):
+    # Adds {doc: (count, norm)} for one postings item to `into`
+    data = getattr(data, 'value', data)  # boto3 hands Binary back wrapped
+    into.update(zip(map(block.__add__, data[0::3]), zip(data[1::3], data[2::3])))
+
+
+# --- WRITING ---
+def compress_line_items(lines):
+    # -> the line items as zlib JSON (amounts as strings), the first ones only if
+    # all of them would be over MAX_LINE_ITEMS
+    while True:
+        data = zlib.compress(json.dumps(lines, default=str).encode('utf-8'))
+        if len(data) <= MAX_LINE_ITEMS or not lines:
+            return data
+        lines = lines[:len(lines) // 2]
+
+
+def index(table, receipts, line_items=None):
+    # Called by the processor after a batch is written to the ledger.
+    # receipts: [(ReceiptID, OCR text)], line_items: {ReceiptID: [line item]}
+    line_items = line_items or {}
+    docs = []
+    for receipt_id, text in receipts:
+        words = tokenize(text or '')
+        if words:
+            docs.append((receipt_id, text, words, line_items.get(receipt_id)))
+    for start in range(0, len(docs), MAX_BLOCK):
+        write_block(table, docs[start:start + MAX_BLOCK])
+
+
+def write_block(table, docs):
+    # 1. A run of doc numbers for the block, and the collection totals BM25 needs
+    response = table.update_item(
+        Key={'Term': META, 'Block': 0},
+        UpdateExpression='ADD NextDoc :n, Tokens :t',
+        ExpressionAttributeValues={':n': len(docs), ':t': sum(len(words) for _, _, words, _ in docs)},
+        ReturnValues='UPDATED_NEW',
+    )
+    block = int(response['Attributes']['NextDoc']) - len(docs)
+
+    # 2. The texts, then one postings item per word
+    postings = {}
+    with table.batch_writer() as batch:
+        for doc, (receipt_id, text, words, lines) in enumerate(docs, start=block):
+            item = {
+                'Term': DOC, 'Block': doc, 'ReceiptID': receipt_id, 'Length': len(words),
+                'Text': zlib.compress(text[:MAX_TEXT].encode('utf-8')),
+            }
+            if lines:
+                item['LineItems'] = compress_line_items(lines)
+            batch.put_item(Item=item)
+            counts = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+            doc_norm = norm(len(words))
+            for word, count in counts.items():
+                postings.setdefault(word, []).append((doc, count, doc_norm))
+        for word, entries in postings.items():
+            batch.put_item(Item={'Term': word, 'Block': block, 'Postings': encode_postings(block, entries)})
+
+
+# --- READING ---
+def parse_search_params(params):
+    # ?q=<words>&limit=
+    query = (params.get('q') or '').strip()
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        raise ValueError("q needs at least one word")
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f"q can have at most {MAX_TERMS} words")
+    limit = int(params.get('limit') or DEFAULT_LIMIT)
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return {'query': query, 'terms': terms, 'limit': limit}
+
+
+def read_range(table, term, low, high):
+    # -> {doc: (count, norm)} of `term` in blocks low..high
+    found = {}
+    request = {
+        'KeyConditionExpression': Key('Term').eq(term) & Key('Block').between(low, high),
+        'ProjectionExpression': '#b, Postings',  # BLOCK is a reserved word
+        'ExpressionAttributeNames': {'#b': 'Block'},
+    }
+    while True:
+        response = table.query(**request)
+        for item in response['Items']:
+            decode_postings(int(item['Block']), item['Postings'], found)
+        if 'LastEvaluatedKey' not in response:
+            return found
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def read_postings(table, terms, next_doc, pool):
+    # -> [{doc: (count, norm)}] per term. Every term's doc numbers are read as
+    # SEGMENTS ranges at once, so a common word doesn't read page after page.
+    step = max(1, -(-next_doc // SEGMENTS))
+    ranges = [(low, low + step - 1) for low in range(0, max(next_doc, 1), step)]
+    futures = [[pool.submit(read_range, table, term, low, high) for low, high in ranges] for term in terms]
+    postings = []
+    for term_futures in futures:
+        found = {}
+        for future in term_futures:
+            found.update(future.result())
+        postings.append(found)
+    return postings
+
+
+def rank(postings, docs, average_length, after=None, limit=DEFAULT_LIMIT):
+    # BM25 over the receipts that have every term.
+    # -> (number of matches, how many are left from `after` on, [(score, doc)] best first)
+    postings = sorted(postings, key=len)
+    matches = [doc for doc in postings[0] if all(doc in other for other in postings[1:])]
+    weights = [math.log(1 + (docs - len(found) + 0.5) / (len(found) + 0.5)) for found in postings]
+    # The length part of BM25 for each of the 256 norms
+    scales = [K1 * (1 - B + B * length_of(n) / average_length) for n in range(256)]
+    scored = []
+    for doc in matches:
+        score = 0.0
+        for weight, found in zip(weights, postings):
+            count, doc_norm = found[doc]
+            score += weight * count * (K1 + 1) / (count + scales[doc_norm])
+        scored.append((score, doc))
+    if after:
+        # Best first, newest first on ties: continue right after the last hit served
+        scored = [hit for hit in scored if hit < (after['score'], after['doc'])]
+    return len(matches), len(scored), heapq.nlargest(limit, scored)
+
+
+def snippet(text, terms):
+    # A window of the text around the first word that matched
+    match = re.search(r'\b(' + '|'.join(map(re.escape, terms)) + r')', text, re.IGNORECASE)
+    start = max(0, (match.start() if match else 0) - SNIPPET_CHARS // 3)
+    window = ' '.join(text[start:start + SNIPPET_CHARS].split())
+    return ('...' if start else '') + window + ('...' if start + SNIPPET_CHARS < len(text) else '')
+
+
+def batch_get(dynamodb, table_name, keys, fields=None):
+    found = []
+    for start in range(0, len(keys), 100):  # BatchGetItem limit
+        request = {table_name: {'Keys': keys[start:start + 100]}}
+        if fields:
+            # Status and Date are reserved words
+            request[table_name]['ProjectionExpression'] = ', '.join(f"#f{i}" for i in range(len(fields)))
+            request[table_name]['ExpressionAttributeNames'] = {f"#f{i}": name for i, name in enumerate(fields)}
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            found.extend(response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys')
+    return found
+
+
+def search(dynamodb, table, ledger, query, terms, limit=DEFAULT_LIMIT, after=None):
+    # -> {'query', 'total', 'hits': [ledger fields + Score + Snippet], 'next': after-key or None}
+    meta = table.get_item(Key={'Term': META, 'Block': 0}).get('Item', {})
+    next_doc = int(meta.get('NextDoc', 0))
+    if not next_doc:
+        return {'query': query, 'total': 0, 'hits': [], 'next': None}
+
+    # 1. Postings of every term, 2. the page of hits
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        postings = read_postings(table, terms, next_doc, pool)
+    if not all(postings):
+        return {'query': query, 'total': 0, 'hits': [], 'next': None}
+    total, left, page = rank(postings, next_doc, int(meta['Tokens']) / next_doc, after, limit)
+
+    # 3. Their texts and ledger rows
+    texts = {int(item['Block']): item for item in
+             batch_get(dynamodb, table.name, [{'Term': DOC, 'Block': doc} for _, doc in page])}
+    receipt_ids = list(dict.fromkeys(texts[doc]['ReceiptID'] for _, doc in page if doc in texts))
+    rows = {item['ReceiptID']: item for item in
+            batch_get(dynamodb, ledger.name, [{'ReceiptID': r} for r in receipt_ids], HIT_FIELDS)}
+    hits = []
+    for score, doc in page:
+        if doc not in texts:
+            continue
+        text = zlib.decompress(getattr(texts[doc]['Text'], 'value', texts[doc]['Text'])).decode('utf-8')
+        hit = dict(rows.get(texts[doc]['ReceiptID'], {'ReceiptID': texts[doc]['ReceiptID']}))
+        hit.update(Score=round(score, 4), Snippet=snippet(text, terms))
+        hits.append(hit)
+    next_key = {'score': page[-1][0], 'doc': page[-1][1]} if left > len(page) else None
+    return {'query': query, 'total': total, 'hits': hits, 'next': next_key}
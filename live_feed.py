@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import websocket  # websocket-client
+except ImportError:
+    websocket = None
+
+# --- LIVE FEED ---
+# Used by app.py and benchmarks/bench_live.py. A LiveFeed follows the ledger on
+# its own thread and keeps the newest receipts, so the dashboard's 1-second
+# fragment only reads memory. Two ways to hear about changes:
+#
+#   - listen: the WebSocket push.py sends change events down. The API is called
+#     once when the socket opens (to catch up) and once per event; an idle
+#     dashboard makes no requests at all.
+#   - without it, GET /expenses/changes is long-polled: once per change, or
+#     once per `wait` seconds when nothing happens.
+WAIT = 20                # seconds the API may hold one request
+CATCH_UP_WAIT = 2        # an event can arrive before its rows are readable (changes.SETTLE)
+MAX_ROWS = 200           # newest receipts kept for the Live Feed table
+IDLE_TIMEOUT = 60        # nobody looked for this long: the browser tab is gone, stop
+MAX_BACKOFF = 30
+QUIET = 10               # seconds a socket read waits before the feed checks it is still wanted
+
+
+class LiveFeed:
+    def __init__(self, fetch, wait=WAIT, max_rows=MAX_ROWS, idle_timeout=IDLE_TIMEOUT, listen=None):
+        # fetch(params) -> the decoded JSON of GET /expenses/changes; raises on failure
+        # listen(stop) -> iterator that opens the socket, yields None once it is open
+        # and whenever it has been quiet for a while, and yields each change event
+        # (changes.publish) as a dict; raises when the socket drops
+        self.fetch = fetch
+        self.listen = listen
+        self.wait = wait
+        self.max_rows = max_rows
+        self.idle_timeout = idle_timeout
+        self.rows = OrderedDict()  # ReceiptID -> item, newest last
+        self.since = None
+        self.received = 0
+        self.error = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.last_read = time.monotonic()
+        self.thread = None
+
+    def alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if not self.alive():
+            self.stop_event.clear()
+            self.last_read = time.monotonic()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def take(self):
+        # -> (rows newest first, receipts received so far)
+        with self.lock:
+            self.last_read = time.monotonic()
+            return list(reversed(self.rows.values())), self.received
+
+    def add(self, items):
+        with self.lock:
+            for item in items:
+                self.rows.pop(item['ReceiptID'], None)
+                self.rows[item['ReceiptID']] = item
+                self.received += 1
+            while len(self.rows) > self.max_rows:
+                self.rows.popitem(last=False)
+
+    def idle(self):
+        return self.stop_event.is_set() or time.monotonic() - self.last_read > self.idle_timeout
+
+    def run(self):
+        if self.listen is not None:
+            self.follow()
+        else:
+            self.poll()
+
+    def catch_up(self, until=None):
+        # Fetches without holding the request open until nothing is left (or, for
+        # an event, until `since` reaches its UpdatedAt)
+        if not self.since:
+            self.since = self.fetch({})['since']
+            return
+        while until is None or self.since < until:
+            page = self.fetch({'since': self.since, 'wait': 0 if until is None else CATCH_UP_WAIT})
+            self.add(page['items'])
+            self.since = page['since']
+            if not page['items']:
+                return
+
+    def follow(self):
+        backoff = 1
+        while not self.idle():
+            try:
+                connected = False
+                for event in self.listen(self.stop_event):
+                    if self.idle():
+                        return
+                    if not connected:
+                        # 1. The socket is open: whatever happened before it is read once
+                        self.catch_up()
+                        connected = True
+                        self.error, backoff = None, 1
+                    if event:
+                        # 2. Each event: read its rows
+                        self.catch_up(event['UpdatedAt'])
+                if connected:
+                    continue  # closed cleanly: reconnect right away
+                raise ConnectionError("live socket closed before it opened")
+            except Exception as e:
+                self.error = str(e)
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def poll(self):
+        backoff = 1
+        while not self.idle():
+            # 1. The first call only fetches the current watermark, then each call waits for news
+            params = {'since': self.since, 'wait': self.wait} if self.since else {}
+            try:
+                page = self.fetch(params)
+            except Exception as e:
+                self.error = str(e)
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            self.error, backoff = None, 1
+
+            # 2. Only the new rows are appended
+            self.add(page['items'])
+            self.since = page['since']
+
+
+def socket_listener(url):
+    # -> a LiveFeed `listen` for the push.py WebSocket at `url` (wss://...), or
+    # None without websocket-client, and the feed long-polls instead
+    if websocket is None or not url:
+        return None
+
+    def listen(stop):
+        ws = websocket.create_connection(url, timeout=QUIET)
+        try:
+            yield None
+            while not stop.is_set():
+                try:
+                    message = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    yield None
+                    continue
+                if not message:
+                    return  # closed by API Gateway (it ends every socket after 2 hours)
+                yield json.loads(message)
+        finally:
+            ws.close()
+
+    return listen
@@ -20,6 +20,13 @@ resource "aws_s3_bucket" "uploads_bucket" {
   force_destroy = true 
 }
 
+# Ledger exports (tools/export_parquet.py) get their own bucket: every object
+# created in the uploads bucket is queued for the processor
+resource "aws_s3_bucket" "exports_bucket" {
+  bucket        = "bill-e-exports-${random_id.suffix.hex}"
+  force_destroy = true
+}
+
 resource "aws_s3_bucket_versioning" "uploads_versioning" {
   bucket = aws_s3_bucket.uploads_bucket.id
   versioning_configuration {
@@ -38,6 +45,86 @@ resource "aws_dynamodb_table" "expenses_table" {
     type = "S" 
   }
 
+  attribute {
+    name = "RecordType"
+    type = "S"
+  }
+
+  attribute {
+    name = "UploadDate"
+    type = "S"
+  }
+
+  attribute {
+    name = "Status"
+    type = "S"
+  }
+
+  attribute {
+    name = "UpdatedAt"
+    type = "S"
+  }
+
+  attribute {
+    name = "RiskScore"
+    type = "N"
+  }
+
+  # Newest-first ledger pages for the reader (every receipt has RecordType = "RECEIPT")
+  global_secondary_index {
+    name            = "UploadDateIndex"
+    hash_key        = "RecordType"
+    range_key       = "UploadDate"
+    projection_type = "ALL"
+  }
+
+  # Delta sync: receipts added or changed since a timestamp
+  global_secondary_index {
+    name            = "UpdatedAtIndex"
+    hash_key        = "RecordType"
+    range_key       = "UpdatedAt"
+    projection_type = "ALL"
+  }
+
+  # Same ordering as UploadDateIndex, narrowed to one Status
+  global_secondary_index {
+    name            = "StatusIndex"
+    hash_key        = "Status"
+    range_key       = "UploadDate"
+    projection_type = "ALL"
+  }
+
+  # Audit Trail sorted by risk; a risk range becomes part of the key condition
+  global_secondary_index {
+    name            = "RiskScoreIndex"
+    hash_key        = "RecordType"
+    range_key       = "RiskScore"
+    projection_type = "ALL"
+  }
+
+  tags = {
+    Environment = "Dev"
+    Project     = "Bill-E"
+  }
+}
+
+# Full OCR text and the inverted index behind GET /search (lambda/search_index.py)
+resource "aws_dynamodb_table" "search_index" {
+  name         = "BillE_SearchIndex"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "Term"
+  range_key    = "Block"
+
+  attribute {
+    name = "Term"
+    type = "S"
+  }
+
+  attribute {
+    name = "Block"
+    type = "N"
+  }
+
   tags = {
     Environment = "Dev"
     Project     = "Bill-E"
@@ -55,6 +142,7 @@ resource "aws_sqs_queue" "ingest_queue" {
   max_message_size          = 262144 
   message_retention_seconds = 86400  
   receive_wait_time_seconds = 10     
+  visibility_timeout_seconds = 540   # 6x the processor timeout, as AWS recommends for Lambda triggers
 
   redrive_policy = jsonencode({
     deadLetterTargetArn = aws_sqs_queue.dlq.arn
@@ -95,6 +183,10 @@ output "bucket_name" {
   value = aws_s3_bucket.uploads_bucket.id
 }
 
+output "export_bucket_name" {
+  value = aws_s3_bucket.exports_bucket.id
+}
+
 output "queue_url" {
   value = aws_sqs_queue.ingest_queue.url
 }
@@ -103,6 +195,23 @@ output "api_endpoint" {
   value = "${aws_apigatewayv2_api.main.api_endpoint}/expenses"
 }
 
+output "stats_endpoint" {
+  value = "${aws_apigatewayv2_api.main.api_endpoint}/stats"
+}
+
+output "changes_endpoint" {
+  value = "${aws_apigatewayv2_api.main.api_endpoint}/expenses/changes"
+}
+
+output "changes_topic_arn" {
+  value = aws_sns_topic.changes.arn
+}
+
+# LIVE_SOCKET_URL for the dashboard
+output "live_endpoint" {
+  value = "${aws_apigatewayv2_api.live.api_endpoint}/${aws_apigatewayv2_stage.live.name}"
+}
+
 # --- 5. THE TRIGGER (Connecting S3 to SQS) ---
 resource "aws_s3_bucket_notification" "bucket_notification" {
   bucket = aws_s3_bucket.uploads_bucket.id
@@ -110,14 +219,16 @@ resource "aws_s3_bucket_notification" "bucket_notification" {
   queue {
     queue_arn     = aws_sqs_queue.ingest_queue.arn
     events        = ["s3:ObjectCreated:*"]
-    # No filter_suffix here means ALL files are accepted!
+    # No filter: only receipts are written to this bucket (exports go to exports_bucket)
   }
 }
 
 # --- 6. THE WORKER (Lambda Function) ---
+# Both lambdas ship the whole lambda/ folder so they can share modules (risk_engine.py, ...)
 data "archive_file" "lambda_zip" {
   type        = "zip"
-  source_file = "../lambda/processor.py"
+  source_dir  = "../lambda"
+  excludes    = ["__pycache__"]
   output_path = "processor_payload.zip"
 }
 
@@ -150,7 +261,8 @@ resource "aws_iam_role_policy" "lambda_policy" {
       },
       {
         Effect = "Allow"
-        Action = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+        # SendMessage: receipts throttled by OCR go back on the queue with a delay
+        Action = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes", "sqs:SendMessage"]
         Resource = aws_sqs_queue.ingest_queue.arn
       },
       {
@@ -160,8 +272,12 @@ resource "aws_iam_role_policy" "lambda_policy" {
       },
       {
         Effect = "Allow"
-        Action = ["dynamodb:PutItem", "dynamodb:Scan", "dynamodb:Query"]
-        Resource = aws_dynamodb_table.expenses_table.arn
+        Action = ["dynamodb:PutItem", "dynamodb:BatchWriteItem", "dynamodb:UpdateItem", "dynamodb:DeleteItem", "dynamodb:GetItem", "dynamodb:BatchGetItem", "dynamodb:Scan", "dynamodb:Query"]
+        Resource = [
+          aws_dynamodb_table.expenses_table.arn,
+          "${aws_dynamodb_table.expenses_table.arn}/index/*",
+          aws_dynamodb_table.search_index.arn
+        ]
       }
     ]
   })
@@ -175,13 +291,32 @@ resource "aws_lambda_function" "processor" {
   source_code_hash = data.archive_file.lambda_zip.output_base64sha256
   runtime          = "python3.9"
   
-  timeout          = 30  
+  timeout          = 90  # > OCR_CONNECT_TIMEOUT + OCR_READ_TIMEOUT + FINISH_SECONDS, with room for OCR_MAX_WAIT
 
   environment {
     variables = {
-      TABLE_NAME    = aws_dynamodb_table.expenses_table.name
-      OCR_API_KEY   = var.ocr_api_key
-      SNS_TOPIC_ARN = aws_sns_topic.alerts.arn  # Passed to Python here
+      MAX_WORKERS         = "10"
+      DEDUP_CACHE_SIZE    = "10000"
+      PREPROCESS_IMAGES   = "false"  # Needs a Pillow layer on the function
+      PDF_PAGE_WORKERS    = "4"  # OCR calls per multi-page PDF at once; needs a pypdf layer to split
+      NEAR_DUP_DISTANCE   = "7"  # perceptual-hash bits a re-photographed copy may differ by; needs Pillow
+      OCR_POOL_SIZE       = "10"
+      OCR_CONNECT_TIMEOUT = "5"
+      OCR_READ_TIMEOUT    = "45"
+      FINISH_SECONDS      = "10"  # kept for the ledger/alert/index writes: OCR calls stop starting before that
+      OCR_RATE_PER_MINUTE = "0"  # the plan's calls/minute divided by maximum_concurrency below; 0 = unmetered
+      OCR_MAX_CONCURRENCY = "10"
+      OCR_MAX_WAIT        = "20"  # then the receipt goes back to SQS (OCR_DEFER_SECONDS, doubling)
+      INGEST_QUEUE_URL    = aws_sqs_queue.ingest_queue.url
+      WRITE_WORKERS       = "10"
+      WRITE_RETRIES       = "5"
+      PROFILE_SAMPLE_RATE = "0"  # e.g. "0.05" profiles 5% of invocations...
+      PROFILE_SLOW_MS     = "20000"  # ...and logs the ones slower than this
+      TABLE_NAME          = aws_dynamodb_table.expenses_table.name
+      SEARCH_TABLE_NAME   = aws_dynamodb_table.search_index.name
+      OCR_API_KEY         = var.ocr_api_key
+      SNS_TOPIC_ARN       = aws_sns_topic.alerts.arn  # Passed to Python here
+      CHANGES_TOPIC_ARN   = aws_sns_topic.changes.arn
     }
   }
 }
@@ -190,13 +325,23 @@ resource "aws_lambda_function" "processor" {
 resource "aws_lambda_event_source_mapping" "sqs_trigger" {
   event_source_arn = aws_sqs_queue.ingest_queue.arn
   function_name    = aws_lambda_function.processor.arn
-  batch_size       = 1
+  batch_size       = 10
+  maximum_batching_window_in_seconds = 5
+
+  # Only the receipts that failed get redelivered, not the whole batch
+  function_response_types = ["ReportBatchItemFailures"]
+
+  # Bounds how many containers share the OCR quota (see OCR_RATE_PER_MINUTE)
+  scaling_config {
+    maximum_concurrency = 4
+  }
 }
 
 # --- 8. THE READER (Lambda Function) ---
 data "archive_file" "reader_zip" {
   type        = "zip"
-  source_file = "../lambda/reader.py"
+  source_dir  = "../lambda"
+  excludes    = ["__pycache__"]
   output_path = "reader_payload.zip"
 }
 
@@ -207,6 +352,18 @@ resource "aws_lambda_function" "reader" {
   handler          = "reader.lambda_handler"
   source_code_hash = data.archive_file.reader_zip.output_base64sha256
   runtime          = "python3.9"
+
+  # GET /expenses/changes holds a request open for up to 25 s
+  timeout          = 30
+
+  environment {
+    variables = {
+      TABLE_NAME            = aws_dynamodb_table.expenses_table.name
+      SEARCH_TABLE_NAME     = aws_dynamodb_table.search_index.name
+      CHANGES_POLL_INTERVAL     = "0.5"
+      CHANGES_MAX_POLL_INTERVAL = "4"
+    }
+  }
 }
 
 resource "aws_lambda_permission" "api_gw" {
@@ -222,9 +379,10 @@ resource "aws_apigatewayv2_api" "main" {
   name          = "bill-e-api"
   protocol_type = "HTTP"
   cors_configuration {
-    allow_origins = ["*"]
-    allow_methods = ["GET", "POST", "OPTIONS"]
-    allow_headers = ["Content-Type"]
+    allow_origins  = ["*"]
+    allow_methods  = ["GET", "POST", "OPTIONS"]
+    allow_headers  = ["Content-Type", "If-None-Match"]
+    expose_headers = ["ETag"]
   }
 }
 
@@ -246,6 +404,26 @@ resource "aws_apigatewayv2_route" "get_expenses" {
   target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
 }
 
+# Long-poll: answers as soon as the processor writes something, or empty after `wait`.
+# Dashboards with the live socket only call it when an event arrives.
+resource "aws_apigatewayv2_route" "get_changes" {
+  api_id    = aws_apigatewayv2_api.main.id
+  route_key = "GET /expenses/changes"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "get_stats" {
+  api_id    = aws_apigatewayv2_api.main.id
+  route_key = "GET /stats"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "get_search" {
+  api_id    = aws_apigatewayv2_api.main.id
+  route_key = "GET /search"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
+}
+
 # --- 11. THE SNITCH (SNS Email Alerts) ---
 
 # A. Create the Topic
@@ -260,7 +438,12 @@ resource "aws_sns_topic_subscription" "email_target" {
   endpoint  = var.alert_email  # Reads from terraform.tfvars
 }
 
-# C. Give Lambda Permission to Send Emails
+# C. Ledger change events (one per written batch), pushed to dashboards (section 12)
+resource "aws_sns_topic" "changes" {
+  name = "bill-e-ledger-changes"
+}
+
+# D. Give Lambda Permission to Send Emails and change events
 resource "aws_iam_role_policy" "sns_policy" {
   name = "bill-e-sns-policy"
   role = aws_iam_role.lambda_role.id
@@ -271,8 +454,131 @@ resource "aws_iam_role_policy" "sns_policy" {
       {
         Effect   = "Allow"
         Action   = "sns:Publish"
-        Resource = aws_sns_topic.alerts.arn
+        Resource = [aws_sns_topic.alerts.arn, aws_sns_topic.changes.arn]
       }
     ]
   })
-}
\ No newline at end of file
+}
+
+# --- 12. LIVE PUSH (WebSocket API for the dashboards) ---
+# push.py keeps the open sockets in BillE_Connections and forwards every ledger
+# change event to them: an idle dashboard costs no Lambda time and no reads.
+resource "aws_dynamodb_table" "connections" {
+  name         = "BillE_Connections"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "ConnectionId"
+
+  attribute {
+    name = "ConnectionId"
+    type = "S"
+  }
+
+  # API Gateway ends every socket after 2 hours; a missed $disconnect expires too
+  ttl {
+    attribute_name = "ExpiresAt"
+    enabled        = true
+  }
+
+  tags = {
+    Environment = "Dev"
+    Project     = "Bill-E"
+  }
+}
+
+resource "aws_apigatewayv2_api" "live" {
+  name                       = "bill-e-live"
+  protocol_type              = "WEBSOCKET"
+  route_selection_expression = "$request.body.action"
+}
+
+resource "aws_apigatewayv2_stage" "live" {
+  api_id      = aws_apigatewayv2_api.live.id
+  name        = "live"
+  auto_deploy = true
+}
+
+data "archive_file" "push_zip" {
+  type        = "zip"
+  source_dir  = "../lambda"
+  excludes    = ["__pycache__"]
+  output_path = "push_payload.zip"
+}
+
+resource "aws_lambda_function" "push" {
+  filename         = data.archive_file.push_zip.output_path
+  function_name    = "bill-e-push"
+  role             = aws_iam_role.lambda_role.arn
+  handler          = "push.lambda_handler"
+  source_code_hash = data.archive_file.push_zip.output_base64sha256
+  runtime          = "python3.9"
+  timeout          = 30
+
+  environment {
+    variables = {
+      CONNECTIONS_TABLE_NAME = aws_dynamodb_table.connections.name
+      WEBSOCKET_CALLBACK_URL = replace("${aws_apigatewayv2_api.live.api_endpoint}/${aws_apigatewayv2_stage.live.name}", "wss://", "https://")
+    }
+  }
+}
+
+resource "aws_apigatewayv2_integration" "push_integration" {
+  api_id           = aws_apigatewayv2_api.live.id
+  integration_type = "AWS_PROXY"
+  integration_uri  = aws_lambda_function.push.invoke_arn
+}
+
+resource "aws_apigatewayv2_route" "live_connect" {
+  api_id    = aws_apigatewayv2_api.live.id
+  route_key = "$connect"
+  target    = "integrations/${aws_apigatewayv2_integration.push_integration.id}"
+}
+
+resource "aws_apigatewayv2_route" "live_disconnect" {
+  api_id    = aws_apigatewayv2_api.live.id
+  route_key = "$disconnect"
+  target    = "integrations/${aws_apigatewayv2_integration.push_integration.id}"
+}
+
+resource "aws_lambda_permission" "live_gw" {
+  statement_id  = "AllowExecutionFromWebSocketAPI"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.push.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_apigatewayv2_api.live.execution_arn}/*/*"
+}
+
+# The change events' consumer
+resource "aws_sns_topic_subscription" "changes_push" {
+  topic_arn = aws_sns_topic.changes.arn
+  protocol  = "lambda"
+  endpoint  = aws_lambda_function.push.arn
+}
+
+resource "aws_lambda_permission" "changes_sns" {
+  statement_id  = "AllowExecutionFromChangesTopic"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.push.function_name
+  principal     = "sns.amazonaws.com"
+  source_arn    = aws_sns_topic.changes.arn
+}
+
+resource "aws_iam_role_policy" "push_policy" {
+  name = "bill-e-push-policy"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:PutItem", "dynamodb:DeleteItem", "dynamodb:Scan"]
+        Resource = aws_dynamodb_table.connections.arn
+      },
+      {
+        Effect   = "Allow"
+        Action   = "execute-api:ManageConnections"
+        Resource = "${aws_apigatewayv2_api.live.execution_arn}/*"
+      }
+    ]
+  })
+}
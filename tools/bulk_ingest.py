@@ -0,0 +1,288 @@
+"""
+Bulk ingestion for migrations and load tests.
+
+    # Upload every receipt under a directory (or listed in a manifest file)
+    python tools/bulk_ingest.py upload ./receipts --bucket my-bill-e-bucket
+    python tools/bulk_ingest.py upload manifest.txt --bucket my-bill-e-bucket --workers 32
+
+    # Write N synthetic ledger rows
+    python tools/bulk_ingest.py seed 100000
+
+Uploads run concurrently, large files go up as multipart transfers, and
+files whose SHA-256 is already a ReceiptID in the ledger are skipped.
+Finished uploads are appended to a state file, so an interrupted run picks
+up where it stopped. --endpoint-url points both S3 and DynamoDB at a local
+stand-in (LocalStack, MinIO + DynamoDB Local, ...).
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+import extractor
+import read_cache
+import rollups
+from risk_engine import RiskEngine, load_rules
+
+MB = 1024 * 1024
+RECEIPT_TYPES = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tif', '.tiff', '.pdf')
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+ROLLUP_FLUSH_ROWS = 10_000  # seeded rows per worker between /stats rollup updates
+
+
+# --- SOURCES ---
+def list_sources(source, prefix=''):
+    # -> [(local path, S3 key)]. A directory is walked for receipt files; any
+    # other file is a manifest with one path per line (relative to the manifest).
+    if os.path.isdir(source):
+        files = []
+        for root, _, names in os.walk(source):
+            for name in sorted(names):
+                if name.lower().endswith(RECEIPT_TYPES):
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, source)))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source) as f:
+            lines = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        files = [(os.path.join(base, line), line) for line in lines]
+    return [(path, prefix + key.replace(os.sep, '/')) for path, key in sorted(files)]
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(MB), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- RESUME STATE ---
+# One JSON line per finished upload; a file counts as done while its size and
+# mtime are unchanged.
+def load_state(path):
+    done = {}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by the interruption
+                done[record['path']] = record
+    return done
+
+
+def is_done(done, path):
+    record = done.get(path)
+    if not record:
+        return False
+    stat = os.stat(path)
+    return record['size'] == stat.st_size and record['mtime'] == stat.st_mtime
+
+
+# --- DEDUP AGAINST THE LEDGER ---
+def existing_hashes(dynamodb, table_name, hashes):
+    # -> the subset of hashes that are already ReceiptIDs in the ledger
+    found = set()
+    hashes = list(hashes)
+    for i in range(0, len(hashes), BATCH_GET_SIZE):
+        request = {table_name: {
+            'Keys': [{'ReceiptID': h} for h in hashes[i:i + BATCH_GET_SIZE]],
+            'ProjectionExpression': 'ReceiptID',
+        }}
+        attempt = 0
+        while request:
+            response = dynamodb.batch_get_item(RequestItems=request)
+            found.update(item['ReceiptID'] for item in response['Responses'].get(table_name, []))
+            request = response.get('UnprocessedKeys') or None
+            if request:
+                attempt += 1
+                time.sleep(min(2.0, 0.05 * 2 ** attempt) * random.random())
+    return found
+
+
+# --- UPLOAD ---
+def upload(s3, dynamodb, sources, bucket, table_name, state_path=None, workers=16,
+           multipart_threshold=8 * MB, multipart_chunksize=8 * MB):
+    start = time.perf_counter()
+    done = load_state(state_path)
+
+    # 1. Drop files a previous run already finished
+    pending = [(path, key) for path, key in sources if not is_done(done, path)]
+    resumed = len(sources) - len(pending)
+
+    # 2. Hash the rest in parallel
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        hashes = list(pool.map(sha256_file, [path for path, _ in pending]))
+
+    # 3. Skip receipts the ledger already has, and copies of ones already sent
+    in_ledger = existing_hashes(dynamodb, table_name, set(hashes))
+    todo, seen = [], in_ledger | {record['sha256'] for record in done.values()}
+    for (path, key), file_hash in zip(pending, hashes):
+        if file_hash not in seen:
+            seen.add(file_hash)
+            todo.append((path, key, file_hash))
+    skipped = len(pending) - len(todo)
+
+    # 4. Upload concurrently; big files are split into parallel multipart parts
+    config = TransferConfig(multipart_threshold=multipart_threshold,
+                            multipart_chunksize=multipart_chunksize, max_concurrency=4)
+    state_lock = threading.Lock()
+    state_file = open(state_path, 'a') if state_path else None
+    totals = {'files': 0, 'bytes': 0, 'failed': 0}
+
+    def send(job):
+        path, key, file_hash = job
+        try:
+            s3.upload_file(path, bucket, key, Config=config)
+        except Exception as e:
+            print(f"Upload Failed: {path}: {e}")
+            with state_lock:
+                totals['failed'] += 1
+            return
+        stat = os.stat(path)
+        with state_lock:
+            totals['files'] += 1
+            totals['bytes'] += stat.st_size
+            if state_file:
+                state_file.write(json.dumps({'path': path, 'key': key, 'sha256': file_hash,
+                                             'size': stat.st_size, 'mtime': stat.st_mtime}) + '\n')
+                state_file.flush()
+            if totals['files'] % 500 == 0:
+                report("Uploaded", totals['files'], totals['bytes'], time.perf_counter() - start)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(send, todo))
+    finally:
+        if state_file:
+            state_file.close()
+
+    seconds = time.perf_counter() - start
+    report("Uploaded", totals['files'], totals['bytes'], seconds)
+    print(f"Skipped {skipped} already in the ledger, {resumed} finished by an earlier run, "
+          f"{totals['failed']} failed")
+    return dict(totals, skipped=skipped, resumed=resumed, seconds=seconds)
+
+
+def report(verb, files, size, seconds):
+    seconds = max(seconds, 1e-9)
+    print(f"{verb} {files:,} files, {size / MB:,.1f} MB in {seconds:.1f}s "
+          f"({files / seconds:,.1f} files/s, {size / MB / seconds:,.1f} MB/s)")
+
+
+# --- SEED ---
+MERCHANTS = ["Uber", "Starbucks", "Apple Store", "The Leela Palace", "Netflix", "Local Taxi",
+             "Amazon AWS", "Go Air", "Royal Casino", "City Wine Bar"]
+ITEMS = ["Coffee", "Sandwich", "Taxi fare", "Room night", "Subscription", "Chips", "Beer", "Wine", "Snacks"]
+
+
+def synthetic_row(i, engine, days=90):
+    # Deterministic per index, so a re-run finds the rows it already wrote
+    rng = random.Random(i)
+    merchant = rng.choice(MERCHANTS)
+    lines = [f"{rng.choice(ITEMS)} {rng.uniform(50, 2000):.2f}" for _ in range(rng.randint(1, 5))]
+    total = round(rng.uniform(100, 15000), 2)
+    uploaded = datetime.datetime(2025, 1, 1) + datetime.timedelta(seconds=rng.randrange(days * 86400))
+    text = (f"{merchant.upper()}\nDate: {uploaded:%d-%m-%Y}\n" + '\n'.join(lines) + f"\nTOTAL {total:.2f}")
+    # Parsed and scored the way the processor does it, so /stats and the
+    # dashboard see the same typed Merchant/Total/Date attributes
+    fields = extractor.extract(text)
+    score, flags = engine.assess(text, fields['Total'], fields['Date'])
+    row = {
+        'ReceiptID': hashlib.sha256(f"seed-{i}".encode()).hexdigest(),
+        'RecordType': 'RECEIPT',
+        'Filename': f"seed/receipt-{i:07d}.png",
+        'UploadDate': uploaded.isoformat(),
+        'UpdatedAt': uploaded.isoformat(),
+        'Status': 'Analyzed',
+        'ExtractedText': text[:100] + "...",
+        'RiskScore': score,
+        'RiskFlags': flags,
+    }
+    row.update((name, value) for name, value in fields.items() if value not in (None, []))
+    return row
+
+
+def seed(dynamodb, table, count, start=0, workers=8, engine=None):
+    # Each worker streams its slice through its own batch_writer, which sends
+    # 25-item BatchWriteItem calls and resends unprocessed items. Rows an earlier
+    # run already wrote are skipped, so the /stats rollups count each row once.
+    if count <= 0:
+        return 0.0
+    engine = engine or RiskEngine(load_rules())
+    began = time.perf_counter()
+    written = {'n': 0, 'new': 0}
+    lock = threading.Lock()
+
+    def write_slice(bounds):
+        # The rollups are updated after each group is flushed to the ledger
+        for group in range(bounds[0], bounds[1], ROLLUP_FLUSH_ROWS):
+            new = []
+            with table.batch_writer() as batch:
+                for first in range(group, min(group + ROLLUP_FLUSH_ROWS, bounds[1]), BATCH_GET_SIZE):
+                    rows = [synthetic_row(i, engine) for i in range(first, min(first + BATCH_GET_SIZE, bounds[1]))]
+                    there = existing_hashes(dynamodb, table.name, [row['ReceiptID'] for row in rows])
+                    fresh = [row for row in rows if row['ReceiptID'] not in there]
+                    for row in fresh:
+                        batch.put_item(Item=row)
+                    new.extend(fresh)
+                    with lock:
+                        before = written['n']
+                        written['n'] += len(rows)
+                        written['new'] += len(fresh)
+                        if written['n'] // 10000 > before // 10000:
+                            print(f"Seeded {written['n']:,} rows ({written['n'] / (time.perf_counter() - began):,.0f} rows/s)")
+            rollups.record(table, new)
+
+    step = -(-count // workers)
+    slices = [(s, min(s + step, start + count)) for s in range(start, start + count, step)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write_slice, slices))
+    read_cache.bump_version(table)
+
+    seconds = time.perf_counter() - began
+    print(f"Seeded {count:,} rows in {seconds:.1f}s ({count / max(seconds, 1e-9):,.0f} rows/s), "
+          f"{written['new']:,} new, {count - written['new']:,} already in the ledger")
+    return seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk receipt upload and ledger seeding")
+    parser.add_argument('--endpoint-url', help="local S3/DynamoDB stand-in, e.g. http://localhost:4566")
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME', 'BillE_Expenses'))
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    up = commands.add_parser('upload', help="upload a directory or manifest of receipts")
+    up.add_argument('source', help="directory to walk, or a manifest file with one path per line")
+    up.add_argument('--bucket', default=os.environ.get('BUCKET_NAME'), required='BUCKET_NAME' not in os.environ)
+    up.add_argument('--prefix', default='', help="S3 key prefix")
+    up.add_argument('--workers', type=int, default=16)
+    up.add_argument('--state', default='.bulk_ingest_state.jsonl', help="resume file ('' to disable)")
+    up.add_argument('--multipart-mb', type=int, default=8, help="files above this go up in parts")
+
+    sd = commands.add_parser('seed', help="write N synthetic ledger rows")
+    sd.add_argument('count', type=int)
+    sd.add_argument('--start', type=int, default=0, help="first row index (resume a partial seed)")
+    sd.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == 'upload':
+        s3 = boto3.client('s3', endpoint_url=args.endpoint_url)
+        dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+        upload(s3, dynamodb, list_sources(args.source, args.prefix), args.bucket, args.table,
+               args.state or None, args.workers, args.multipart_mb * MB, args.multipart_mb * MB)
+    else:
+        dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+        seed(dynamodb, dynamodb.Table(args.table), args.count, args.start, args.workers)
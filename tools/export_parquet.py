@@ -0,0 +1,356 @@
+"""
+Columnar export of the ledger: streams the receipts from DynamoDB into Parquet
+files partitioned by upload month and risk status, under ledger/ in the export
+bucket (terraform output export_bucket_name) or in a local directory. Never in
+the receipts bucket: everything written there is queued for OCR.
+
+    python tools/export_parquet.py --bucket my-bill-e-exports         # new and changed receipts
+    python tools/export_parquet.py --out ./ledger-export --full        # everything, locally
+
+    ledger/_manifest.json
+    ledger/upload_month=2025-01/risk=flagged/part-20250116T020000-00000.parquet
+
+The first run (or --full) reads the table with a parallel Scan. Every later run
+only Queries UpdatedAtIndex for receipts changed since the last watermark, and
+appends their files. Within a file rows are sorted by UploadDate, so a day
+range skips row groups by their statistics. The manifest lists every file with its partition, row
+count and UpdatedAt range. It is written last, so read_export(), which goes
+through it, never sees half of a run. Receipts changed after they were exported
+(rescore.py) are exported again; read_export() keeps the newest copy and
+--full compacts the older ones away.
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+EXPORT_PREFIX = 'ledger'
+MANIFEST = '_manifest.json'
+FLOOR = '0000-00-00'
+# Receipts younger than this are left for the next run: a batch stamped just
+# before the watermark may still be on its way into the table and the index
+SETTLE = 300
+
+SCHEMA = pa.schema([
+    ('ReceiptID', pa.string()),
+    ('Filename', pa.string()),
+    ('UploadDate', pa.timestamp('us')),
+    ('UpdatedAt', pa.timestamp('us')),
+    ('Status', pa.string()),
+    ('RiskScore', pa.int32()),
+    ('RiskFlags', pa.list_(pa.string())),
+    ('Merchant', pa.string()),
+    ('Date', pa.date32()),
+    ('Total', pa.float64()),
+    ('Tax', pa.float64()),
+    ('Currency', pa.string()),
+    ('LineItems', pa.list_(pa.struct([('Description', pa.string()), ('Quantity', pa.int32()),
+                                      ('Amount', pa.float64())]))),
+    ('LineItemsTruncated', pa.int32()),  # line items left off the ledger row (processor.MAX_LINE_ITEMS_BYTES)
+    ('ExtractedText', pa.string()),
+])
+PARTITIONS = pa.schema([('upload_month', pa.string()), ('risk', pa.string())])
+PARTITIONING = ds.partitioning(PARTITIONS, flavor='hive')
+DATASET_SCHEMA = pa.unify_schemas([SCHEMA, PARTITIONS])
+
+
+# --- STORAGE ---
+class LocalStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def put(self, path, data):
+        target = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+
+    def get(self, path):
+        try:
+            with open(os.path.join(self.root, path), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, path):
+        try:
+            os.remove(os.path.join(self.root, path))
+        except FileNotFoundError:
+            pass
+
+    def filesystem(self):
+        # Memory-mapped reads: pages come straight from the OS cache
+        return pafs.LocalFileSystem(use_mmap=True), self.root
+
+
+class S3Store:
+    def __init__(self, s3, bucket, prefix=EXPORT_PREFIX):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def put(self, path, data):
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{path}", Body=data)
+
+    def get(self, path):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{path}")['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def delete(self, path):
+        self.s3.delete_object(Bucket=self.bucket, Key=f"{self.prefix}/{path}")
+
+    def filesystem(self):
+        return pafs.S3FileSystem(region=self.s3.meta.region_name), f"{self.bucket}/{self.prefix}"
+
+
+def load_manifest(store):
+    data = store.get(MANIFEST)
+    return json.loads(data) if data else {'format': 1, 'watermark': FLOOR, 'files': [], 'runs': []}
+
+
+# --- READING THE LEDGER ---
+def scan_segment(table, segment, total_segments):
+    kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': Attr('RecordType').eq('RECEIPT'),
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def scan_ledger(table, segments):
+    # Every receipt, pages from all segments as they arrive
+    streams = [scan_segment(table, s, segments) for s in range(segments)]
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        while streams:
+            pages = list(pool.map(lambda stream: next(stream, None), streams))
+            streams = [stream for stream, page in zip(streams, pages) if page is not None]
+            for page in pages:
+                if page:
+                    yield page
+
+
+def changed_since(table, watermark, horizon):
+    # Receipts with watermark < UpdatedAt <= horizon, through the delta-sync index
+    kwargs = {
+        'IndexName': 'UpdatedAtIndex',
+        'KeyConditionExpression': Key('RecordType').eq('RECEIPT') & Key('UpdatedAt').between(watermark, horizon),
+    }
+    while True:
+        response = table.query(**kwargs)
+        yield [item for item in response['Items'] if item['UpdatedAt'] != watermark]
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+# --- WRITING PARQUET ---
+def partition_of(item):
+    return item['UploadDate'][:7], 'flagged' if int(item.get('RiskScore', 0)) > 0 else 'clean'
+
+
+def number(value):
+    return float(value) if value is not None else None
+
+
+def parse_dates(name, values, type_):
+    # ISO strings parse column-wise in Arrow. One malformed value (a Date like
+    # 2024-02-31) makes the cast fail for the whole column, so that column is
+    # parsed value by value instead and what doesn't parse is exported as null.
+    strings = pa.array(values, pa.string())
+    try:
+        return pc.cast(strings, type_)
+    except pa.ArrowInvalid:
+        pass
+    parse = datetime.date.fromisoformat if pa.types.is_date(type_) else datetime.datetime.fromisoformat
+    parsed = []
+    for value in values:
+        try:
+            parsed.append(parse(value) if value else None)
+        except (TypeError, ValueError):
+            parsed.append(None)
+    bad = sum(1 for value, result in zip(values, parsed) if value and result is None)
+    print(f"{bad} {name} value(s) that aren't dates exported as null")
+    return pa.array(parsed, type_)
+
+
+def to_table(items):
+    # DynamoDB items (strings and Decimals) -> typed Arrow columns
+    columns = {name: [item.get(name) for item in items] for name in SCHEMA.names}
+    columns['RiskScore'] = [int(value or 0) for value in columns['RiskScore']]
+    columns['LineItemsTruncated'] = [int(value or 0) for value in columns['LineItemsTruncated']]
+    columns['RiskFlags'] = [list(value or []) for value in columns['RiskFlags']]
+    columns['Total'] = [number(value) for value in columns['Total']]
+    columns['Tax'] = [number(value) for value in columns['Tax']]
+    columns['LineItems'] = [
+        [{'Description': line.get('Description'), 'Quantity': int(line.get('Quantity', 1)),
+          'Amount': number(line.get('Amount'))} for line in value or []]
+        for value in columns['LineItems']
+    ]
+    arrays = []
+    for field in SCHEMA:
+        if field.name in ('UploadDate', 'UpdatedAt', 'Date'):
+            arrays.append(parse_dates(field.name, columns[field.name], field.type))
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+
+def write_partitions(store, items, run, sequence, workers):
+    # One file per partition for this chunk of items; sorted by UploadDate so
+    # row-group statistics narrow time-range reads
+    groups = {}
+    for item in items:
+        groups.setdefault(partition_of(item), []).append(item)
+
+    def write(entry):
+        n, ((month, risk), rows) = entry
+        rows.sort(key=lambda item: item['UploadDate'])
+        path = f"upload_month={month}/risk={risk}/part-{run}-{sequence + n:05d}.parquet"
+        buffer = io.BytesIO()
+        pq.write_table(to_table(rows), buffer, compression='zstd', row_group_size=64 * 1024)
+        store.put(path, buffer.getvalue())
+        updated = [item['UpdatedAt'] for item in rows]
+        return {'path': path, 'upload_month': month, 'risk': risk, 'rows': len(rows), 'bytes': buffer.tell(),
+                'updated_min': min(updated), 'updated_max': max(updated), 'run': run}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(write, enumerate(sorted(groups.items()))))
+
+
+def export(table, store, full=False, segments=4, batch_size=100_000, workers=8, settle=SETTLE, now=None):
+    # -> the run's entry in the manifest
+    began = time.perf_counter()
+    manifest = load_manifest(store)
+    now = now or datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    horizon = (now - datetime.timedelta(seconds=settle)).isoformat()
+    run = stamp = now.strftime('%Y%m%dT%H%M%S')
+    while run in {previous['run'] for previous in manifest['runs']}:
+        run = f"{stamp}-{len(manifest['runs'])}"
+    full = full or not manifest['files']
+    if full:
+        pages = scan_ledger(table, segments)
+    else:
+        pages = changed_since(table, manifest['watermark'], horizon)
+
+    # 1. Stream the receipts, writing a set of files every batch_size rows
+    files, pending, rows = [], [], 0
+    for page in pages:
+        for item in page:
+            item.setdefault('UpdatedAt', item['UploadDate'])  # receipts from before delta sync
+        pending.extend(item for item in page if item['UpdatedAt'] <= horizon)
+        if len(pending) >= batch_size:
+            files += write_partitions(store, pending, run, len(files), workers)
+            rows += len(pending)
+            pending = []
+            print(f"Exported {rows:,} receipts ({rows / (time.perf_counter() - began):,.0f} rows/s)")
+    if pending:
+        files += write_partitions(store, pending, run, len(files), workers)
+        rows += len(pending)
+
+    # 2. Publish them: the manifest goes last
+    stale = manifest['files'] if full else []
+    entry = {'run': run, 'mode': 'full' if full else 'incremental', 'watermark': horizon, 'rows': rows,
+             'files': len(files), 'bytes': sum(f['bytes'] for f in files),
+             'seconds': round(time.perf_counter() - began, 3)}
+    manifest['files'] = files if full else manifest['files'] + files
+    manifest['watermark'] = horizon
+    manifest['runs'].append(entry)
+    store.put(MANIFEST, json.dumps(manifest, indent=1).encode('utf-8'))
+
+    # 3. A full export replaces everything that came before
+    kept = {f['path'] for f in files}
+    for old in stale:
+        if old['path'] not in kept:
+            store.delete(old['path'])
+    print(f"Exported {rows:,} receipts into {len(files):,} files ({entry['bytes'] / 1e6:,.1f} MB)"
+          f" in {entry['seconds']:.1f}s, watermark {horizon}")
+    return entry
+
+
+# --- READING THE EXPORT ---
+def dataset(store, files):
+    fs, base = store.filesystem()
+    return ds.dataset([f"{base}/{f['path']}" for f in files], schema=DATASET_SCHEMA, format='parquet',
+                      filesystem=fs, partitioning=PARTITIONING, partition_base_dir=base)
+
+
+def read_export(store, columns=None, filter=None, latest=True):
+    """
+    The exported ledger as an Arrow table. Only the files and row groups that
+    can match `filter` are read (upload_month and risk are partition columns),
+    and only `columns`:
+
+        read_export(store, ['Merchant', 'Total'],
+                    (pc.field('risk') == 'flagged') & (pc.field('upload_month') >= '2025-03'))
+
+    latest=True drops copies of a receipt superseded by a later run.
+    """
+    manifest = load_manifest(store)
+    if not manifest['files']:
+        return DATASET_SCHEMA.empty_table().select(columns) if columns else DATASET_SCHEMA.empty_table()
+    wanted = list(columns) if columns else None
+    if latest and wanted:
+        wanted += [name for name in ('ReceiptID', 'UpdatedAt') if name not in wanted]
+    result = dataset(store, manifest['files']).to_table(columns=wanted, filter=filter)
+
+    # Files after the last full export hold the only copies that can supersede
+    # another, so only they are read to find the newest UpdatedAt of a receipt
+    base = manifest['files'][0]['run']
+    newer = [f for f in manifest['files'] if f['run'] != base]
+    if latest and newer:
+        newest = dataset(store, newer).to_table(columns=['ReceiptID', 'UpdatedAt'])
+        newest = newest.group_by('ReceiptID').aggregate([('UpdatedAt', 'max')])
+        position = pc.index_in(result['ReceiptID'], value_set=newest['ReceiptID'])
+        current = pc.greater_equal(result['UpdatedAt'], pc.take(newest['UpdatedAt_max'], position))
+        result = result.filter(pc.fill_null(current, True))
+    return result.select(columns) if columns else result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the ledger to partitioned Parquet")
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME', 'BillE_Expenses'))
+    parser.add_argument('--bucket', default=os.environ.get('EXPORT_BUCKET_NAME'), help="export bucket")
+    parser.add_argument('--prefix', default=EXPORT_PREFIX)
+    parser.add_argument('--out', help="local directory instead of S3")
+    parser.add_argument('--full', action='store_true', help="re-export everything and drop older files")
+    parser.add_argument('--segments', type=int, default=4, help="parallel Scan segments (full export)")
+    parser.add_argument('--batch-size', type=int, default=100_000, help="receipts per set of files")
+    parser.add_argument('--workers', type=int, default=8, help="files written in parallel")
+    parser.add_argument('--settle', type=int, default=SETTLE, help="skip receipts changed in the last N seconds")
+    parser.add_argument('--endpoint-url', help="LocalStack / DynamoDB Local, e.g. http://localhost:4566")
+    args = parser.parse_args()
+
+    if not args.out and not args.bucket:
+        sys.exit("Give --bucket (or EXPORT_BUCKET_NAME) or --out")
+    if args.bucket and args.bucket == os.environ.get('BUCKET_NAME'):
+        sys.exit(f"{args.bucket} is the receipts bucket: the processor would OCR every export file")
+    table = boto3.resource('dynamodb', endpoint_url=args.endpoint_url).Table(args.table)
+    if args.out:
+        store = LocalStore(args.out)
+    else:
+        store = S3Store(boto3.client('s3', endpoint_url=args.endpoint_url), args.bucket, args.prefix)
+    export(table, store, args.full, args.segments, args.batch_size, args.workers, args.settle)
@@ -0,0 +1,127 @@
+"""
+Rollup reconciliation: rebuilds the KPI rollups behind GET /stats
+(lambda/rollups.py) from the ledger and compares them with the ones the
+processor maintained.
+
+    python tools/reconcile_rollups.py          # report drift, exit 1 if there is any
+    python tools/reconcile_rollups.py --fix    # overwrite the rollups with the rebuilt ones
+
+The processor, tools/rescore.py and tools/bulk_ingest.py seed keep the rollups
+up to date; this catches what a crash between a ledger write and its rollup
+update left behind. Counters the processor adds while --fix is writing can be
+overwritten, so pick a quiet moment (or run it again).
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+import read_cache
+import rollups
+
+
+def scan_segment(table, segment, total_segments):
+    # Receipts and rollup items in one pass over the table
+    kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': Attr('RecordType').eq('RECEIPT') | Attr('ReceiptID').begins_with(rollups.STATS_PREFIX),
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def rebuild(table, segments=4):
+    # -> (rollup items rebuilt from the receipts, rollup items in the table, receipts seen)
+    def work(segment):
+        totals, top, found, seen = {}, [], {}, 0
+        for page in scan_segment(table, segment, segments):
+            receipts = [item for item in page if item.get('RecordType') == 'RECEIPT']
+            found.update((item['ReceiptID'], item) for item in page if item.get('RecordType') != 'RECEIPT')
+            rollups.accumulate(receipts, totals)
+            top = rollups.merge_top(top, [rollups.top_entry(item) for item in receipts if 'Total' in item],
+                                    'ReceiptID', 'Total')
+            seen += len(receipts)
+        return totals, top, found, seen
+
+    totals, top, found, seen = {}, [], {}, 0
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        for part, part_top, part_found, part_seen in pool.map(work, range(segments)):
+            for key, counters in part.items():
+                bucket = totals.setdefault(key, {})
+                for name, value in counters.items():
+                    bucket[name] = bucket.get(name, 0) + value
+            top = rollups.merge_top(top, part_top, 'ReceiptID', 'Total')
+            found.update(part_found)
+            seen += part_seen
+
+    expected = {key: dict(counters, ReceiptID=key) for key, counters in totals.items()}
+    summary = expected.setdefault(rollups.SUMMARY_KEY, {'ReceiptID': rollups.SUMMARY_KEY})
+    summary['TopReceipts'] = top
+    summary['TopMerchants'] = rollups.merge_top([], [
+        rollups.merchant_entry(key, counters) for key, counters in totals.items()
+        if key.startswith(rollups.MERCHANT_PREFIX)
+    ], 'Merchant', 'Spend')
+    return expected, found, seen
+
+
+def compare(expected, found):
+    # -> [(rollup key, attribute, rebuilt value, stored value)]; a missing counter counts as 0
+    drift = []
+    for key in sorted(expected.keys() | found.keys()):
+        want, got = expected.get(key, {}), found.get(key, {})
+        for name in sorted((want.keys() | got.keys()) - {'ReceiptID', 'TopVersion'}):
+            if (want.get(name) or 0) != (got.get(name) or 0):
+                drift.append((key, name, want.get(name), got.get(name)))
+    return drift
+
+
+def fix(table, expected, found):
+    # Replace every rollup item; a new TopVersion makes in-flight top-list merges retry
+    version = found.get(rollups.SUMMARY_KEY, {}).get('TopVersion', 0)
+    expected[rollups.SUMMARY_KEY]['TopVersion'] = version + 1
+    with table.batch_writer() as batch:
+        for item in expected.values():
+            batch.put_item(Item=item)
+        for key in found.keys() - expected.keys():
+            batch.delete_item(Key={'ReceiptID': key})
+    read_cache.bump_version(table)
+
+
+def reconcile(table, segments=4, apply=False):
+    start = time.perf_counter()
+    expected, found, seen = rebuild(table, segments)
+    drift = compare(expected, found)
+    for key, name, want, got in drift[:20]:
+        print(f"  {key} {name}: rebuilt {want!r}, stored {got!r}")
+    if len(drift) > 20:
+        print(f"  ... and {len(drift) - 20:,} more")
+    print(f"Checked {seen:,} receipts against {len(found):,} rollup items in {time.perf_counter() - start:.1f}s:"
+          f" {len(drift):,} differences")
+    if apply and drift:
+        fix(table, expected, found)
+        print(f"Rewrote {len(expected):,} rollup items, deleted {len(found.keys() - expected.keys()):,} stale ones")
+    return drift
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the /stats rollups from the ledger and verify them")
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME', 'BillE_Expenses'))
+    parser.add_argument('--segments', type=int, default=4, help="parallel Scan segments")
+    parser.add_argument('--endpoint-url', help="local DynamoDB, e.g. http://localhost:8000")
+    parser.add_argument('--fix', action='store_true', help="overwrite the rollups with the rebuilt ones")
+    args = parser.parse_args()
+
+    table = boto3.resource('dynamodb', endpoint_url=args.endpoint_url).Table(args.table)
+    drift = reconcile(table, args.segments, args.fix)
+    if drift and not args.fix:
+        sys.exit(1)
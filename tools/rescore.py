@@ -0,0 +1,329 @@
+"""
+Bulk re-scoring job: applies the current risk rule set to every receipt
+already in the ledger and writes back only the rows whose score or flags
+changed.
+
+    python tools/rescore.py --rules my_rules.json --dry-run
+    python tools/rescore.py --segments 8
+
+The ledger is streamed with a parallel Scan into columnar batches, and each
+batch is scored with pandas string/NumPy operations instead of calling
+RiskEngine.assess once per receipt.
+
+The ledger only keeps the first 100 characters of the OCR text. Longer texts
+are read from the search table (SEARCH_TABLE_NAME); receipts whose full text
+isn't there are skipped, never scored from the cut-off preview.
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import numpy as np
+import pandas as pd
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+import read_cache
+import rollups
+import search_index
+from risk_engine import WORD, RiskEngine, load_rules
+
+COLUMNS = ['ReceiptID', 'ExtractedText', 'Merchant', 'Total', 'Date', 'NearDuplicateOf', 'RiskScore', 'RiskFlags']
+PREVIEW_CHARS = 100     # the processor stores extracted_text[:100] + "..."
+PREVIEW_SUFFIX = '...'
+
+
+# --- STREAMING THE LEDGER ---
+def scan_segment(table, segment, total_segments):
+    # One worker's share of a parallel Scan, page by page
+    kwargs = {
+        'Segment': segment,
+        'TotalSegments': total_segments,
+        'FilterExpression': Attr('RecordType').eq('RECEIPT'),
+        'ProjectionExpression': ', '.join(f"#{c}" for c in COLUMNS),
+        'ExpressionAttributeNames': {f"#{c}": c for c in COLUMNS},
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield response['Items']
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def stream_ledger(table, total_segments=4, batch_size=100_000):
+    # -> DataFrames of up to batch_size receipts; segments are read in parallel
+    segments = [scan_segment(table, s, total_segments) for s in range(total_segments)]
+    rows = []
+    with ThreadPoolExecutor(max_workers=total_segments) as pool:
+        while segments:
+            pages = list(pool.map(lambda seg: next(seg, None), segments))
+            segments = [seg for seg, page in zip(segments, pages) if page is not None]
+            for page in pages:
+                rows.extend(page or [])
+            while len(rows) >= batch_size:
+                yield to_frame(rows[:batch_size])
+                rows = rows[batch_size:]
+    if rows:
+        yield to_frame(rows)
+
+
+def to_frame(items):
+    frame = pd.DataFrame(items, columns=COLUMNS)
+    frame['RiskScore'] = pd.to_numeric(frame['RiskScore'], errors='coerce').fillna(0).astype(np.int64)
+    frame['RiskFlags'] = frame['RiskFlags'].apply(lambda flags: list(flags) if isinstance(flags, (list, tuple)) else [])
+    frame['Text'] = preview_text(frame['ExtractedText'])
+    return frame
+
+
+# --- FULL TEXT ---
+def preview_text(previews):
+    # The whole OCR text where the ledger's preview holds all of it, else NaN
+    body = previews.fillna('').astype(str)
+    body = body.where(~body.str.endswith(PREVIEW_SUFFIX), body.str[:-len(PREVIEW_SUFFIX)])
+    return body.where(body.str.len() < PREVIEW_CHARS)
+
+
+class FullTexts:
+    # The OCR text the processor put in the search table (#DOC items), by ReceiptID
+    def __init__(self, dynamodb, table, workers=16):
+        self.dynamodb = dynamodb
+        self.table = table
+        self.workers = workers
+        # ReceiptID -> doc number, read once: #DOC items are keyed by doc number
+        self.docs = {}
+        kwargs = {'KeyConditionExpression': Key('Term').eq(search_index.DOC),
+                  'ProjectionExpression': 'Block, ReceiptID'}
+        while True:
+            response = table.query(**kwargs)
+            self.docs.update((item['ReceiptID'], item['Block']) for item in response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def get(self, receipt_ids):
+        # -> {ReceiptID: text} for the receipts the index has whole
+        keys = [{'Term': search_index.DOC, 'Block': self.docs[r]} for r in receipt_ids if r in self.docs]
+        chunks = [keys[i:i + 100] for i in range(0, len(keys), 100)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pages = pool.map(lambda chunk: search_index.batch_get(self.dynamodb, self.table.name, chunk,
+                                                                   ('ReceiptID', 'Text')), chunks)
+            texts = {}
+            for page in pages:
+                for item in page:
+                    text = zlib.decompress(getattr(item['Text'], 'value', item['Text'])).decode('utf-8')
+                    if len(text) < search_index.MAX_TEXT:  # longer ones were cut off there too
+                        texts[item['ReceiptID']] = text
+        return texts
+
+
+def with_full_text(frame, texts=None):
+    # -> (frame with every Text filled in, receipts skipped for lack of one)
+    missing = frame['Text'].isna()
+    if texts is not None and missing.any():
+        found = texts.get(frame.loc[missing, 'ReceiptID'].tolist())
+        frame['Text'] = frame['Text'].fillna(frame['ReceiptID'].map(found))
+        missing = frame['Text'].isna()
+    return frame[~missing], int(missing.sum())
+
+
+# --- VECTORIZED SCORING ---
+def rule_table(engine):
+    # Rule number -> (weight, flag), numbered in the order assess() lists flags
+    rules = engine.rules
+    table = {}
+    for phrase, (position, weight) in engine.keywords.items():
+        table[position] = (weight, rules['keyword_flag'].format(word=phrase))
+    offset = len(rules['keywords'])
+    for i, (name, rule) in enumerate(rules['patterns'].items()):
+        table[offset + i] = (rule.get('weight', 0), rules['pattern_flag'].format(name=name))
+    offset += len(rules['patterns'])
+    table[offset] = (rules['amount_weight'], rules['amount_flag'])
+    table[offset + 1] = (rules['weekday_weight'], rules['weekday_flag'])
+    table[offset + 2] = (rules['near_duplicate_weight'], rules['near_duplicate_flag'])
+    return table
+
+
+def score_frame(engine, frame):
+    """
+    Same result as engine.assess(text, total, date, near_duplicate) for every row, computed
+    column-wise. -> (scores Series, flags Series), aligned to frame.index
+    """
+    rules = engine.rules
+    index = frame.index
+    hits = []  # arrays of (row, rule number), one entry per rule a row matches
+
+    def add(mask, rule):
+        rows = np.flatnonzero(mask)
+        hits.append(np.column_stack((rows, np.full(len(rows), rule))))
+
+    raw = frame['Text'].fillna('').astype(str)
+
+    # Only rows that contain some keyword as a substring can match one, and
+    # finding them is a single vectorized regex pass; only they get tokenized
+    candidates = []
+    if engine.keywords:
+        words = sorted({word for phrase in engine.keywords for word in phrase.split(' ')}, key=len, reverse=True)
+        pattern = '|'.join(map(re.escape, words))
+        if all(word.isascii() for word in words):
+            # \b matches \w+ tokenization for ASCII words, and drops "barcode" for "bar"
+            pattern = rf'\b(?:{pattern})\b'
+        candidates = np.flatnonzero(raw.str.contains(pattern, case=False, regex=True))
+        text = raw.iloc[candidates].str.lower()
+
+    # 1. Single-word keywords: tokenize each candidate once, then one isin() lookup
+    if engine.single_words and len(candidates):
+        tokens = text.str.findall(WORD.pattern)
+        rows = np.repeat(candidates, tokens.str.len().to_numpy())
+        tokens = pd.Series(np.concatenate(tokens.to_numpy()), dtype=object)
+        found = tokens.isin(engine.single_words).to_numpy()
+        found_rules = tokens[found].map(lambda word: engine.keywords[word][0]).to_numpy(dtype=np.int64)
+        hits.append(np.column_stack((rows[found], found_rules)))
+
+    # 2. Multi-word keywords: one contains() per phrase (there are few)
+    for phrase, (position, _) in engine.keywords.items():
+        if ' ' in phrase and len(candidates):
+            pattern = r'(?<!\w)' + r'\W+'.join(phrase.split(' ')) + r'(?!\w)'
+            mask = np.zeros(len(index), dtype=bool)
+            mask[candidates] = text.str.contains(pattern, regex=True).to_numpy()
+            add(mask, position)
+
+    # 3. Regex rules
+    offset = len(rules['keywords'])
+    for i, rule in enumerate(rules['patterns'].values()):
+        add(raw.str.contains(rule['pattern'], case=False, regex=True).to_numpy(), offset + i)
+    offset += len(rules['patterns'])
+
+    # 4. Amount rule
+    if rules['amount_threshold'] is not None:
+        totals = pd.to_numeric(frame['Total'], errors='coerce').to_numpy(dtype=float)
+        add(np.nan_to_num(totals, nan=-np.inf) > rules['amount_threshold'], offset)
+
+    # 5. Weekday rule
+    if rules['weekdays']:
+        dates = pd.to_datetime(frame['Date'], format="%Y-%m-%d", errors='coerce')
+        add(dates.dt.weekday.isin(rules['weekdays']).to_numpy(), offset + 1)
+
+    # 6. Near-duplicate rule: the match the processor stored on the receipt
+    add(frame['NearDuplicateOf'].notna().to_numpy(), offset + 2)
+
+    # Each rule counts once per receipt, however often it appears
+    pairs = np.unique(np.concatenate(hits), axis=0) if hits else np.empty((0, 2), dtype=np.int64)
+    table = rule_table(engine)
+
+    weights = np.array([table[rule][0] for rule in pairs[:, 1]], dtype=np.int64)
+    scores = np.bincount(pairs[:, 0], weights=weights, minlength=len(index)).astype(np.int64)
+
+    # Rows share a handful of rule combinations: fold each row's rules into one
+    # bitmask (Python ints, so any rule count fits) and build each list once
+    bits = pd.Series([1 << int(rule) for rule in pairs[:, 1]], dtype=object)
+    masks = bits.groupby(pairs[:, 0]).sum()
+    lists = {}
+    for mask in masks.unique():
+        flags = []
+        for rule in sorted(table):
+            if mask >> rule & 1:
+                flag = table[rule][1]
+                # Keywords can share one flag text (e.g. "NON_COMPLIANT"); it is listed once
+                if rule >= len(rules['keywords']) or flag not in flags:
+                    flags.append(flag)
+        lists[mask] = flags
+
+    row_flags = [[] for _ in range(len(index))]
+    for row, mask in zip(masks.index, masks.to_numpy()):
+        row_flags[row] = lists[mask]
+    return pd.Series(scores, index=index), pd.Series(row_flags, index=index, dtype=object)
+
+
+def changed_rows(frame, scores, flags):
+    # Rows whose stored RiskScore/RiskFlags differ from the fresh ones
+    score_changed = frame['RiskScore'].to_numpy() != scores.to_numpy()
+    flags_changed = frame['RiskFlags'].map(tuple).to_numpy() != flags.map(tuple).to_numpy()
+    mask = score_changed | flags_changed
+    out = frame.loc[mask, ['ReceiptID']].copy()
+    out['RiskScore'] = scores[mask]
+    out['RiskFlags'] = flags[mask]
+    return out
+
+
+# --- WRITE BACK ---
+def write_changes(table, changes, workers=16):
+    # -> receipts skipped because they were deleted since the Scan read them.
+    # UpdatedAt is bumped so the dashboard's delta sync picks the change up. It is
+    # UTC in the processor's format (the Lambda clock's naive isoformat), whatever
+    # time zone this job runs in, so the stamps sort with the processor's.
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None).isoformat()
+
+    def update(row):
+        # ALL_OLD: the item as the rollups counted it, whatever the Scan saw
+        try:
+            old = table.update_item(
+                Key={'ReceiptID': row.ReceiptID},
+                UpdateExpression='SET RiskScore = :s, RiskFlags = :f, UpdatedAt = :u',
+                ConditionExpression=Attr('ReceiptID').exists(),
+                ExpressionAttributeValues={':s': int(row.RiskScore), ':f': list(row.RiskFlags), ':u': now},
+                ReturnValues='ALL_OLD',
+            )['Attributes']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return None  # deleted mid-run: nothing to re-score or move between buckets
+        return old, int(row.RiskScore)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(update, changes.itertuples(index=False)))
+    updated = [result for result in results if result is not None]
+    read_cache.bump_version(table)
+    # Move the receipts between the /stats risk buckets
+    rollups.rescored(table, updated)
+    return len(results) - len(updated)
+
+
+def rescore(table, engine, segments=4, batch_size=100_000, dry_run=False, workers=16, texts=None):
+    # texts: FullTexts, or None to re-score only receipts whose preview is their whole text
+    seen = changed = skipped = 0
+    start = time.perf_counter()
+    for frame in stream_ledger(table, segments, batch_size):
+        frame, cut_off = with_full_text(frame, texts)
+        scores, flags = score_frame(engine, frame)
+        changes = changed_rows(frame, scores, flags)
+        deleted = 0
+        if not dry_run and len(changes):
+            deleted = write_changes(table, changes, workers)
+        seen += len(frame)
+        changed += len(changes) - deleted
+        skipped += cut_off + deleted
+        rate = seen / (time.perf_counter() - start)
+        print(f"Re-scored {seen:,} receipts, {changed:,} changed, {skipped:,} skipped without their full text"
+              f" or deleted ({rate:,.0f} rows/s)")
+    return seen, changed, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score the whole ledger with the current rule set")
+    parser.add_argument('--table', default=os.environ.get('TABLE_NAME', 'BillE_Expenses'))
+    parser.add_argument('--rules', help="JSON rule set (default: RISK_RULES_FILE or the built-in rules)")
+    parser.add_argument('--segments', type=int, default=4, help="parallel Scan segments")
+    parser.add_argument('--batch-size', type=int, default=100_000)
+    parser.add_argument('--workers', type=int, default=16, help="parallel UpdateItem calls")
+    parser.add_argument('--search-table', default=os.environ.get('SEARCH_TABLE_NAME', 'BillE_SearchIndex'),
+                        help="where the full OCR texts are; '' re-scores only receipts with short texts")
+    parser.add_argument('--endpoint-url', help="local DynamoDB, e.g. http://localhost:8000")
+    parser.add_argument('--dry-run', action='store_true', help="count changes without writing")
+    args = parser.parse_args()
+
+    dynamodb = boto3.resource('dynamodb', endpoint_url=args.endpoint_url)
+    table = dynamodb.Table(args.table)
+    engine = RiskEngine(load_rules(args.rules))
+    texts = FullTexts(dynamodb, dynamodb.Table(args.search_table), args.workers) if args.search_table else None
+    seen, changed, skipped = rescore(table, engine, args.segments, args.batch_size, args.dry_run, args.workers, texts)
+    print(f"Done: {seen:,} receipts, {changed:,} {'would change' if args.dry_run else 'updated'},"
+          f" {skipped:,} skipped (text longer than the ledger's preview and not in the search table,"
+          f" or deleted during the run)")